@@ -46,9 +46,9 @@ def create_app(config_name=None):
     from logging_config import setup_logging
     setup_logging(app)
     
-    # Cache configuration
-    app.config['CACHE_TYPE'] = 'SimpleCache'  # Use simple cache instead of Redis for development
-    app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+    # Cache configuration (CACHE_BACKEND picks SimpleCache, Redis or both)
+    from app.utils.cache_backends import configure_cache
+    configure_cache(app)
     
     # File upload configuration
     app.config['UPLOAD_FOLDER'] = app.config.get('UPLOAD_FOLDER', 'uploads')
@@ -59,10 +59,44 @@ def create_app(config_name=None):
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
-    socketio.init_app(app, async_mode='eventlet', cors_allowed_origins=app.config.get('ALLOWED_ORIGINS', ['http://localhost:3000', 'http://localhost:3001', 'http://localhost:3002', 'http://localhost:5173']))
+    # Socket.IO handlers are imported before init_app so that every app's
+    # server registers them, not just the first one created in the process
+    from app.socketio_handlers import queue_events
+    socketio.init_app(app, async_mode='eventlet', cors_allowed_origins=app.config.get('ALLOWED_ORIGINS', ['http://localhost:3000', 'http://localhost:3001', 'http://localhost:3002', 'http://localhost:5173']),
+                      message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'), channel=app.config.get('SOCKETIO_CHANNEL', 'flask-socketio'))
     cache.init_app(app)
     limiter.init_app(app)
     
+    from app.services.availability_index import availability_index
+    availability_index.init_app(app)
+    
+    from app.services.report_rollup_service import report_rollups
+    report_rollups.init_app(app)
+    
+    from app.services.token_blocklist import token_blocklist
+    token_blocklist.init_app(app)
+    
+    from app.services.identity_service import identity_cache
+    identity_cache.init_app(app)
+    
+    from app.services.tagged_cache import tagged_cache
+    tagged_cache.init_app(app)
+    
+    from app.services.queue_broadcaster import queue_broadcaster
+    queue_broadcaster.init_app(app)
+    
+    from app.services.queue_numbers import queue_numbers
+    queue_numbers.init_app(app)
+    
+    from app.services.booking_ids import booking_ids
+    booking_ids.init_app(app)
+    
+    from app.services.notification_dispatcher import notification_dispatcher
+    notification_dispatcher.init_app(app)
+    
+    from app.services.notification_scheduler import notification_scheduler
+    notification_scheduler.init_app(app)
+    
     # CORS Configuration with security
     allowed_origins = os.environ.get('ALLOWED_ORIGINS', 'http://localhost:3000,http://localhost:3001,http://localhost:3002,http://localhost:5173').split(',')
     CORS(app, origins=allowed_origins, supports_credentials=True)
@@ -97,16 +131,14 @@ def create_app(config_name=None):
     app.register_blueprint(queue_bp, url_prefix='/api/queue')
     app.register_blueprint(health_bp, url_prefix='/api')
     
-    # Import and register socketio handlers
-    from app.socketio_handlers import queue_events
+    # Register management commands
+    from app.commands import register_commands
+    register_commands(app)
     
     # JWT error handlers
     @jwt.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
-        from app.models.user import TokenBlocklist
-        jti = jwt_payload['jti']
-        token = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar()
-        return token is not None
+        return token_blocklist.is_revoked(jwt_payload['jti'])
     
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -0,0 +1,47 @@
+"""
+Flask CLI management commands
+
+Run with `flask --app run <command>` from the backend directory.
+"""
+import click
+from datetime import datetime, timedelta
+
+
+def register_commands(app):
+    """Register the management commands on the app"""
+
+    @app.cli.command('rebuild-rollups')
+    @click.option('--start-date', help='First day to rebuild (YYYY-MM-DD), defaults to 30 days ago')
+    @click.option('--end-date', help='Last day to rebuild (YYYY-MM-DD), defaults to today')
+    @click.option('--clinic-id', type=int, help='Only rebuild this clinic')
+    @click.option('--doctor-id', type=int, help='Only rebuild this doctor')
+    @click.option('--chunk-days', type=click.IntRange(min=1), default=31, show_default=True,
+                  help='Days rebuilt per transaction')
+    def rebuild_rollups(start_date, end_date, clinic_id, doctor_id, chunk_days):
+        """Backfill or rebuild the daily report rollups for a date range"""
+        from app.services.report_rollup_service import report_rollups
+
+        try:
+            end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else datetime.now().date()
+            start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else end - timedelta(days=30)
+        except ValueError:
+            raise click.BadParameter('Dates must use YYYY-MM-DD')
+        if start > end:
+            raise click.BadParameter('start-date must not be after end-date')
+
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+            report_rollups.rebuild(chunk_start, chunk_end, clinic_id, doctor_id)
+            click.echo(f'Rebuilt rollups for {chunk_start} to {chunk_end}')
+            chunk_start = chunk_end + timedelta(days=1)
+
+    @app.cli.command('prune-token-blocklist')
+    @click.option('--days', type=click.IntRange(min=1),
+                  help='Delete revocations older than this many days (at least the refresh token lifetime, the default)')
+    def prune_token_blocklist(days):
+        """Delete revoked token entries that can no longer match a valid token"""
+        from app.services.token_blocklist import token_blocklist
+
+        deleted = token_blocklist.prune(timedelta(days=days) if days else None)
+        click.echo(f'Deleted {deleted} revoked token entries')
@@ -13,8 +13,12 @@ from .prescription import Prescription
 from .payment import Payment
 from .notification import Notification
 from .audit_log import AuditLog
+from .report_rollup import DailyRevenueRollup, DailyVisitRollup
+from .queue_counter import QueueCounter
+from .booking_counter import BookingCounter
 
 __all__ = [
     'User', 'TokenBlocklist', 'Clinic', 'Doctor', 'DoctorSchedule', 'Patient', 'Service',
-    'Appointment', 'Visit', 'Prescription', 'Payment', 'Notification', 'AuditLog'
+    'Appointment', 'Visit', 'Prescription', 'Payment', 'Notification', 'AuditLog',
+    'DailyRevenueRollup', 'DailyVisitRollup', 'QueueCounter', 'BookingCounter'
 ]
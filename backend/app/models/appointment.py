@@ -42,6 +42,9 @@ class Appointment(db.Model):
         db.Index('idx_appointment_clinic_date', 'clinic_id', db.func.date('start_time')),
         db.Index('idx_appointment_status_date', 'status', db.func.date('start_time')),
         db.Index('idx_appointment_booking_id', 'booking_id'),
+        # Plain btree indexes for half-open start_time range filters
+        db.Index('idx_appointment_doctor_start', 'doctor_id', 'start_time'),
+        db.Index('idx_appointment_clinic_start', 'clinic_id', 'start_time'),
     )
     
     def __init__(self, booking_id, clinic_id, doctor_id, patient_id, service_id, 
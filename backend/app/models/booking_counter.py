@@ -0,0 +1,12 @@
+from app import db
+
+class BookingCounter(db.Model):
+    """Last booking ID sequence number handed out per day"""
+    __tablename__ = 'booking_counters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, unique=True)
+    last_number = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<BookingCounter {self.day} last={self.last_number}>'
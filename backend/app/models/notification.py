@@ -23,6 +23,9 @@ class Notification(db.Model):
     sent_at = db.Column(db.DateTime)
     status = db.Column(db.Enum(NotificationStatus), default=NotificationStatus.PENDING, nullable=False, index=True)
     related_appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=True)
+    # Set while a dispatcher is sending it (or holding it back after a retryable failure)
+    leased_until = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __init__(self, recipient, notification_type, message, scheduled_time, related_appointment_id=None):
@@ -51,6 +54,7 @@ class Notification(db.Model):
             'scheduled_time': self.scheduled_time.isoformat() if self.scheduled_time else None,
             'sent_at': self.sent_at.isoformat() if self.sent_at else None,
             'status': self.status.value if self.status else None,
+            'attempts': self.attempts,
             'related_appointment_id': self.related_appointment_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -36,6 +36,7 @@ class Payment(db.Model):
         db.Index('idx_payment_date_status', db.func.date('created_at'), 'status'),
         db.Index('idx_payment_patient_date', 'patient_id', db.func.date('created_at')),
         db.Index('idx_payment_visit', 'visit_id'),
+        db.Index('idx_payments_created_at', 'created_at'),
     )
     
     def __init__(self, visit_id, patient_id, total_amount, amount_paid, payment_method, 
@@ -0,0 +1,17 @@
+from app import db
+
+class QueueCounter(db.Model):
+    """Last queue number handed out per clinic and day"""
+    __tablename__ = 'queue_counters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    clinic_id = db.Column(db.Integer, db.ForeignKey('clinics.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    last_number = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('clinic_id', 'day', name='_queue_counter_key_uc'),
+    )
+
+    def __repr__(self):
+        return f'<QueueCounter clinic={self.clinic_id} {self.day} last={self.last_number}>'
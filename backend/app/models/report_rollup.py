@@ -0,0 +1,52 @@
+from app import db
+from app.models.payment import PaymentMethod
+
+class DailyRevenueRollup(db.Model):
+    """Paid payments summed per day, clinic, doctor, service and payment method"""
+    __tablename__ = 'daily_revenue_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    clinic_id = db.Column(db.Integer, db.ForeignKey('clinics.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    payment_method = db.Column(db.Enum(PaymentMethod), nullable=False)
+    payment_count = db.Column(db.Integer, default=0, nullable=False)
+    total_revenue = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    doctor_share = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    center_share = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+
+    # Indexes for performance
+    __table_args__ = (
+        db.UniqueConstraint('day', 'clinic_id', 'doctor_id', 'service_id', 'payment_method',
+                            name='_revenue_rollup_key_uc'),
+        db.Index('idx_revenue_rollup_doctor_day', 'doctor_id', 'day'),
+        db.Index('idx_revenue_rollup_clinic_day', 'clinic_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<DailyRevenueRollup {self.day} doctor={self.doctor_id} {self.total_revenue}>'
+
+class DailyVisitRollup(db.Model):
+    """Visits counted per day, clinic, doctor and service"""
+    __tablename__ = 'daily_visit_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    clinic_id = db.Column(db.Integer, db.ForeignKey('clinics.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    total_visits = db.Column(db.Integer, default=0, nullable=False)
+    scheduled_visits = db.Column(db.Integer, default=0, nullable=False)
+    walk_in_visits = db.Column(db.Integer, default=0, nullable=False)
+    completed_visits = db.Column(db.Integer, default=0, nullable=False)
+
+    # Indexes for performance
+    __table_args__ = (
+        db.UniqueConstraint('day', 'clinic_id', 'doctor_id', 'service_id', name='_visit_rollup_key_uc'),
+        db.Index('idx_visit_rollup_doctor_day', 'doctor_id', 'day'),
+        db.Index('idx_visit_rollup_clinic_day', 'clinic_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<DailyVisitRollup {self.day} doctor={self.doctor_id} visits={self.total_visits}>'
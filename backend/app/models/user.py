@@ -75,5 +75,10 @@ class TokenBlocklist(db.Model):
     jti = db.Column(db.String(36), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Indexes for performance (blocklist cache sync and pruning scan by age)
+    __table_args__ = (
+        db.Index('idx_token_blacklist_created_at', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<TokenBlocklist {self.jti}>'
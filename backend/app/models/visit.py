@@ -13,6 +13,14 @@ class VisitType(enum.Enum):
     SCHEDULED = "scheduled"
     WALK_IN = "walk_in"
 
+# Waiting order is kept in sort_key, spaced SORT_KEY_GAP apart, so moving a
+# patient only rewrites that patient's key; queue_number stays what's displayed
+SORT_KEY_GAP = 1 << 16
+
+def default_sort_key(context):
+    """New visits queue in queue_number order"""
+    return (context.get_current_parameters().get('queue_number') or 0) * SORT_KEY_GAP
+
 class Visit(db.Model):
     __tablename__ = 'visits'
     
@@ -29,8 +37,15 @@ class Visit(db.Model):
     status = db.Column(db.Enum(VisitStatus), default=VisitStatus.WAITING, nullable=False, index=True)
     visit_type = db.Column(db.Enum(VisitType), nullable=False)
     queue_number = db.Column(db.Integer, nullable=False)
+    sort_key = db.Column(db.BigInteger, nullable=False, default=default_sort_key)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('idx_visit_clinic_created', 'clinic_id', 'created_at'),
+        db.Index('idx_visit_doctor_created', 'doctor_id', 'created_at'),
+    )
+    
     # Relationships - Use back_populates to avoid conflicts
     prescription = db.relationship('Prescription', back_populates='visit', uselist=False)
     payment = db.relationship('Payment', backref='visit', uselist=False)
@@ -51,6 +66,7 @@ class Visit(db.Model):
             'status': self.status.value if self.status else None,
             'visit_type': self.visit_type.value if self.visit_type else None,
             'queue_number': self.queue_number,
+            'sort_key': self.sort_key,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
         
@@ -1,6 +1,6 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
-from app import db, cache
+from app import db
 from app.models.appointment import Appointment, AppointmentStatus, BookingSource
 from app.models.patient import Patient
 from app.models.doctor import Doctor
@@ -11,12 +11,29 @@ from app.models.visit import Visit, VisitStatus, VisitType
 from app.models.payment import Payment, PaymentMethod, PaymentStatus
 from app.utils.decorators import receptionist_required, doctor_required, validate_json, log_audit
 from app.utils.validators import validate_appointment_time, validate_phone_number
-from app.utils.helpers import generate_booking_id, calculate_end_time
+from app.utils.helpers import generate_booking_id, calculate_end_time, date_filter, date_range_filter, get_next_queue_number
+from app.utils.aggregates import count_if, aggregate_groups, rollup
+from app.utils.projection import appointment_projection
 from app.services.booking_service import BookingService
+from app.services.identity_service import current_identity, current_doctor
+from app.services.tagged_cache import tagged_cache, activity_scope
 from datetime import datetime, timedelta
 
 appointments_bp = Blueprint('appointments', __name__)
 
+def emit_appointment_created(appointment, visit):
+    """Tell the appointment's clinic and doctor rooms about a new booking"""
+    from app import socketio
+    
+    appointment_data = {
+        'appointment': appointment.to_dict(),
+        'visit': visit.to_dict(),
+        'clinic_id': appointment.clinic_id,
+        'doctor_id': appointment.doctor_id
+    }
+    socketio.emit('appointment_created', appointment_data, room=f'clinic_{appointment.clinic_id}')
+    socketio.emit('appointment_created', appointment_data, room=f'doctor_{appointment.doctor_id}')
+
 @appointments_bp.route('', methods=['GET'])
 @jwt_required()
 def get_appointments():
@@ -31,24 +48,18 @@ def get_appointments():
     status = request.args.get('status')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    fields = request.args.get('fields')  # e.g. id,start_time,patient.name
     
     # Create cache key
-    cache_key = f'appointments_{clinic_id}_{doctor_id}_{patient_id}_{date}_{start_date}_{end_date}_{status}_{page}_{per_page}'
+    cache_key = f'appointments_{clinic_id}_{doctor_id}_{patient_id}_{date}_{start_date}_{end_date}_{status}_{page}_{per_page}_{fields}'
     
-    # Try to get from cache first
-    cached_result = cache.get(cache_key)
+    # Try to get from cache first (dropped when matching appointments, visits or payments change)
+    cached = tagged_cache.entry(cache_key, activity_scope(clinic_id, doctor_id, patient_id, date))
+    cached_result = cached.get()
     if cached_result:
         return jsonify(cached_result), 200
     
-    # Build query with eager loading to prevent N+1 queries
-    from sqlalchemy.orm import joinedload
-    query = Appointment.query.options(
-        joinedload(Appointment.patient),
-        joinedload(Appointment.doctor),
-        joinedload(Appointment.clinic),
-        joinedload(Appointment.service),
-        joinedload(Appointment.visit)
-    )
+    query = Appointment.query
     
     if clinic_id:
         query = query.filter(Appointment.clinic_id == clinic_id)
@@ -61,20 +72,20 @@ def get_appointments():
     if date:
         try:
             date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-            query = query.filter(db.func.date(Appointment.start_time) == date_obj)
+            query = query.filter(date_filter(Appointment.start_time, date_obj))
         except ValueError:
             return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     elif start_date or end_date:
         if start_date:
             try:
                 start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-                query = query.filter(db.func.date(Appointment.start_time) >= start_date_obj)
+                query = query.filter(date_range_filter(Appointment.start_time, start_date_obj))
             except ValueError:
                 return jsonify({'message': 'Invalid start_date format. Use YYYY-MM-DD'}), 400
         if end_date:
             try:
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-                query = query.filter(db.func.date(Appointment.start_time) <= end_date_obj)
+                query = query.filter(date_range_filter(Appointment.start_time, end_date=end_date_obj))
             except ValueError:
                 return jsonify({'message': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
     
@@ -94,21 +105,37 @@ def get_appointments():
     # Order by start time
     query = query.order_by(Appointment.start_time.desc())
     
-    # Paginate
-    appointments = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    if fields:
+        # Only the requested columns, serialized straight from the result rows
+        projection = appointment_projection()
+        try:
+            query, layout = projection.select(query, fields)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        appointments = query.paginate(page=page, per_page=per_page, error_out=False)
+        items = [projection.serialize(row, layout) for row in appointments.items]
+    else:
+        # Full objects, eager loaded to prevent N+1 queries
+        from sqlalchemy.orm import joinedload
+        query = query.options(
+            joinedload(Appointment.patient),
+            joinedload(Appointment.doctor),
+            joinedload(Appointment.clinic),
+            joinedload(Appointment.service),
+            joinedload(Appointment.visit)
+        )
+        appointments = query.paginate(page=page, per_page=per_page, error_out=False)
+        items = [appointment.to_dict() for appointment in appointments.items]
     
     result = {
-        'appointments': [appointment.to_dict() for appointment in appointments.items],
+        'appointments': items,
         'total': appointments.total,
         'pages': appointments.pages,
         'current_page': page,
         'per_page': per_page
     }
     
-    # Cache for 5 minutes
-    cache.set(cache_key, result, timeout=300)
+    cached.set(result, timeout=current_app.config.get('APPOINTMENTS_CACHE_TIMEOUT', 300))
     
     return jsonify(result), 200
 
@@ -132,178 +159,98 @@ def get_appointment_statistics():
         doctor_id = request.args.get('doctor_id', type=int)
         
         today = datetime.now().date()
-        base_query = Appointment.query
-        
-        # Apply clinic and doctor filtering
-        if clinic_id:
-            base_query = base_query.filter(Appointment.clinic_id == clinic_id)
-        if doctor_id:
-            base_query = base_query.filter(Appointment.doctor_id == doctor_id)
         
         # Apply date filtering
         if date_str:
             try:
                 date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                base_query = base_query.filter(db.func.date(Appointment.start_time) == date_obj)
+                period = date_filter(Appointment.start_time, date_obj)
             except ValueError:
                 return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
         elif start_date_str or end_date_str:
+            start_date_obj = end_date_obj = None
             if start_date_str:
                 try:
                     start_date_obj = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    base_query = base_query.filter(db.func.date(Appointment.start_time) >= start_date_obj)
                 except ValueError:
                     return jsonify({'message': 'Invalid start_date format. Use YYYY-MM-DD'}), 400
             if end_date_str:
                 try:
                     end_date_obj = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    base_query = base_query.filter(db.func.date(Appointment.start_time) <= end_date_obj)
                 except ValueError:
                     return jsonify({'message': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
+            period = date_range_filter(Appointment.start_time, start_date_obj, end_date_obj)
         else:
             # Default: today's appointments
-            base_query = base_query.filter(db.func.date(Appointment.start_time) == today)
-        
-        # Total appointments
-        total_appointments = base_query.count()
+            period = date_filter(Appointment.start_time, today)
         
-        # Count by status
-        confirmed_count = base_query.filter(Appointment.status == AppointmentStatus.CONFIRMED).count()
-        checked_in_count = base_query.filter(Appointment.status == AppointmentStatus.CHECKED_IN).count()
-        completed_count = base_query.filter(Appointment.status == AppointmentStatus.COMPLETED).count()
-        cancelled_count = base_query.filter(Appointment.status == AppointmentStatus.CANCELLED).count()
-        no_show_count = base_query.filter(Appointment.status == AppointmentStatus.NO_SHOW).count()
-        
-        # Count by clinic - use the same filter conditions
-        clinic_counts = {}
-        clinic_query = db.session.query(
-            Appointment.clinic_id,
-            db.func.count(Appointment.id).label('count')
+        # Totals and status counts honour the clinic/doctor filters; the clinic,
+        # doctor and booking source breakdowns only use the date filter
+        scoped = [period]
+        if clinic_id:
+            scoped.append(Appointment.clinic_id == clinic_id)
+        if doctor_id:
+            scoped.append(Appointment.doctor_id == doctor_id)
+        
+        # Recent (last 7 days) and this week's appointments are unfiltered
+        recent_start = datetime.combine(today - timedelta(days=7), datetime.min.time())
+        week_start = datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time())
+        
+        # One pass over the period plus the recent window, grouped finely enough
+        # to roll up every breakdown
+        rows = aggregate_groups(
+            db.session.query(Appointment).outerjoin(
+                Clinic, Clinic.id == Appointment.clinic_id
+            ).outerjoin(
+                Doctor, Doctor.id == Appointment.doctor_id
+            ).filter(
+                db.or_(period, Appointment.start_time >= min(recent_start, week_start))
+            ),
+            {
+                'clinic_id': Appointment.clinic_id,
+                'clinic_name': Clinic.name,
+                'doctor_id': Appointment.doctor_id,
+                'doctor_name': Doctor.name,
+                'booking_source': Appointment.booking_source,
+                'status': Appointment.status
+            },
+            in_period=count_if(period),
+            in_scope=count_if(db.and_(*scoped)),
+            recent=count_if(Appointment.start_time >= recent_start),
+            this_week=count_if(Appointment.start_time >= week_start)
         )
         
-        if date_str:
-            try:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                clinic_query = clinic_query.filter(db.func.date(Appointment.start_time) == date_obj)
-            except ValueError:
-                pass
-        elif start_date_str or end_date_str:
-            if start_date_str:
-                try:
-                    start_date_obj = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    clinic_query = clinic_query.filter(db.func.date(Appointment.start_time) >= start_date_obj)
-                except ValueError:
-                    pass
-            if end_date_str:
-                try:
-                    end_date_obj = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    clinic_query = clinic_query.filter(db.func.date(Appointment.start_time) <= end_date_obj)
-                except ValueError:
-                    pass
-        else:
-            clinic_query = clinic_query.filter(db.func.date(Appointment.start_time) == today)
-        
-        appointments_by_clinic = clinic_query.group_by(Appointment.clinic_id).all()
-        for clinic_id, count in appointments_by_clinic:
-            clinic = Clinic.query.get(clinic_id)
-            clinic_name = clinic.name if clinic else f'Clinic {clinic_id}'
-            clinic_counts[clinic_name] = count
-        
-        # Count by doctor
-        doctor_counts = {}
-        doctor_query = db.session.query(
-            Appointment.doctor_id,
-            db.func.count(Appointment.id).label('count')
+        by_status = rollup(rows, lambda row: row['status'], 'in_scope')
+        clinic_counts = rollup(
+            [row for row in rows if row['in_period']],
+            lambda row: row['clinic_name'] or f"Clinic {row['clinic_id']}",
+            'in_period'
         )
-        
-        if date_str:
-            try:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                doctor_query = doctor_query.filter(db.func.date(Appointment.start_time) == date_obj)
-            except ValueError:
-                pass
-        elif start_date_str or end_date_str:
-            if start_date_str:
-                try:
-                    start_date_obj = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    doctor_query = doctor_query.filter(db.func.date(Appointment.start_time) >= start_date_obj)
-                except ValueError:
-                    pass
-            if end_date_str:
-                try:
-                    end_date_obj = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    doctor_query = doctor_query.filter(db.func.date(Appointment.start_time) <= end_date_obj)
-                except ValueError:
-                    pass
-        else:
-            doctor_query = doctor_query.filter(db.func.date(Appointment.start_time) == today)
-        
-        appointments_by_doctor = doctor_query.group_by(Appointment.doctor_id).all()
-        for doctor_id, count in appointments_by_doctor:
-            doctor = Doctor.query.get(doctor_id)
-            doctor_name = doctor.name if doctor else f'Doctor {doctor_id}'
-            doctor_counts[doctor_name] = count
-        
-        # Count by booking source
-        booking_source_counts = {}
-        source_query = db.session.query(
-            Appointment.booking_source,
-            db.func.count(Appointment.id).label('count')
+        doctor_counts = rollup(
+            [row for row in rows if row['in_period']],
+            lambda row: row['doctor_name'] or f"Doctor {row['doctor_id']}",
+            'in_period'
+        )
+        booking_source_counts = rollup(
+            [row for row in rows if row['in_period']],
+            lambda row: row['booking_source'].value if row['booking_source'] else None,
+            'in_period'
         )
-        
-        if date_str:
-            try:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                source_query = source_query.filter(db.func.date(Appointment.start_time) == date_obj)
-            except ValueError:
-                pass
-        elif start_date_str or end_date_str:
-            if start_date_str:
-                try:
-                    start_date_obj = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    source_query = source_query.filter(db.func.date(Appointment.start_time) >= start_date_obj)
-                except ValueError:
-                    pass
-            if end_date_str:
-                try:
-                    end_date_obj = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    source_query = source_query.filter(db.func.date(Appointment.start_time) <= end_date_obj)
-                except ValueError:
-                    pass
-        else:
-            source_query = source_query.filter(db.func.date(Appointment.start_time) == today)
-        
-        appointments_by_source = source_query.group_by(Appointment.booking_source).all()
-        for source, count in appointments_by_source:
-            if source:
-                booking_source_counts[source.value] = count
-        
-        # Recent appointments (last 7 days)
-        seven_days_ago = datetime.now().date() - timedelta(days=7)
-        recent_count = Appointment.query.filter(
-            Appointment.start_time >= datetime.combine(seven_days_ago, datetime.min.time())
-        ).count()
-        
-        # This week's appointments
-        start_of_week = today - timedelta(days=today.weekday())
-        this_week_count = Appointment.query.filter(
-            Appointment.start_time >= datetime.combine(start_of_week, datetime.min.time())
-        ).count()
         
         return jsonify({
-            'total': total_appointments,
+            'total': sum(row['in_scope'] for row in rows),
             'by_status': {
-                'confirmed': confirmed_count,
-                'checked_in': checked_in_count,
-                'completed': completed_count,
-                'cancelled': cancelled_count,
-                'no_show': no_show_count
+                'confirmed': by_status.get(AppointmentStatus.CONFIRMED, 0),
+                'checked_in': by_status.get(AppointmentStatus.CHECKED_IN, 0),
+                'completed': by_status.get(AppointmentStatus.COMPLETED, 0),
+                'cancelled': by_status.get(AppointmentStatus.CANCELLED, 0),
+                'no_show': by_status.get(AppointmentStatus.NO_SHOW, 0)
             },
             'by_clinic': clinic_counts,
             'by_doctor': doctor_counts,
             'by_booking_source': booking_source_counts,
-            'recent': recent_count,
-            'this_week': this_week_count
+            'recent': sum(row['recent'] for row in rows),
+            'this_week': sum(row['this_week'] for row in rows)
         }), 200
     except Exception as e:
         import traceback
@@ -353,11 +300,7 @@ def create_appointment(data, current_user):
         
         # Create visit for the appointment
         # Get next queue number for the clinic on this date
-        from sqlalchemy import func
-        max_queue = db.session.query(func.max(Visit.queue_number)).filter(
-            Visit.clinic_id == data['clinic_id'],
-            func.date(Visit.created_at) == start_time.date()
-        ).scalar() or 0
+        queue_number = get_next_queue_number(data['clinic_id'], start_time.date())
         
         visit = Visit(
             appointment_id=appointment.id,
@@ -367,7 +310,7 @@ def create_appointment(data, current_user):
             clinic_id=data['clinic_id'],
             check_in_time=start_time,  # Set check-in time to appointment time
             visit_type=VisitType.SCHEDULED,
-            queue_number=max_queue + 1,
+            queue_number=queue_number,
             status=VisitStatus.WAITING
         )
         
@@ -396,26 +339,7 @@ def create_appointment(data, current_user):
         db.session.commit()
         
         # Emit SocketIO event for real-time updates
-        from app import socketio
-        from app.services.queue_service import QueueService
-        
-        # Emit appointment created event
-        appointment_data = {
-            'appointment': appointment.to_dict(),
-            'visit': visit.to_dict(),
-            'clinic_id': appointment.clinic_id,
-            'doctor_id': appointment.doctor_id
-        }
-        socketio.emit('appointment_created', appointment_data, room=f'clinic_{appointment.clinic_id}')
-        socketio.emit('appointment_created', appointment_data, room=f'doctor_{appointment.doctor_id}')
-        
-        # Emit queue update for the clinic
-        queue_service = QueueService()
-        queue_data = queue_service.get_clinic_queue(appointment.clinic_id)
-        socketio.emit('queue_updated', queue_data, room=f'clinic_{appointment.clinic_id}')
-        
-        # Invalidate cache for appointments
-        cache.clear()
+        emit_appointment_created(appointment, visit)
         
         # Schedule SMS reminder (1 hour before appointment) - DISABLED FOR TESTING
         # try:
@@ -450,16 +374,60 @@ def create_appointment(data, current_user):
         traceback.print_exc()
         return jsonify({'message': f'Failed to create appointment: {str(e)}'}), 500
 
+@appointments_bp.route('/series', methods=['POST'])
+@receptionist_required
+@validate_json(['clinic_id', 'doctor_id', 'patient_id', 'service_id', 'start_time', 'booking_source', 'recurrence'])
+@log_audit('create_appointment_series', 'appointment')
+def create_appointment_series(data, current_user):
+    """Create a recurring appointment series (e.g. weekly x 10 or every 3 days x 6)"""
+    recurrence = data['recurrence']
+    if not isinstance(recurrence, dict):
+        return jsonify({'message': 'recurrence must be an object with count, frequency and interval'}), 400
+    
+    try:
+        series_data = dict(
+            data,
+            booking_source=BookingSource[data['booking_source'].upper()],
+            created_by=current_user.id
+        )
+        booking_service = BookingService()
+        appointments, conflicts = booking_service.create_appointment_series(
+            series_data, recurrence, allow_partial=bool(data.get('allow_partial'))
+        )
+    except KeyError:
+        return jsonify({'message': f'Invalid booking source: {data["booking_source"]}'}), 400
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        traceback.print_exc()
+        return jsonify({'message': f'Failed to create appointment series: {str(e)}'}), 500
+    
+    if not appointments:
+        return jsonify({
+            'message': 'No appointments were created because some occurrences are not available',
+            'appointments': [],
+            'conflicts': conflicts
+        }), 409
+    
+    for appointment in appointments:
+        emit_appointment_created(appointment, appointment.visit)
+    
+    return jsonify({
+        'message': f'{len(appointments)} appointments created successfully',
+        'appointments': [appointment.to_dict() for appointment in appointments],
+        'conflicts': conflicts
+    }), 201
+
 @appointments_bp.route('/<int:appointment_id>', methods=['PUT'])
 @jwt_required()
 @log_audit('update_appointment', 'appointment')
 def update_appointment(appointment_id):
     """Update appointment"""
-    from flask_jwt_extended import get_jwt_identity
-    from app.models.user import User, UserRole
+    from app.models.user import UserRole
     
-    current_user_id = int(get_jwt_identity())
-    current_user = User.query.get(current_user_id)
+    current_user = current_identity()
     
     if not current_user:
         return jsonify({'message': 'User not found'}), 401
@@ -501,7 +469,7 @@ def update_appointment(appointment_id):
             
             # If Doctor is changing status to completed, verify it's their appointment
             if new_status == AppointmentStatus.COMPLETED and is_doctor:
-                doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+                doctor = current_doctor()
                 if not doctor:
                     return jsonify({'message': 'Doctor profile not found for this user'}), 404
                 if appointment.doctor_id != doctor.id:
@@ -667,19 +635,7 @@ def update_appointment(appointment_id):
     if status_changed and new_status:
         appointment_date = appointment.start_time.date() if appointment.start_time else datetime.now().date()
         queue_service = QueueService()
-        phases_data = queue_service.get_all_appointments_for_date(appointment_date, appointment.clinic_id)
-        
-        # Organize into phases
-        phases = {
-            'appointments_today': [],
-            'waiting': [],
-            'with_doctor': [],
-            'completed': []
-        }
-        for apt in phases_data:
-            queue_phase = apt.get('queue_phase', 'appointments_today')
-            if queue_phase in phases:
-                phases[queue_phase].append(apt)
+        phases = queue_service.get_queue_phases(appointment_date, appointment.clinic_id)
         
         # Emit phases_updated event
         socketio.emit('phases_updated', {
@@ -711,27 +667,6 @@ def update_appointment(appointment_id):
                 'clinic_id': appointment.clinic_id,
                 'doctor_id': appointment.doctor_id
             }, room=f'doctor_{appointment.doctor_id}')
-        
-        # If status changed to cancelled and same day, emit queue_updated to remove from queue
-        if new_status == AppointmentStatus.CANCELLED:
-            appointment_date = appointment.start_time.date() if appointment.start_time else None
-            today = datetime.now().date()
-            if appointment_date == today:
-                # Emit queue_updated to refresh queue
-                queue_data = queue_service.get_clinic_queue(appointment.clinic_id)
-                socketio.emit('queue_updated', queue_data, room=f'clinic_{appointment.clinic_id}')
-                
-                if appointment.doctor_id:
-                    doctor_queue_data = queue_service.get_doctor_queue(appointment.doctor_id)
-                    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{appointment.doctor_id}')
-    
-    # Emit queue update for the clinic
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(appointment.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{appointment.clinic_id}')
-    
-    # Invalidate cache for appointments
-    cache.clear()
     
     return jsonify({
         'message': 'Appointment updated successfully',
@@ -766,7 +701,6 @@ def cancel_appointment(appointment_id, current_user):
     
     # Emit SocketIO event for real-time updates
     from app import socketio
-    from app.services.queue_service import QueueService
     
     # Emit appointment cancelled event
     appointment_data = {
@@ -777,14 +711,6 @@ def cancel_appointment(appointment_id, current_user):
     socketio.emit('appointment_cancelled', appointment_data, room=f'clinic_{appointment.clinic_id}')
     socketio.emit('appointment_cancelled', appointment_data, room=f'doctor_{appointment.doctor_id}')
     
-    # Emit queue update for the clinic
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(appointment.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{appointment.clinic_id}')
-    
-    # Invalidate cache for appointments
-    cache.clear()
-    
     return jsonify({'message': 'Appointment cancelled successfully'}), 200
 
 @appointments_bp.route('/available-slots', methods=['GET'])
@@ -856,6 +782,71 @@ def get_available_slots():
         'date': date
     }), 200
 
+@appointments_bp.route('/availability', methods=['GET'])
+@jwt_required()
+def get_clinic_availability():
+    """Get slot availability for all doctors of a clinic across a date range"""
+    clinic_id = request.args.get('clinic_id', type=int)
+    start_date = request.args.get('start_date')
+    days = request.args.get('days', 7, type=int)
+    
+    if not all([clinic_id, start_date]):
+        return jsonify({'message': 'clinic_id and start_date are required'}), 400
+    
+    if not 1 <= days <= 31:
+        return jsonify({'message': 'days must be between 1 and 31'}), 400
+    
+    try:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    clinic = Clinic.query.get(clinic_id)
+    if not clinic:
+        return jsonify({'message': 'Clinic not found'}), 404
+    if not clinic.is_active:
+        return jsonify({'message': 'Clinic is not active'}), 400
+    
+    booking_service = BookingService()
+    return jsonify(booking_service.get_clinic_availability(clinic_id, start_date, days)), 200
+
+@appointments_bp.route('/next-slots', methods=['GET'])
+@jwt_required()
+def get_next_free_slots():
+    """Get the next free time slots for a doctor across the coming days"""
+    doctor_id = request.args.get('doctor_id', type=int)
+    count = request.args.get('count', 5, type=int)
+    days = request.args.get('days', 14, type=int)
+    start_date = request.args.get('start_date')
+    
+    if not doctor_id:
+        return jsonify({'message': 'doctor_id is required'}), 400
+    
+    if not 1 <= count <= 100 or not 1 <= days <= 90:
+        return jsonify({'message': 'count must be 1-100 and days must be 1-90'}), 400
+    
+    if start_date:
+        try:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    doctor = Doctor.query.get(doctor_id)
+    if not doctor:
+        return jsonify({'message': 'Doctor not found'}), 404
+    
+    booking_service = BookingService()
+    slots = booking_service.get_next_free_slots(doctor_id, count, start_date=start_date, days=days)
+    
+    return jsonify({
+        'doctor_id': doctor_id,
+        'slots': [{
+            'date': slot.date().isoformat(),
+            'start_time': slot.strftime('%H:%M'),
+            'end_time': (slot + timedelta(minutes=30)).strftime('%H:%M')
+        } for slot in slots]
+    }), 200
+
 @appointments_bp.route('/current', methods=['GET'])
 @doctor_required
 def get_current_appointment(current_user):
@@ -863,7 +854,7 @@ def get_current_appointment(current_user):
     from sqlalchemy.orm import joinedload
     
     # Get doctor for current user
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor = current_doctor()
     if not doctor:
         return jsonify({'message': 'Doctor profile not found for this user'}), 404
     
@@ -937,7 +928,7 @@ def complete_current_appointment(current_user):
     from app import socketio
     
     # Get doctor for current user
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor = current_doctor()
     if not doctor:
         return jsonify({'message': 'Doctor profile not found for this user'}), 404
     
@@ -978,14 +969,6 @@ def complete_current_appointment(current_user):
     
     db.session.commit()
     
-    # Emit SocketIO events for real-time updates
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(current_visit.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{current_visit.clinic_id}')
-    
-    doctor_queue_data = queue_service.get_doctor_queue(doctor.id)
-    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{doctor.id}')
-    
     # Emit appointment completed event
     if appointment:
         appointment_data = {
@@ -1004,19 +987,8 @@ def complete_current_appointment(current_user):
     if not appointment_date:
         appointment_date = datetime.now().date()
     
-    phases_data = queue_service.get_all_appointments_for_date(appointment_date, current_visit.clinic_id)
-    
-    # Organize into phases
-    phases = {
-        'appointments_today': [],
-        'waiting': [],
-        'with_doctor': [],
-        'completed': []
-    }
-    for apt in phases_data:
-        queue_phase = apt.get('queue_phase', 'appointments_today')
-        if queue_phase in phases:
-            phases[queue_phase].append(apt)
+    queue_service = QueueService()
+    phases = queue_service.get_queue_phases(appointment_date, current_visit.clinic_id)
     
     socketio.emit('phases_updated', {
         'phases': phases,
@@ -1032,9 +1004,6 @@ def complete_current_appointment(current_user):
         'date': appointment_date.isoformat()
     }, room=f'doctor_{doctor.id}')
     
-    # Invalidate cache
-    cache.clear()
-    
     return jsonify({
         'message': 'Appointment completed successfully',
         'appointment': appointment.to_dict() if appointment else None,
@@ -14,6 +14,7 @@ from app.models.doctor import Doctor
 from app.models.audit_log import AuditLog
 from app.utils.decorators import validate_json, receptionist_required, admin_required
 from app.utils.validators import validate_phone_number
+from app.services.token_blocklist import token_blocklist
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
@@ -100,6 +101,8 @@ def logout():
     db.session.add(audit_log)
     db.session.commit()
     
+    token_blocklist.revoke(jti, blacklisted_token.created_at)
+    
     return jsonify({'message': 'Logout successful'}), 200
 
 @auth_bp.route('/me', methods=['GET'])
@@ -5,6 +5,7 @@ from app.models.clinic import Clinic
 from app.models.service import Service
 from app.models.doctor import Doctor
 from app.utils.decorators import admin_required, receptionist_required, validate_json, log_audit
+from app.utils.aggregates import count_if, aggregate_scalars
 from sqlalchemy import or_ as sql_or
 from datetime import datetime
 
@@ -619,16 +620,19 @@ def get_clinic_statistics():
             services_query = Service.query
             doctors_query = Doctor.query
         
-        total_clinics = clinics_query.count()
-        active_clinics = clinics_query.filter_by(is_active=True).count()
+        totals = aggregate_scalars(
+            total_clinics=clinics_query.with_entities(db.func.count(Clinic.id)),
+            active_clinics=clinics_query.with_entities(count_if(Clinic.is_active == True)),
+            total_services=services_query.with_entities(db.func.count(Service.id)),
+            active_services=services_query.with_entities(count_if(Service.is_active == True)),
+            total_doctors=doctors_query.with_entities(db.func.count(Doctor.id))
+        )
+        total_clinics = totals['total_clinics']
+        active_clinics = totals['active_clinics']
         inactive_clinics = total_clinics - active_clinics
-        
-        # Total services
-        total_services = services_query.count()
-        active_services = services_query.filter_by(is_active=True).count()
-        
-        # Total doctors
-        total_doctors = doctors_query.count()
+        total_services = totals['total_services']
+        active_services = totals['active_services']
+        total_doctors = totals['total_doctors']
         
         return jsonify({
             'total_clinics': total_clinics,
@@ -1,14 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db, cache
+from app import db
 from app.models.appointment import Appointment, AppointmentStatus
 from app.models.visit import Visit, VisitStatus
 from app.models.payment import Payment, PaymentStatus
-from app.models.user import User, UserRole
+from app.models.user import UserRole
 from app.models.doctor import Doctor
 from app.models.clinic import Clinic
 from app.models.notification import Notification
 from app.utils.decorators import doctor_required
+from app.utils.helpers import date_filter
+from app.services.identity_service import current_identity
+from app.services.tagged_cache import tagged_cache, activity_scope
 from datetime import datetime, timedelta
 
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -17,8 +20,7 @@ dashboard_bp = Blueprint('dashboard', __name__)
 @jwt_required()
 def get_dashboard_stats():
     """Get dashboard statistics"""
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_identity()
     
     if not user:
         return jsonify({'message': 'User not found'}), 401
@@ -27,8 +29,12 @@ def get_dashboard_stats():
     today = datetime.now().date()
     cache_key = f'dashboard_stats_{user.id}_{today}'
     
-    # Try to get from cache first
-    cached_stats = cache.get(cache_key)
+    # Doctors see their own day, everyone else the whole center's
+    doctor_id = user.doctor_id if user.role == UserRole.DOCTOR else None
+    
+    # Try to get from cache first (dropped when today's appointments, visits or payments change)
+    cached = tagged_cache.entry(cache_key, activity_scope(doctor_id=doctor_id, day=today.isoformat()))
+    cached_stats = cached.get()
     if cached_stats:
         return jsonify(cached_stats), 200
     
@@ -40,14 +46,13 @@ def get_dashboard_stats():
         stats = get_receptionist_stats(today)
     elif user.role == UserRole.DOCTOR:
         # Doctor dashboard
-        doctor = Doctor.query.filter_by(user_id=user.id).first()
-        if doctor:
-            stats = get_doctor_stats(doctor.id, today)
+        if user.doctor_id:
+            stats = get_doctor_stats(user.doctor_id, today)
         else:
             stats = get_receptionist_stats(today)  # Fallback
     
-    # Cache for 30 seconds for more responsive updates
-    cache.set(cache_key, stats, timeout=30)
+    # Overdue payment alerts are time based, so entries still expire
+    cached.set(stats, timeout=current_app.config.get('DASHBOARD_CACHE_TIMEOUT', 30))
     
     return jsonify(stats), 200
 
@@ -55,57 +60,57 @@ def get_receptionist_stats(date):
     """Get statistics for receptionist dashboard"""
     # Today's appointments
     today_appointments = db.session.query(Appointment).filter(
-        db.func.date(Appointment.start_time) == date
+        date_filter(Appointment.start_time, date)
     ).count()
     
     confirmed_appointments = db.session.query(Appointment).filter(
-        db.func.date(Appointment.start_time) == date,
+        date_filter(Appointment.start_time, date),
         Appointment.status == AppointmentStatus.CONFIRMED
     ).count()
     
     checked_in_appointments = db.session.query(Appointment).filter(
-        db.func.date(Appointment.start_time) == date,
+        date_filter(Appointment.start_time, date),
         Appointment.status == AppointmentStatus.CHECKED_IN
     ).count()
     
     completed_appointments = db.session.query(Appointment).filter(
-        db.func.date(Appointment.start_time) == date,
+        date_filter(Appointment.start_time, date),
         Appointment.status == AppointmentStatus.COMPLETED
     ).count()
     
     # Today's visits (count by creation date for simplicity)
     today_visits = db.session.query(Visit).filter(
-        db.func.date(Visit.created_at) == date
+        date_filter(Visit.created_at, date)
     ).count()
     
     waiting_visits = db.session.query(Visit).filter(
-        db.func.date(Visit.created_at) == date,
+        date_filter(Visit.created_at, date),
         Visit.status == VisitStatus.WAITING
     ).count()
     
     in_progress_visits = db.session.query(Visit).filter(
-        db.func.date(Visit.created_at) == date,
+        date_filter(Visit.created_at, date),
         Visit.status == VisitStatus.IN_PROGRESS
     ).count()
     
     pending_payment_visits = db.session.query(Visit).filter(
-        db.func.date(Visit.created_at) == date,
+        date_filter(Visit.created_at, date),
         Visit.status == VisitStatus.PENDING_PAYMENT
     ).count()
     
     # Today's payments
     today_payments = db.session.query(Payment).filter(
-        db.func.date(Payment.created_at) == date
+        date_filter(Payment.created_at, date)
     ).count()
     
     paid_payments = db.session.query(Payment).filter(
-        db.func.date(Payment.created_at) == date,
+        date_filter(Payment.created_at, date),
         Payment.status == PaymentStatus.PAID
     ).count()
     
     # Revenue
     today_revenue = db.session.query(db.func.sum(Payment.amount_paid)).filter(
-        db.func.date(Payment.created_at) == date,
+        date_filter(Payment.created_at, date),
         Payment.status == PaymentStatus.PAID
     ).scalar() or 0
     
@@ -116,7 +121,7 @@ def get_receptionist_stats(date):
     doctors_without_checkin = db.session.query(Doctor).filter(
         ~Doctor.id.in_(
             db.session.query(Visit.doctor_id).filter(
-                db.func.date(Visit.created_at) == date
+                date_filter(Visit.created_at, date)
             )
         )
     ).all()
@@ -168,44 +173,44 @@ def get_doctor_stats(doctor_id, date):
     # Doctor's appointments today
     today_appointments = db.session.query(Appointment).filter(
         Appointment.doctor_id == doctor_id,
-        db.func.date(Appointment.start_time) == date
+        date_filter(Appointment.start_time, date)
     ).count()
     
     # Doctor's visits today (based on creation date for simplicity)
     today_visits = db.session.query(Visit).filter(
         Visit.doctor_id == doctor_id,
-        db.func.date(Visit.created_at) == date
+        date_filter(Visit.created_at, date)
     ).count()
     
     # Doctor's queue
     waiting_patients = db.session.query(Visit).filter(
         Visit.doctor_id == doctor_id,
         Visit.status == VisitStatus.WAITING,
-        db.func.date(Visit.created_at) == date
+        date_filter(Visit.created_at, date)
     ).count()
     
     called_patients = db.session.query(Visit).filter(
         Visit.doctor_id == doctor_id,
         Visit.status == VisitStatus.CALLED,
-        db.func.date(Visit.created_at) == date
+        date_filter(Visit.created_at, date)
     ).count()
     
     in_progress_patients = db.session.query(Visit).filter(
         Visit.doctor_id == doctor_id,
         Visit.status == VisitStatus.IN_PROGRESS,
-        db.func.date(Visit.created_at) == date
+        date_filter(Visit.created_at, date)
     ).count()
     
     completed_patients = db.session.query(Visit).filter(
         Visit.doctor_id == doctor_id,
         Visit.status == VisitStatus.COMPLETED,
-        db.func.date(Visit.created_at) == date
+        date_filter(Visit.created_at, date)
     ).count()
     
     # Doctor's revenue today
     today_revenue = db.session.query(db.func.sum(Payment.doctor_share)).filter(
         Payment.visit.has(Visit.doctor_id == doctor_id),
-        db.func.date(Payment.created_at) == date,
+        date_filter(Payment.created_at, date),
         Payment.status == PaymentStatus.PAID
     ).scalar() or 0
     
@@ -7,6 +7,8 @@ from app.models.user import User, UserRole
 from app.models.doctor_schedule import DoctorSchedule
 from app.models.appointment import Appointment
 from app.utils.decorators import admin_required, receptionist_required, validate_json, log_audit
+from app.utils.helpers import date_filter
+from app.utils.aggregates import aggregate_groups, rollup
 from sqlalchemy import or_ as sql_or
 from datetime import datetime
 
@@ -383,7 +385,7 @@ def get_doctor_schedule(doctor_id):
     # Get appointments for the date
     appointments = db.session.query(Appointment).filter(
         Appointment.doctor_id == doctor_id,
-        db.func.date(Appointment.start_time) == date_obj
+        date_filter(Appointment.start_time, date_obj)
     ).order_by(Appointment.start_time).all()
     
     return jsonify({
@@ -473,40 +475,19 @@ def get_doctor_statistics():
         clinic_id = request.args.get('clinic_id', type=int)
         
         # Build base query with filters
-        base_query = Doctor.query
+        base_query = db.session.query(Doctor).outerjoin(Clinic, Clinic.id == Doctor.clinic_id)
         if clinic_id:
-            base_query = base_query.filter_by(clinic_id=clinic_id)
+            base_query = base_query.filter(Doctor.clinic_id == clinic_id)
         
-        total_doctors = base_query.count()
-        
-        # Count by clinic
-        clinic_counts = {}
-        doctors_by_clinic_query = db.session.query(
-            Doctor.clinic_id,
-            db.func.count(Doctor.id).label('count')
+        # One grouped pass, rolled up into the clinic and specialty breakdowns
+        rows = aggregate_groups(
+            base_query,
+            {'clinic_id': Doctor.clinic_id, 'clinic_name': Clinic.name, 'specialty': Doctor.specialty},
+            count=db.func.count(Doctor.id)
         )
-        if clinic_id:
-            doctors_by_clinic_query = doctors_by_clinic_query.filter_by(clinic_id=clinic_id)
-        doctors_by_clinic = doctors_by_clinic_query.group_by(Doctor.clinic_id).all()
-        
-        for clinic_id_val, count in doctors_by_clinic:
-            clinic = Clinic.query.get(clinic_id_val)
-            clinic_name = clinic.name if clinic else f'Clinic {clinic_id_val}'
-            clinic_counts[clinic_name] = count
-        
-        # Count by specialty
-        specialty_counts = {}
-        doctors_by_specialty_query = db.session.query(
-            Doctor.specialty,
-            db.func.count(Doctor.id).label('count')
-        )
-        if clinic_id:
-            doctors_by_specialty_query = doctors_by_specialty_query.filter_by(clinic_id=clinic_id)
-        doctors_by_specialty = doctors_by_specialty_query.group_by(Doctor.specialty).all()
-        
-        for specialty, count in doctors_by_specialty:
-            if specialty:
-                specialty_counts[specialty] = count
+        total_doctors = sum(row['count'] for row in rows)
+        clinic_counts = rollup(rows, lambda row: row['clinic_name'] or f"Clinic {row['clinic_id']}", 'count')
+        specialty_counts = rollup(rows, lambda row: row['specialty'] or None, 'count')
         
         return jsonify({
             'total_doctors': total_doctors,
@@ -60,6 +60,12 @@ def readiness_check():
             'error': str(e)
         }), 503
 
+@health_bp.route('/health/notifications', methods=['GET'])
+def notification_metrics():
+    """SMS queue depth, lag and throughput"""
+    from app.services.notification_scheduler import notification_scheduler
+    return jsonify(notification_scheduler.metrics()), 200
+
 @health_bp.route('/health/live', methods=['GET'])
 def liveness_check():
     """Liveness check for Kubernetes"""
@@ -1,14 +1,15 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
-from app import db, cache
+from app import db
 from app.models.patient import Patient, Gender
 from app.models.appointment import Appointment
 from app.models.visit import Visit
 from app.utils.decorators import receptionist_required, validate_json, log_audit
 from app.utils.validators import validate_phone_number
+from app.utils.aggregates import count_if, aggregate_row
+from app.utils.exports import stream_rows, csv_response
+from app.services.tagged_cache import tagged_cache, PATIENTS_TAG, REFERENCE_TAG
 from datetime import datetime, timedelta
-import csv
-from io import StringIO, BytesIO
 
 patients_bp = Blueprint('patients', __name__)
 
@@ -27,8 +28,9 @@ def get_patients():
     # Create cache key
     cache_key = f'patients_{phone}_{name}_{gender}_{clinic_id}_{doctor_id}_{page}_{per_page}'
     
-    # Try to get from cache first
-    cached_result = cache.get(cache_key)
+    # Try to get from cache first (dropped when any patient changes)
+    cached = tagged_cache.entry(cache_key, [PATIENTS_TAG, REFERENCE_TAG])
+    cached_result = cached.get()
     if cached_result:
         return jsonify(cached_result), 200
     
@@ -72,8 +74,7 @@ def get_patients():
         'per_page': per_page
     }
     
-    # Cache for 5 minutes
-    cache.set(cache_key, result, timeout=300)
+    cached.set(result, timeout=current_app.config.get('PATIENTS_CACHE_TIMEOUT', 300))
     
     return jsonify(result), 200
 
@@ -286,45 +287,30 @@ def search_patients():
 def export_patients():
     """Export patients to CSV"""
     try:
-        # Get all patients (can add filters later)
-        patients = Patient.query.order_by(Patient.name).all()
+        # Get all patients (can add filters later), streamed in batches
+        statement = db.select(
+            Patient.id, Patient.name, Patient.phone, Patient.age, Patient.gender,
+            Patient.address, Patient.medical_history, Patient.created_at
+        ).order_by(Patient.name, Patient.id)
         
-        # Create CSV in memory
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        writer.writerow([
-            'ID', 'Name', 'Phone', 'Age', 'Gender', 'Address', 'Medical History', 'Created At'
-        ])
-        
-        # Write data
-        for patient in patients:
-            writer.writerow([
-                patient.id,
-                patient.name,
-                patient.phone,
-                patient.age,
-                patient.gender.value if patient.gender else '',
-                patient.address or '',
-                patient.medical_history or '',
-                patient.created_at.strftime('%Y-%m-%d %H:%M:%S') if patient.created_at else ''
-            ])
-        
-        # Create response
-        output.seek(0)
-        
-        # Create a BytesIO for the response
-        from io import BytesIO
-        csv_bytes = BytesIO()
-        csv_bytes.write(output.getvalue().encode('utf-8-sig'))  # UTF-8 with BOM for Excel compatibility
-        csv_bytes.seek(0)
+        rows = (
+            [
+                patient_id,
+                name,
+                phone,
+                age,
+                gender.value if gender else '',
+                address or '',
+                medical_history or '',
+                created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else ''
+            ]
+            for patient_id, name, phone, age, gender, address, medical_history, created_at in stream_rows(statement)
+        )
         
-        return send_file(
-            csv_bytes,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'patients_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.csv'
+        return csv_response(
+            ['ID', 'Name', 'Phone', 'Age', 'Gender', 'Address', 'Medical History', 'Created At'],
+            rows,
+            f'patients_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.csv'
         )
     except Exception as e:
         return jsonify({'message': f'Error exporting patients: {str(e)}'}), 500
@@ -345,18 +331,22 @@ def get_patient_statistics():
         else:
             base_query = Patient.query
         
-        total_patients = base_query.count()
-        
-        # Count by gender
-        male_count = base_query.filter_by(gender=Gender.MALE).count()
-        female_count = base_query.filter_by(gender=Gender.FEMALE).count()
-        other_count = base_query.filter_by(gender=Gender.OTHER).count()
-        
         # Recent registrations (last 30 days)
         thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        recent_count = base_query.filter(
-            Patient.created_at >= thirty_days_ago
-        ).count()
+        
+        totals = aggregate_row(
+            base_query,
+            total=db.func.count(Patient.id),
+            male=count_if(Patient.gender == Gender.MALE),
+            female=count_if(Patient.gender == Gender.FEMALE),
+            other=count_if(Patient.gender == Gender.OTHER),
+            recent=count_if(Patient.created_at >= thirty_days_ago)
+        )
+        total_patients = totals['total']
+        male_count = totals['male']
+        female_count = totals['female']
+        other_count = totals['other']
+        recent_count = totals['recent']
         
         return jsonify({
             'total': total_patients,
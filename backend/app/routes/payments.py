@@ -1,16 +1,20 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from app import db, cache
+from app import db
 from app.models.payment import Payment, PaymentMethod, PaymentStatus
 from app.models.visit import Visit, VisitStatus
 from app.models.patient import Patient
+from app.models.doctor import Doctor
+from app.models.clinic import Clinic
+from app.models.service import Service
 from app.utils.decorators import receptionist_required, validate_json, log_audit
 from app.utils.validators import validate_payment_amount
 from app.services.payment_service import PaymentService
+from app.utils.helpers import date_filter, date_range_filter
+from app.utils.aggregates import count_if, sum_if, aggregate_row
+from app.utils.exports import stream_rows, XlsxExport
 from datetime import datetime
-from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
-from io import BytesIO
 
 payments_bp = Blueprint('payments', __name__)
 
@@ -51,19 +55,19 @@ def get_payments():
         if date:
             try:
                 date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-                query = query.filter(db.func.date(Payment.created_at) == date_obj)
+                query = query.filter(date_filter(Payment.created_at, date_obj))
             except ValueError:
                 return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
         elif start_date:
             try:
                 start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-                query = query.filter(db.func.date(Payment.created_at) >= start_date_obj)
+                query = query.filter(date_range_filter(Payment.created_at, start_date_obj))
             except ValueError:
                 return jsonify({'message': 'Invalid start_date format. Use YYYY-MM-DD'}), 400
         if end_date:
             try:
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-                query = query.filter(db.func.date(Payment.created_at) <= end_date_obj)
+                query = query.filter(date_range_filter(Payment.created_at, end_date=end_date_obj))
             except ValueError:
                 return jsonify({'message': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
         
@@ -224,7 +228,6 @@ def process_existing_payment(payment_id, data, current_user):
     
     # Emit real-time update for payment processing
     from app import socketio
-    from app.services.queue_service import QueueService
     
     # Emit payment processed event
     socketio.emit('payment_processed', {
@@ -232,18 +235,6 @@ def process_existing_payment(payment_id, data, current_user):
         'visit': visit.to_dict() if visit else None
     })
     
-    # Emit queue updates if visit exists
-    if visit:
-        queue_service = QueueService()
-        queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-        socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
-        
-        doctor_queue_data = queue_service.get_doctor_queue(visit.doctor_id)
-        socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{visit.doctor_id}')
-    
-    # Invalidate cache
-    cache.clear()
-    
     return jsonify({
         'message': 'Payment processed successfully',
         'payment': payment.to_dict()
@@ -363,51 +354,34 @@ def get_payment_statistics():
             if doctor_id:
                 base_query = base_query.filter(Visit.doctor_id == doctor_id)
         
-        # Get total payments
-        total_payments = base_query.count()
-        
-        # Count by status
-        pending_count = base_query.filter_by(status=PaymentStatus.PENDING).count()
-        partially_paid_count = base_query.filter_by(status=PaymentStatus.PARTIALLY_PAID).count()
-        paid_count = base_query.filter_by(status=PaymentStatus.PAID).count()
-        refunded_count = base_query.filter_by(status=PaymentStatus.REFUNDED).count()
-        
-        # Count by method
-        cash_count = base_query.filter_by(payment_method=PaymentMethod.CASH).count()
-        visa_count = base_query.filter_by(payment_method=PaymentMethod.VISA).count()
-        bank_transfer_count = base_query.filter_by(payment_method=PaymentMethod.BANK_TRANSFER).count()
-        
-        # Calculate totals - need to rebuild query for aggregations
-        revenue_query = db.session.query(db.func.sum(Payment.amount_paid))
-        if clinic_id or doctor_id:
-            revenue_query = revenue_query.join(Visit, Payment.visit_id == Visit.id)
-            if clinic_id:
-                revenue_query = revenue_query.filter(Visit.clinic_id == clinic_id)
-            if doctor_id:
-                revenue_query = revenue_query.filter(Visit.doctor_id == doctor_id)
-        total_revenue = revenue_query.filter(Payment.status == PaymentStatus.PAID).scalar() or 0
-        
-        # Total refunds
-        refunds_query = db.session.query(db.func.sum(Payment.amount_paid))
-        if clinic_id or doctor_id:
-            refunds_query = refunds_query.join(Visit, Payment.visit_id == Visit.id)
-            if clinic_id:
-                refunds_query = refunds_query.filter(Visit.clinic_id == clinic_id)
-            if doctor_id:
-                refunds_query = refunds_query.filter(Visit.doctor_id == doctor_id)
-        total_refunds = refunds_query.filter(Payment.status == PaymentStatus.REFUNDED).scalar() or 0
-        
-        # Pending amount
-        pending_query = db.session.query(db.func.sum(Payment.total_amount - Payment.amount_paid))
-        if clinic_id or doctor_id:
-            pending_query = pending_query.join(Visit, Payment.visit_id == Visit.id)
-            if clinic_id:
-                pending_query = pending_query.filter(Visit.clinic_id == clinic_id)
-            if doctor_id:
-                pending_query = pending_query.filter(Visit.doctor_id == doctor_id)
-        pending_amount = pending_query.filter(
-            Payment.status.in_([PaymentStatus.PENDING, PaymentStatus.PARTIALLY_PAID])
-        ).scalar() or 0
+        totals = aggregate_row(
+            base_query,
+            total=db.func.count(Payment.id),
+            pending=count_if(Payment.status == PaymentStatus.PENDING),
+            partially_paid=count_if(Payment.status == PaymentStatus.PARTIALLY_PAID),
+            paid=count_if(Payment.status == PaymentStatus.PAID),
+            refunded=count_if(Payment.status == PaymentStatus.REFUNDED),
+            cash=count_if(Payment.payment_method == PaymentMethod.CASH),
+            visa=count_if(Payment.payment_method == PaymentMethod.VISA),
+            bank_transfer=count_if(Payment.payment_method == PaymentMethod.BANK_TRANSFER),
+            revenue=sum_if(Payment.amount_paid, Payment.status == PaymentStatus.PAID),
+            refunds=sum_if(Payment.amount_paid, Payment.status == PaymentStatus.REFUNDED),
+            pending_amount=sum_if(
+                Payment.total_amount - Payment.amount_paid,
+                Payment.status.in_([PaymentStatus.PENDING, PaymentStatus.PARTIALLY_PAID])
+            )
+        )
+        total_payments = totals['total']
+        pending_count = totals['pending']
+        partially_paid_count = totals['partially_paid']
+        paid_count = totals['paid']
+        refunded_count = totals['refunded']
+        cash_count = totals['cash']
+        visa_count = totals['visa']
+        bank_transfer_count = totals['bank_transfer']
+        total_revenue = totals['revenue']
+        total_refunds = totals['refunds']
+        pending_amount = totals['pending_amount']
         
         return jsonify({
             'total': total_payments,
@@ -482,35 +456,36 @@ def export_payments():
     if date:
         try:
             date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-            query = query.filter(db.func.date(Payment.created_at) == date_obj)
+            query = query.filter(date_filter(Payment.created_at, date_obj))
         except ValueError:
             return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     elif start_date or end_date:
         if start_date:
             try:
                 start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-                query = query.filter(db.func.date(Payment.created_at) >= start_date_obj)
+                query = query.filter(date_range_filter(Payment.created_at, start_date_obj))
             except ValueError:
                 return jsonify({'message': 'Invalid start_date format. Use YYYY-MM-DD'}), 400
         if end_date:
             try:
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-                query = query.filter(db.func.date(Payment.created_at) <= end_date_obj)
+                query = query.filter(date_range_filter(Payment.created_at, end_date=end_date_obj))
             except ValueError:
                 return jsonify({'message': 'Invalid end_date format. Use YYYY-MM-DD'}), 400
     
-    # Get payments with related data (already joined Visit above, now eager load relationships)
-    payments = query.options(
-        db.joinedload(Payment.visit).joinedload(Visit.patient),
-        db.joinedload(Payment.visit).joinedload(Visit.doctor),
-        db.joinedload(Payment.visit).joinedload(Visit.clinic),
-        db.joinedload(Payment.visit).joinedload(Visit.service)
-    ).all()
+    # Select only the exported columns (already joined Visit above) and stream them
+    query = query.outerjoin(Patient, Visit.patient_id == Patient.id) \
+        .outerjoin(Doctor, Visit.doctor_id == Doctor.id) \
+        .outerjoin(Clinic, Visit.clinic_id == Clinic.id) \
+        .outerjoin(Service, Visit.service_id == Service.id) \
+        .with_entities(
+            Payment.id, Payment.created_at, Patient.name, Patient.phone, Doctor.name, Clinic.name,
+            Service.name, Payment.total_amount, Payment.discount_amount, Payment.amount_paid,
+            Payment.payment_method, Payment.status
+        ).order_by(Payment.id)
     
-    # Create workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Payments"
+    # Create workbook (write-only, rows are spooled to disk)
+    export = XlsxExport("Payments", column_widths=[12, 18, 20, 15, 20, 20, 20, 14, 12, 12, 12, 15, 15])
     
     # Define header styles
     header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
@@ -521,58 +496,46 @@ def export_payments():
         'Payment ID', 'Date', 'Patient Name', 'Phone', 'Doctor', 'Clinic', 'Service',
         'Total Amount', 'Discount', 'Amount Paid', 'Remaining', 'Payment Method', 'Status'
     ]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center')
+    export.append([
+        export.cell(header, font=header_font, fill=header_fill, alignment=Alignment(horizontal='center'))
+        for header in headers
+    ])
     
     # Write data
-    for row_num, payment in enumerate(payments, 2):
-        visit = payment.visit
-        patient = visit.patient if visit else None
-        doctor = visit.doctor if visit else None
-        clinic = visit.clinic if visit else None
-        service = visit.service if visit else None
-        
-        ws.cell(row=row_num, column=1, value=payment.id)
-        ws.cell(row=row_num, column=2, value=payment.created_at.strftime('%Y-%m-%d %H:%M') if payment.created_at else '')
-        ws.cell(row=row_num, column=3, value=patient.name if patient else '')
-        ws.cell(row=row_num, column=4, value=patient.phone if patient else '')
-        ws.cell(row=row_num, column=5, value=f"Dr. {doctor.name}" if doctor else '')
-        ws.cell(row=row_num, column=6, value=clinic.name if clinic else '')
-        ws.cell(row=row_num, column=7, value=service.name if service else '')
-        ws.cell(row=row_num, column=8, value=float(payment.total_amount))
-        ws.cell(row=row_num, column=9, value=float(payment.discount_amount))
-        ws.cell(row=row_num, column=10, value=float(payment.amount_paid))
-        ws.cell(row=row_num, column=11, value=payment.remaining_amount)
-        ws.cell(row=row_num, column=12, value=payment.payment_method.value if payment.payment_method else '')
-        ws.cell(row=row_num, column=13, value=payment.status.value if payment.status else '')
+    for (payment_id, created_at, patient_name, phone, doctor_name, clinic_name, service_name,
+         total_amount, discount_amount, amount_paid, payment_method, payment_status) in stream_rows(query):
+        total_amount = float(total_amount)
+        discount_amount = float(discount_amount)
+        amount_paid = float(amount_paid)
+        export.append([
+            payment_id,
+            created_at.strftime('%Y-%m-%d %H:%M') if created_at else '',
+            patient_name or '',
+            phone or '',
+            f"Dr. {doctor_name}" if doctor_name else '',
+            clinic_name or '',
+            service_name or '',
+            total_amount,
+            discount_amount,
+            amount_paid,
+            max(0, total_amount - discount_amount - amount_paid),  # Same as Payment.remaining_amount
+            payment_method.value if payment_method else '',
+            payment_status.value if payment_status else ''
+        ])
     
     # Add total row
-    total_row = row_num + 1
-    ws.cell(row=total_row, column=7, value='TOTAL')
-    ws.cell(row=total_row, column=8, value=f'=SUM(H2:H{row_num})')  # Total Amount
-    ws.cell(row=total_row, column=9, value=f'=SUM(I2:I{row_num})')  # Discount
-    ws.cell(row=total_row, column=10, value=f'=SUM(J2:J{row_num})')  # Amount Paid
-    ws.cell(row=total_row, column=11, value=f'=SUM(K2:K{row_num})')  # Remaining
-    
-    # Style total row
-    for col in [7, 8, 9, 10, 11]:
-        cell = ws.cell(row=total_row, column=col)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
-    
-    # Adjust column widths
-    column_widths = [12, 18, 20, 15, 20, 20, 20, 14, 12, 12, 12, 15, 15]
-    for col_num, width in enumerate(column_widths, 1):
-        ws.column_dimensions[chr(64 + col_num)].width = width
-    
-    # Create in-memory file
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
+    last_row = export.row_count
+    total_style = {
+        'font': Font(bold=True),
+        'fill': PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
+    }
+    export.append([None] * 6 + [
+        export.cell('TOTAL', **total_style),
+        export.cell(f'=SUM(H2:H{last_row})', **total_style),  # Total Amount
+        export.cell(f'=SUM(I2:I{last_row})', **total_style),  # Discount
+        export.cell(f'=SUM(J2:J{last_row})', **total_style),  # Amount Paid
+        export.cell(f'=SUM(K2:K{last_row})', **total_style),  # Remaining
+    ])
     
     # Generate filename
     if date:
@@ -582,9 +545,4 @@ def export_payments():
     else:
         filename = f"payments_{datetime.now().strftime('%Y%m%d')}.xlsx"
     
-    return send_file(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
-    )
+    return export.response(filename)
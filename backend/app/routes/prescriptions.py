@@ -3,10 +3,10 @@ from flask_jwt_extended import jwt_required
 from app import db
 from app.models.prescription import Prescription
 from app.models.visit import Visit, VisitStatus
-from app.models.doctor import Doctor
 from app.models.user import User, UserRole
 from app.utils.decorators import doctor_required, validate_json, log_audit
 from app.utils.validators import validate_file_upload, sanitize_filename
+from app.services.identity_service import current_doctor
 import os
 from datetime import datetime
 
@@ -22,7 +22,7 @@ def create_prescription(data, current_user):
     visit = Visit.query.get_or_404(visit_id)
     
     # Check if visit belongs to current doctor
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor = current_doctor()
     if not doctor or visit.doctor_id != doctor.id:
         return jsonify({'message': 'Unauthorized to create prescription for this visit'}), 403
     
@@ -99,7 +99,7 @@ def update_prescription(prescription_id, current_user):
     prescription = Prescription.query.get_or_404(prescription_id)
     
     # Check if prescription belongs to current doctor
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor = current_doctor()
     if not doctor or prescription.visit.doctor_id != doctor.id:
         return jsonify({'message': 'Unauthorized to update this prescription'}), 403
     
@@ -141,7 +141,7 @@ def upload_prescription_image(current_user):
     
     # Get visit and check authorization
     visit = Visit.query.get_or_404(visit_id)
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor = current_doctor()
     if not doctor or visit.doctor_id != doctor.id:
         return jsonify({'message': 'Unauthorized to upload image for this visit'}), 403
     
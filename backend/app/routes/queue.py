@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from app import db, socketio
 from app.models.appointment import Appointment, AppointmentStatus
 from app.models.visit import Visit, VisitStatus, VisitType
@@ -7,27 +7,29 @@ from app.models.patient import Patient
 from app.models.doctor import Doctor
 from app.models.clinic import Clinic
 from app.models.service import Service
-from app.models.user import User, UserRole
+from app.models.user import UserRole
 from app.utils.decorators import receptionist_required, doctor_required
 from app.services.queue_service import QueueService
+from app.services.identity_service import current_identity, current_doctor
 from datetime import datetime, timedelta
 
 queue_bp = Blueprint('queue', __name__)
 
+# Most visits or appointments a batch endpoint accepts at once
+MAX_BATCH_SIZE = 100
+
 @queue_bp.route('/clinic/<int:clinic_id>', methods=['GET'])
 @jwt_required()
 def get_clinic_queue(clinic_id):
     """Get queue for a specific clinic with optional date range filtering"""
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_identity()
     
     if not user:
         return jsonify({'message': 'User not found'}), 401
     
     # Check if user has access to this clinic
     if user.role == UserRole.DOCTOR:
-        doctor = Doctor.query.filter_by(user_id=user.id).first()
-        if not doctor or doctor.clinic_id != clinic_id:
+        if not user.doctor_id or user.clinic_id != clinic_id:
             return jsonify({'message': 'Access denied to this clinic'}), 403
     elif user.role not in [UserRole.RECEPTIONIST, UserRole.ADMIN]:
         return jsonify({'message': 'Insufficient permissions'}), 403
@@ -58,15 +60,14 @@ def get_clinic_queue(clinic_id):
 @jwt_required()
 def get_doctor_queue(user_id):
     """Get queue for a specific doctor by user_id"""
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_identity()
     
     if not user:
         return jsonify({'message': 'User not found'}), 401
     
     # Check if user has access to this doctor
     if user.role == UserRole.DOCTOR:
-        doctor = Doctor.query.filter_by(user_id=user.id).first()
+        doctor = current_doctor()
         if not doctor:
             return jsonify({'message': 'Doctor profile not found'}), 404
         # Use the doctor's actual ID
@@ -136,15 +137,6 @@ def checkin_patient(current_user):
     
     db.session.commit()
     
-    # Emit real-time updates
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(appointment.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{appointment.clinic_id}')
-    
-    # Emit to doctor room
-    doctor_queue_data = queue_service.get_doctor_queue(appointment.doctor_id)
-    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{appointment.doctor_id}')
-    
     # Emit new check-in event
     socketio.emit('new_checkin', {
         'visit': visit.to_dict(),
@@ -163,8 +155,7 @@ def checkin_patient(current_user):
 @jwt_required()
 def call_patient():
     """Call a patient from the queue"""
-    current_user_id = int(get_jwt_identity())
-    current_user = User.query.get(current_user_id)
+    current_user = current_identity()
     
     if not current_user:
         return jsonify({'message': 'User not found'}), 401
@@ -185,7 +176,7 @@ def call_patient():
     
     # Check if user has access to this visit
     if current_user.role == UserRole.DOCTOR:
-        doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+        doctor = current_doctor()
         if not doctor or doctor.id != visit.doctor_id:
             return jsonify({'message': 'Access denied to this visit'}), 403
     
@@ -199,14 +190,6 @@ def call_patient():
     
     db.session.commit()
     
-    # Emit real-time updates
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
-    
-    doctor_queue_data = queue_service.get_doctor_queue(visit.doctor_id)
-    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{visit.doctor_id}')
-    
     return jsonify({
         'message': 'Patient called successfully',
         'visit': visit.to_dict()
@@ -229,7 +212,7 @@ def start_consultation(current_user):
     
     # Check if user has access to this visit
     if current_user.role == UserRole.DOCTOR:
-        doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+        doctor = current_doctor()
         if not doctor or doctor.id != visit.doctor_id:
             return jsonify({'message': 'Access denied to this visit'}), 403
     
@@ -244,14 +227,6 @@ def start_consultation(current_user):
     
     db.session.commit()
     
-    # Emit real-time updates
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
-    
-    doctor_queue_data = queue_service.get_doctor_queue(visit.doctor_id)
-    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{visit.doctor_id}')
-    
     return jsonify({
         'message': 'Consultation started successfully',
         'visit': visit.to_dict()
@@ -262,8 +237,7 @@ def start_consultation(current_user):
 def complete_consultation():
     """Complete consultation with a patient"""
     from flask import current_app
-    current_user_id = int(get_jwt_identity())
-    current_user = User.query.get(current_user_id)
+    current_user = current_identity()
     
     if not current_user:
         return jsonify({'message': 'User not found'}), 401
@@ -291,7 +265,7 @@ def complete_consultation():
     
     # Check if user has access to this visit
     if current_user.role == UserRole.DOCTOR:
-        doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+        doctor = current_doctor()
         if not doctor or doctor.id != visit.doctor_id:
             return jsonify({'message': 'Access denied to this visit'}), 403
     
@@ -307,18 +281,107 @@ def complete_consultation():
         current_app.logger.error(f"Unexpected error completing consultation: {str(e)}")
         return jsonify({'message': f'Unexpected error: {str(e)}'}), 500
     
-    # Emit real-time updates
-    queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
-    
-    doctor_queue_data = queue_service.get_doctor_queue(visit.doctor_id)
-    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{visit.doctor_id}')
-    
     return jsonify({
         'message': 'Consultation completed successfully',
         'visit': visit.to_dict()
     }), 200
 
+def batch_ids(data, key):
+    """A non-empty list of ids from a batch request body, or None"""
+    ids = data.get(key) if data else None
+    if not isinstance(ids, list) or not ids or len(ids) > MAX_BATCH_SIZE:
+        return None
+    return ids
+
+def emit_phase_updates(visits):
+    """One phases_updated event per affected clinic and doctor room for a batch of visits"""
+    queue_service = QueueService()
+    groups = {}
+    for visit in visits:
+        appointment_date = visit.appointment.start_time.date() if visit.appointment else datetime.now().date()
+        groups.setdefault((visit.clinic_id, appointment_date), set()).add(visit.doctor_id)
+    
+    for (clinic_id, appointment_date), doctor_ids in groups.items():
+        phases = queue_service.get_queue_phases(appointment_date, clinic_id)
+        socketio.emit('phases_updated', {
+            'phases': phases,
+            'clinic_id': clinic_id,
+            'date': appointment_date.isoformat()
+        }, room=f'clinic_{clinic_id}')
+        for doctor_id in doctor_ids:
+            socketio.emit('phases_updated', {
+                'phases': phases,
+                'clinic_id': clinic_id,
+                'doctor_id': doctor_id,
+                'date': appointment_date.isoformat()
+            }, room=f'doctor_{doctor_id}')
+
+@queue_bp.route('/checkin/batch', methods=['POST'])
+@receptionist_required
+def checkin_patients(current_user):
+    """Check in several patients at once (e.g. the pre-booked patients at opening)"""
+    appointment_ids = batch_ids(request.get_json(), 'appointment_ids')
+    if appointment_ids is None:
+        return jsonify({'message': f'appointment_ids must be a list of 1-{MAX_BATCH_SIZE} ids'}), 400
+    
+    queue_service = QueueService()
+    visits, errors = queue_service.check_in_many(appointment_ids)
+    
+    # Queue rooms get the new visits as one queue_delta per room
+    for clinic_id in {visit.clinic_id for visit in visits}:
+        socketio.emit('new_checkin', {
+            'visits': [visit.to_dict() for visit in visits if visit.clinic_id == clinic_id],
+            'clinic_id': clinic_id
+        }, room=f'clinic_{clinic_id}')
+    
+    return jsonify({
+        'message': f'{len(visits)} patients checked in',
+        'visits': [visit.to_dict() for visit in visits],
+        'errors': errors
+    }), 200
+
+@queue_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def batch_queue_action():
+    """Call, start or complete several visits at once"""
+    current_user = current_identity()
+    
+    if not current_user:
+        return jsonify({'message': 'User not found'}), 401
+    
+    data = request.get_json()
+    action = data.get('action') if data else None
+    visit_ids = batch_ids(data, 'visit_ids')
+    if visit_ids is None:
+        return jsonify({'message': f'visit_ids must be a list of 1-{MAX_BATCH_SIZE} ids'}), 400
+    
+    # Same roles as the single endpoints: only receptionists start consultations
+    allowed_roles = [UserRole.RECEPTIONIST, UserRole.ADMIN]
+    if action != 'start':
+        allowed_roles.append(UserRole.DOCTOR)
+    if current_user.role not in allowed_roles:
+        return jsonify({'message': 'Insufficient permissions'}), 403
+    
+    # Doctors only act on their own visits
+    doctor_id = None
+    if current_user.role == UserRole.DOCTOR:
+        doctor = current_doctor()
+        if not doctor:
+            return jsonify({'message': 'Doctor profile not found for this user'}), 404
+        doctor_id = doctor.id
+    
+    try:
+        queue_service = QueueService()
+        visits, errors = queue_service.transition_many(visit_ids, action, doctor_id)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify({
+        'message': f'{len(visits)} visits updated',
+        'visits': [visit.to_dict() for visit in visits],
+        'errors': errors
+    }), 200
+
 @queue_bp.route('/skip', methods=['POST'])
 @receptionist_required
 def skip_patient(current_user):
@@ -336,7 +399,7 @@ def skip_patient(current_user):
     
     # Check if user has access to this visit
     if current_user.role == UserRole.DOCTOR:
-        doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+        doctor = current_doctor()
         if not doctor or doctor.id != visit.doctor_id:
             return jsonify({'message': 'Access denied to this visit'}), 403
     elif current_user.role not in [UserRole.RECEPTIONIST, UserRole.ADMIN]:
@@ -352,14 +415,6 @@ def skip_patient(current_user):
     
     db.session.commit()
     
-    # Emit real-time updates
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
-    
-    doctor_queue_data = queue_service.get_doctor_queue(visit.doctor_id)
-    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{visit.doctor_id}')
-    
     return jsonify({
         'message': 'Patient skipped successfully',
         'visit': visit.to_dict()
@@ -369,8 +424,7 @@ def skip_patient(current_user):
 @jwt_required()
 def get_upcoming_appointments():
     """Get upcoming appointments that haven't been checked in"""
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_identity()
     
     if not user:
         return jsonify({'message': 'User not found'}), 401
@@ -403,8 +457,7 @@ def get_upcoming_appointments():
 @jwt_required()
 def get_all_appointments_for_date():
     """Get all appointments for a specific date (including checked-in ones)"""
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_identity()
     
     if not user:
         return jsonify({'message': 'User not found'}), 401
@@ -452,12 +505,10 @@ def reorder_queue(current_user):
     try:
         visit = queue_service.reorder_queue(visit_id, new_position)
         
-        # Emit real-time updates
-        queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-        socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
         socketio.emit('queue_reordered', {
             'visit_id': visit_id,
             'new_position': new_position,
+            'sort_key': visit.sort_key,
             'clinic_id': visit.clinic_id
         }, room=f'clinic_{visit.clinic_id}')
         
@@ -491,9 +542,6 @@ def create_walkin_visit(current_user):
             notes=data.get('notes', '')
         )
         
-        # Emit real-time updates
-        queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-        socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
         socketio.emit('walkin_added', {
             'visit': visit.to_dict(),
             'clinic_id': visit.clinic_id
@@ -523,9 +571,6 @@ def cancel_visit(current_user):
     try:
         visit = queue_service.cancel_visit(visit_id, reason)
         
-        # Emit real-time updates
-        queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-        socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
         socketio.emit('visit_cancelled', {
             'visit_id': visit_id,
             'reason': reason,
@@ -544,8 +589,7 @@ def cancel_visit(current_user):
 @jwt_required()
 def get_queue_phases(clinic_id):
     """Get queue organized by 4 phases for the selected date"""
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_identity()
     
     if not user:
         return jsonify({'message': 'User not found'}), 401
@@ -553,11 +597,10 @@ def get_queue_phases(clinic_id):
     # Check if user has access to this clinic
     doctor_id = None
     if user.role == UserRole.DOCTOR:
-        doctor = Doctor.query.filter_by(user_id=user.id).first()
-        if not doctor or doctor.clinic_id != clinic_id:
+        if not user.doctor_id or user.clinic_id != clinic_id:
             return jsonify({'message': 'Access denied to this clinic'}), 403
         # Auto-filter by doctor's ID for doctors
-        doctor_id = doctor.id
+        doctor_id = user.doctor_id
     elif user.role not in [UserRole.RECEPTIONIST, UserRole.ADMIN]:
         return jsonify({'message': 'Insufficient permissions'}), 403
     else:
@@ -577,32 +620,9 @@ def get_queue_phases(clinic_id):
     try:
         queue_service = QueueService()
         
-        # Get all appointments for the selected date with optional doctor filter
-        appointments = queue_service.get_all_appointments_for_date(selected_date, clinic_id, doctor_id)
-        
-        # Organize into 4 phases
-        phases = {
-            'appointments_today': [],  # Scheduled appointments
-            'waiting': [],            # Checked in, waiting
-            'with_doctor': [],        # In progress
-            'completed': []           # Completed
-        }
-        
-        for apt in appointments:
-            queue_phase = apt.get('queue_phase', 'appointments_today')
-            
-            if queue_phase == 'appointments_today':
-                phases['appointments_today'].append(apt)
-            elif queue_phase == 'waiting':
-                phases['waiting'].append(apt)
-            elif queue_phase == 'with_doctor':
-                phases['with_doctor'].append(apt)
-            elif queue_phase == 'completed':
-                phases['completed'].append(apt)
-        
-        # Sort appointments by time
-        for phase in phases.values():
-            phase.sort(key=lambda x: x.get('start_time', ''))
+        # Get all appointments for the selected date organized into 4 phases
+        # (already ordered by start time)
+        phases = queue_service.get_queue_phases(selected_date, clinic_id, doctor_id)
         
         return jsonify({
             'phases': phases,
@@ -622,8 +642,7 @@ def move_patient_phase():
     from flask import current_app
     from app.models.payment import Payment, PaymentStatus
     
-    current_user_id = int(get_jwt_identity())
-    current_user = User.query.get(current_user_id)
+    current_user = current_identity()
     
     if not current_user:
         return jsonify({'message': 'User not found'}), 401
@@ -683,7 +702,7 @@ def move_patient_phase():
         
         # Doctor can only move their own appointments
         if is_doctor and visit:
-            doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+            doctor = current_doctor()
             if not doctor:
                 return jsonify({'message': 'Doctor profile not found for this user'}), 404
             if visit.doctor_id != doctor.id:
@@ -778,13 +797,6 @@ def move_patient_phase():
         
         db.session.commit()
         
-        # Emit real-time updates
-        queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-        socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
-        
-        doctor_queue_data = queue_service.get_doctor_queue(visit.doctor_id)
-        socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{visit.doctor_id}')
-        
         # Emit current_appointment_available event when moving to with_doctor
         # This triggers auto-navigation for the doctor
         if to_phase == 'with_doctor' and visit:
@@ -815,19 +827,7 @@ def move_patient_phase():
         if not appointment_date:
             appointment_date = datetime.now().date()
         
-        phases_data = queue_service.get_all_appointments_for_date(appointment_date, visit.clinic_id)
-        
-        # Organize into phases
-        phases = {
-            'appointments_today': [],
-            'waiting': [],
-            'with_doctor': [],
-            'completed': []
-        }
-        for apt in phases_data:
-            queue_phase = apt.get('queue_phase', 'appointments_today')
-            if queue_phase in phases:
-                phases[queue_phase].append(apt)
+        phases = queue_service.get_queue_phases(appointment_date, visit.clinic_id)
         
         socketio.emit('phases_updated', {
             'phases': phases,
@@ -869,20 +869,71 @@ def move_patient_phase():
         current_app.logger.error(f"Error moving patient phase: {str(e)}")
         return jsonify({'message': f'Error moving patient: {str(e)}'}), 500
 
+@queue_bp.route('/phases/move/batch', methods=['POST'])
+@jwt_required()
+def move_patient_phases():
+    """Move several patients between phases in one transaction"""
+    current_user = current_identity()
+    
+    if not current_user:
+        return jsonify({'message': 'User not found'}), 401
+    
+    # Allow receptionist, admin, and doctor roles
+    if current_user.role not in [UserRole.RECEPTIONIST, UserRole.ADMIN, UserRole.DOCTOR]:
+        return jsonify({'message': 'Insufficient permissions'}), 403
+    
+    moves = batch_ids(request.get_json(), 'moves')
+    if moves is None or not all(isinstance(move, dict) for move in moves):
+        return jsonify({'message': f'moves must be a list of 1-{MAX_BATCH_SIZE} moves'}), 400
+    
+    is_doctor = current_user.role == UserRole.DOCTOR
+    doctor_id = None
+    if is_doctor:
+        doctor = current_doctor()
+        if not doctor:
+            return jsonify({'message': 'Doctor profile not found for this user'}), 404
+        doctor_id = doctor.id
+    
+    # Role restrictions of /phases/move, per move
+    allowed, errors = [], []
+    for index, move in enumerate(moves):
+        from_phase, to_phase = move.get('from_phase'), move.get('to_phase')
+        if not from_phase or not to_phase:
+            errors.append({'index': index, 'message': 'from_phase and to_phase are required'})
+        elif is_doctor and to_phase == 'with_doctor':
+            errors.append({'index': index, 'message': 'Only receptionists can start consultations.'})
+        elif is_doctor and from_phase == 'appointments_today':
+            errors.append({'index': index, 'message': 'Only receptionists can check in patients.'})
+        elif not is_doctor and from_phase == 'with_doctor' and to_phase == 'completed':
+            errors.append({'index': index, 'message': 'Only doctors can complete consultations.'})
+        else:
+            allowed.append(index)
+    
+    queue_service = QueueService()
+    visits, move_errors = queue_service.move_phases_many([moves[index] for index in allowed], doctor_id)
+    errors.extend(dict(error, index=allowed[error['index']]) for error in move_errors)
+    errors.sort(key=lambda error: error['index'])
+    
+    emit_phase_updates(visits)
+    
+    return jsonify({
+        'message': f'{len(visits)} patients moved',
+        'visits': [visit.to_dict() for visit in visits],
+        'errors': errors
+    }), 200
+
 @queue_bp.route('/statistics/<int:clinic_id>', methods=['GET'])
 @jwt_required()
 def get_queue_statistics(clinic_id):
     """Get queue statistics for a clinic"""
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_identity()
     
     if not user:
         return jsonify({'message': 'User not found'}), 401
     
     # Check if user has access to this clinic
     if user.role == UserRole.DOCTOR:
-        doctor = Doctor.query.filter_by(user_id=user.id).first()
-        if not doctor or doctor.clinic_id != clinic_id:
+        if not user.doctor_id or user.clinic_id != clinic_id:
             return jsonify({'message': 'Access denied to this clinic'}), 403
     elif user.role not in [UserRole.RECEPTIONIST, UserRole.ADMIN]:
         return jsonify({'message': 'Insufficient permissions'}), 403
@@ -6,10 +6,14 @@ from app.models.visit import Visit
 from app.models.appointment import Appointment
 from app.models.doctor import Doctor
 from app.models.clinic import Clinic
+from app.models.patient import Patient
+from app.models.service import Service
 from app.utils.decorators import receptionist_required, doctor_required
+from app.utils.helpers import date_range_filter
+from app.utils.exports import stream_rows, csv_response
+from app.services.report_rollup_service import report_rollups
+from app.services.identity_service import current_identity
 from datetime import datetime, timedelta
-import csv
-import io
 
 reports_bp = Blueprint('reports', __name__)
 
@@ -34,50 +38,36 @@ def get_revenue_report():
     except ValueError:
         return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
-    # Build query with join to Visit for filtering
-    query = db.session.query(Payment).join(Visit, Payment.visit_id == Visit.id).filter(
-        Payment.status == PaymentStatus.PAID,
-        db.func.date(Payment.created_at) >= start_date_obj,
-        db.func.date(Payment.created_at) <= end_date_obj
-    )
-    
-    if clinic_id:
-        query = query.filter(Visit.clinic_id == clinic_id)
-    if doctor_id:
-        query = query.filter(Visit.doctor_id == doctor_id)
-    
-    payments = query.all()
+    rows = report_rollups.revenue_by_doctor(start_date_obj, end_date_obj, clinic_id, doctor_id)
     
     # Calculate totals
-    total_revenue = sum(float(payment.amount_paid) for payment in payments)
-    total_doctor_share = sum(float(payment.doctor_share) for payment in payments)
-    total_center_share = sum(float(payment.center_share) for payment in payments)
+    payment_count = sum(int(count or 0) for _, count, _, _, _ in rows)
+    total_revenue = sum(float(revenue or 0) for _, _, revenue, _, _ in rows)
+    total_doctor_share = sum(float(share or 0) for _, _, _, share, _ in rows)
+    total_center_share = sum(float(share or 0) for _, _, _, _, share in rows)
     
     # Group by doctor
     doctor_revenue = {}
-    for payment in payments:
-        if not payment.visit or not payment.visit.doctor:
-            continue
-        doctor_name = payment.visit.doctor.name
-        if doctor_name not in doctor_revenue:
-            doctor_revenue[doctor_name] = {
+    for doctor, count, revenue, doctor_share, center_share in rows:
+        if doctor.name not in doctor_revenue:
+            doctor_revenue[doctor.name] = {
                 'total_revenue': 0,
                 'doctor_share': 0,
                 'center_share': 0,
                 'visit_count': 0
             }
         
-        doctor_revenue[doctor_name]['total_revenue'] += float(payment.amount_paid)
-        doctor_revenue[doctor_name]['doctor_share'] += float(payment.doctor_share)
-        doctor_revenue[doctor_name]['center_share'] += float(payment.center_share)
-        doctor_revenue[doctor_name]['visit_count'] += 1
+        doctor_revenue[doctor.name]['total_revenue'] += float(revenue or 0)
+        doctor_revenue[doctor.name]['doctor_share'] += float(doctor_share or 0)
+        doctor_revenue[doctor.name]['center_share'] += float(center_share or 0)
+        doctor_revenue[doctor.name]['visit_count'] += int(count or 0)
     
     return jsonify({
         'summary': {
             'total_revenue': total_revenue,
             'total_doctor_share': total_doctor_share,
             'total_center_share': total_center_share,
-            'payment_count': len(payments)
+            'payment_count': payment_count
         },
         'by_doctor': doctor_revenue,
         'date_range': {
@@ -107,63 +97,43 @@ def get_visits_report():
     except ValueError:
         return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
-    # Build query
-    query = db.session.query(Visit).filter(
-        db.func.date(Visit.created_at) >= start_date_obj,
-        db.func.date(Visit.created_at) <= end_date_obj
-    )
-    
-    if clinic_id:
-        query = query.filter(Visit.clinic_id == clinic_id)
-    if doctor_id:
-        query = query.filter(Visit.doctor_id == doctor_id)
-    
-    visits = query.all()
-    
     # Group by clinic
     clinic_stats = {}
-    for visit in visits:
-        if not visit.clinic:
-            continue
-        clinic_name = visit.clinic.name
-        if clinic_name not in clinic_stats:
-            clinic_stats[clinic_name] = {
+    for clinic, total, scheduled, walk_in, completed in report_rollups.visits_by_clinic(
+            start_date_obj, end_date_obj, clinic_id, doctor_id):
+        if clinic.name not in clinic_stats:
+            clinic_stats[clinic.name] = {
                 'total_visits': 0,
                 'scheduled_visits': 0,
                 'walk_in_visits': 0,
                 'completed_visits': 0
             }
         
-        clinic_stats[clinic_name]['total_visits'] += 1
-        if visit.visit_type.value == 'scheduled':
-            clinic_stats[clinic_name]['scheduled_visits'] += 1
-        else:
-            clinic_stats[clinic_name]['walk_in_visits'] += 1
-        
-        if visit.status.value == 'completed':
-            clinic_stats[clinic_name]['completed_visits'] += 1
+        clinic_stats[clinic.name]['total_visits'] += int(total or 0)
+        clinic_stats[clinic.name]['scheduled_visits'] += int(scheduled or 0)
+        clinic_stats[clinic.name]['walk_in_visits'] += int(walk_in or 0)
+        clinic_stats[clinic.name]['completed_visits'] += int(completed or 0)
     
     # Group by doctor
     doctor_stats = {}
-    for visit in visits:
-        if not visit.doctor:
-            continue
-        doctor_name = visit.doctor.name
-        if doctor_name not in doctor_stats:
-            doctor_stats[doctor_name] = {
+    total_visits = 0
+    for doctor, total, completed in report_rollups.visits_by_doctor(
+            start_date_obj, end_date_obj, clinic_id, doctor_id):
+        total_visits += int(total or 0)
+        if doctor.name not in doctor_stats:
+            doctor_stats[doctor.name] = {
                 'total_visits': 0,
                 'completed_visits': 0,
-                'specialty': visit.doctor.specialty
+                'specialty': doctor.specialty
             }
         
-        doctor_stats[doctor_name]['total_visits'] += 1
-        if visit.status.value == 'completed':
-            doctor_stats[doctor_name]['completed_visits'] += 1
+        doctor_stats[doctor.name]['total_visits'] += int(total or 0)
+        doctor_stats[doctor.name]['completed_visits'] += int(completed or 0)
     
     return jsonify({
         'by_clinic': clinic_stats,
         'by_doctor': doctor_stats,
-        'total_visits': len(visits),
+        'total_visits': total_visits,
         'date_range': {
             'start_date': start_date,
             'end_date': end_date
@@ -191,43 +161,27 @@ def get_doctor_shares_report():
     except ValueError:
         return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
-    # Build query with join to Visit for filtering
-    query = db.session.query(Payment).join(Visit, Payment.visit_id == Visit.id).filter(
-        Payment.status == PaymentStatus.PAID,
-        db.func.date(Payment.created_at) >= start_date_obj,
-        db.func.date(Payment.created_at) <= end_date_obj
-    )
-    
-    if clinic_id:
-        query = query.filter(Visit.clinic_id == clinic_id)
-    if doctor_id:
-        query = query.filter(Visit.doctor_id == doctor_id)
-    
-    # Get payments in date range
-    payments = query.all()
+    rows = report_rollups.revenue_by_doctor(start_date_obj, end_date_obj, clinic_id, doctor_id)
     
     # Calculate totals
-    total_revenue = sum(float(payment.amount_paid) for payment in payments)
-    total_doctor_share = sum(float(payment.doctor_share) for payment in payments)
-    total_center_share = sum(float(payment.center_share) for payment in payments)
+    total_revenue = sum(float(revenue or 0) for _, _, revenue, _, _ in rows)
+    total_doctor_share = sum(float(share or 0) for _, _, _, share, _ in rows)
+    total_center_share = sum(float(share or 0) for _, _, _, _, share in rows)
     
     # Group by doctor
     doctor_shares = {}
-    for payment in payments:
-        if not payment.visit or not payment.visit.doctor:
-            continue
-        doctor_name = payment.visit.doctor.name
-        if doctor_name not in doctor_shares:
-            doctor_shares[doctor_name] = {
+    for doctor, _, revenue, doctor_share, center_share in rows:
+        if doctor.name not in doctor_shares:
+            doctor_shares[doctor.name] = {
                 'total_revenue': 0,
                 'doctor_share': 0,
                 'center_share': 0,
-                'share_percentage': payment.visit.doctor.share_percentage
+                'share_percentage': doctor.share_percentage
             }
         
-        doctor_shares[doctor_name]['total_revenue'] += float(payment.amount_paid)
-        doctor_shares[doctor_name]['doctor_share'] += float(payment.doctor_share)
-        doctor_shares[doctor_name]['center_share'] += float(payment.center_share)
+        doctor_shares[doctor.name]['total_revenue'] += float(revenue or 0)
+        doctor_shares[doctor.name]['doctor_share'] += float(doctor_share or 0)
+        doctor_shares[doctor.name]['center_share'] += float(center_share or 0)
     
     return jsonify({
         'summary': {
@@ -248,11 +202,9 @@ def get_doctor_shares_report():
 @jwt_required()
 def export_report():
     """Export report as CSV"""
-    from flask_jwt_extended import get_jwt_identity
-    from app.models.user import User, UserRole
+    from app.models.user import UserRole
     
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    user = current_identity()
     
     if not user:
         return jsonify({'message': 'User not found'}), 401
@@ -279,82 +231,63 @@ def export_report():
     except ValueError:
         return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
     if report_type == 'revenue':
-        # Revenue report
-        writer.writerow(['Date', 'Doctor', 'Patient', 'Service', 'Amount Paid', 'Doctor Share', 'Center Share'])
+        # Revenue report (payments whose visit lacks a doctor, patient or service are skipped)
+        header = ['Date', 'Doctor', 'Patient', 'Service', 'Amount Paid', 'Doctor Share', 'Center Share']
         
         # Build query with join to Visit for filtering
-        query = db.session.query(Payment).join(Visit, Payment.visit_id == Visit.id).filter(
-            Payment.status == PaymentStatus.PAID,
-            db.func.date(Payment.created_at) >= start_date_obj,
-            db.func.date(Payment.created_at) <= end_date_obj
-        )
+        query = db.session.query(
+            Payment.created_at, Doctor.name, Patient.name, Service.name,
+            Payment.amount_paid, Payment.doctor_share, Payment.center_share
+        ).join(Visit, Payment.visit_id == Visit.id) \
+            .join(Doctor, Visit.doctor_id == Doctor.id) \
+            .join(Patient, Visit.patient_id == Patient.id) \
+            .join(Service, Visit.service_id == Service.id) \
+            .filter(
+                Payment.status == PaymentStatus.PAID,
+                date_range_filter(Payment.created_at, start_date_obj, end_date_obj)
+            )
         
         if clinic_id:
             query = query.filter(Visit.clinic_id == clinic_id)
         if doctor_id:
             query = query.filter(Visit.doctor_id == doctor_id)
         
-        payments = query.all()
-        
-        for payment in payments:
-            if not payment.visit or not payment.visit.doctor or not payment.visit.patient or not payment.visit.service:
-                continue
-            writer.writerow([
-                payment.created_at.strftime('%Y-%m-%d'),
-                payment.visit.doctor.name,
-                payment.visit.patient.name,
-                payment.visit.service.name,
-                payment.amount_paid,
-                payment.doctor_share,
-                payment.center_share
-            ])
+        rows = (
+            [created_at.strftime('%Y-%m-%d'), doctor_name, patient_name, service_name,
+             amount_paid, doctor_share, center_share]
+            for created_at, doctor_name, patient_name, service_name, amount_paid, doctor_share, center_share
+            in stream_rows(query.order_by(Payment.created_at, Payment.id))
+        )
     
     elif report_type == 'visits':
-        # Visits report
-        writer.writerow(['Date', 'Clinic', 'Doctor', 'Patient', 'Service', 'Visit Type', 'Status'])
+        # Visits report (visits without a clinic, doctor, patient or service are skipped)
+        header = ['Date', 'Clinic', 'Doctor', 'Patient', 'Service', 'Visit Type', 'Status']
         
         # Build query with filters
-        query = db.session.query(Visit).filter(
-            db.func.date(Visit.created_at) >= start_date_obj,
-            db.func.date(Visit.created_at) <= end_date_obj
-        )
+        query = db.session.query(
+            Visit.created_at, Clinic.name, Doctor.name, Patient.name, Service.name,
+            Visit.visit_type, Visit.status
+        ).join(Clinic, Visit.clinic_id == Clinic.id) \
+            .join(Doctor, Visit.doctor_id == Doctor.id) \
+            .join(Patient, Visit.patient_id == Patient.id) \
+            .join(Service, Visit.service_id == Service.id) \
+            .filter(date_range_filter(Visit.created_at, start_date_obj, end_date_obj))
         
         if clinic_id:
             query = query.filter(Visit.clinic_id == clinic_id)
         if doctor_id:
             query = query.filter(Visit.doctor_id == doctor_id)
         
-        visits = query.all()
-        
-        for visit in visits:
-            if not visit.clinic or not visit.doctor or not visit.patient or not visit.service:
-                continue
-            writer.writerow([
-                visit.created_at.strftime('%Y-%m-%d'),
-                visit.clinic.name,
-                visit.doctor.name,
-                visit.patient.name,
-                visit.service.name,
-                visit.visit_type.value,
-                visit.status.value
-            ])
+        rows = (
+            [created_at.strftime('%Y-%m-%d'), clinic_name, doctor_name, patient_name, service_name,
+             visit_type.value, status.value]
+            for created_at, clinic_name, doctor_name, patient_name, service_name, visit_type, status
+            in stream_rows(query.order_by(Visit.created_at, Visit.id))
+        )
     
     else:
         return jsonify({'message': 'Invalid report type'}), 400
     
-    # Return CSV
-    output.seek(0)
-    csv_data = output.getvalue()
-    output.close()
-    
-    from flask import Response
-    return Response(
-        csv_data,
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename={report_type}_report_{start_date}_to_{end_date}.csv'}
-    )
+    # Stream CSV
+    return csv_response(header, rows, f'{report_type}_report_{start_date}_to_{end_date}.csv', bom=False)
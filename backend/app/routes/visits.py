@@ -8,7 +8,7 @@ from app.models.doctor import Doctor
 from app.models.service import Service
 from app.models.clinic import Clinic
 from app.utils.decorators import receptionist_required, doctor_required, validate_json, log_audit
-from app.utils.helpers import get_next_queue_number
+from app.utils.helpers import get_next_queue_number, date_filter
 from app.services.queue_service import QueueService
 from datetime import datetime
 
@@ -54,7 +54,7 @@ def get_visits():
     if date:
         try:
             date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-            query = query.filter(db.func.date(Visit.created_at) == date_obj)
+            query = query.filter(date_filter(Visit.created_at, date_obj))
         except ValueError:
             return jsonify({'message': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
@@ -119,12 +119,6 @@ def check_in_patient(data, current_user):
     
     db.session.commit()
     
-    # Emit queue update via SocketIO
-    from app import socketio
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(appointment.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{appointment.clinic_id}')
-    
     return jsonify({
         'message': 'Patient checked in successfully',
         'visit': visit.to_dict(),
@@ -155,12 +149,6 @@ def create_walkin_visit(data, current_user):
     db.session.add(visit)
     db.session.commit()
     
-    # Emit queue update via SocketIO
-    from app import socketio
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(data['clinic_id'])
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{data["clinic_id"]}')
-    
     return jsonify({
         'message': 'Walk-in visit created successfully',
         'visit': visit.to_dict(),
@@ -219,15 +207,7 @@ def update_visit_status(visit_id, data, current_user):
     
     db.session.commit()
     
-    # Emit queue update
     from app import socketio
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
-    
-    # Emit doctor queue update
-    doctor_queue_data = queue_service.get_doctor_queue(visit.doctor_id)
-    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{visit.doctor_id}')
     
     # Emit visit status change event to both rooms
     visit_status_data = {
@@ -257,15 +237,7 @@ def call_patient(visit_id, current_user):
     visit.status = VisitStatus.CALLED
     db.session.commit()
     
-    # Emit queue update
     from app import socketio
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(visit.clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{visit.clinic_id}')
-    
-    # Emit doctor queue update
-    doctor_queue_data = queue_service.get_doctor_queue(visit.doctor_id)
-    socketio.emit('queue_updated', doctor_queue_data, room=f'doctor_{visit.doctor_id}')
     
     # Emit visit status change event to both rooms
     visit_status_data = {
@@ -0,0 +1,392 @@
+"""
+In-memory slot availability index
+
+Each doctor/day is represented as two 48-bit masks, one bit per half-hour slot
+(bit 0 = 00:00, bit 1 = 00:30, ..., bit 47 = 23:30):
+
+- schedule_mask: slots inside the doctor's DoctorSchedule hours (or the legacy
+  working_days/working_hours JSON when the day has no schedule rows)
+- booked_mask: slots overlapped by CONFIRMED/CHECKED_IN appointments
+
+Days are loaded lazily with one query and then kept up to date from committed
+session changes, so repeated availability lookups do not touch the database.
+The index is per process; entries expire after AVAILABILITY_INDEX_TTL seconds so
+changes committed by other workers are picked up. Booking still validates
+against the database, so a stale entry can only affect what the UI offers.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.doctor import Doctor
+from app.models.doctor_schedule import DoctorSchedule
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 48
+FULL_DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+
+# Appointment statuses that occupy a slot
+BLOCKING_STATUSES = (AppointmentStatus.CONFIRMED, AppointmentStatus.CHECKED_IN)
+
+DAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+
+def to_schedule_day(date):
+    """Convert a date to the DoctorSchedule day format (Sunday=0, Saturday=6)"""
+    return (date.weekday() + 1) % 7
+
+
+def hours_mask(hours):
+    """Build a slot mask covering whole hours"""
+    mask = 0
+    for hour in hours:
+        if 0 <= hour <= 23:
+            mask |= 0b11 << (hour * 2)
+    return mask
+
+
+def interval_mask(date, start_time, end_time):
+    """Build a slot mask for every slot on `date` overlapped by [start_time, end_time)"""
+    day_start = datetime.combine(date, datetime.min.time())
+    start_minutes = (start_time - day_start).total_seconds() / 60
+    end_minutes = (end_time - day_start).total_seconds() / 60
+    first = max(0, int(start_minutes // SLOT_MINUTES))
+    last = min(SLOTS_PER_DAY, int(-(-end_minutes // SLOT_MINUTES)))  # ceil
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def slot_label(index):
+    """Return the HH:MM start time of a slot"""
+    minutes = index * SLOT_MINUTES
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def slot_end_label(index):
+    """Return the HH:MM end time of a slot (23:30 ends at 00:00)"""
+    return slot_label((index + 1) % SLOTS_PER_DAY)
+
+
+def past_slots_mask(date, now):
+    """
+    Slots on `date` that are already in the past at `now`
+
+    Matches the booking screen's rule: slots in earlier hours are past, and a
+    slot in the current hour is past once it started more than 15 minutes ago.
+    """
+    if date != now.date():
+        return 0
+    mask = 0
+    for index in range(SLOTS_PER_DAY):
+        slot_hour, slot_minute = divmod(index * SLOT_MINUTES, 60)
+        if slot_hour < now.hour or (slot_hour == now.hour and slot_minute < now.minute - 15):
+            mask |= 1 << index
+    return mask
+
+
+def working_hours_mask(doctor):
+    """Slot mask for the doctor's legacy working_hours JSON (default 09:00-17:00)"""
+    try:
+        working_hours = doctor.get_working_hours()
+        if working_hours and isinstance(working_hours, dict):
+            start_hour = int(working_hours.get('start', '09:00').split(':')[0])
+            end_hour = int(working_hours.get('end', '17:00').split(':')[0])
+        else:
+            start_hour, end_hour = 9, 17
+    except (ValueError, AttributeError, KeyError):
+        start_hour, end_hour = 9, 17
+    return hours_mask(range(start_hour, end_hour))
+
+
+def week_masks(doctor, schedule_hours):
+    """
+    Build the seven day masks (Sunday=0) for a doctor
+
+    schedule_hours maps day_of_week to the available DoctorSchedule hours. Days
+    without schedule rows fall back to working_hours, but only on working_days:
+    booking validation rejects other days, so their slots could never be booked.
+    """
+    fallback_mask = working_hours_mask(doctor)
+    working_days = doctor.working_days or []
+    day_masks = []
+    for day_of_week in range(7):
+        mask = hours_mask(schedule_hours.get(day_of_week, ()))
+        if not mask and DAY_NAMES[day_of_week] in working_days:
+            mask = fallback_mask
+        day_masks.append(mask)
+    return day_masks
+
+
+class DoctorWeek:
+    """Cached weekly schedule for a doctor"""
+
+    def __init__(self, is_active, day_masks, loaded_at):
+        self.is_active = is_active
+        self.day_masks = day_masks  # indexed by DoctorSchedule day (Sunday=0)
+        self.loaded_at = loaded_at
+
+
+class DayAvailability:
+    """Slot masks for one doctor on one day"""
+
+    def __init__(self, schedule_mask, appointment_masks, loaded_at):
+        self.schedule_mask = schedule_mask
+        self.appointment_masks = appointment_masks  # {appointment_id: mask}
+        self.loaded_at = loaded_at
+        self._recompute()
+
+    def _recompute(self):
+        booked = 0
+        for mask in self.appointment_masks.values():
+            booked |= mask
+        self.booked_mask = booked
+
+    def set_appointment(self, appointment_id, mask):
+        self.appointment_masks[appointment_id] = mask
+        self.booked_mask |= mask
+
+    def remove_appointment(self, appointment_id):
+        if self.appointment_masks.pop(appointment_id, None) is not None:
+            self._recompute()
+
+    @property
+    def free_mask(self):
+        return self.schedule_mask & ~self.booked_mask
+
+
+class AvailabilityIndex:
+    """Per-doctor, per-day slot bitmap index"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._weeks = {}  # doctor_id -> DoctorWeek
+        self._days = {}  # (doctor_id, date) -> DayAvailability
+        self._appointment_keys = {}  # appointment_id -> (doctor_id, date)
+        self._listening = False
+
+    def init_app(self, app):
+        """Configure the index and start following committed appointment changes"""
+        self.ttl = app.config.get('AVAILABILITY_INDEX_TTL', self.ttl)
+        self.clear()
+        if not self._listening:
+            event.listen(Session, 'after_flush', _collect_changes)
+            event.listen(Session, 'do_orm_execute', _collect_bulk_changes)
+            event.listen(Session, 'after_commit', _apply_changes)
+            event.listen(Session, 'after_soft_rollback', _discard_changes)
+            self._listening = True
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _expired(self, loaded_at):
+        return self.ttl is not None and time.monotonic() - loaded_at > self.ttl
+
+    def _get_week(self, doctor_id):
+        week = self._weeks.get(doctor_id)
+        if week is not None and not self._expired(week.loaded_at):
+            return week
+
+        doctor = db.session.get(Doctor, doctor_id)
+        if not doctor:
+            return None
+
+        rows = db.session.query(DoctorSchedule.day_of_week, DoctorSchedule.hour).filter(
+            DoctorSchedule.doctor_id == doctor_id,
+            DoctorSchedule.is_available == True
+        ).all()
+        schedule_hours = {}
+        for day_of_week, hour in rows:
+            schedule_hours.setdefault(day_of_week, set()).add(hour)
+        day_masks = week_masks(doctor, schedule_hours)
+
+        week = DoctorWeek(bool(doctor.is_active), day_masks, time.monotonic())
+        self._weeks[doctor_id] = week
+        return week
+
+    def _load_days(self, doctor_id, dates):
+        """Load the given days for a doctor with a single appointment query"""
+        week = self._get_week(doctor_id)
+        if week is None:
+            return
+        dates = sorted(dates)
+        range_start = datetime.combine(dates[0], datetime.min.time())
+        range_end = datetime.combine(dates[-1] + timedelta(days=1), datetime.min.time())
+
+        appointments = db.session.query(
+            Appointment.id, Appointment.start_time, Appointment.end_time
+        ).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.status.in_(BLOCKING_STATUSES),
+            Appointment.start_time < range_end,
+            Appointment.end_time > range_start
+        ).all()
+
+        loaded_at = time.monotonic()
+        days = {}
+        for date in dates:
+            schedule_mask = week.day_masks[to_schedule_day(date)] if week.is_active else 0
+            days[date] = DayAvailability(schedule_mask, {}, loaded_at)
+        for appointment_id, start_time, end_time in appointments:
+            date = start_time.date()
+            if date in days:
+                days[date].set_appointment(appointment_id, interval_mask(date, start_time, end_time))
+
+        for date, day in days.items():
+            self._days[(doctor_id, date)] = day
+            for appointment_id in day.appointment_masks:
+                self._appointment_keys[appointment_id] = (doctor_id, date)
+
+    def get_days(self, doctor_id, dates):
+        """Return {date: DayAvailability} for a doctor, loading missing days in one query"""
+        with self._lock:
+            missing = []
+            for date in dates:
+                day = self._days.get((doctor_id, date))
+                if day is None or self._expired(day.loaded_at):
+                    missing.append(date)
+            if missing:
+                self._load_days(doctor_id, missing)
+            if self._get_week(doctor_id) is None:
+                return None
+            return {date: self._days[(doctor_id, date)] for date in dates}
+
+    def get_day(self, doctor_id, date):
+        days = self.get_days(doctor_id, [date])
+        return days[date] if days else None
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def free_mask(self, doctor_id, date, now=None):
+        """Bookable slots for a doctor on a date (excluding past slots)"""
+        day = self.get_day(doctor_id, date)
+        if day is None:
+            return 0
+        now = now or datetime.utcnow()
+        return day.free_mask & ~past_slots_mask(date, now)
+
+    def next_free_slots(self, doctor_id, count, start_date=None, days=14, now=None):
+        """Return up to `count` free slot start datetimes over the next `days` days"""
+        now = now or datetime.utcnow()
+        start_date = start_date or now.date()
+        dates = [start_date + timedelta(days=offset) for offset in range(days)]
+        day_map = self.get_days(doctor_id, dates)
+        if not day_map:
+            return []
+
+        slots = []
+        for date in dates:
+            mask = day_map[date].free_mask & ~past_slots_mask(date, now)
+            day_start = datetime.combine(date, datetime.min.time())
+            while mask and len(slots) < count:
+                lowest = mask & -mask
+                index = lowest.bit_length() - 1
+                slots.append(day_start + timedelta(minutes=index * SLOT_MINUTES))
+                mask ^= lowest
+            if len(slots) >= count:
+                break
+        return slots
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def clear(self):
+        with self._lock:
+            self._weeks.clear()
+            self._days.clear()
+            self._appointment_keys.clear()
+
+    def invalidate_doctor(self, doctor_id):
+        """Drop the cached schedule and days of a doctor"""
+        with self._lock:
+            self._weeks.pop(doctor_id, None)
+            for key in [key for key in self._days if key[0] == doctor_id]:
+                day = self._days.pop(key)
+                for appointment_id in day.appointment_masks:
+                    self._appointment_keys.pop(appointment_id, None)
+
+    def apply_appointment(self, appointment_id, doctor_id, start_time, end_time, active):
+        """Move an appointment to its committed position in the index"""
+        with self._lock:
+            old_key = self._appointment_keys.pop(appointment_id, None)
+            if old_key is not None and old_key in self._days:
+                self._days[old_key].remove_appointment(appointment_id)
+
+            if not active or start_time is None or end_time is None:
+                return
+            date = start_time.date()
+            day = self._days.get((doctor_id, date))
+            if day is not None:
+                day.set_appointment(appointment_id, interval_mask(date, start_time, end_time))
+                self._appointment_keys[appointment_id] = (doctor_id, date)
+
+
+availability_index = AvailabilityIndex()
+
+
+# ----------------------------------------------------------------------
+# Session hooks: collect appointment/schedule changes on flush, apply them
+# once the transaction commits and drop them on rollback.
+# ----------------------------------------------------------------------
+
+def _pending(session):
+    return session.info.setdefault('availability_changes', {'appointments': {}, 'doctors': set(), 'clear': False})
+
+
+def _collect_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Appointment):
+            _pending(session)['appointments'][obj.id] = (
+                obj.doctor_id,
+                obj.start_time,
+                obj.end_time,
+                obj not in session.deleted and obj.status in BLOCKING_STATUSES
+            )
+        elif isinstance(obj, DoctorSchedule):
+            _pending(session)['doctors'].add(obj.doctor_id)
+        elif isinstance(obj, Doctor):
+            _pending(session)['doctors'].add(obj.id)
+
+
+def _collect_bulk_changes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (Appointment, DoctorSchedule, Doctor):
+        # Bulk statements don't tell us which rows changed
+        _pending(orm_execute_state.session)['clear'] = True
+
+
+def _apply_changes(session):
+    changes = session.info.pop('availability_changes', None)
+    if not changes:
+        return
+    if changes['clear']:
+        availability_index.clear()
+        return
+    for doctor_id in changes['doctors']:
+        availability_index.invalidate_doctor(doctor_id)
+    for appointment_id, (doctor_id, start_time, end_time, active) in changes['appointments'].items():
+        availability_index.apply_appointment(appointment_id, doctor_id, start_time, end_time, active)
+
+
+def _discard_changes(session, previous_transaction):
+    changes = session.info.pop('availability_changes', None)
+    if not changes:
+        return
+    # Days loaded inside the rolled back transaction may have seen its flushed rows
+    if changes['clear']:
+        availability_index.clear()
+        return
+    doctor_ids = set(changes['doctors'])
+    doctor_ids.update(doctor_id for doctor_id, _, _, _ in changes['appointments'].values())
+    for doctor_id in doctor_ids:
+        availability_index.invalidate_doctor(doctor_id)
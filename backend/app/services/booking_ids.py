@@ -0,0 +1,53 @@
+"""
+Booking ID allocation
+
+Booking IDs (A-YYYY-MMDD-NNNN, dated by the day they are created) take their
+sequence number from a booking_counters row per day (see
+app/services/counters.py) instead of a LIKE 'A-YYYY-MMDD-%' search for the
+day's last ID, which cost a query per appointment and let concurrent creates
+pick the same ID. generate_many() reserves the IDs for a batch of
+appointments in one statement.
+
+BOOKING_ID_BLOCK_SIZE > 1 hands single IDs out from per-process blocks.
+"""
+from datetime import datetime
+from sqlalchemy import select
+from app import db
+from app.models.appointment import Appointment
+from app.models.booking_counter import BookingCounter
+from app.services.counters import DailyCounter
+
+# Length of 'A-YYYY-MMDD-', after which the sequence number starts
+_PREFIX_LENGTH = 12
+
+
+def format_booking_id(day, sequence):
+    return f"A-{day.strftime('%Y-%m%d')}-{sequence:04d}"
+
+
+class BookingIdAllocator(DailyCounter):
+    """Hands out collision-free booking IDs from booking_counters"""
+
+    model = BookingCounter
+    block_size_setting = 'BOOKING_ID_BLOCK_SIZE'
+
+    def generate(self, day=None):
+        """A new booking ID for a day (today by default)"""
+        if day is None:
+            day = datetime.now().date()
+        return format_booking_id(day, self.take(day))
+
+    def generate_many(self, count, day=None):
+        """count new booking IDs, reserved together"""
+        if day is None:
+            day = datetime.now().date()
+        return [format_booking_id(day, sequence) for sequence in self.reserve(count, day)]
+
+    def start_value(self, day):
+        prefix = format_booking_id(day, 0)[:_PREFIX_LENGTH]
+        return select(
+            db.func.max(db.cast(db.func.substr(Appointment.booking_id, _PREFIX_LENGTH + 1), db.Integer))
+        ).where(Appointment.booking_id.like(f'{prefix}%'))
+
+
+booking_ids = BookingIdAllocator()
@@ -2,182 +2,145 @@ from app import db
 from app.models.appointment import Appointment, AppointmentStatus
 from app.models.doctor import Doctor
 from app.models.service import Service
-from app.utils.helpers import get_time_slots, is_business_hours, calculate_end_time
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.models.payment import Payment, PaymentMethod, PaymentStatus
+from app.utils.helpers import calculate_end_time, date_filter
+from app.services.availability_index import (
+    availability_index, past_slots_mask, slot_label, slot_end_label, interval_mask, week_masks,
+    to_schedule_day, BLOCKING_STATUSES, SLOTS_PER_DAY, SLOT_MINUTES
+)
+from app.services.conflict_engine import conflict_engine
 from datetime import datetime, timedelta
 
+# Days between occurrences for each recurrence frequency (RRULE FREQ)
+SERIES_FREQUENCIES = {'daily': 1, 'weekly': 7}
+MAX_SERIES_OCCURRENCES = 52
+
+def series_start_times(start_time, count, frequency='weekly', interval=1):
+    """Start times of a recurring series, like RRULE FREQ=<frequency>;INTERVAL=<interval>;COUNT=<count>"""
+    if not isinstance(frequency, str) or frequency not in SERIES_FREQUENCIES:
+        raise ValueError(f"Invalid frequency: {frequency}. Valid values: {sorted(SERIES_FREQUENCIES)}")
+    if not 1 <= count <= MAX_SERIES_OCCURRENCES:
+        raise ValueError(f"count must be between 1 and {MAX_SERIES_OCCURRENCES}")
+    if interval < 1:
+        raise ValueError("interval must be at least 1")
+    step = timedelta(days=SERIES_FREQUENCIES[frequency] * interval)
+    return [start_time + step * occurrence for occurrence in range(count)]
+
+def _recurrence_number(recurrence, key, default):
+    """A whole-number recurrence field; ValueError for null, fractions, booleans or text"""
+    value = recurrence.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"recurrence {key} must be a whole number")
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"recurrence {key} must be a whole number")
+
 class BookingService:
     """Service for handling appointment booking logic"""
     
     def get_available_slots(self, doctor_id, date):
         """Get available time slots for a doctor on a specific date"""
-        from app.models.doctor_schedule import DoctorSchedule
-        
-        doctor = Doctor.query.get(doctor_id)
-        if not doctor:
+        day = availability_index.get_day(doctor_id, date)
+        if day is None:
             return []
         
-        # Check if doctor is active
-        if not doctor.is_active:
-            return []
+        past_mask = past_slots_mask(date, datetime.utcnow())
         
-        # Get day of week for the date
-        # Python weekday(): Monday=0, Tuesday=1, ..., Sunday=6
-        # Our DB format: Sunday=0, Monday=1, ..., Saturday=6
-        python_weekday = date.weekday()  # Python: Monday=0, Sunday=6
-        our_day_of_week = (python_weekday + 1) % 7  # Convert to our format
-        
-        # Get doctor's schedule for this day from DoctorSchedule table
-        available_hours = set()
-        try:
-            doctor_schedules = DoctorSchedule.query.filter_by(
-                doctor_id=doctor_id,
-                day_of_week=our_day_of_week,
-                is_available=True
-            ).all()
-            
-            # Get available hours from DoctorSchedule
-            # Filter out invalid hours (must be 0-23) to prevent errors
-            if doctor_schedules:
-                available_hours = {s.hour for s in doctor_schedules if 0 <= s.hour <= 23}
-        except Exception as e:
-            # If DoctorSchedule table doesn't exist or query fails, fall back to JSON
-            doctor_schedules = []
-            available_hours = set()
-        
-        # If no schedule found in DoctorSchedule or no available hours, fall back to old JSON fields
-        if not available_hours:
-            # Get doctor's working hours from JSON
-            try:
-                working_hours = doctor.get_working_hours()
-                if working_hours and isinstance(working_hours, dict):
-                    start_hour = int(working_hours.get('start', '09:00').split(':')[0])
-                    end_hour = int(working_hours.get('end', '17:00').split(':')[0])
-                else:
-                    # Default working hours if JSON is invalid
-                    start_hour = 9
-                    end_hour = 17
-            except (ValueError, AttributeError, KeyError):
-                # Default working hours if parsing fails
-                start_hour = 9
-                end_hour = 17
-            
-            # Generate time slots based on working hours
-            slots = get_time_slots(start_hour, end_hour, 30, date) if start_hour < end_hour else []
-            
-            # Build available hours set from working hours (all hours in range)
-            available_hours = set(range(start_hour, end_hour))
-        else:
-            # Use DoctorSchedule table to get available hours
-            # Generate slots ONLY for hours that are in the doctor's schedule
-            # This ensures slots match exactly what was entered in the schedule
-            if available_hours:
-                # Filter out invalid hours (must be 0-23)
-                valid_hours = {h for h in available_hours if 0 <= h <= 23}
-                if not valid_hours:
-                    # No valid hours, fall back to default
-                    slots = []
-                    available_hours = set()
-                else:
-                    # Generate slots ONLY for each hour that is in the schedule
-                    # This ensures we don't generate slots for hours not in the schedule
-                    slots = []
-                    for hour in sorted(valid_hours):
-                        # Generate 30-minute slots for this hour (e.g., hour 9 → 9:00 and 9:30)
-                        # get_time_slots(hour, hour + 1, 30, date) will generate slots for this hour only
-                        # It handles hour 23 correctly (will generate 23:00 and 23:30, not 24:00)
-                        end_hour = hour + 1 if hour < 23 else 24  # Allow 24 for last hour
-                        hour_slots = get_time_slots(hour, end_hour, 30, date)
-                        slots.extend(hour_slots)
-                    
-                    # Update available_hours to only valid hours
-                    available_hours = valid_hours
-            else:
-                # No available hours, return empty slots
-                slots = []
-        
-        # Get existing appointments for the date
-        existing_appointments = db.session.query(Appointment).filter(
-            Appointment.doctor_id == doctor_id,
-            db.func.date(Appointment.start_time) == date,
-            Appointment.status.in_([AppointmentStatus.CONFIRMED, AppointmentStatus.CHECKED_IN])
-        ).all()
-        
-        # Create set of occupied times
-        occupied_times = set()
-        for appointment in existing_appointments:
-            start_time = appointment.start_time.time()
-            end_time = appointment.end_time.time()
-            
-            # Add all 30-minute slots that overlap with this appointment
-            current_time = start_time
-            while current_time < end_time:
-                occupied_times.add(current_time.strftime('%H:%M'))
-                current_time = (datetime.combine(date, current_time) + timedelta(minutes=30)).time()
-        
-        # Get current UTC datetime for comparison
-        now_utc = datetime.utcnow()
-        current_date = now_utc.date()
-        current_time = now_utc.time()
-        
-        # Filter out occupied slots and check availability
+        # Return all scheduled slots with an availability flag so the UI can show
+        # why slots aren't available
         available_slots = []
-        for slot in slots:
-            slot_time = datetime.strptime(slot['start_time'], '%H:%M').time()
-            slot_hour = slot_time.hour
-            
-            # Check if this hour is in doctor's available schedule
-            if slot_hour not in available_hours:
-                available_slots.append({
-                    'start_time': slot['start_time'],
-                    'end_time': slot['end_time'],
-                    'available': False,
-                    'reason': 'Not in schedule'
-                })
-                continue
-            
-            # Check if slot is occupied by existing appointment
-            if slot_time.strftime('%H:%M') in occupied_times:
-                available_slots.append({
-                    'start_time': slot['start_time'],
-                    'end_time': slot['end_time'],
-                    'available': False,
-                    'reason': 'Booked'
-                })
+        for index in range(SLOTS_PER_DAY):
+            bit = 1 << index
+            if not day.schedule_mask & bit:
                 continue
             
-            # Check if slot is in the past (for today only)
-            if date == current_date:
-                # For today, only show slots in the future
-                # Compare time components (hour and minute) to avoid timezone/datetime comparison issues
-                slot_hour = slot_time.hour
-                slot_minute = slot_time.minute
-                current_hour = current_time.hour
-                current_minute = current_time.minute
-                
-                # Check if slot time is in the past
-                # Add a small buffer (15 minutes) to allow booking near current time
-                is_past = (slot_hour < current_hour) or \
-                         (slot_hour == current_hour and slot_minute < current_minute - 15)
-                
-                if is_past:
-                    available_slots.append({
-                        'start_time': slot['start_time'],
-                        'end_time': slot['end_time'],
-                        'available': False,
-                        'reason': 'Past time'
-                    })
-                    continue
+            slot = {
+                'start_time': slot_label(index),
+                'end_time': slot_end_label(index),
+                'available': False
+            }
+            if day.booked_mask & bit:
+                slot['reason'] = 'Booked'
+            elif past_mask & bit:
+                slot['reason'] = 'Past time'
+            else:
+                slot['available'] = True
+            available_slots.append(slot)
+        
+        return available_slots
+    
+    def get_next_free_slots(self, doctor_id, count=5, start_date=None, days=14):
+        """Get the next `count` free slot start times for a doctor within `days` days"""
+        return availability_index.next_free_slots(doctor_id, count, start_date=start_date, days=days)
+    
+    def get_clinic_availability(self, clinic_id, start_date, days=7):
+        """
+        Get slot availability for every active doctor of a clinic over a date range
+        
+        Returns a doctor x day matrix of 48-bit slot masks (bit 0 = 00:00,
+        bit 47 = 23:30). Uses one doctor, one schedule and one appointment query
+        regardless of the number of doctors or days.
+        """
+        from app.models.doctor_schedule import DoctorSchedule
+        
+        dates = [start_date + timedelta(days=offset) for offset in range(days)]
+        range_start = datetime.combine(start_date, datetime.min.time())
+        range_end = range_start + timedelta(days=days)
+        
+        doctors = Doctor.query.filter_by(clinic_id=clinic_id, is_active=True).order_by(Doctor.id).all()
+        doctor_ids = [doctor.id for doctor in doctors]
+        
+        schedule_hours = {doctor_id: {} for doctor_id in doctor_ids}
+        appointments = []
+        if doctor_ids:
+            schedule_rows = db.session.query(
+                DoctorSchedule.doctor_id, DoctorSchedule.day_of_week, DoctorSchedule.hour
+            ).filter(
+                DoctorSchedule.doctor_id.in_(doctor_ids),
+                DoctorSchedule.is_available == True
+            ).all()
+            for doctor_id, day_of_week, hour in schedule_rows:
+                schedule_hours[doctor_id].setdefault(day_of_week, set()).add(hour)
             
-            # Slot is available
-            available_slots.append({
-                'start_time': slot['start_time'],
-                'end_time': slot['end_time'],
-                'available': True
+            appointments = db.session.query(
+                Appointment.doctor_id, Appointment.start_time, Appointment.end_time
+            ).filter(
+                Appointment.doctor_id.in_(doctor_ids),
+                Appointment.status.in_(BLOCKING_STATUSES),
+                Appointment.start_time < range_end,
+                Appointment.end_time > range_start
+            ).all()
+        
+        day_offsets = {date: offset for offset, date in enumerate(dates)}
+        booked = {doctor_id: [0] * days for doctor_id in doctor_ids}
+        for doctor_id, start_time, end_time in appointments:
+            offset = day_offsets.get(start_time.date())
+            if offset is not None:
+                booked[doctor_id][offset] |= interval_mask(start_time.date(), start_time, end_time)
+        
+        now = datetime.utcnow()
+        past = [past_slots_mask(date, now) for date in dates]
+        
+        matrix = []
+        for doctor in doctors:
+            day_masks = week_masks(doctor, schedule_hours[doctor.id])
+            schedule = [day_masks[to_schedule_day(date)] for date in dates]
+            matrix.append({
+                'id': doctor.id,
+                'name': doctor.name,
+                'schedule': schedule,
+                'booked': booked[doctor.id],
+                'free': [schedule[i] & ~booked[doctor.id][i] & ~past[i] for i in range(days)]
             })
         
-        # Return only available slots (filter out unavailable ones for cleaner response)
-        # Actually, let's return all slots with availability flag so UI can show why slots aren't available
-        return available_slots
+        return {
+            'clinic_id': clinic_id,
+            'dates': [date.isoformat() for date in dates],
+            'slot_minutes': SLOT_MINUTES,
+            'doctors': matrix
+        }
     
     def create_appointment(self, data):
         """Create a new appointment with validation"""
@@ -189,88 +152,18 @@ class BookingService:
         
         end_time = calculate_end_time(start_time, service.duration)
         
-        # Check for conflicts
-        conflicting_appointments = db.session.query(Appointment).filter(
-            Appointment.doctor_id == data['doctor_id'],
-            Appointment.status.in_([AppointmentStatus.CONFIRMED, AppointmentStatus.CHECKED_IN]),
-            db.or_(
-                # New appointment starts during existing appointment
-                db.and_(
-                    Appointment.start_time <= start_time,
-                    Appointment.end_time > start_time
-                ),
-                # New appointment ends during existing appointment
-                db.and_(
-                    Appointment.start_time < end_time,
-                    Appointment.end_time >= end_time
-                ),
-                # New appointment completely contains existing appointment
-                db.and_(
-                    Appointment.start_time >= start_time,
-                    Appointment.end_time <= end_time
-                )
-            )
-        ).first()
-        
-        if conflicting_appointments:
-            raise ValueError("Time slot conflicts with existing appointment")
-        
-        # Check if doctor works on this day
-        doctor = Doctor.query.get(data['doctor_id'])
-        if not doctor:
+        # Schedule coverage and conflicts come from one load of the doctor's day
+        calendar = conflict_engine.load(data['doctor_id'], [(start_time, end_time)])
+        if calendar is None:
             raise ValueError("Doctor not found")
         
         # Check if doctor is active
-        if not doctor.is_active:
+        if not calendar.doctor.is_active:
             raise ValueError("Doctor is not active")
         
-        # Check if doctor is available at this specific time using DoctorSchedule table
-        # Python weekday(): Monday=0, Tuesday=1, ..., Sunday=6
-        # Our DB format: Sunday=0, Monday=1, ..., Saturday=6
-        python_weekday = start_time.weekday()  # Python: Monday=0, Sunday=6
-        our_day_of_week = (python_weekday + 1) % 7  # Convert to our format
-        appointment_hour = start_time.hour
-        
-        # Check DoctorSchedule table first
-        from app.models.doctor_schedule import DoctorSchedule
-        
-        # Calculate all hours covered by this appointment
-        # Appointment duration is in minutes, so we need to check all hours it spans
-        appointment_duration_hours = (service.duration + 29) // 30  # Round up to nearest 30-minute slot
-        hours_to_check = []
-        current_check_time = start_time
-        while current_check_time < end_time:
-            hours_to_check.append(current_check_time.hour)
-            current_check_time += timedelta(minutes=30)
-        
-        # Remove duplicates while preserving order
-        hours_to_check = list(dict.fromkeys(hours_to_check))
-        
-        # Check if all required hours are available in DoctorSchedule
-        schedule_entries = DoctorSchedule.query.filter_by(
-            doctor_id=data['doctor_id'],
-            day_of_week=our_day_of_week,
-            is_available=True
-        ).filter(DoctorSchedule.hour.in_(hours_to_check)).all()
-        
-        available_hours = {entry.hour for entry in schedule_entries}
-        missing_hours = set(hours_to_check) - available_hours
-        
-        if schedule_entries and len(missing_hours) == 0:
-            # All required hours are available in DoctorSchedule table - this is valid
-            pass
-        elif schedule_entries and len(missing_hours) > 0:
-            # Some hours are missing - this is invalid
-            raise ValueError(f"Appointment spans hours not in doctor's schedule: {sorted(missing_hours)}")
-        else:
-            # No DoctorSchedule entries found - fall back to old working_days and working_hours JSON fields
-            day_name = start_time.strftime('%A')
-            if not doctor.is_working_on_day(day_name):
-                raise ValueError(f"Doctor doesn't work on {day_name}")
-            
-            # Check working hours using old JSON field
-            if not is_business_hours(start_time, doctor.get_working_hours()):
-                raise ValueError("Appointment outside working hours")
+        is_valid, message = calendar.check(start_time, end_time)
+        if not is_valid:
+            raise ValueError(message)
         
         # Create appointment
         appointment = Appointment(
@@ -291,6 +184,120 @@ class BookingService:
         
         return appointment
     
+    def create_appointment_series(self, data, recurrence, allow_partial=False):
+        """
+        Create a recurring appointment series
+        
+        recurrence holds 'count', 'frequency' ('daily' or 'weekly') and
+        'interval'. All occurrences are validated in one pass and inserted in a
+        single flush and commit. Like a single booking, each occurrence gets
+        its queued visit and pending payment; queue numbers are reserved once
+        per day. Returns (appointments, conflicts), where conflicts lists the
+        occurrences that could not be booked. Unless allow_partial is set,
+        nothing is booked when any occurrence conflicts.
+        """
+        from app.utils.helpers import generate_booking_ids
+        from app.services.queue_numbers import queue_numbers
+        
+        start_time = datetime.fromisoformat(data['start_time'].replace('Z', '+00:00'))
+        start_times = series_start_times(
+            start_time,
+            _recurrence_number(recurrence, 'count', 1),
+            recurrence.get('frequency', 'weekly'),
+            _recurrence_number(recurrence, 'interval', 1)
+        )
+        
+        service = Service.query.get(data['service_id'])
+        if not service:
+            raise ValueError("Service not found")
+        intervals = [(start, calculate_end_time(start, service.duration)) for start in start_times]
+        
+        calendar = conflict_engine.load(data['doctor_id'], intervals)
+        if calendar is None:
+            raise ValueError("Doctor not found")
+        if not calendar.doctor.is_active:
+            raise ValueError("Doctor is not active")
+        
+        # Occurrences are also checked against each other
+        accepted, conflicts = [], []
+        for occurrence, ((start, end), (is_valid, message)) in enumerate(zip(intervals, calendar.check_many(intervals))):
+            if is_valid:
+                accepted.append((start, end))
+            else:
+                conflicts.append({'occurrence': occurrence, 'start_time': start.isoformat(), 'message': message})
+        
+        if not accepted or (conflicts and not allow_partial):
+            return [], conflicts
+        
+        booking_ids = generate_booking_ids(len(accepted))
+        days = {}
+        for start, end in accepted:
+            days[start.date()] = days.get(start.date(), 0) + 1
+        queue_numbers_by_day = {
+            day: iter(queue_numbers.reserve(count, day, clinic_id=data['clinic_id']))
+            for day, count in days.items()
+        }
+        price = float(service.price)
+        doctor_share = price * calendar.doctor.share_percentage
+        
+        appointments, rows = [], []
+        for booking_id, (start, end) in zip(booking_ids, accepted):
+            appointment = Appointment(
+                booking_id=booking_id,
+                clinic_id=data['clinic_id'],
+                doctor_id=data['doctor_id'],
+                patient_id=data['patient_id'],
+                service_id=data['service_id'],
+                start_time=start,
+                end_time=end,
+                booking_source=data['booking_source'],
+                created_by=data['created_by'],
+                notes=data.get('notes')
+            )
+            # The visit is queued at the appointment time, as for a single booking
+            visit = Visit(
+                appointment=appointment,
+                doctor_id=data['doctor_id'],
+                patient_id=data['patient_id'],
+                service_id=data['service_id'],
+                clinic_id=data['clinic_id'],
+                check_in_time=start,
+                visit_type=VisitType.SCHEDULED,
+                queue_number=next(queue_numbers_by_day[start.date()]),
+                status=VisitStatus.WAITING
+            )
+            payment = Payment(
+                visit_id=None,  # Set from payment.visit on flush
+                patient_id=data['patient_id'],
+                total_amount=price,
+                amount_paid=0.0,
+                payment_method=PaymentMethod.CASH,
+                doctor_share=doctor_share,
+                center_share=price - doctor_share,
+                status=PaymentStatus.PENDING
+            )
+            payment.visit = visit
+            appointments.append(appointment)
+            rows.extend([appointment, visit, payment])
+        
+        # One flush; SQLAlchemy batches the rows into multi-row INSERTs where the database allows it
+        db.session.add_all(rows)
+        db.session.flush()
+        appointment_ids = [appointment.id for appointment in appointments]
+        db.session.commit()
+        
+        # Reload with the related rows to_dict() needs in one query
+        from sqlalchemy.orm import joinedload
+        appointments = Appointment.query.options(
+            joinedload(Appointment.patient),
+            joinedload(Appointment.doctor),
+            joinedload(Appointment.clinic),
+            joinedload(Appointment.service),
+            joinedload(Appointment.visit)
+        ).filter(Appointment.id.in_(appointment_ids)).order_by(Appointment.start_time).all()
+        
+        return appointments, conflicts
+    
     def get_appointment_by_booking_id(self, booking_id):
         """Get appointment by booking ID"""
         return Appointment.query.filter_by(booking_id=booking_id).first()
@@ -313,7 +320,7 @@ class BookingService:
         """Get all appointments for a doctor on a specific date"""
         return db.session.query(Appointment).filter(
             Appointment.doctor_id == doctor_id,
-            db.func.date(Appointment.start_time) == date
+            date_filter(Appointment.start_time, date)
         ).order_by(Appointment.start_time).all()
     
     def get_appointments_for_patient(self, patient_id, limit=10):
@@ -0,0 +1,199 @@
+"""
+Appointment conflict checks
+
+A doctor's calendar is loaded with one schedule query and one appointment query
+covering the days from the first to the last proposal. Booked appointments are kept sorted by
+start time together with a running maximum of their end times, so an overlap
+lookup is a bisect plus a short backwards walk that stops as soon as no earlier
+appointment can reach the proposed start. The same calendar answers the
+schedule-coverage question, and a batch of proposals (e.g. a recurring series)
+is validated in one pass: accepted proposals are added to the calendar so later
+ones in the batch are checked against them too.
+
+Unlike the availability index this always reads the database, so it is what
+booking relies on.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from app import db
+from app.models.appointment import Appointment
+from app.models.doctor import Doctor
+from app.models.doctor_schedule import DoctorSchedule
+from app.services.availability_index import BLOCKING_STATUSES, to_schedule_day
+
+CONFLICT_MESSAGE = "Time slot conflicts with existing appointment"
+BATCH_CONFLICT_MESSAGE = "Time slot conflicts with another appointment in this request"
+
+
+def covered_hours(start_time, end_time):
+    """Every clock hour touched by [start_time, end_time), in order"""
+    hours = []
+    current = start_time.replace(minute=0, second=0, microsecond=0)
+    while current < end_time:
+        hours.append(current.hour)
+        current += timedelta(hours=1)
+    return list(dict.fromkeys(hours))
+
+
+def parse_working_hours(doctor):
+    """(start, end) times from the doctor's legacy working_hours JSON (default 09:00-17:00)"""
+    working_hours = doctor.get_working_hours()
+    if not working_hours or not isinstance(working_hours, dict):
+        working_hours = {'start': '09:00', 'end': '17:00'}
+    try:
+        start_hour = datetime.strptime(working_hours.get('start', '09:00'), '%H:%M').time()
+        end_hour = datetime.strptime(working_hours.get('end', '17:00'), '%H:%M').time()
+    except (ValueError, TypeError):
+        start_hour = datetime.strptime('09:00', '%H:%M').time()
+        end_hour = datetime.strptime('17:00', '%H:%M').time()
+    return start_hour, end_hour
+
+
+class IntervalSet:
+    """Half-open intervals sorted by start with a running maximum of their ends"""
+
+    def __init__(self):
+        self._items = []  # (start, end, key), sorted by start
+        self._max_ends = []  # _max_ends[i] = max end of _items[:i + 1]
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, start, end, key=None):
+        index = bisect_right(self._items, start, key=lambda item: item[0])
+        self._items.insert(index, (start, end, key))
+        # Only the running maximum from the insertion point onwards changes
+        del self._max_ends[index:]
+        latest = self._max_ends[-1] if self._max_ends else end
+        for _, item_end, _ in self._items[index:]:
+            latest = max(latest, item_end)
+            self._max_ends.append(latest)
+
+    def overlapping(self, start, end, ignore=None):
+        """Keys of the intervals overlapping [start, end), latest start first"""
+        index = bisect_left(self._items, end, key=lambda item: item[0]) - 1
+        keys = []
+        while index >= 0 and self._max_ends[index] > start:
+            _, item_end, key = self._items[index]
+            if item_end > start and (ignore is None or key != ignore):
+                keys.append(key)
+            index -= 1
+        return keys
+
+
+class DoctorCalendar:
+    """A doctor's weekly schedule and booked appointments over the loaded days"""
+
+    def __init__(self, doctor, schedule_hours, appointments):
+        self.doctor = doctor
+        self.schedule_hours = schedule_hours  # {day_of_week (Sunday=0): {hour}}
+        self.booked = IntervalSet()
+        for appointment_id, start_time, end_time in appointments:
+            self.booked.add(start_time, end_time, appointment_id)
+
+    def schedule_error(self, start_time, end_time):
+        """Why [start_time, end_time) is outside the doctor's hours, or None"""
+        available_hours = self.schedule_hours.get(to_schedule_day(start_time.date()))
+        if available_hours:
+            missing_hours = set(covered_hours(start_time, end_time)) - available_hours
+            if missing_hours:
+                return f"Appointment spans hours not in doctor's schedule: {sorted(missing_hours)}"
+            return None
+
+        # No DoctorSchedule rows for the day - fall back to working_days/working_hours
+        day_name = start_time.strftime('%A')
+        if not self.doctor.is_working_on_day(day_name):
+            return f"Doctor doesn't work on {day_name}"
+        start_hour, end_hour = parse_working_hours(self.doctor)
+        if start_time.time() < start_hour or end_time.time() > end_hour:
+            return "Appointment outside working hours"
+        return None
+
+    def conflicts(self, start_time, end_time, appointment_id=None):
+        """IDs of the booked appointments overlapping [start_time, end_time)"""
+        return self.booked.overlapping(start_time, end_time, ignore=appointment_id)
+
+    def check(self, start_time, end_time):
+        """(is_valid, message) for booking [start_time, end_time)"""
+        error = self.schedule_error(start_time, end_time)
+        if error:
+            return False, error
+        conflicts = self.conflicts(start_time, end_time)
+        if conflicts:
+            if any(isinstance(key, tuple) for key in conflicts):
+                return False, BATCH_CONFLICT_MESSAGE
+            return False, CONFLICT_MESSAGE
+        return True, "Valid"
+
+    def check_many(self, intervals):
+        """
+        (is_valid, message) for each proposed (start_time, end_time), in order
+
+        Each valid proposal is booked into the calendar, so later ones may not
+        overlap it.
+        """
+        results = []
+        for index, (start_time, end_time) in enumerate(intervals):
+            result = self.check(start_time, end_time)
+            if result[0]:
+                self.booked.add(start_time, end_time, ('proposed', index))
+            results.append(result)
+        return results
+
+
+class ConflictEngine:
+    """Loads doctor calendars and validates proposed appointment times"""
+
+    def load(self, doctor_id, intervals, appointment_id=None):
+        """
+        Load a doctor's calendar for the whole days of the given (start, end) pairs
+
+        Returns None if the doctor does not exist. appointment_id is left out
+        of the booked intervals, for moving an existing appointment.
+        """
+        doctor = db.session.get(Doctor, doctor_id)
+        if not doctor:
+            return None
+
+        rows = db.session.query(DoctorSchedule.day_of_week, DoctorSchedule.hour).filter(
+            DoctorSchedule.doctor_id == doctor_id,
+            DoctorSchedule.is_available == True
+        ).all()
+        schedule_hours = {}
+        for day_of_week, hour in rows:
+            schedule_hours.setdefault(day_of_week, set()).add(hour)
+
+        range_start = datetime.combine(min(start for start, _ in intervals).date(), datetime.min.time())
+        last_day = max(start for start, _ in intervals).date() + timedelta(days=1)
+        range_end = max([datetime.combine(last_day, datetime.min.time())] + [end for _, end in intervals])
+        query = db.session.query(Appointment.id, Appointment.start_time, Appointment.end_time).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.status.in_(BLOCKING_STATUSES),
+            Appointment.start_time < range_end,
+            Appointment.end_time > range_start
+        )
+        if appointment_id is not None:
+            query = query.filter(Appointment.id != appointment_id)
+
+        return DoctorCalendar(doctor, schedule_hours, query.all())
+
+    def validate(self, doctor_id, start_time, end_time, appointment_id=None):
+        """(is_valid, message) for one proposed appointment"""
+        results = self.validate_many(doctor_id, [(start_time, end_time)], appointment_id)
+        return results[0]
+
+    def validate_many(self, doctor_id, intervals, appointment_id=None):
+        """
+        Validate proposed (start_time, end_time) pairs for one doctor in one pass
+
+        Returns an (is_valid, message) pair per proposal, see DoctorCalendar.check_many.
+        """
+        if not intervals:
+            return []
+        calendar = self.load(doctor_id, intervals, appointment_id)
+        if calendar is None:
+            return [(False, "Doctor not found")] * len(intervals)
+        return calendar.check_many(intervals)
+
+
+conflict_engine = ConflictEngine()
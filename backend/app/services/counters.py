@@ -0,0 +1,109 @@
+"""
+Per-day counters
+
+Sequences that restart every day (queue numbers, booking IDs) are kept in a
+counter table with one row per scope and day, instead of reading the highest
+value handed out so far, which two concurrent requests could both read.
+
+- PostgreSQL: a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING bumps
+  the counter (creating it on first use) and returns the new value.
+- Other databases (SQLite): the UPDATE runs first, so the transaction holds
+  the write lock before the value is read back.
+
+Either way the row stays locked until the caller's transaction ends, and a
+rolled back transaction gives its numbers back. reserve(count) takes a whole
+range in the same single statement. A new counter starts from start_value(),
+the highest value already in use that day.
+
+With a block size > 1 each process reserves that many values at a time in a
+transaction of its own and hands them out from memory, so the counter row is
+only locked once per block. Values then stay unique but may have gaps
+(unused blocks, rollbacks) and interleave between workers.
+"""
+import threading
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+
+class DailyCounter:
+    """
+    A per-day sequence stored in `model`
+
+    The model needs a `day` column, the scope columns passed as keyword
+    arguments and a `last_number` column, with a unique constraint over the
+    scope columns and day.
+    """
+
+    model = None
+    block_size_setting = None
+
+    def __init__(self):
+        self.block_size = 1
+        self._blocks = {}  # (day, scope) -> [next value, last value]
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.block_size = max(1, app.config.get(self.block_size_setting, 1))
+        with self._lock:
+            self._blocks.clear()
+
+    def start_value(self, day, **scope):
+        """SELECT of the highest value in use before the counter existed"""
+        raise NotImplementedError
+
+    def take(self, day, **scope):
+        """The next value, from this process' block if blocks are enabled"""
+        if self.block_size == 1:
+            return self._advance(db.session, day, scope, 1)
+
+        key = (day, tuple(sorted(scope.items())))
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None or block[0] > block[1]:
+                # Committed on its own so the counter isn't locked for the
+                # rest of the caller's transaction
+                with db.engine.begin() as connection:
+                    last = self._advance(connection, day, scope, self.block_size)
+                self._blocks = {k: v for k, v in self._blocks.items() if k[0] >= day}
+                block = self._blocks[key] = [last - self.block_size + 1, last]
+            value = block[0]
+            block[0] += 1
+            return value
+
+    def reserve(self, count, day, **scope):
+        """count consecutive values in one statement, as part of the caller's transaction"""
+        if count < 1:
+            return range(0)
+        last = self._advance(db.session, day, scope, count)
+        return range(last - count + 1, last + 1)
+
+    def _key(self, day, scope):
+        return [self.model.day == day] + [getattr(self.model, column) == value for column, value in scope.items()]
+
+    def _advance(self, executor, day, scope, count):
+        """Advance the counter by count and return its new value"""
+        if db.engine.dialect.name == 'postgresql':
+            return executor.execute(self._upsert(day, scope, count)).scalar_one()
+
+        key = self._key(day, scope)
+        bump = update(self.model).where(*key).values(last_number=self.model.last_number + count)
+        if executor.execute(bump, execution_options={'synchronize_session': False}).rowcount == 0:
+            start = executor.execute(self.start_value(day, **scope)).scalar() or 0
+            try:
+                with executor.begin_nested():
+                    executor.execute(insert(self.model).values(day=day, last_number=start + count, **scope))
+                return start + count
+            except IntegrityError:
+                # Created by a concurrent transaction in the meantime
+                executor.execute(bump, execution_options={'synchronize_session': False})
+        return executor.execute(select(self.model.last_number).where(*key)).scalar_one()
+
+    def _upsert(self, day, scope, count):
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        start = db.func.coalesce(self.start_value(day, **scope).scalar_subquery(), 0)
+        statement = pg_insert(self.model).values(day=day, last_number=start + count, **scope)
+        return statement.on_conflict_do_update(
+            index_elements=[*scope, 'day'],
+            set_={'last_number': self.model.last_number + count}
+        ).returning(self.model.last_number)
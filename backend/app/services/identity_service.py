@@ -0,0 +1,163 @@
+"""
+Current user resolution
+
+Most handlers only need the caller's id, role and linked doctor. current_identity()
+resolves them once per request (kept on flask.g) with a single query joining
+users to doctors, and keeps the result in a per-process cache for
+IDENTITY_CACHE_TTL seconds so role checks on later requests need no query at
+all (0 disables the cache).
+
+Role changes, doctor links/unlinks and deleted users drop the cached entry when
+their transaction commits, so they take effect immediately on this worker and
+within IDENTITY_CACHE_TTL on the others. The role is deliberately not read from
+JWT claims: those stay valid for the token's whole lifetime.
+"""
+import threading
+import time
+from flask import g, has_app_context
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.models.user import User, UserRole
+from app.models.doctor import Doctor
+
+
+class Identity:
+    """The caller's id and role, plus the doctor profile linked to the user"""
+    __slots__ = ('id', 'role', 'doctor_id', 'clinic_id')
+
+    def __init__(self, id, role, doctor_id=None, clinic_id=None):
+        self.id = id
+        self.role = role
+        self.doctor_id = doctor_id
+        self.clinic_id = clinic_id
+
+    @property
+    def is_doctor(self):
+        return self.role == UserRole.DOCTOR
+
+    def __repr__(self):
+        return f'<Identity user={self.id} {self.role.value} doctor={self.doctor_id}>'
+
+
+class IdentityCache:
+    """Short-lived user_id -> Identity cache shared by the requests of one process"""
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._listening = False
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', self.ttl)
+        self.clear()
+        if not self._listening:
+            event.listen(Session, 'after_flush', _collect_changes)
+            event.listen(Session, 'after_commit', _apply_changes)
+            event.listen(Session, 'after_soft_rollback', _discard_changes)
+            self._listening = True
+
+    def load(self, user_id):
+        """Read the identity from the database (None if the user does not exist)"""
+        row = db.session.query(User.id, User.role, Doctor.id, Doctor.clinic_id).outerjoin(
+            Doctor, Doctor.user_id == User.id
+        ).filter(User.id == user_id).order_by(Doctor.id).first()
+        if row is None:
+            return None
+        return Identity(*row)
+
+    def get(self, user_id):
+        """Cached identity for user_id, loading it on a miss"""
+        if self.ttl > 0:
+            with self._lock:
+                entry = self._entries.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+        identity = self.load(user_id)
+        if identity is not None and self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (time.monotonic() + self.ttl, identity)
+        return identity
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def _per_request(name, loader):
+    """
+    Memoize loader() on flask.g for the current token
+
+    Keyed by the token's jti so an app context shared by several requests
+    (tests, nested test clients) never hands one caller's result to another.
+    """
+    key = get_jwt()['jti']
+    cached = g.get(name)
+    if cached is None or cached[0] != key:
+        cached = (key, loader())
+        setattr(g, name, cached)
+    return cached[1]
+
+
+def current_identity():
+    """Identity of the JWT's user for this request, or None if the user no longer exists"""
+    return _per_request('current_identity', lambda: identity_cache.get(int(get_jwt_identity())))
+
+
+def current_user():
+    """The User row of the JWT's user, loaded at most once per request"""
+    def load():
+        identity = current_identity()
+        return db.session.get(User, identity.id) if identity else None
+    return _per_request('current_user', load)
+
+
+def current_doctor():
+    """The Doctor profile linked to the JWT's user, loaded at most once per request"""
+    def load():
+        identity = current_identity()
+        return db.session.get(Doctor, identity.doctor_id) if identity and identity.doctor_id else None
+    return _per_request('current_doctor', load)
+
+
+# ----------------------------------------------------------------------
+# Session hooks: drop cached identities of users whose role, doctor link or
+# account changed once the transaction commits.
+# ----------------------------------------------------------------------
+
+def _changed_user_ids(obj):
+    if isinstance(obj, User):
+        return {obj.id} if obj.id is not None else set()
+    history = inspect(obj).attrs.user_id.history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    return {value for value in values if value is not None}
+
+
+def _collect_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (User, Doctor)):
+            session.info.setdefault('identity_changes', set()).update(_changed_user_ids(obj))
+
+
+def _apply_changes(session):
+    user_ids = session.info.pop('identity_changes', None)
+    if user_ids:
+        identity_cache.invalidate(user_ids)
+        # Later lookups in this request see the committed state too
+        if has_app_context():
+            for name in ('current_identity', 'current_user', 'current_doctor'):
+                g.pop(name, None)
+
+
+def _discard_changes(session, previous_transaction):
+    session.info.pop('identity_changes', None)
@@ -0,0 +1,208 @@
+"""
+Batched SMS dispatch
+
+Due notifications are sent in batches instead of one Celery task per row:
+
+1. claim: one UPDATE ... RETURNING leases up to SMS_DISPATCH_BATCH_SIZE
+   pending, due rows (leased_until = now + SMS_LEASE_SECONDS, attempts + 1)
+   and commits. On PostgreSQL the rows are picked with FOR UPDATE SKIP
+   LOCKED, so concurrent dispatchers take disjoint batches without waiting
+   on each other; SQLite has a single writer, so the UPDATE alone is enough.
+   A dispatcher that dies mid-batch leaves leases that simply run out.
+2. send: the batch goes through the configured SMS provider (see
+   sms_providers.py) from up to SMS_DISPATCH_CONCURRENCY threads.
+3. record: one UPDATE marks the sent rows and one the failed ones;
+   retryable failures are held back (leased_until = now + delay, one UPDATE
+   per delay) until they are due again, and fail after SMS_MAX_ATTEMPTS.
+   Throttled sends are held back the same way but don't count as attempts.
+
+The database is only touched from the calling thread.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import logging
+from flask import current_app
+from sqlalchemy import or_, select, update
+from app import db
+from app.models.notification import Notification, NotificationStatus
+from app.services.sms_providers import SendResult, create_provider
+
+logger = logging.getLogger(__name__)
+
+
+class ClaimedNotification:
+    """A leased notification, detached from the session"""
+
+    def __init__(self, id, recipient, message, notification_type, attempts):
+        self.id = id
+        self.recipient = recipient
+        self.message = message
+        self.notification_type = notification_type
+        self.attempts = attempts
+
+
+class NotificationDispatcher:
+    """Claims due notifications in batches, sends them concurrently and records the outcome in bulk"""
+
+    def init_app(self, app):
+        app.config.setdefault('SMS_DISPATCH_BATCH_SIZE', 100)
+        app.config.setdefault('SMS_DISPATCH_CONCURRENCY', 10)
+        app.config.setdefault('SMS_LEASE_SECONDS', 300)
+        app.config.setdefault('SMS_MAX_ATTEMPTS', 3)
+        app.config.setdefault('SMS_RETRY_SECONDS', 60)
+        app.extensions['notification_dispatcher'] = {'provider': None}
+
+    @property
+    def provider(self):
+        """The app's SMS provider, created on first use"""
+        extension = current_app.extensions['notification_dispatcher']
+        if extension['provider'] is None:
+            extension['provider'] = create_provider(current_app.config)
+        return extension['provider']
+
+    @provider.setter
+    def provider(self, provider):
+        current_app.extensions['notification_dispatcher']['provider'] = provider
+
+    def _available(self, now):
+        return (
+            Notification.status == NotificationStatus.PENDING,
+            or_(Notification.leased_until.is_(None), Notification.leased_until <= now)
+        )
+
+    def oldest_due(self, now=None, not_before=None):
+        """scheduled_time of the oldest claimable due notification (at or after not_before), or None"""
+        now = now or datetime.utcnow()
+        query = select(db.func.min(Notification.scheduled_time)).where(
+            *self._available(now), Notification.scheduled_time <= now
+        )
+        if not_before is not None:
+            query = query.where(Notification.scheduled_time >= not_before)
+        return db.session.execute(query).scalar()
+
+    def claim(self, limit=None, ids=None, now=None, due_before=None):
+        """
+        Lease up to limit pending notifications and commit
+
+        Without ids only due notifications (scheduled before due_before, if
+        given) are claimed, oldest first; with ids those notifications are
+        claimed if pending and not leased.
+        """
+        now = now or datetime.utcnow()
+        limit = limit or current_app.config['SMS_DISPATCH_BATCH_SIZE']
+        available = select(Notification.id).where(*self._available(now))
+        if ids is not None:
+            available = available.where(Notification.id.in_(ids))
+        else:
+            available = available.where(Notification.scheduled_time <= now)
+            if due_before is not None:
+                available = available.where(Notification.scheduled_time < due_before)
+        available = available.order_by(Notification.scheduled_time, Notification.id).limit(limit)
+        if db.engine.dialect.name == 'postgresql':
+            available = available.with_for_update(skip_locked=True)
+
+        rows = db.session.execute(
+            update(Notification).where(
+                Notification.id.in_(available.scalar_subquery())
+            ).values(
+                leased_until=now + timedelta(seconds=current_app.config['SMS_LEASE_SECONDS']),
+                attempts=Notification.attempts + 1
+            ).returning(
+                Notification.id, Notification.recipient, Notification.message,
+                Notification.notification_type, Notification.attempts
+            ).execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return sorted((ClaimedNotification(*row) for row in rows), key=lambda claimed: claimed.id)
+
+    def send(self, claimed):
+        """SendResult for each claimed notification, in order"""
+        provider = self.provider
+        if not claimed:
+            return []
+
+        def send_one(notification):
+            try:
+                return provider.send(notification.recipient, notification.message)
+            except Exception as e:
+                logger.exception(f"SMS provider failed on notification {notification.id}")
+                return SendResult(False, error=str(e), retryable=True)
+
+        workers = min(current_app.config['SMS_DISPATCH_CONCURRENCY'], len(claimed))
+        if workers <= 1:
+            return [send_one(notification) for notification in claimed]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(send_one, claimed))
+
+    def record(self, claimed, results, now=None):
+        """Store the outcome of a sent batch with one UPDATE per outcome and commit"""
+        now = now or datetime.utcnow()
+        max_attempts = current_app.config['SMS_MAX_ATTEMPTS']
+        sent, failed, retry, throttled = [], [], {}, {}  # release time -> ids
+        for notification, result in zip(claimed, results):
+            delay = result.retry_after if result.retry_after is not None else current_app.config['SMS_RETRY_SECONDS']
+            if result.ok:
+                sent.append(notification.id)
+            elif result.throttled:
+                throttled.setdefault(now + timedelta(seconds=delay), []).append(notification.id)
+            elif result.retryable and notification.attempts < max_attempts:
+                retry.setdefault(now + timedelta(seconds=delay), []).append(notification.id)
+            else:
+                logger.warning(f"SMS notification {notification.id} failed: {result.error}")
+                failed.append(notification.id)
+
+        def mark(ids, **values):
+            if ids:
+                db.session.execute(
+                    update(Notification).where(Notification.id.in_(ids)).values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+
+        mark(sent, status=NotificationStatus.SENT, sent_at=now, leased_until=None)
+        mark(failed, status=NotificationStatus.FAILED, leased_until=None)
+        for release_at, ids in retry.items():
+            mark(ids, leased_until=release_at)
+        self.defer(throttled, commit=False)
+        db.session.commit()
+        return {
+            'sent': len(sent),
+            'failed': len(failed),
+            'retrying': sum(len(ids) for ids in retry.values()),
+            'throttled': sum(len(ids) for ids in throttled.values()),
+        }
+
+    def defer(self, deferrals, commit=True):
+        """Hand claimed notifications back without counting the attempt; deferrals maps release time -> ids"""
+        for release_at, ids in deferrals.items():
+            if ids:
+                db.session.execute(
+                    update(Notification).where(Notification.id.in_(ids)).values(
+                        leased_until=release_at, attempts=Notification.attempts - 1
+                    ).execution_options(synchronize_session=False)
+                )
+        if commit:
+            db.session.commit()
+
+    def dispatch_batch(self, limit=None, ids=None):
+        """Claim, send and record one batch; returns counts by outcome"""
+        claimed = self.claim(limit, ids)
+        counts = self.record(claimed, self.send(claimed))
+        counts['claimed'] = len(claimed)
+        return counts
+
+    def dispatch_pending(self, max_batches=None):
+        """Send due notifications batch by batch until none are left, max_batches ran or the provider throttles"""
+        limit = current_app.config['SMS_DISPATCH_BATCH_SIZE']
+        totals = {'claimed': 0, 'sent': 0, 'failed': 0, 'retrying': 0, 'throttled': 0}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            counts = self.dispatch_batch(limit)
+            batches += 1
+            for key in totals:
+                totals[key] += counts[key]
+            if counts['claimed'] < limit or counts['throttled']:
+                break
+        return totals
+
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,259 @@
+"""
+Periodic SMS dispatch with rate limits and backoff
+
+Celery beat runs process_pending_notifications every SMS_DISPATCH_INTERVAL
+seconds, and each run drains due notifications through the dispatcher:
+
+- A cache lock lets one run go at a time; a tick that finds it taken (a slow
+  run, several beat ticks) is skipped instead of piling up.
+- Notifications are taken oldest first, one SMS_SCHEDULE_BUCKET_SECONDS wide
+  bucket of scheduled_time at a time, never more than the global token
+  bucket (SMS_GLOBAL_RATE per second, bursts of SMS_GLOBAL_BURST) allows.
+- Each recipient has a token bucket too (SMS_RECIPIENT_RATE per hour,
+  bursts of SMS_RECIPIENT_BURST). A notification whose recipient is out of
+  tokens is handed back until the tick after one is available.
+- When the provider throttles, the run stops and later runs stay idle for
+  its Retry-After, or else for an exponential backoff from
+  SMS_BACKOFF_SECONDS up to SMS_BACKOFF_MAX_SECONDS.
+
+Buckets, backoff and the last run's figures live in the Flask-Caching
+backend, so with Redis all workers share them; the lock makes their
+read-modify-write safe. metrics() reports queue depth (due and waiting),
+lag (age of the oldest due notification) and throughput (sent per minute
+over the last THROUGHPUT_WINDOW).
+"""
+import math
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, case, func, or_
+from app import cache, db
+from app.models.notification import Notification, NotificationStatus
+from app.services.notification_dispatcher import notification_dispatcher
+
+# Window the throughput metric is measured over
+THROUGHPUT_WINDOW = timedelta(minutes=5)
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most capacity"""
+
+    def __init__(self, rate, capacity, tokens=None, updated=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = updated
+
+    def _refill(self, now):
+        if self.updated is not None and now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        if self.updated is None or now > self.updated:
+            self.updated = now
+
+    def available(self, now):
+        """Whole tokens available at now (a time.time() timestamp)"""
+        self._refill(now)
+        return int(self.tokens)
+
+    def take(self, now):
+        """Take a token if there is one"""
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def wait(self, now):
+        """Seconds until a token is available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def state(self):
+        return (self.tokens, self.updated)
+
+
+class NotificationScheduler:
+    """Rate-limited, backpressured runs of the notification dispatcher"""
+
+    key_prefix = 'sms_scheduler:'
+
+    def init_app(self, app):
+        app.config.setdefault('SMS_DISPATCH_INTERVAL', 30)
+        app.config.setdefault('SMS_SCHEDULE_BUCKET_SECONDS', 300)
+        app.config.setdefault('SMS_DISPATCH_MAX_PER_RUN', 1000)
+        app.config.setdefault('SMS_GLOBAL_RATE', 10)
+        app.config.setdefault('SMS_GLOBAL_BURST', 100)
+        app.config.setdefault('SMS_RECIPIENT_RATE', 5)
+        app.config.setdefault('SMS_RECIPIENT_BURST', 3)
+        app.config.setdefault('SMS_BACKOFF_SECONDS', 30)
+        app.config.setdefault('SMS_BACKOFF_MAX_SECONDS', 900)
+
+    # ------------------------------------------------------------------
+    # Token buckets
+    # ------------------------------------------------------------------
+
+    def _global_bucket(self):
+        config = current_app.config
+        state = cache.get(self.key_prefix + 'global') or (None, None)
+        return TokenBucket(config['SMS_GLOBAL_RATE'], config['SMS_GLOBAL_BURST'], *state)
+
+    def _recipient_buckets(self, recipients):
+        config = current_app.config
+        keys = [self.key_prefix + 'recipient:' + recipient for recipient in recipients]
+        states = cache.get_many(*keys) if keys else []
+        return {
+            recipient: TokenBucket(config['SMS_RECIPIENT_RATE'] / 3600, config['SMS_RECIPIENT_BURST'], *(state or ()))
+            for recipient, state in zip(recipients, states)
+        }
+
+    def _save_recipient_buckets(self, buckets):
+        config = current_app.config
+        # A bucket left alone this long is full again, the same as a new one
+        refill_seconds = math.ceil(config['SMS_RECIPIENT_BURST'] * 3600 / config['SMS_RECIPIENT_RATE'])
+        cache.set_many({
+            self.key_prefix + 'recipient:' + recipient: bucket.state() for recipient, bucket in buckets.items()
+        }, timeout=refill_seconds)
+
+    def _release_time(self, now, wait):
+        """The first dispatch tick at least wait seconds after now"""
+        interval = current_app.config['SMS_DISPATCH_INTERVAL']
+        return now + timedelta(seconds=max(interval, math.ceil(wait / interval) * interval))
+
+    def admit(self, claimed, global_bucket, now):
+        """
+        Split claimed notifications into (allowed, deferrals) by the token buckets
+
+        deferrals maps release time -> notification ids, for dispatcher.defer.
+        """
+        timestamp = time.time()
+        recipients = list(dict.fromkeys(notification.recipient for notification in claimed))
+        buckets = self._recipient_buckets(recipients)
+        allowed, deferrals = [], {}
+        for notification in claimed:
+            bucket = buckets[notification.recipient]
+            if not bucket.take(timestamp):
+                wait = bucket.wait(timestamp)
+            elif not global_bucket.take(timestamp):
+                bucket.tokens += 1  # not sent after all
+                wait = global_bucket.wait(timestamp)
+            else:
+                allowed.append(notification)
+                continue
+            deferrals.setdefault(self._release_time(now, wait), []).append(notification.id)
+        self._save_recipient_buckets(buckets)
+        return allowed, deferrals
+
+    # ------------------------------------------------------------------
+    # Runs
+    # ------------------------------------------------------------------
+
+    def _backoff(self, stats, retry_after):
+        config = current_app.config
+        previous = cache.get(self.key_prefix + 'backoff') or {'streak': 0}
+        if retry_after is None:
+            retry_after = min(config['SMS_BACKOFF_SECONDS'] * 2 ** previous['streak'], config['SMS_BACKOFF_MAX_SECONDS'])
+        until = time.time() + retry_after
+        cache.set(self.key_prefix + 'backoff', {'until': until, 'streak': previous['streak'] + 1},
+                  timeout=int(retry_after) + 60)
+        stats['backoff_until'] = datetime.utcfromtimestamp(until).isoformat()
+
+    def run(self):
+        """Dispatch what the rate limits allow now; returns the run's figures"""
+        lock_key = self.key_prefix + 'lock'
+        if not cache.add(lock_key, True, timeout=current_app.config['SMS_LEASE_SECONDS']):
+            return {'skipped': 'another run is in progress'}
+        try:
+            stats = self._run()
+        finally:
+            cache.delete(lock_key)
+        cache.set(self.key_prefix + 'last_run', stats, timeout=0)
+        return stats
+
+    def _run(self):
+        config = current_app.config
+        started = time.monotonic()
+        stats = {'started_at': datetime.utcnow().isoformat(), 'claimed': 0, 'sent': 0, 'failed': 0,
+                 'retrying': 0, 'throttled': 0, 'deferred': 0}
+
+        backoff = cache.get(self.key_prefix + 'backoff')
+        if backoff and backoff['until'] > time.time():
+            stats['skipped'] = 'provider throttling backoff'
+            stats['backoff_until'] = datetime.utcfromtimestamp(backoff['until']).isoformat()
+            return stats
+
+        global_bucket = self._global_bucket()
+        bucket_width = timedelta(seconds=config['SMS_SCHEDULE_BUCKET_SECONDS'])
+        bucket_start = next_start = None
+        while stats['claimed'] < config['SMS_DISPATCH_MAX_PER_RUN']:
+            now = datetime.utcnow()
+            budget = min(global_bucket.available(time.time()), config['SMS_DISPATCH_BATCH_SIZE'],
+                         config['SMS_DISPATCH_MAX_PER_RUN'] - stats['claimed'])
+            if budget <= 0:
+                break
+            if bucket_start is None:
+                bucket_start = notification_dispatcher.oldest_due(now, not_before=next_start)
+                if bucket_start is None:
+                    break
+            bucket_end = bucket_start + bucket_width
+
+            claimed = notification_dispatcher.claim(budget, now=now, due_before=bucket_end)
+            if len(claimed) < budget:
+                # This bucket is drained, carry on with the next one
+                bucket_start, next_start = None, bucket_end
+            if not claimed:
+                continue
+            allowed, deferrals = self.admit(claimed, global_bucket, now)
+            notification_dispatcher.defer(deferrals)
+            results = notification_dispatcher.send(allowed)
+            counts = notification_dispatcher.record(allowed, results)
+            stats['claimed'] += len(claimed)
+            stats['deferred'] += len(claimed) - len(allowed)
+            for key in ('sent', 'failed', 'retrying', 'throttled'):
+                stats[key] += counts[key]
+            if counts['throttled']:
+                retry_after = max((result.retry_after for result in results
+                                   if result.throttled and result.retry_after is not None), default=None)
+                self._backoff(stats, retry_after)
+                break
+
+        cache.set(self.key_prefix + 'global', global_bucket.state(), timeout=0)
+        if stats['sent'] and not stats['throttled']:
+            cache.delete(self.key_prefix + 'backoff')
+        stats['duration'] = round(time.monotonic() - started, 3)
+        return stats
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def metrics(self):
+        """Queue depth, lag and throughput of the notification queue, plus the last run"""
+        now = datetime.utcnow()
+        pending = Notification.status == NotificationStatus.PENDING
+        due = Notification.scheduled_time <= now
+        leased = Notification.leased_until > now
+        unleased = or_(Notification.leased_until.is_(None), Notification.leased_until <= now)
+        depth, held, scheduled, oldest_due, sent = db.session.query(
+            func.sum(case((and_(pending, due, unleased), 1), else_=0)),
+            func.sum(case((and_(pending, leased), 1), else_=0)),
+            func.sum(case((and_(pending, ~due), 1), else_=0)),
+            func.min(case((and_(pending, due, unleased), Notification.scheduled_time))),
+            func.sum(case((Notification.sent_at >= now - THROUGHPUT_WINDOW, 1), else_=0)),
+        ).one()
+        backoff = cache.get(self.key_prefix + 'backoff')
+        window_minutes = THROUGHPUT_WINDOW.total_seconds() / 60
+        return {
+            'depth': depth or 0,
+            'leased': held or 0,
+            'scheduled': scheduled or 0,
+            'lag_seconds': round((now - oldest_due).total_seconds(), 1) if oldest_due else 0,
+            'sent_per_minute': round((sent or 0) / window_minutes, 2),
+            'backoff_until': (datetime.utcfromtimestamp(backoff['until']).isoformat()
+                              if backoff and backoff['until'] > time.time() else None),
+            'last_run': cache.get(self.key_prefix + 'last_run'),
+        }
+
+
+notification_scheduler = NotificationScheduler()
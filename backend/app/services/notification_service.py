@@ -1,9 +1,28 @@
+from flask import current_app
+from sqlalchemy import insert, select
 from app import db
 from app.models.notification import Notification, NotificationType, NotificationStatus
-from app.models.appointment import Appointment
+from app.models.appointment import Appointment, AppointmentStatus
 from app.models.patient import Patient
+from app.models.doctor import Doctor
+from app.models.clinic import Clinic
+from app.utils.helpers import date_filter, date_range_filter
 from datetime import datetime, timedelta
 
+# Message templates, bound once and shared by the per-appointment helpers and the bulk reminder job
+REMINDER_MESSAGE = (
+    "Hi {patient_name}, this is a reminder that you have an appointment with Dr. {doctor_name} at {clinic_name} "
+    "on {date} at {time}. Please arrive 10 minutes early. Thank you!"
+).format
+CONFIRMATION_MESSAGE = (
+    "Hi {patient_name}, your appointment with Dr. {doctor_name} at {clinic_name} on {date} at {time} "
+    "has been confirmed. Booking ID: {booking_id}. Thank you!"
+).format
+FOLLOWUP_MESSAGE = (
+    "Hi {patient_name}, we hope you had a good experience with Dr. {doctor_name}. Please don't hesitate to "
+    "contact us if you have any questions or need to schedule another appointment. Thank you!"
+).format
+
 class NotificationService:
     """Service for handling notification logic"""
     
@@ -31,6 +50,64 @@ class NotificationService:
         
         return notification
     
+    def schedule_reminders_for_day(self, day=None, lead_time=None):
+        """
+        Create SMS reminders for every confirmed appointment on day (default: tomorrow)
+
+        One joined query reads the appointments with their patient, doctor and
+        clinic names, leaving out those that already have a reminder, so running
+        it again only picks up appointments booked since. The notifications are
+        inserted in bulk, lead_time (default SMS_REMINDER_LEAD_MINUTES) before
+        each appointment, for the dispatcher to send when due.
+        Returns the number of reminders created.
+        """
+        day = day or (datetime.now() + timedelta(days=1)).date()
+        if lead_time is None:
+            lead_time = timedelta(minutes=current_app.config.get('SMS_REMINDER_LEAD_MINUTES', 60))
+
+        already_reminded = select(Notification.id).where(
+            Notification.related_appointment_id == Appointment.id,
+            Notification.notification_type == NotificationType.SMS_REMINDER
+        ).exists()
+        appointments = db.session.execute(
+            select(
+                Appointment.id, Appointment.start_time,
+                Patient.name, Patient.phone, Doctor.name, Clinic.name
+            ).join(Patient, Patient.id == Appointment.patient_id)
+            .join(Doctor, Doctor.id == Appointment.doctor_id)
+            .join(Clinic, Clinic.id == Appointment.clinic_id)
+            .where(
+                Appointment.status == AppointmentStatus.CONFIRMED,
+                date_filter(Appointment.start_time, day),
+                ~already_reminded
+            ).order_by(Appointment.start_time, Appointment.id)
+        ).all()
+        if not appointments:
+            return 0
+
+        now = datetime.utcnow()
+        date = appointments[0].start_time.strftime('%Y-%m-%d')  # the same for the whole day
+        notifications = [
+            {
+                'recipient': phone,
+                'notification_type': NotificationType.SMS_REMINDER,
+                'message': REMINDER_MESSAGE(
+                    patient_name=patient_name, doctor_name=doctor_name, clinic_name=clinic_name,
+                    date=date, time=start_time.strftime('%H:%M')
+                ),
+                'scheduled_time': start_time - lead_time,
+                'status': NotificationStatus.PENDING,
+                'attempts': 0,
+                'related_appointment_id': appointment_id,
+                'created_at': now,
+            }
+            for appointment_id, start_time, patient_name, phone, doctor_name, clinic_name in appointments
+        ]
+        db.session.execute(insert(Notification), notifications)
+        db.session.commit()
+        
+        return len(notifications)
+    
     def schedule_confirmation_sms(self, appointment_id, phone_number, message):
         """Schedule confirmation SMS for appointment"""
         appointment = Appointment.query.get(appointment_id)
@@ -113,25 +190,21 @@ class NotificationService:
     def get_notification_stats(self, start_date, end_date):
         """Get notification statistics for date range"""
         total_notifications = db.session.query(Notification).filter(
-            db.func.date(Notification.created_at) >= start_date,
-            db.func.date(Notification.created_at) <= end_date
+            date_range_filter(Notification.created_at, start_date, end_date)
         ).count()
         
         sent_notifications = db.session.query(Notification).filter(
-            db.func.date(Notification.created_at) >= start_date,
-            db.func.date(Notification.created_at) <= end_date,
+            date_range_filter(Notification.created_at, start_date, end_date),
             Notification.status == NotificationStatus.SENT
         ).count()
         
         failed_notifications = db.session.query(Notification).filter(
-            db.func.date(Notification.created_at) >= start_date,
-            db.func.date(Notification.created_at) <= end_date,
+            date_range_filter(Notification.created_at, start_date, end_date),
             Notification.status == NotificationStatus.FAILED
         ).count()
         
         pending_notifications = db.session.query(Notification).filter(
-            db.func.date(Notification.created_at) >= start_date,
-            db.func.date(Notification.created_at) <= end_date,
+            date_range_filter(Notification.created_at, start_date, end_date),
             Notification.status == NotificationStatus.PENDING
         ).count()
         
@@ -145,34 +218,28 @@ class NotificationService:
     
     def create_appointment_reminder_message(self, appointment):
         """Create reminder message for appointment"""
-        patient_name = appointment.patient.name
-        doctor_name = appointment.doctor.name
-        clinic_name = appointment.clinic.name
-        appointment_time = appointment.start_time.strftime('%H:%M')
-        appointment_date = appointment.start_time.strftime('%Y-%m-%d')
-        
-        message = f"Hi {patient_name}, this is a reminder that you have an appointment with Dr. {doctor_name} at {clinic_name} on {appointment_date} at {appointment_time}. Please arrive 10 minutes early. Thank you!"
-        
-        return message
+        return REMINDER_MESSAGE(
+            patient_name=appointment.patient.name,
+            doctor_name=appointment.doctor.name,
+            clinic_name=appointment.clinic.name,
+            date=appointment.start_time.strftime('%Y-%m-%d'),
+            time=appointment.start_time.strftime('%H:%M')
+        )
     
     def create_appointment_confirmation_message(self, appointment):
         """Create confirmation message for appointment"""
-        patient_name = appointment.patient.name
-        doctor_name = appointment.doctor.name
-        clinic_name = appointment.clinic.name
-        appointment_time = appointment.start_time.strftime('%H:%M')
-        appointment_date = appointment.start_time.strftime('%Y-%m-%d')
-        booking_id = appointment.booking_id
-        
-        message = f"Hi {patient_name}, your appointment with Dr. {doctor_name} at {clinic_name} on {appointment_date} at {appointment_time} has been confirmed. Booking ID: {booking_id}. Thank you!"
-        
-        return message
+        return CONFIRMATION_MESSAGE(
+            patient_name=appointment.patient.name,
+            doctor_name=appointment.doctor.name,
+            clinic_name=appointment.clinic.name,
+            date=appointment.start_time.strftime('%Y-%m-%d'),
+            time=appointment.start_time.strftime('%H:%M'),
+            booking_id=appointment.booking_id
+        )
     
     def create_followup_message(self, appointment):
         """Create follow-up message for appointment"""
-        patient_name = appointment.patient.name
-        doctor_name = appointment.doctor.name
-        
-        message = f"Hi {patient_name}, we hope you had a good experience with Dr. {doctor_name}. Please don't hesitate to contact us if you have any questions or need to schedule another appointment. Thank you!"
-        
-        return message
+        return FOLLOWUP_MESSAGE(
+            patient_name=appointment.patient.name,
+            doctor_name=appointment.doctor.name
+        )
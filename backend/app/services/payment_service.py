@@ -2,7 +2,7 @@ from app import db
 from app.models.payment import Payment, PaymentMethod, PaymentStatus
 from app.models.visit import Visit, VisitStatus
 from app.models.doctor import Doctor
-from app.utils.helpers import calculate_doctor_share, calculate_center_share
+from app.utils.helpers import calculate_doctor_share, calculate_center_share, date_range_filter
 from datetime import datetime
 
 class PaymentService:
@@ -135,8 +135,7 @@ class PaymentService:
         """Get payment summary for date range"""
         query = db.session.query(Payment).filter(
             Payment.status == PaymentStatus.PAID,
-            db.func.date(Payment.created_at) >= start_date,
-            db.func.date(Payment.created_at) <= end_date
+            date_range_filter(Payment.created_at, start_date, end_date)
         )
         
         if doctor_id:
@@ -161,8 +160,7 @@ class PaymentService:
         payments = db.session.query(Payment).filter(
             Payment.visit.has(Visit.doctor_id == doctor_id),
             Payment.status == PaymentStatus.PAID,
-            db.func.date(Payment.created_at) >= start_date,
-            db.func.date(Payment.created_at) <= end_date
+            date_range_filter(Payment.created_at, start_date, end_date)
         ).all()
         
         total_earnings = sum(float(payment.doctor_share) for payment in payments)
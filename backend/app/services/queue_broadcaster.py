@@ -0,0 +1,259 @@
+"""
+Versioned queue deltas for the Socket.IO queue rooms
+
+Instead of rebuilding a whole clinic/doctor queue after every change, each
+committed visit change is sent to the rooms it affects as one `queue_delta`:
+
+    {'room': 'clinic_3', 'version': 42, 'op': 'status_changed',
+     'visit_id': 17, 'date': '2030-01-01', 'visit': {...queue entry...}}
+
+op is 'added', 'moved' (queue number or sort key changed), 'status_changed',
+'updated' or 'removed' (no 'visit'). Every op except 'removed' carries the
+full queue entry, so applying a delta is an idempotent upsert/delete by visit
+id; waiting patients are listed in order of their entry's sort_key.
+
+Each room has a version that grows by one per delta. A client that sees a gap
+(or a version that went backwards) asks for a `queue_snapshot` and carries on
+from the snapshot's version. Versions live in the Flask-Caching backend, so
+workers sharing a Redis cache share them too.
+
+The deltas a transaction produces for one room (e.g. a batch check-in) are
+sent together, and deltas for a room are also held for
+QUEUE_DELTA_COALESCE_WINDOW seconds; either way a burst goes out as a single
+message listing the versions it covers and the last change of each visit:
+
+    {'room': 'clinic_3', 'version': 45, 'versions': [43, 44, 45],
+     'changes': [{'op': 'status_changed', 'visit_id': 17, ...}, ...]}
+
+With SOCKETIO_MESSAGE_QUEUE set the message goes through the queue to the
+room's clients on every node.
+"""
+import threading
+from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import cache, socketio
+from app.models.visit import Visit
+from app.services.queue_service import QueueService, QUEUE_STATUSES, queue_entry
+
+# Attributes that decide which rooms list a visit and where
+TRACKED_ATTRIBUTES = ('clinic_id', 'doctor_id', 'status', 'queue_number', 'sort_key', 'created_at')
+
+
+def clinic_room(clinic_id):
+    return f'clinic_{clinic_id}'
+
+
+def doctor_room(doctor_id):
+    return f'doctor_{doctor_id}'
+
+
+class QueueBroadcaster:
+    """Per-room versions and delta/snapshot messages for the live queues"""
+
+    key_prefix = 'queue_version:'
+
+    def __init__(self):
+        self._listening = False
+        self.coalesce_window = 0
+        self._pending = {}  # room -> deltas waiting to be sent
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Start broadcasting the visit changes of each committed transaction"""
+        self.coalesce_window = app.config.get('QUEUE_DELTA_COALESCE_WINDOW', 0)
+        if not self._listening:
+            for attribute in TRACKED_ATTRIBUTES:
+                event.listen(getattr(Visit, attribute), 'set', _keep_previous_value, active_history=True)
+            event.listen(Session, 'after_flush', _collect_changes)
+            event.listen(Session, 'after_flush_postexec', _collect_entries)
+            event.listen(Session, 'after_commit', _publish_changes)
+            event.listen(Session, 'after_soft_rollback', _discard_changes)
+            self._listening = True
+
+    def version(self, room):
+        """Version of the last delta sent to a room (0 if none)"""
+        return cache.get(self.key_prefix + room) or 0
+
+    def next_version(self, room, count=1):
+        """Reserve count versions of a room and return the last one"""
+        key = self.key_prefix + room
+        cache.add(key, 0, timeout=0)
+        # Atomic on Redis, so workers never hand out the same version
+        return cache.cache.inc(key, count)
+
+    def snapshot(self, clinic_id=None, doctor_id=None, known_version=None):
+        """
+        Today's queue for a clinic or doctor room with the version it reflects
+
+        The version is read before the queue, so deltas after it may already
+        be included - which is harmless, as applying them is idempotent. If
+        the client is already at the current version only the version is sent.
+        The snapshot's date lets the client drop deltas for other days.
+        """
+        room = clinic_room(clinic_id) if clinic_id else doctor_room(doctor_id)
+        version = self.version(room)
+        if known_version is not None and known_version == version:
+            return {'room': room, 'version': version, 'unchanged': True}
+        day = datetime.now().date()
+        queue_service = QueueService()
+        if clinic_id:
+            queue = queue_service.get_clinic_queue(clinic_id, day)
+        else:
+            queue = queue_service.get_doctor_queue(doctor_id, day)
+        return {'room': room, 'version': version, 'date': day.isoformat(), 'queue': queue}
+
+    def publish(self, room, op, visit_id, day, entry=None):
+        """Send one delta to a room under the room's next version"""
+        return self.publish_many(room, [(op, visit_id, day, entry)])[0]
+
+    def publish_many(self, room, changes):
+        """Send (op, visit_id, day, entry) changes to a room as one message, one version each"""
+        last = self.next_version(room, len(changes))
+        deltas = []
+        for version, (op, visit_id, day, entry) in zip(range(last - len(changes) + 1, last + 1), changes):
+            delta = {
+                'room': room,
+                'version': version,
+                'op': op,
+                'visit_id': visit_id,
+                'date': day.isoformat() if day else None,
+            }
+            if entry is not None:
+                delta['visit'] = entry
+            deltas.append(delta)
+        if not self.coalesce_window:
+            socketio.emit('queue_delta', merge_deltas(deltas), room=room)
+            return deltas
+        with self._lock:
+            pending = self._pending.setdefault(room, [])
+            pending.extend(deltas)
+            first = len(pending) == len(deltas)
+        if first:
+            socketio.start_background_task(self._send_later, room)
+        return deltas
+
+    def _send_later(self, room):
+        socketio.sleep(self.coalesce_window)
+        with self._lock:
+            deltas = self._pending.pop(room, [])
+        if deltas:
+            socketio.emit('queue_delta', merge_deltas(deltas), room=room)
+
+
+def merge_deltas(deltas):
+    """One message for a room's deltas, keeping the last change of each visit"""
+    if len(deltas) == 1:
+        return deltas[0]
+    changes = {}
+    for delta in deltas:
+        change = {key: value for key, value in delta.items() if key not in ('room', 'version')}
+        previous = changes.pop(delta['visit_id'], None)
+        if previous is not None and previous['op'] == 'added' and change['op'] != 'removed':
+            # Still new to clients that haven't seen the burst
+            change['op'] = 'added'
+        changes[delta['visit_id']] = change
+    return {
+        'room': deltas[-1]['room'],
+        'version': max(delta['version'] for delta in deltas),
+        'versions': [delta['version'] for delta in deltas],
+        'changes': list(changes.values()),
+    }
+
+
+queue_broadcaster = QueueBroadcaster()
+
+
+# ----------------------------------------------------------------------
+# Session hooks: record each visit's state before the transaction and its
+# queue entry after every flush, send the deltas once it commits.
+# ----------------------------------------------------------------------
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    # Registered with active_history so that assigning to an expired
+    # attribute still loads the value it replaces
+    return value
+
+
+def _committed_state(obj):
+    state = {}
+    for attribute in TRACKED_ATTRIBUTES:
+        history = inspect(obj).attrs[attribute].history
+        if history.deleted:
+            state[attribute] = history.deleted[0]
+        elif history.unchanged:
+            state[attribute] = history.unchanged[0]
+        else:
+            state[attribute] = getattr(obj, attribute)
+    return state
+
+
+def _current_state(obj):
+    state = {attribute: getattr(obj, attribute) for attribute in TRACKED_ATTRIBUTES}
+    state['clinic_entry'] = queue_entry(obj)
+    state['doctor_entry'] = queue_entry(obj, include_doctor=False)
+    return state
+
+
+def _rooms(state):
+    """Rooms listing a visit in this state -> key of its queue entry there"""
+    if state is None or state['status'] not in QUEUE_STATUSES:
+        return {}
+    return {clinic_room(state['clinic_id']): 'clinic_entry', doctor_room(state['doctor_id']): 'doctor_entry'}
+
+
+def _day(state):
+    return state['created_at'].date() if state['created_at'] else None
+
+
+def _collect_changes(session, flush_context):
+    flushed = session.info.setdefault('queue_flushed', [])
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Visit) or obj.id is None:
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        changes = session.info.setdefault('queue_changes', {})
+        if obj.id not in changes:
+            changes[obj.id] = {'before': None if obj in session.new else _committed_state(obj)}
+        changes[obj.id]['after'] = None
+        if obj not in session.deleted:
+            flushed.append(obj)
+
+
+def _collect_entries(session, flush_context):
+    # New visits only load their patient/doctor/service once they are persistent
+    changes = session.info.get('queue_changes', {})
+    for obj in session.info.pop('queue_flushed', ()):
+        changes[obj.id]['after'] = _current_state(obj)
+
+
+def _publish_changes(session):
+    changes = session.info.pop('queue_changes', None)
+    if not changes:
+        return
+    room_changes = {}  # room -> [(op, visit_id, day, entry)]
+    for visit_id, change in changes.items():
+        before, after = change['before'], change['after']
+        before_rooms = _rooms(before)
+        # Visits missing their patient, doctor or service aren't listed
+        after_rooms = {room: after[key] for room, key in _rooms(after).items() if after[key] is not None}
+        for room, entry in after_rooms.items():
+            if room not in before_rooms:
+                op = 'added'
+            elif before['queue_number'] != after['queue_number'] or before['sort_key'] != after['sort_key']:
+                op = 'moved'
+            elif before['status'] != after['status']:
+                op = 'status_changed'
+            else:
+                op = 'updated'
+            room_changes.setdefault(room, []).append((op, visit_id, _day(after), entry))
+        for room in before_rooms.keys() - after_rooms.keys():
+            room_changes.setdefault(room, []).append(('removed', visit_id, _day(before), None))
+    for room, items in room_changes.items():
+        queue_broadcaster.publish_many(room, items)
+
+
+def _discard_changes(session, previous_transaction):
+    session.info.pop('queue_changes', None)
+    session.info.pop('queue_flushed', None)
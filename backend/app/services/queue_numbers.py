@@ -0,0 +1,41 @@
+"""
+Queue number allocation
+
+Queue numbers come from one queue_counters row per clinic and day (see
+app/services/counters.py) instead of MAX(queue_number) + 1 over the day's
+visits, which two reception desks checking patients in at the same moment
+could both read. A clinic's counter starts from the day's highest existing
+queue number.
+
+QUEUE_NUMBER_BLOCK_SIZE > 1 hands numbers out from per-process blocks: they
+stay unique but may have gaps and interleave between workers.
+"""
+from datetime import datetime
+from sqlalchemy import select
+from app import db
+from app.models.queue_counter import QueueCounter
+from app.models.visit import Visit
+from app.services.counters import DailyCounter
+from app.utils.helpers import date_filter
+
+
+class QueueNumberAllocator(DailyCounter):
+    """Hands out per-clinic, per-day queue numbers from queue_counters"""
+
+    model = QueueCounter
+    block_size_setting = 'QUEUE_NUMBER_BLOCK_SIZE'
+
+    def allocate(self, clinic_id, day=None):
+        """Next queue number for a clinic on a day (today by default)"""
+        if day is None:
+            day = datetime.now().date()
+        return self.take(day, clinic_id=clinic_id)
+
+    def start_value(self, day, clinic_id):
+        return select(db.func.max(Visit.queue_number)).where(
+            Visit.clinic_id == clinic_id,
+            date_filter(Visit.created_at, day)
+        )
+
+
+queue_numbers = QueueNumberAllocator()
@@ -0,0 +1,174 @@
+from app import db
+from app.models.appointment import Appointment, AppointmentStatus
+from app.models.visit import Visit, VisitStatus
+from app.models.payment import Payment
+from app.models.patient import Patient
+from app.models.doctor import Doctor
+from app.models.clinic import Clinic
+from app.models.service import Service
+from app.utils.helpers import date_filter
+
+# Phase names in the order they are shown on the reception screen
+QUEUE_PHASES = ('appointments_today', 'waiting', 'with_doctor', 'completed')
+
+# Appointment statuses that appear on the queue board
+ACTIVE_APPOINTMENT_STATUSES = (
+    AppointmentStatus.CONFIRMED,
+    AppointmentStatus.CHECKED_IN,
+    AppointmentStatus.COMPLETED
+)
+
+
+def resolve_queue_phase(appointment_status, appointment_start, visit_status, visit_check_in):
+    """
+    Map an appointment/visit pair to (queue_phase, visit_status)
+
+    visit_status is None when the appointment has no visit yet.
+    """
+    if visit_status is None:
+        # No visit means it's a scheduled appointment - patient hasn't checked in
+        return 'appointments_today', 'scheduled'
+
+    if appointment_status == AppointmentStatus.CONFIRMED:
+        # Auto-created visits (check-in time matches appointment time within 1 minute)
+        # have not been checked in yet
+        if (visit_check_in and appointment_start and
+                abs((visit_check_in - appointment_start).total_seconds()) < 60):
+            return 'appointments_today', 'scheduled'
+        # Visit progressed beyond the auto-created state but the appointment status
+        # wasn't updated - use the visit status to determine the phase
+        if visit_status == VisitStatus.COMPLETED:
+            return 'completed', visit_status.value
+        if visit_status == VisitStatus.IN_PROGRESS:
+            return 'with_doctor', visit_status.value
+        if visit_status == VisitStatus.CALLED:
+            return 'waiting', visit_status.value
+        return 'appointments_today', 'scheduled'
+
+    # Appointment is CHECKED_IN or COMPLETED - patient has checked in
+    if visit_status == VisitStatus.COMPLETED:
+        return 'completed', visit_status.value
+    if visit_status == VisitStatus.IN_PROGRESS:
+        return 'with_doctor', visit_status.value
+    return 'waiting', visit_status.value
+
+
+class QueuePhaseBuilder:
+    """
+    Builds the queue phase rows for a date with a fixed number of queries
+
+    One query loads the appointments together with their patient, doctor, clinic
+    and service names; a second loads the visits and payments for all of them.
+    The query count does not depend on the number of appointments.
+    """
+
+    def __init__(self, date, clinic_id=None, doctor_id=None):
+        self.date = date
+        self.clinic_id = clinic_id
+        self.doctor_id = doctor_id
+
+    def _appointment_filters(self):
+        filters = [
+            date_filter(Appointment.start_time, self.date),
+            Appointment.status.in_(ACTIVE_APPOINTMENT_STATUSES)
+        ]
+        if self.clinic_id:
+            filters.append(Appointment.clinic_id == self.clinic_id)
+        if self.doctor_id:
+            filters.append(Appointment.doctor_id == self.doctor_id)
+        return filters
+
+    def _load_appointments(self):
+        return db.session.query(
+            Appointment.id,
+            Appointment.booking_id,
+            Appointment.start_time,
+            Appointment.end_time,
+            Appointment.notes,
+            Appointment.status,
+            Patient.name,
+            Patient.phone,
+            Doctor.name,
+            Clinic.name,
+            Service.name
+        ).join(
+            Patient, Patient.id == Appointment.patient_id
+        ).join(
+            Doctor, Doctor.id == Appointment.doctor_id
+        ).join(
+            Clinic, Clinic.id == Appointment.clinic_id
+        ).join(
+            Service, Service.id == Appointment.service_id
+        ).filter(
+            *self._appointment_filters()
+        ).order_by(Appointment.start_time).all()
+
+    def _load_visits(self):
+        """Return {appointment_id: (visit_id, status, check_in_time, queue_number, sort_key, payment_id)}"""
+        appointment_ids = db.session.query(Appointment.id).filter(
+            *self._appointment_filters()
+        )
+        rows = db.session.query(
+            Visit.appointment_id,
+            Visit.id,
+            Visit.status,
+            Visit.check_in_time,
+            Visit.queue_number,
+            Visit.sort_key,
+            Payment.id
+        ).outerjoin(
+            Payment, Payment.visit_id == Visit.id
+        ).filter(
+            Visit.appointment_id.in_(appointment_ids)
+        ).order_by(Visit.id, Payment.id).all()
+
+        # Keep the first visit per appointment and the first payment per visit
+        visits = {}
+        for appointment_id, *visit in rows:
+            if appointment_id not in visits:
+                visits[appointment_id] = tuple(visit)
+        return visits
+
+    def build(self):
+        """Return the appointment rows with their queue phase, ordered by start time"""
+        appointments = self._load_appointments()
+        if not appointments:
+            return []
+        visits = self._load_visits()
+
+        rows = []
+        for (apt_id, booking_id, start_time, end_time, notes, apt_status,
+             patient_name, patient_phone, doctor_name, clinic_name, service_name) in appointments:
+            visit_id, visit_status, check_in_time, queue_number, sort_key, payment_id = \
+                visits.get(apt_id, (None,) * 6)
+            queue_phase, visit_status_value = resolve_queue_phase(
+                apt_status, start_time, visit_status, check_in_time
+            )
+            rows.append({
+                'id': apt_id,
+                'booking_id': booking_id,
+                'patient_name': patient_name,
+                'patient_phone': patient_phone,
+                'doctor_name': doctor_name,
+                'clinic_name': clinic_name,
+                'service_name': service_name,
+                'start_time': start_time.isoformat(),
+                'end_time': end_time.isoformat(),
+                'notes': notes,
+                'visit_status': visit_status_value,
+                'queue_phase': queue_phase,
+                'visit_id': visit_id,
+                'queue_number': queue_number,
+                'sort_key': sort_key,
+                'payment_id': payment_id
+            })
+        return rows
+
+    def build_phases(self):
+        """Return the rows grouped into the four queue phases, waiting in queue order"""
+        phases = {phase: [] for phase in QUEUE_PHASES}
+        for row in self.build():
+            phases[row['queue_phase']].append(row)
+        # Stable, so rows without a visit key keep their start time order
+        phases['waiting'].sort(key=lambda row: (row['sort_key'] is None, row['sort_key'] or 0))
+        return phases
@@ -1,13 +1,54 @@
-from app import db
-from app.models.visit import Visit, VisitStatus
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import joinedload
+from app import db, socketio
+from app.models.visit import Visit, VisitStatus, SORT_KEY_GAP
 from app.models.appointment import Appointment
 from app.models.patient import Patient
 from app.models.doctor import Doctor
 from app.models.clinic import Clinic
 from app.models.service import Service
-from app.utils.helpers import get_next_queue_number
+from app.utils.helpers import get_next_queue_number, date_filter, date_range_filter
+from app.services.queue_phase_builder import QueuePhaseBuilder
 from datetime import datetime
 
+# Statuses listed in the live queues (waiting, called, in progress, completed)
+QUEUE_STATUSES = (VisitStatus.WAITING, VisitStatus.CALLED, VisitStatus.IN_PROGRESS, VisitStatus.COMPLETED)
+
+# Batch queue actions: action -> (required status, new status, timestamp, error)
+VISIT_TRANSITIONS = {
+    'call': (VisitStatus.WAITING, VisitStatus.CALLED, 'called_time', "Only waiting patients can be called"),
+    'start': (VisitStatus.CALLED, VisitStatus.IN_PROGRESS, 'start_time', "Patient must be called first"),
+    'complete': (VisitStatus.IN_PROGRESS, VisitStatus.COMPLETED, 'end_time', "Consultation must be in progress to complete"),
+}
+
+# Queue phases a visit can be moved to and the visit status of each
+PHASE_STATUSES = {
+    'waiting': VisitStatus.WAITING,
+    'with_doctor': VisitStatus.IN_PROGRESS,
+    'completed': VisitStatus.COMPLETED,
+}
+
+def queue_entry(visit, include_doctor=True):
+    """A visit as listed in a clinic (or, without the doctor, a doctor) queue; None if incomplete"""
+    if not visit.patient or not visit.service or (include_doctor and not visit.doctor):
+        return None
+    entry = {
+        'id': visit.id,
+        'queue_number': visit.queue_number,
+        'sort_key': visit.sort_key,
+        'patient_name': visit.patient.name,
+        'patient_phone': visit.patient.phone,
+        'service_name': visit.service.name,
+        'visit_type': visit.visit_type.value,
+        'check_in_time': visit.check_in_time.isoformat() if visit.check_in_time else None,
+        'start_time': visit.start_time.isoformat() if visit.start_time else None,
+        'end_time': visit.end_time.isoformat() if visit.end_time else None,
+        'status': visit.status.value
+    }
+    if include_doctor:
+        entry['doctor_name'] = visit.doctor.name
+    return entry
+
 class QueueService:
     """Service for handling queue management logic"""
     
@@ -23,9 +64,8 @@ class QueueService:
         
         visits = db.session.query(Visit).filter(
             Visit.clinic_id == clinic_id,
-            db.func.date(Visit.created_at) >= start_date,
-            db.func.date(Visit.created_at) <= end_date
-        ).order_by(Visit.queue_number).all()
+            date_range_filter(Visit.created_at, start_date, end_date)
+        ).order_by(Visit.sort_key, Visit.id).all()
         
         # Group by status
         queue_data = {
@@ -38,21 +78,9 @@ class QueueService:
         }
         
         for visit in visits:
-            if not visit.patient or not visit.doctor or not visit.service:
+            visit_info = queue_entry(visit)
+            if visit_info is None:
                 continue
-            visit_info = {
-                'id': visit.id,
-                'queue_number': visit.queue_number,
-                'patient_name': visit.patient.name,
-                'patient_phone': visit.patient.phone,
-                'doctor_name': visit.doctor.name,
-                'service_name': visit.service.name,
-                'visit_type': visit.visit_type.value,
-                'check_in_time': visit.check_in_time.isoformat() if visit.check_in_time else None,
-                'start_time': visit.start_time.isoformat() if visit.start_time else None,
-                'end_time': visit.end_time.isoformat() if visit.end_time else None,
-                'status': visit.status.value
-            }
             
             if visit.status == VisitStatus.WAITING:
                 queue_data['waiting'].append(visit_info)
@@ -77,9 +105,8 @@ class QueueService:
         
         visits = db.session.query(Visit).filter(
             Visit.doctor_id == doctor_id,
-            db.func.date(Visit.created_at) >= start_date,
-            db.func.date(Visit.created_at) <= end_date
-        ).order_by(Visit.queue_number).all()
+            date_range_filter(Visit.created_at, start_date, end_date)
+        ).order_by(Visit.sort_key, Visit.id).all()
         
         # Group by status
         queue_data = {
@@ -92,20 +119,9 @@ class QueueService:
         }
         
         for visit in visits:
-            if not visit.patient or not visit.service:
+            visit_info = queue_entry(visit, include_doctor=False)
+            if visit_info is None:
                 continue
-            visit_info = {
-                'id': visit.id,
-                'queue_number': visit.queue_number,
-                'patient_name': visit.patient.name,
-                'patient_phone': visit.patient.phone,
-                'service_name': visit.service.name,
-                'visit_type': visit.visit_type.value,
-                'check_in_time': visit.check_in_time.isoformat() if visit.check_in_time else None,
-                'start_time': visit.start_time.isoformat() if visit.start_time else None,
-                'end_time': visit.end_time.isoformat() if visit.end_time else None,
-                'status': visit.status.value
-            }
             
             if visit.status == VisitStatus.WAITING:
                 queue_data['waiting'].append(visit_info)
@@ -263,8 +279,8 @@ class QueueService:
         visit = db.session.query(Visit).filter(
             Visit.doctor_id == doctor_id,
             Visit.status == VisitStatus.WAITING,
-            db.func.date(Visit.created_at) >= week_ago
-        ).order_by(Visit.queue_number).first()
+            date_range_filter(Visit.created_at, week_ago)
+        ).order_by(Visit.sort_key, Visit.id).first()
         
         return visit
     
@@ -282,30 +298,250 @@ class QueueService:
         position = db.session.query(Visit).filter(
             Visit.clinic_id == visit.clinic_id,
             Visit.status == VisitStatus.WAITING,
-            Visit.queue_number < visit.queue_number,
-            db.func.date(Visit.created_at) >= week_ago
+            or_(Visit.sort_key < visit.sort_key,
+                and_(Visit.sort_key == visit.sort_key, Visit.id < visit.id)),
+            date_range_filter(Visit.created_at, week_ago)
         ).count() + 1
         
         return position
     
     def get_next_queue_number(self, clinic_id):
-        """Get next available queue number for clinic"""
+        """Allocate the next queue number for clinic today"""
+        return get_next_queue_number(clinic_id)
+    
+    def check_in_many(self, appointment_ids):
+        """
+        Check in several appointments in one transaction
+        
+        Appointments and their visits are loaded with one query and the visits
+        that still have to be created get their queue numbers from one counter
+        update per clinic. Returns (visits, errors), errors listing the
+        appointments that were skipped and why.
+        """
+        from sqlalchemy.orm import joinedload
+        
+        appointment_ids = list(dict.fromkeys(appointment_ids))
+        appointments = {
+            appointment.id: appointment
+            # Patients are listed in the queue deltas sent on commit
+            for appointment in Appointment.query.options(
+                joinedload(Appointment.visit), joinedload(Appointment.patient)
+            ).filter(Appointment.id.in_(appointment_ids))
+        }
+        
+        ready, errors = [], []
+        for appointment_id in appointment_ids:
+            appointment = appointments.get(appointment_id)
+            message = self._check_in_error(appointment)
+            if message:
+                errors.append({'appointment_id': appointment_id, 'message': message})
+            else:
+                ready.append(appointment)
+        
+        visits = self._check_in(ready)
+        db.session.commit()
+        return self._reload(visits), errors
+    
+    def _check_in_error(self, appointment):
+        """Why an appointment can't be checked in, or None if it can"""
+        from app.models.appointment import AppointmentStatus
+        
+        if not appointment:
+            return 'Appointment not found'
+        if appointment.status != AppointmentStatus.CONFIRMED:
+            return 'Only confirmed appointments can be checked in'
+        return None
+    
+    def _check_in(self, appointments, now=None):
+        """Put appointments in the waiting queue, creating the missing visits"""
+        from app.models.visit import VisitType
+        from app.models.appointment import AppointmentStatus
+        
+        now = now or datetime.utcnow()
+        queue_numbers = self._reserve_queue_numbers(
+            [appointment.clinic_id for appointment in appointments if appointment.visit is None]
+        )
+        
+        visits = []
+        for appointment in appointments:
+            visit = appointment.visit
+            if visit:
+                # Visit was created with the appointment - record the actual check-in
+                visit.check_in_time = now
+                visit.status = VisitStatus.WAITING
+            else:
+                visit = Visit(
+                    appointment_id=appointment.id,
+                    doctor_id=appointment.doctor_id,
+                    patient_id=appointment.patient_id,
+                    service_id=appointment.service_id,
+                    clinic_id=appointment.clinic_id,
+                    check_in_time=now,
+                    visit_type=VisitType.SCHEDULED,
+                    queue_number=queue_numbers[appointment.clinic_id].pop(0),
+                    status=VisitStatus.WAITING
+                )
+                db.session.add(visit)
+            appointment.status = AppointmentStatus.CHECKED_IN
+            visits.append(visit)
+        return visits
+    
+    def _reserve_queue_numbers(self, clinic_ids):
+        """Today's next queue numbers for each clinic, one per occurrence in clinic_ids"""
+        from app.services.queue_numbers import queue_numbers
+        
         today = datetime.now().date()
+        counts = {}
+        for clinic_id in clinic_ids:
+            counts[clinic_id] = counts.get(clinic_id, 0) + 1
+        return {
+            clinic_id: list(queue_numbers.reserve(count, today, clinic_id=clinic_id))
+            for clinic_id, count in counts.items()
+        }
+    
+    def transition_many(self, visit_ids, action, doctor_id=None):
+        """
+        Call, start or complete several visits in one transaction
+        
+        Each visit must be in the status the single endpoint requires. With
+        doctor_id set, other doctors' visits are refused. Returns (visits,
+        errors) like check_in_many.
+        """
+        from sqlalchemy.orm import joinedload
+        from app.models.appointment import AppointmentStatus
         
-        # Get the highest queue number for today
-        max_queue = db.session.query(db.func.max(Visit.queue_number)).filter(
-            Visit.clinic_id == clinic_id,
-            db.func.date(Visit.created_at) == today
-        ).scalar()
+        if action not in VISIT_TRANSITIONS:
+            raise ValueError(f"Invalid action: {action}. Valid values: {sorted(VISIT_TRANSITIONS)}")
+        required_status, new_status, timestamp, message = VISIT_TRANSITIONS[action]
+        
+        visit_ids = list(dict.fromkeys(visit_ids))
+        visits = {
+            visit.id: visit
+            for visit in Visit.query.options(
+                joinedload(Visit.appointment), joinedload(Visit.patient)
+            ).filter(Visit.id.in_(visit_ids))
+        }
         
-        return (max_queue or 0) + 1
+        now = datetime.utcnow()
+        changed, errors = [], []
+        for visit_id in visit_ids:
+            visit = visits.get(visit_id)
+            if not visit:
+                errors.append({'visit_id': visit_id, 'message': 'Visit not found'})
+            elif doctor_id is not None and visit.doctor_id != doctor_id:
+                errors.append({'visit_id': visit_id, 'message': 'Access denied to this visit'})
+            elif visit.status != required_status:
+                errors.append({'visit_id': visit_id, 'message': message})
+            else:
+                visit.status = new_status
+                # A consultation keeps its first start time
+                if timestamp != 'start_time' or not visit.start_time:
+                    setattr(visit, timestamp, now)
+                if new_status == VisitStatus.COMPLETED and visit.appointment:
+                    visit.appointment.status = AppointmentStatus.COMPLETED
+                changed.append(visit)
+        
+        db.session.commit()
+        return self._reload(changed), errors
+    
+    def move_phases_many(self, moves, doctor_id=None):
+        """
+        Apply several queue phase moves in one transaction
+        
+        Each move has to_phase and a visit_id, or an appointment_id when
+        checking in from appointments_today. Moves are applied as by
+        /queue/phases/move; role checks are left to the caller, but with
+        doctor_id set other doctors' visits are refused. Check-ins follow
+        check_in_many's rules, and an appointment is checked in at most once
+        per batch. Returns (visits, errors), errors naming the move by its
+        index.
+        """
+        from sqlalchemy.orm import joinedload
+        from app.models.appointment import AppointmentStatus
+        from app.models.payment import PaymentStatus
+        
+        visit_ids = {move['visit_id'] for move in moves if move.get('visit_id')}
+        visits = {
+            visit.id: visit
+            for visit in Visit.query.options(
+                joinedload(Visit.appointment), joinedload(Visit.payment), joinedload(Visit.patient)
+            ).filter(Visit.id.in_(visit_ids))
+        } if visit_ids else {}
+        appointment_ids = {
+            move['appointment_id'] for move in moves
+            if move.get('appointment_id') and not visits.get(move.get('visit_id'))
+        }
+        appointments = {
+            appointment.id: appointment
+            for appointment in Appointment.query.options(
+                joinedload(Appointment.visit), joinedload(Appointment.patient)
+            ).filter(Appointment.id.in_(appointment_ids))
+        } if appointment_ids else {}
+        
+        now = datetime.utcnow()
+        moved, check_ins, errors = [], {}, []
+        for index, move in enumerate(moves):
+            to_phase = move.get('to_phase')
+            visit = visits.get(move.get('visit_id'))
+            if to_phase not in PHASE_STATUSES:
+                errors.append({'index': index, 'message': 'Invalid phase'})
+                continue
+            
+            if move.get('from_phase') == 'appointments_today' and to_phase == 'waiting':
+                appointment = visit.appointment if visit else appointments.get(move.get('appointment_id'))
+                message = self._check_in_error(appointment)
+                if not message and appointment.id in check_ins:
+                    message = 'Appointment already in this batch'
+                if message:
+                    errors.append({'index': index, 'message': message})
+                    continue
+                check_ins[appointment.id] = appointment
+                continue
+            
+            if not visit:
+                errors.append({'index': index, 'message': 'Visit not found. Cannot move appointment without visit.'})
+                continue
+            if doctor_id is not None and visit.doctor_id != doctor_id:
+                errors.append({'index': index, 'message': 'You can only move appointments for your own patients'})
+                continue
+            
+            visit.status = PHASE_STATUSES[to_phase]
+            if to_phase == 'waiting':
+                visit.check_in_time = visit.check_in_time or now
+            elif to_phase == 'with_doctor':
+                visit.start_time = visit.start_time or now
+                visit.called_time = visit.called_time or now
+                if visit.appointment:
+                    visit.appointment.status = AppointmentStatus.CHECKED_IN
+            else:
+                visit.end_time = visit.end_time or now
+                if visit.appointment:
+                    visit.appointment.status = AppointmentStatus.COMPLETED
+                if visit.payment:
+                    visit.payment.status = PaymentStatus.APPOINTMENT_COMPLETED
+            moved.append(visit)
+        
+        moved.extend(self._check_in(list(check_ins.values()), now))
+        db.session.commit()
+        return self._reload(moved), errors
+    
+    def _reload(self, visits):
+        """Refresh visits expired by a commit with one query instead of one each"""
+        from sqlalchemy import inspect
+        from sqlalchemy.orm import joinedload
+        
+        # The identity key doesn't trigger a load of the expired visit
+        ids = [inspect(visit).identity[0] for visit in visits]
+        if ids:
+            Visit.query.options(joinedload(Visit.appointment)).filter(Visit.id.in_(ids)).all()
+        return visits
     
     def get_upcoming_appointments(self, date, clinic_id=None):
         """Get confirmed appointments for a specific date that haven't been checked in"""
         from app.models.appointment import AppointmentStatus
         
         query = db.session.query(Appointment).filter(
-            db.func.date(Appointment.start_time) == date,
+            date_filter(Appointment.start_time, date),
             Appointment.status == AppointmentStatus.CONFIRMED,
             ~db.session.query(Visit).filter(Visit.appointment_id == Appointment.id).exists()
         )
@@ -335,109 +571,21 @@ class QueueService:
 
     def get_all_appointments_for_date(self, date, clinic_id=None, doctor_id=None):
         """Get all appointments for a specific date organized by queue phase"""
-        from app.models.appointment import AppointmentStatus
-        
-        # Get all appointments for the date (include all active statuses)
-        query = db.session.query(Appointment).filter(
-            db.func.date(Appointment.start_time) == date,
-            Appointment.status.in_([
-                AppointmentStatus.CONFIRMED, 
-                AppointmentStatus.CHECKED_IN,
-                AppointmentStatus.COMPLETED
-            ])
-        )
-        
-        if clinic_id:
-            query = query.filter(Appointment.clinic_id == clinic_id)
-        
-        if doctor_id:
-            query = query.filter(Appointment.doctor_id == doctor_id)
-        
-        appointments = query.order_by(Appointment.start_time).all()
-        
-        # Convert to dict format with proper queue phase mapping
-        appointments_data = []
-        for apt in appointments:
-            # Check if appointment has a visit
-            visit = Visit.query.filter_by(appointment_id=apt.id).first()
-            
-            if visit:
-                from app.models.appointment import AppointmentStatus
-                from app.models.visit import VisitStatus
-                
-                visit_status = visit.status.value.lower()
-                
-                # Simplified logic: Determine phase based on appointment status and visit status
-                # Key rule: If appointment status is CONFIRMED, patient hasn't checked in yet
-                # If appointment status is CHECKED_IN or COMPLETED, patient has checked in
-                
-                if apt.status == AppointmentStatus.CONFIRMED:
-                    # Appointment is confirmed but patient hasn't checked in
-                    # Check if visit is auto-created (check_in_time equals appointment start_time)
-                    # Auto-created visits should appear in appointments_today
-                    if (visit.check_in_time and apt.start_time and 
-                        abs((visit.check_in_time - apt.start_time).total_seconds()) < 60):
-                        # Auto-created visit (check-in time matches appointment time within 1 minute)
-                        queue_phase = 'appointments_today'
-                        visit_status = 'scheduled'
-                    elif visit.status in [VisitStatus.CALLED, VisitStatus.IN_PROGRESS, VisitStatus.COMPLETED]:
-                        # Visit has progressed beyond auto-created state, but appointment status wasn't updated
-                        # This means patient has checked in - use visit status to determine phase
-                        if visit.status == VisitStatus.COMPLETED:
-                            queue_phase = 'completed'
-                        elif visit.status == VisitStatus.IN_PROGRESS:
-                            queue_phase = 'with_doctor'
-                        else:  # CALLED or WAITING
-                            queue_phase = 'waiting'
-                    else:
-                        # Visit exists but status suggests not checked in yet
-                        queue_phase = 'appointments_today'
-                        visit_status = 'scheduled'
-                else:
-                    # Appointment status is CHECKED_IN or COMPLETED - patient has checked in
-                    # Map visit status to queue phase
-                    if visit.status == VisitStatus.COMPLETED:
-                        queue_phase = 'completed'
-                    elif visit.status == VisitStatus.IN_PROGRESS:
-                        queue_phase = 'with_doctor'
-                    elif visit.status in [VisitStatus.WAITING, VisitStatus.CALLED]:
-                        queue_phase = 'waiting'
-                    else:
-                        queue_phase = 'waiting'  # Default fallback
-            else:
-                # No visit means it's a scheduled appointment - patient hasn't checked in
-                queue_phase = 'appointments_today'
-                visit_status = 'scheduled'
-            
-            # Get payment for this visit if it exists
-            payment_id = None
-            if visit:
-                from app.models.payment import Payment
-                payment = Payment.query.filter_by(visit_id=visit.id).first()
-                if payment:
-                    payment_id = payment.id
-            
-            appointments_data.append({
-                'id': apt.id,
-                'booking_id': apt.booking_id,
-                'patient_name': apt.patient.name,
-                'patient_phone': apt.patient.phone,
-                'doctor_name': apt.doctor.name,
-                'clinic_name': apt.clinic.name,
-                'service_name': apt.service.name,
-                'start_time': apt.start_time.isoformat(),
-                'end_time': apt.end_time.isoformat(),
-                'notes': apt.notes,
-                'visit_status': visit_status,
-                'queue_phase': queue_phase,
-                'visit_id': visit.id if visit else None,
-                'payment_id': payment_id
-            })
-        
-        return appointments_data
+        return QueuePhaseBuilder(date, clinic_id, doctor_id).build()
+    
+    def get_queue_phases(self, date, clinic_id=None, doctor_id=None):
+        """Get appointments for a date grouped into the 4 queue phases"""
+        return QueuePhaseBuilder(date, clinic_id, doctor_id).build_phases()
     
     def reorder_queue(self, visit_id, new_position):
-        """Reorder queue by moving a visit to a new position"""
+        """
+        Move a waiting visit to a new (1-based) position in today's clinic queue
+
+        Only the moved visit's sort_key is written: it takes a key between its
+        new neighbours'. When that leaves no room for another move between
+        them, the clinic's keys are respaced in the background; a move into a
+        gap that is already used up respaces them first.
+        """
         visit = Visit.query.get(visit_id)
         if not visit:
             raise ValueError("Visit not found")
@@ -445,34 +593,76 @@ class QueueService:
         if visit.status != VisitStatus.WAITING:
             raise ValueError("Only waiting patients can be reordered")
         
-        # Get all waiting visits for the same clinic on the same day
         today = datetime.now().date()
-        waiting_visits = db.session.query(Visit).filter(
-            Visit.clinic_id == visit.clinic_id,
-            Visit.status == VisitStatus.WAITING,
-            db.func.date(Visit.created_at) == today,
-            Visit.id != visit_id
-        ).order_by(Visit.queue_number).all()
-        
-        # Insert the visit at the new position
-        if new_position <= 0:
-            new_position = 1
-        if new_position > len(waiting_visits) + 1:
-            new_position = len(waiting_visits) + 1
-        
-        # Update queue numbers
-        new_queue_number = new_position
-        for i, waiting_visit in enumerate(waiting_visits):
-            if i + 1 >= new_position:
-                waiting_visit.queue_number = i + 2
-            else:
-                waiting_visit.queue_number = i + 1
+        sort_key, crowded = self._sort_key_at(visit, today, max(new_position, 1))
+        if sort_key is None:
+            self.rebalance_sort_keys(visit.clinic_id, today, commit=False)
+            sort_key, crowded = self._sort_key_at(visit, today, max(new_position, 1))
         
-        visit.queue_number = new_queue_number
+        visit.sort_key = sort_key
         db.session.commit()
         
+        if crowded:
+            self.schedule_rebalance(visit.clinic_id, today)
         return visit
     
+    def _waiting_visits(self, clinic_id, day):
+        return db.session.query(Visit).filter(
+            Visit.clinic_id == clinic_id,
+            Visit.status == VisitStatus.WAITING,
+            date_filter(Visit.created_at, day)
+        )
+    
+    def _sort_key_at(self, visit, day, position):
+        """
+        (sort_key, crowded) placing visit at position among the other waiting visits
+
+        sort_key is None if there is no free key there. crowded means the next
+        move next to it would find none.
+        """
+        others = self._waiting_visits(visit.clinic_id, day).filter(Visit.id != visit.id).with_entities(Visit.sort_key)
+        if position == 1:
+            after = others.order_by(Visit.sort_key, Visit.id).limit(1).scalar()
+            if after is None:
+                return visit.sort_key, False
+            return after - SORT_KEY_GAP, False
+        
+        neighbours = [key for key, in others.order_by(Visit.sort_key, Visit.id).offset(position - 2).limit(2)]
+        if len(neighbours) == 2:
+            before, after = neighbours
+        else:
+            # Last place: stay below the key the next check-in will get
+            before = neighbours[0] if neighbours else others.order_by(Visit.sort_key.desc(), Visit.id.desc()).limit(1).scalar()
+            if before is None:
+                return visit.sort_key, False
+            last_number = db.session.query(func.max(Visit.queue_number)).filter(
+                Visit.clinic_id == visit.clinic_id,
+                date_filter(Visit.created_at, day)
+            ).scalar() or 0
+            after = (last_number + 1) * SORT_KEY_GAP
+        
+        if after - before < 2:
+            return None, True
+        sort_key = (before + after) // 2
+        return sort_key, min(sort_key - before, after - sort_key) < 2
+    
+    def rebalance_sort_keys(self, clinic_id, day, commit=True):
+        """Respace the sort keys of a clinic's waiting visits SORT_KEY_GAP apart, keeping their order"""
+        visits = self._waiting_visits(clinic_id, day).options(
+            joinedload(Visit.patient), joinedload(Visit.doctor), joinedload(Visit.service)
+        ).order_by(Visit.sort_key, Visit.id).all()
+        for index, visit in enumerate(visits):
+            if visit.sort_key != (index + 1) * SORT_KEY_GAP:
+                visit.sort_key = (index + 1) * SORT_KEY_GAP
+        if commit:
+            db.session.commit()
+        return visits
+    
+    def schedule_rebalance(self, clinic_id, day):
+        """Rebalance a clinic's sort keys in a background task"""
+        from flask import current_app
+        socketio.start_background_task(_rebalance_in_background, current_app._get_current_object(), clinic_id, day)
+    
     def cancel_visit(self, visit_id, reason="Cancelled by receptionist"):
         """Cancel a visit and remove from queue"""
         visit = Visit.query.get(visit_id)
@@ -533,7 +723,7 @@ class QueueService:
             # Get all visits for the date
             visits = db.session.query(Visit).filter(
                 Visit.clinic_id == clinic_id,
-                db.func.date(Visit.created_at) == date
+                date_filter(Visit.created_at, date)
             ).all()
             
             current_app.logger.info(f"Retrieved {len(visits)} visits for clinic {clinic_id} on {date}")
@@ -594,4 +784,15 @@ class QueueService:
             'completed_count': completed_count,
             'avg_wait_time_minutes': round(avg_wait_time, 1),
             'avg_consultation_time_minutes': round(avg_consultation_time, 1)
-        }
\ No newline at end of file
+        }
+
+
+def _rebalance_in_background(app, clinic_id, day):
+    with app.app_context():
+        try:
+            QueueService().rebalance_sort_keys(clinic_id, day)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception(f"Rebalancing queue sort keys failed for clinic {clinic_id}")
+        finally:
+            db.session.remove()
@@ -0,0 +1,284 @@
+"""
+Daily report rollups
+
+DailyRevenueRollup and DailyVisitRollup hold per-day sums of paid payments and
+visits so the revenue, visits and doctor-shares reports don't have to load
+every row in their range. A bucket is a (day, clinic, doctor) slice of both
+tables; it is rebuilt from the source rows with one DELETE and one
+INSERT ... SELECT per table, which keeps the rollups exact no matter which code
+path changed a payment or visit.
+
+Payments and visits changed in a transaction are collected on flush and their
+buckets are rebuilt just before the transaction commits, so rollups commit
+together with the change. Only changes to what the rollups aggregate count:
+updates that just move a visit through the queue (waiting, called, in
+progress) or touch other columns commit without a rebuild. The migration
+backfills the tables; `flask rebuild-rollups` repairs a date range.
+"""
+from datetime import timedelta
+from sqlalchemy import event, insert, select, delete, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.models.payment import Payment, PaymentStatus
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.models.report_rollup import DailyRevenueRollup, DailyVisitRollup
+from app.utils.aggregates import count_if
+from app.utils.helpers import date_range_filter
+
+
+class ReportRollupService:
+    """Maintains and reads the daily report rollup tables"""
+
+    def __init__(self):
+        self._listening = False
+
+    def init_app(self, app):
+        """Start rebuilding the rollup buckets touched by each committed transaction"""
+        if not self._listening:
+            event.listen(Session, 'after_flush', _collect_changes)
+            event.listen(Session, 'before_commit', _refresh_changes)
+            event.listen(Session, 'after_soft_rollback', _discard_changes)
+            self._listening = True
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def _lock_days(self, session, days):
+        """Serialize rebuilds of the same day across transactions (PostgreSQL only)"""
+        if session.get_bind().dialect.name != 'postgresql':
+            return
+        for day in sorted(days):
+            session.execute(
+                select(db.func.pg_advisory_xact_lock(day.toordinal()))
+            )
+
+    def _rebuild(self, session, start_date, end_date, clinic_id=None, doctor_id=None):
+        payment_day = db.func.date(Payment.created_at)
+        revenue = select(
+            payment_day,
+            Visit.clinic_id,
+            Visit.doctor_id,
+            Visit.service_id,
+            Payment.payment_method,
+            db.func.count(Payment.id),
+            db.func.coalesce(db.func.sum(Payment.amount_paid), 0),
+            db.func.coalesce(db.func.sum(Payment.doctor_share), 0),
+            db.func.coalesce(db.func.sum(Payment.center_share), 0)
+        ).join(
+            Visit, Payment.visit_id == Visit.id
+        ).where(
+            Payment.status == PaymentStatus.PAID,
+            date_range_filter(Payment.created_at, start_date, end_date)
+        ).group_by(
+            payment_day, Visit.clinic_id, Visit.doctor_id, Visit.service_id, Payment.payment_method
+        )
+
+        visit_day = db.func.date(Visit.created_at)
+        visits = select(
+            visit_day,
+            Visit.clinic_id,
+            Visit.doctor_id,
+            Visit.service_id,
+            db.func.count(Visit.id),
+            count_if(Visit.visit_type == VisitType.SCHEDULED),
+            count_if(Visit.visit_type == VisitType.WALK_IN),
+            count_if(Visit.status == VisitStatus.COMPLETED)
+        ).where(
+            date_range_filter(Visit.created_at, start_date, end_date)
+        ).group_by(
+            visit_day, Visit.clinic_id, Visit.doctor_id, Visit.service_id
+        )
+
+        clear_revenue = delete(DailyRevenueRollup).where(
+            DailyRevenueRollup.day >= start_date, DailyRevenueRollup.day <= end_date
+        )
+        clear_visits = delete(DailyVisitRollup).where(
+            DailyVisitRollup.day >= start_date, DailyVisitRollup.day <= end_date
+        )
+        if clinic_id is not None:
+            revenue = revenue.where(Visit.clinic_id == clinic_id)
+            visits = visits.where(Visit.clinic_id == clinic_id)
+            clear_revenue = clear_revenue.where(DailyRevenueRollup.clinic_id == clinic_id)
+            clear_visits = clear_visits.where(DailyVisitRollup.clinic_id == clinic_id)
+        if doctor_id is not None:
+            revenue = revenue.where(Visit.doctor_id == doctor_id)
+            visits = visits.where(Visit.doctor_id == doctor_id)
+            clear_revenue = clear_revenue.where(DailyRevenueRollup.doctor_id == doctor_id)
+            clear_visits = clear_visits.where(DailyVisitRollup.doctor_id == doctor_id)
+
+        session.execute(clear_revenue, execution_options={'synchronize_session': False})
+        session.execute(clear_visits, execution_options={'synchronize_session': False})
+        session.execute(insert(DailyRevenueRollup).from_select([
+            'day', 'clinic_id', 'doctor_id', 'service_id', 'payment_method',
+            'payment_count', 'total_revenue', 'doctor_share', 'center_share'
+        ], revenue))
+        session.execute(insert(DailyVisitRollup).from_select([
+            'day', 'clinic_id', 'doctor_id', 'service_id',
+            'total_visits', 'scheduled_visits', 'walk_in_visits', 'completed_visits'
+        ], visits))
+
+    def refresh_buckets(self, buckets, session=None):
+        """Rebuild the given (day, clinic_id, doctor_id) buckets"""
+        session = session or db.session
+        buckets = sorted(set(buckets))
+        if not buckets:
+            return
+        self._lock_days(session, {day for day, _, _ in buckets})
+        for day, clinic_id, doctor_id in buckets:
+            self._rebuild(session, day, day, clinic_id, doctor_id)
+
+    def rebuild(self, start_date, end_date, clinic_id=None, doctor_id=None):
+        """Rebuild every bucket between start_date and end_date (inclusive) and commit"""
+        days = {start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)}
+        self._lock_days(db.session, days)
+        self._rebuild(db.session, start_date, end_date, clinic_id, doctor_id)
+        db.session.commit()
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def _filtered(self, query, model, start_date, end_date, clinic_id=None, doctor_id=None):
+        query = query.filter(model.day >= start_date, model.day <= end_date)
+        if clinic_id:
+            query = query.filter(model.clinic_id == clinic_id)
+        if doctor_id:
+            query = query.filter(model.doctor_id == doctor_id)
+        return query
+
+    def revenue_by_doctor(self, start_date, end_date, clinic_id=None, doctor_id=None):
+        """Return (doctor, payment_count, total_revenue, doctor_share, center_share) rows"""
+        from app.models.doctor import Doctor
+        query = db.session.query(
+            Doctor,
+            db.func.sum(DailyRevenueRollup.payment_count),
+            db.func.sum(DailyRevenueRollup.total_revenue),
+            db.func.sum(DailyRevenueRollup.doctor_share),
+            db.func.sum(DailyRevenueRollup.center_share)
+        ).select_from(DailyRevenueRollup).join(Doctor, Doctor.id == DailyRevenueRollup.doctor_id)
+        query = self._filtered(query, DailyRevenueRollup, start_date, end_date, clinic_id, doctor_id)
+        return query.group_by(Doctor.id).order_by(Doctor.id).all()
+
+    def visits_by_clinic(self, start_date, end_date, clinic_id=None, doctor_id=None):
+        """Return (clinic, total, scheduled, walk_in, completed) rows"""
+        from app.models.clinic import Clinic
+        query = db.session.query(
+            Clinic,
+            db.func.sum(DailyVisitRollup.total_visits),
+            db.func.sum(DailyVisitRollup.scheduled_visits),
+            db.func.sum(DailyVisitRollup.walk_in_visits),
+            db.func.sum(DailyVisitRollup.completed_visits)
+        ).select_from(DailyVisitRollup).join(Clinic, Clinic.id == DailyVisitRollup.clinic_id)
+        query = self._filtered(query, DailyVisitRollup, start_date, end_date, clinic_id, doctor_id)
+        return query.group_by(Clinic.id).order_by(Clinic.id).all()
+
+    def visits_by_doctor(self, start_date, end_date, clinic_id=None, doctor_id=None):
+        """Return (doctor, total, completed) rows"""
+        from app.models.doctor import Doctor
+        query = db.session.query(
+            Doctor,
+            db.func.sum(DailyVisitRollup.total_visits),
+            db.func.sum(DailyVisitRollup.completed_visits)
+        ).select_from(DailyVisitRollup).join(Doctor, Doctor.id == DailyVisitRollup.doctor_id)
+        query = self._filtered(query, DailyVisitRollup, start_date, end_date, clinic_id, doctor_id)
+        return query.group_by(Doctor.id).order_by(Doctor.id).all()
+
+
+report_rollups = ReportRollupService()
+
+
+# ----------------------------------------------------------------------
+# Session hooks: collect touched payments/visits on flush and rebuild their
+# buckets before the transaction commits.
+# ----------------------------------------------------------------------
+
+def _pending(session):
+    return session.info.setdefault('rollup_changes', {'buckets': set(), 'payments': set(), 'visits': {}})
+
+
+# Columns the rollups group or sum by; status only counts on moves into or out
+# of the aggregated status (COMPLETED visits, PAID payments)
+VISIT_ROLLUP_ATTRIBUTES = ('created_at', 'clinic_id', 'doctor_id', 'service_id', 'visit_type')
+VISIT_SCOPE_ATTRIBUTES = ('clinic_id', 'doctor_id', 'service_id')
+PAYMENT_ROLLUP_ATTRIBUTES = ('created_at', 'visit_id', 'payment_method', 'amount_paid', 'doctor_share', 'center_share')
+
+
+def _changed(obj, attributes):
+    attrs = inspect(obj).attrs
+    return any(attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+def _status_changed(obj, aggregated_status):
+    history = inspect(obj).attrs['status'].history
+    if not history.has_changes():
+        return False
+    # An unloaded previous value could have been the aggregated status
+    return not history.deleted or aggregated_status in set(history.added) | set(history.deleted)
+
+
+def _history_values(obj, attribute):
+    """Current and previous values of an attribute"""
+    history = inspect(obj).attrs[attribute].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    return {value for value in values if value is not None}
+
+
+def _collect_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        inserted_or_deleted = obj in session.new or obj in session.deleted
+        if isinstance(obj, Visit):
+            if not (inserted_or_deleted or _changed(obj, VISIT_ROLLUP_ATTRIBUTES)
+                    or _status_changed(obj, VisitStatus.COMPLETED)):
+                continue
+            changes = _pending(session)
+            scopes = {
+                (clinic_id, doctor_id)
+                for clinic_id in _history_values(obj, 'clinic_id')
+                for doctor_id in _history_values(obj, 'doctor_id')
+            }
+            if obj.created_at:
+                changes['buckets'].update((obj.created_at.date(),) + scope for scope in scopes)
+            # The visit's payment is bucketed by the payment day, and grouped by the visit's scope
+            if obj.id is not None and (inserted_or_deleted or _changed(obj, VISIT_SCOPE_ATTRIBUTES)):
+                changes['visits'].setdefault(obj.id, set()).update(scopes)
+        elif isinstance(obj, Payment):
+            if not (inserted_or_deleted or _changed(obj, PAYMENT_ROLLUP_ATTRIBUTES)
+                    or _status_changed(obj, PaymentStatus.PAID)):
+                continue
+            if obj.created_at and obj.visit_id is not None:
+                _pending(session)['payments'].add((obj.created_at.date(), obj.visit_id))
+
+
+def _refresh_changes(session):
+    # before_commit runs ahead of the commit's own flush; flush here so the
+    # pending changes are collected too
+    session.flush()
+    changes = session.info.pop('rollup_changes', None)
+    if not changes:
+        return
+
+    buckets = set(changes['buckets'])
+    visits = changes['visits']
+    payment_visit_ids = {visit_id for _, visit_id in changes['payments']} - set(visits)
+    if payment_visit_ids:
+        for visit_id, clinic_id, doctor_id in session.execute(
+            select(Visit.id, Visit.clinic_id, Visit.doctor_id).where(Visit.id.in_(payment_visit_ids))
+        ):
+            visits[visit_id] = {(clinic_id, doctor_id)}
+    for day, visit_id in changes['payments']:
+        buckets.update((day,) + scope for scope in visits.get(visit_id, ()))
+
+    changed_visit_ids = set(visits) - payment_visit_ids
+    if changed_visit_ids:
+        for visit_id, created_at in session.execute(
+            select(Payment.visit_id, Payment.created_at).where(Payment.visit_id.in_(changed_visit_ids))
+        ):
+            if created_at:
+                buckets.update((created_at.date(),) + scope for scope in visits[visit_id])
+
+    report_rollups.refresh_buckets(buckets, session)
+
+
+def _discard_changes(session, previous_transaction):
+    session.info.pop('rollup_changes', None)
@@ -0,0 +1,177 @@
+"""
+SMS providers for the notification dispatcher
+
+A provider sends one message at a time and says how it went with a
+SendResult; the dispatcher calls it from several threads at once, so
+providers must be thread-safe. SMS_PROVIDER picks one:
+
+- 'log' (default): writes the message to the log, for development and tests.
+- 'http': POSTs {'to', 'from', 'message'} as JSON to SMS_API_URL with
+  SMS_API_KEY as a bearer token. Connections are kept alive and reused from
+  a pool of SMS_POOL_SIZE, so a batch doesn't pay a TCP/TLS handshake per
+  message.
+
+429 and 5xx responses and connection errors are retryable; 429 also marks
+the result as throttled, and a Retry-After header is passed on so the
+caller can hold off.
+"""
+import http.client
+import json
+import logging
+import queue
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class SendResult:
+    """Outcome of sending one message"""
+
+    def __init__(self, ok, error=None, retryable=False, retry_after=None, throttled=False):
+        self.ok = ok
+        self.error = error
+        self.retryable = retryable or throttled
+        self.retry_after = retry_after  # seconds, if the provider asked
+        self.throttled = throttled  # the provider is rate limiting us, not rejecting the message
+
+    def __repr__(self):
+        if self.ok:
+            return 'SendResult(ok)'
+        return f'SendResult(error={self.error!r}, retryable={self.retryable})'
+
+
+class SMSProvider:
+    """Sends one SMS; must be safe to call from several threads"""
+
+    def send(self, recipient, message):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LogProvider(SMSProvider):
+    """Logs messages instead of sending them"""
+
+    def __init__(self, sender_id=None):
+        self.sender_id = sender_id
+
+    def send(self, recipient, message):
+        logger.info(f"SMS from {self.sender_id} to {recipient}: {message}")
+        return SendResult(True)
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one host, reused across threads"""
+
+    # Errors from a kept-alive connection the server already closed
+    STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, scheme, netloc, size=10, timeout=10):
+        self.connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        self.netloc = netloc
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self.connection_class(self.netloc, timeout=self.timeout), False
+
+    def _put(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, headers, body) of one request over a pooled connection"""
+        connection, reused = self._get()
+        try:
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+            except self.STALE_ERRORS:
+                if not reused:
+                    raise
+                # The server dropped the idle connection before reading the request
+                connection.close()
+                connection = self.connection_class(self.netloc, timeout=self.timeout)
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+            payload = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._put(connection)
+        return response.status, response.headers, payload
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class HTTPProvider(SMSProvider):
+    """JSON-over-HTTP SMS gateway"""
+
+    def __init__(self, url, api_key=None, sender_id=None, pool_size=10, timeout=10):
+        parts = urlsplit(url)
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+        self.api_key = api_key
+        self.sender_id = sender_id
+        self.pool = ConnectionPool(parts.scheme, parts.netloc, pool_size, timeout)
+
+    def send(self, recipient, message):
+        body = json.dumps({'to': recipient, 'from': self.sender_id, 'message': message}).encode()
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        try:
+            status, response_headers, _ = self.pool.request('POST', self.path, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            return SendResult(False, error=str(e) or type(e).__name__, retryable=True)
+
+        if 200 <= status < 300:
+            return SendResult(True)
+        if status == 429 or status >= 500:
+            return SendResult(False, error=f'HTTP {status}', retryable=True, throttled=status == 429,
+                              retry_after=parse_retry_after(response_headers.get('Retry-After')))
+        return SendResult(False, error=f'HTTP {status}')
+
+    def close(self):
+        self.pool.close()
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header given in seconds, else None"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def create_provider(config):
+    """The SMS provider configured by SMS_PROVIDER"""
+    name = config.get('SMS_PROVIDER', 'log')
+    if name == 'log':
+        return LogProvider(config.get('SMS_SENDER_ID'))
+    if name == 'http':
+        if not config.get('SMS_API_URL'):
+            raise ValueError("SMS_API_URL must be set for the http SMS provider")
+        return HTTPProvider(
+            config['SMS_API_URL'],
+            api_key=config.get('SMS_API_KEY'),
+            sender_id=config.get('SMS_SENDER_ID'),
+            pool_size=config.get('SMS_POOL_SIZE', 10),
+            timeout=config.get('SMS_TIMEOUT', 10),
+        )
+    raise ValueError(f"Unknown SMS provider: {name}")
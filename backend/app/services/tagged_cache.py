@@ -0,0 +1,229 @@
+"""
+Tag-based invalidation for cached API responses
+
+Each cached response is stored together with the versions of the tags it
+depends on (a clinic, a doctor, a day, ...). Invalidating a tag replaces its
+version, so every entry stamped with the old version is ignored from then on -
+without knowing which keys those entries live under. Tags and entries live in
+the same Flask-Caching backend, so this works across workers whenever the
+backend is shared.
+
+Appointments, visits and payments committed in a transaction invalidate the
+tags of the clinics, doctors, patients and days they touched (old and new
+values); patients, doctors, clinics and services invalidate REFERENCE_TAG,
+which every entry depends on because responses embed their names. The
+invalidation happens once the transaction commits, so the next request reads
+the committed state.
+"""
+import os
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app import cache
+from app.models.appointment import Appointment
+from app.models.visit import Visit
+from app.models.payment import Payment
+from app.models.patient import Patient
+from app.models.doctor import Doctor
+from app.models.clinic import Clinic
+from app.models.service import Service
+
+# Names, prices and other reference data embedded in every cached response
+REFERENCE_TAG = 'reference'
+# Patient lists (new patients don't change any appointment or dashboard response)
+PATIENTS_TAG = 'patients'
+
+
+def activity_tags(clinic_ids=(), doctor_ids=(), patient_ids=(), days=()):
+    """Tags invalidated by a change to appointments/visits/payments in these scopes"""
+    tags = {'all'}
+    tags.update(f'clinic:{clinic_id}' for clinic_id in clinic_ids)
+    tags.update(f'doctor:{doctor_id}' for doctor_id in doctor_ids)
+    tags.update(f'patient:{patient_id}' for patient_id in patient_ids)
+    for day in days:
+        tags.add(f'day:{day}')
+        tags.update(f'clinic:{clinic_id}:day:{day}' for clinic_id in clinic_ids)
+        tags.update(f'doctor:{doctor_id}:day:{day}' for doctor_id in doctor_ids)
+    return tags
+
+
+def activity_scope(clinic_id=None, doctor_id=None, patient_id=None, day=None):
+    """
+    Tags a response filtered this way depends on
+
+    The narrowest scope wins: any change that can affect the response
+    invalidates that one tag, while changes elsewhere leave the entry alone.
+    """
+    if patient_id:
+        scope = f'patient:{patient_id}'
+    elif doctor_id and day:
+        scope = f'doctor:{doctor_id}:day:{day}'
+    elif clinic_id and day:
+        scope = f'clinic:{clinic_id}:day:{day}'
+    elif doctor_id:
+        scope = f'doctor:{doctor_id}'
+    elif clinic_id:
+        scope = f'clinic:{clinic_id}'
+    elif day:
+        scope = f'day:{day}'
+    else:
+        scope = 'all'
+    return [scope, REFERENCE_TAG]
+
+
+def _new_version():
+    return os.urandom(8).hex()
+
+
+class CacheEntry:
+    """A cached value that is only served while its tags are unchanged"""
+
+    def __init__(self, tagged_cache, key, tags):
+        self.tagged_cache = tagged_cache
+        self.key = key
+        self.tags = list(tags)
+        self._versions = None
+
+    def get(self):
+        """The cached value, or None if it is missing or one of its tags was invalidated"""
+        stored, versions = self.tagged_cache._read(self.key, self.tags)
+        # Versions are read before the caller computes the value, so a change
+        # committed in the meantime invalidates what set() stores
+        self._versions = versions
+        if stored is not None and list(stored[0]) == versions:
+            return stored[1]
+        return None
+
+    def set(self, value, timeout=None):
+        if self._versions is None:
+            self.get()
+        cache.set(self.key, (self._versions, value), timeout=timeout)
+
+
+class TaggedCache:
+    """Tag versions and commit-time invalidation on top of the Flask-Caching `cache`"""
+
+    key_prefix = 'tag:'
+
+    def __init__(self):
+        self._listening = False
+
+    def init_app(self, app):
+        """Start invalidating the tags touched by each committed transaction"""
+        if not self._listening:
+            event.listen(Session, 'after_flush', _collect_changes)
+            event.listen(Session, 'do_orm_execute', _collect_bulk_changes)
+            event.listen(Session, 'after_commit', _apply_changes)
+            event.listen(Session, 'after_soft_rollback', _discard_changes)
+            self._listening = True
+
+    def entry(self, key, tags):
+        return CacheEntry(self, key, tags)
+
+    def _read(self, key, tags):
+        tag_keys = [self.key_prefix + tag for tag in tags]
+        stored, *versions = cache.get_many(key, *tag_keys)
+        missing = [tag_key for tag_key, version in zip(tag_keys, versions) if version is None]
+        if missing:
+            for tag_key in missing:
+                cache.add(tag_key, _new_version(), timeout=0)
+            # Another worker may have added the version first
+            versions = cache.get_many(*tag_keys)
+        return stored, list(versions)
+
+    def invalidate(self, tags):
+        """Drop every entry that depends on one of the tags"""
+        if tags:
+            # New versions rather than delete_many(), which stops at the first
+            # missing key on some backends
+            cache.set_many({self.key_prefix + tag: _new_version() for tag in tags}, timeout=0)
+
+
+tagged_cache = TaggedCache()
+
+
+# ----------------------------------------------------------------------
+# Session hooks: collect the tags touched on flush, invalidate them once the
+# transaction commits and drop them on rollback.
+# ----------------------------------------------------------------------
+
+def _pending(session):
+    return session.info.setdefault('cache_tags', set())
+
+
+def _history_values(obj, attribute):
+    """Current and previous values of an attribute"""
+    history = inspect(obj).attrs[attribute].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    return {value for value in values if value is not None}
+
+
+def _days(obj, attribute):
+    return {value.date() for value in _history_values(obj, attribute)}
+
+
+def _collect_changes(session, flush_context):
+    tags = set()
+    appointment_ids = set()
+    payment_days = {}  # visit_id -> days
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Appointment):
+            tags |= activity_tags(
+                _history_values(obj, 'clinic_id'),
+                _history_values(obj, 'doctor_id'),
+                _history_values(obj, 'patient_id'),
+                _days(obj, 'start_time'),
+            )
+        elif isinstance(obj, Visit):
+            tags |= activity_tags(
+                _history_values(obj, 'clinic_id'),
+                _history_values(obj, 'doctor_id'),
+                _history_values(obj, 'patient_id'),
+                _days(obj, 'created_at'),
+            )
+            # Appointment lists embed the visit
+            appointment_ids |= _history_values(obj, 'appointment_id')
+        elif isinstance(obj, Payment):
+            for visit_id in _history_values(obj, 'visit_id'):
+                payment_days.setdefault(visit_id, set()).update(_days(obj, 'created_at'))
+        elif isinstance(obj, Patient):
+            tags.add(PATIENTS_TAG)
+            if obj not in session.new:
+                tags.update({REFERENCE_TAG, f'patient:{obj.id}'})
+        elif isinstance(obj, (Doctor, Clinic, Service)):
+            tags.add(REFERENCE_TAG)
+
+    if payment_days:
+        for visit_id, clinic_id, doctor_id, patient_id, appointment_id in session.execute(
+            select(Visit.id, Visit.clinic_id, Visit.doctor_id, Visit.patient_id, Visit.appointment_id)
+            .where(Visit.id.in_(payment_days))
+        ):
+            tags |= activity_tags({clinic_id}, {doctor_id}, {patient_id}, payment_days[visit_id])
+            if appointment_id is not None:
+                appointment_ids.add(appointment_id)
+    if appointment_ids:
+        for clinic_id, doctor_id, patient_id, start_time in session.execute(
+            select(Appointment.clinic_id, Appointment.doctor_id, Appointment.patient_id, Appointment.start_time)
+            .where(Appointment.id.in_(appointment_ids))
+        ):
+            tags |= activity_tags({clinic_id}, {doctor_id}, {patient_id}, {start_time.date()})
+    if tags:
+        _pending(session).update(tags)
+
+
+def _collect_bulk_changes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (Appointment, Visit, Payment, Patient, Doctor, Clinic, Service):
+        # Bulk statements don't tell us which rows changed; every entry depends on REFERENCE_TAG
+        _pending(orm_execute_state.session).update({REFERENCE_TAG, PATIENTS_TAG})
+
+
+def _apply_changes(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        tagged_cache.invalidate(tags)
+
+
+def _discard_changes(session, previous_transaction):
+    session.info.pop('cache_tags', None)
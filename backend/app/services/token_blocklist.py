@@ -0,0 +1,254 @@
+"""
+JWT blocklist cache
+
+The token_in_blocklist_loader runs on every authenticated request and socket
+event. Instead of querying token_blacklist each time, every worker keeps:
+
+- a bloom filter of the JTIs revoked within the refresh token lifetime (older
+  tokens have expired and are rejected before the blocklist is consulted).
+  A JTI the filter has never seen is not revoked, so most lookups need no
+  query at all.
+- an LRU of JTIs whose status is known, which absorbs the filter's false
+  positives and answers revoked tokens without touching the database.
+
+The filter is loaded from token_blacklist when the app starts, so the first
+request doesn't pay for it (on first use instead if the table doesn't exist
+yet or TOKEN_BLOCKLIST_WARM_ON_START is off), and then pulls newly revoked
+JTIs every TOKEN_BLOCKLIST_SYNC_SECONDS - from Redis when
+TOKEN_BLOCKLIST_REDIS_URL is set, otherwise from the table. Logouts handled
+by this worker take effect immediately; other workers see them after at most
+one sync interval.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import inspect
+from app import db
+from app.models.user import TokenBlocklist
+
+REDIS_KEY = 'token_blocklist'
+
+# Logouts committed out of id/created_at order are still picked up by
+# re-reading this much history on every sync
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class _BlocklistState:
+    """Per-app cache contents"""
+
+    def __init__(self, capacity):
+        self.bloom = BloomFilter(capacity)
+        self.known = OrderedDict()
+        self.synced_at = None
+        self.synced_until = None
+
+
+class TokenBlocklistCache:
+    """Answers "is this JTI revoked?" from memory wherever possible"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def init_app(self, app):
+        app.config.setdefault('TOKEN_BLOCKLIST_SYNC_SECONDS', 2)
+        app.config.setdefault('TOKEN_BLOCKLIST_BLOOM_CAPACITY', 100000)
+        app.config.setdefault('TOKEN_BLOCKLIST_LRU_SIZE', 10000)
+        app.config.setdefault('TOKEN_BLOCKLIST_REDIS_URL', None)
+        app.config.setdefault('TOKEN_BLOCKLIST_WARM_ON_START', True)
+        app.extensions['token_blocklist'] = {'state': None, 'redis': None}
+        if app.config['TOKEN_BLOCKLIST_WARM_ON_START']:
+            with app.app_context():
+                self.warm()
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _extension(self):
+        return current_app.extensions['token_blocklist']
+
+    def _redis(self):
+        """Redis client for sharing revocations, or None"""
+        extension = self._extension()
+        url = current_app.config.get('TOKEN_BLOCKLIST_REDIS_URL')
+        if url and extension['redis'] is None:
+            import redis
+            extension['redis'] = redis.Redis.from_url(url)
+        return extension['redis'] if url else None
+
+    def _lifetime(self):
+        return current_app.config.get('JWT_REFRESH_TOKEN_EXPIRES') or timedelta(days=30)
+
+    def _remember(self, state, jti, revoked):
+        state.known[jti] = revoked
+        state.known.move_to_end(jti)
+        while len(state.known) > current_app.config['TOKEN_BLOCKLIST_LRU_SIZE']:
+            state.known.popitem(last=False)
+
+    def _add_revoked(self, state, jtis):
+        for jti in jtis:
+            if jti not in state.bloom:
+                state.bloom.add(jti)
+            self._remember(state, jti, True)
+
+    def _load(self):
+        """Build a fresh filter from every revocation still within the token lifetime"""
+        now = datetime.utcnow()
+        query = db.session.query(TokenBlocklist.jti).filter(
+            TokenBlocklist.created_at >= now - self._lifetime()
+        ).order_by(TokenBlocklist.created_at)
+        jtis = [jti for jti, in query]
+        capacity = max(current_app.config['TOKEN_BLOCKLIST_BLOOM_CAPACITY'], len(jtis) * 2)
+        state = _BlocklistState(capacity)
+        self._add_revoked(state, jtis)
+        state.synced_at = time.monotonic()
+        state.synced_until = now
+        return state
+
+    def _pull_redis(self, client, since):
+        since_score = since.timestamp()
+        return [
+            jti.decode('utf-8') if isinstance(jti, bytes) else jti
+            for jti in client.zrangebyscore(REDIS_KEY, since_score, '+inf')
+        ]
+
+    def _pull_database(self, since):
+        query = db.session.query(TokenBlocklist.jti).filter(TokenBlocklist.created_at >= since)
+        return [jti for jti, in query]
+
+    def _sync(self, state):
+        """Add JTIs revoked by other workers since the last sync"""
+        if time.monotonic() - state.synced_at < current_app.config['TOKEN_BLOCKLIST_SYNC_SECONDS']:
+            return state
+        now = datetime.utcnow()
+        since = state.synced_until - SYNC_OVERLAP
+        client = self._redis()
+        jtis = None
+        if client is not None:
+            try:
+                jtis = self._pull_redis(client, since)
+            except Exception as e:
+                current_app.logger.warning(f'Token blocklist Redis sync failed, using the database: {e}')
+        if jtis is None:
+            jtis = self._pull_database(since)
+        self._add_revoked(state, jtis)
+        state.synced_at = time.monotonic()
+        state.synced_until = now
+        if state.bloom.count > state.bloom.capacity:
+            # Too full for its error rate; rebuild at a larger size
+            state = self._load()
+        return state
+
+    def _state(self):
+        extension = self._extension()
+        with self._lock:
+            state = extension['state']
+            state = self._load() if state is None else self._sync(state)
+            extension['state'] = state
+            return state
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def warm(self):
+        """Load the filter now instead of on the first lookup; returns False if it couldn't be"""
+        try:
+            if not inspect(db.engine).has_table(TokenBlocklist.__tablename__):
+                return False  # not migrated yet, e.g. `flask db upgrade` on a new database
+            state = self._load()
+        except Exception as e:
+            current_app.logger.warning(f'Could not warm the token blocklist cache, loading it on first use: {e}')
+            db.session.rollback()
+            return False
+        with self._lock:
+            self._extension()['state'] = state
+        return True
+
+    def is_revoked(self, jti):
+        """True if the token with this JTI has been revoked"""
+        try:
+            state = self._state()
+        except Exception as e:
+            current_app.logger.warning(f'Token blocklist cache unavailable, querying directly: {e}')
+            db.session.rollback()
+            return db.session.query(TokenBlocklist.id).filter_by(jti=jti).first() is not None
+
+        if jti not in state.bloom:
+            return False
+        with self._lock:
+            revoked = state.known.get(jti)
+            if revoked is not None:
+                self._remember(state, jti, revoked)
+                return revoked
+        revoked = db.session.query(TokenBlocklist.id).filter_by(jti=jti).first() is not None
+        with self._lock:
+            self._remember(state, jti, revoked)
+        return revoked
+
+    def revoke(self, jti, created_at=None):
+        """Record a revocation committed to token_blacklist on this worker"""
+        extension = self._extension()
+        with self._lock:
+            if extension['state'] is not None:
+                self._add_revoked(extension['state'], [jti])
+        client = self._redis()
+        if client is not None:
+            try:
+                client.zadd(REDIS_KEY, {jti: (created_at or datetime.utcnow()).timestamp()})
+            except Exception as e:
+                # Other workers fall back to the table on their next sync
+                current_app.logger.warning(f'Could not share token revocation through Redis: {e}')
+
+    def prune(self, older_than=None):
+        """
+        Delete revocations older than the refresh token lifetime; returns the number deleted
+
+        older_than can only lengthen that: a shorter cutoff would drop
+        revocations of refresh tokens that are still valid.
+        """
+        cutoff = datetime.utcnow() - max(older_than or self._lifetime(), self._lifetime())
+        deleted = TokenBlocklist.query.filter(TokenBlocklist.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        client = self._redis()
+        if client is not None:
+            try:
+                client.zremrangebyscore(REDIS_KEY, '-inf', cutoff.timestamp())
+            except Exception as e:
+                current_app.logger.warning(f'Could not prune the Redis token blocklist: {e}')
+        # Rebuild the filter without the pruned entries on next use
+        with self._lock:
+            self._extension()['state'] = None
+        return deleted
+
+
+token_blocklist = TokenBlocklistCache()
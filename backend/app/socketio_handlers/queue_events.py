@@ -1,13 +1,23 @@
-from flask_socketio import emit, join_room, leave_room
-from app import socketio, db
-from app.services.queue_service import QueueService
-from app.models.user import User
-from flask_jwt_extended import decode_token
-from flask import request
+"""
+Socket.IO queue rooms
+
+The JWT is verified once, on connect: the caller's identity (role and
+doctor/clinic scope, from the identity cache) is kept in the socket's session
+together with the token's jti and expiry. Later events are authorized from
+that context plus the cached blocklist check, so they need no token and no
+database query. Role changes apply from the client's next connection.
+"""
+import time
+from flask_socketio import emit, join_room, leave_room, disconnect
+from app import socketio
+from app.services.queue_broadcaster import queue_broadcaster
+from app.services.identity_service import identity_cache
+from app.services.token_blocklist import token_blocklist
+from flask import request, session
 import jwt
 
 def verify_jwt_token(token):
-    """Verify JWT token and return user"""
+    """Verify JWT token and return the socket's auth context (None if it is not valid)"""
     try:
         # Get the secret key from app config
         from flask import current_app
@@ -15,11 +25,15 @@ def verify_jwt_token(token):
         
         # Verify and decode the token
         decoded = jwt.decode(token, secret, algorithms=['HS256'])
-        user_id = decoded['sub']
+        if token_blocklist.is_revoked(decoded['jti']):
+            print("JWT token has been revoked")
+            return None
         
-        # Get user from database
-        user = User.query.get(user_id)
-        return user
+        # Role and doctor/clinic scope, usually without a query
+        identity = identity_cache.get(int(decoded['sub']))
+        if identity is None:
+            return None
+        return {'identity': identity, 'jti': decoded['jti'], 'expires': decoded['exp']}
     except jwt.ExpiredSignatureError:
         print("JWT token has expired")
         return None
@@ -30,6 +44,37 @@ def verify_jwt_token(token):
         print(f"JWT verification failed: {e}")
         return None
 
+def socket_identity():
+    """Identity stored at connect, or None if the token has since expired or been revoked"""
+    context = session.get('auth')
+    if context is None:
+        return None
+    if context['expires'] <= time.time() or token_blocklist.is_revoked(context['jti']):
+        return None
+    return context['identity']
+
+def _same_id(value, expected):
+    try:
+        return int(value) == expected
+    except (TypeError, ValueError):
+        return False
+
+def can_watch(identity, clinic_id=None, doctor_id=None):
+    """Doctors only follow their own queue and clinic; other staff follow any"""
+    if not identity.is_doctor:
+        return True
+    if doctor_id is not None:
+        return _same_id(doctor_id, identity.doctor_id)
+    return _same_id(clinic_id, identity.clinic_id)
+
+def _authorized():
+    """The session's identity, or None after telling the client why not"""
+    identity = socket_identity()
+    if identity is None:
+        emit('error', {'message': 'Invalid authentication'})
+        disconnect()
+    return identity
+
 @socketio.on('connect')
 def handle_connect(auth=None):
     """Handle client connection"""
@@ -44,12 +89,13 @@ def handle_connect(auth=None):
         print("No token provided for connection")
         return False
     
-    user = verify_jwt_token(token)
-    if not user:
+    context = verify_jwt_token(token)
+    if not context:
         print("Invalid token for connection")
         return False
     
-    print(f"User {user.username} connected")
+    session['auth'] = context
+    print(f"User {context['identity'].id} connected")
     emit('connected', {'message': 'Connected to queue updates'})
 
 @socketio.on('disconnect')
@@ -60,58 +106,35 @@ def handle_disconnect():
 @socketio.on('join_queue_room')
 def handle_join_queue_room(data):
     """Join a clinic queue room for real-time updates"""
-    # Get token from data or query params
-    token = None
-    if data and 'token' in data:
-        token = data['token']
-    elif request.args.get('token'):
-        token = request.args.get('token')
-    
-    if not token:
-        emit('error', {'message': 'Authentication required'})
-        return False
-    
-    user = verify_jwt_token(token)
-    if not user:
-        emit('error', {'message': 'Invalid authentication'})
+    identity = _authorized()
+    if not identity:
         return False
     
-    clinic_id = data.get('clinic_id')
+    clinic_id = data.get('clinic_id') if data else None
     if not clinic_id:
         emit('error', {'message': 'clinic_id is required'})
         return
+    if not can_watch(identity, clinic_id=clinic_id):
+        emit('error', {'message': 'Access denied'})
+        return
     
     # Join the room
     room = f'clinic_{clinic_id}'
     join_room(room)
     
-    # Send current queue state
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(clinic_id)
-    emit('queue_updated', queue_data)
+    # Send current queue state; deltas continue from its version
+    emit('queue_snapshot', queue_broadcaster.snapshot(clinic_id=clinic_id))
     
-    print(f"User {user.username} joined room {room}")
+    print(f"User {identity.id} joined room {room}")
 
 @socketio.on('leave_queue_room')
 def handle_leave_queue_room(data):
     """Leave a clinic queue room"""
-    # Get token from data or query params
-    token = None
-    if data and 'token' in data:
-        token = data['token']
-    elif request.args.get('token'):
-        token = request.args.get('token')
-    
-    if not token:
-        emit('error', {'message': 'Authentication required'})
-        return False
-    
-    user = verify_jwt_token(token)
-    if not user:
-        emit('error', {'message': 'Invalid authentication'})
+    identity = _authorized()
+    if not identity:
         return False
     
-    clinic_id = data.get('clinic_id')
+    clinic_id = data.get('clinic_id') if data else None
     if not clinic_id:
         emit('error', {'message': 'clinic_id is required'})
         return
@@ -120,63 +143,40 @@ def handle_leave_queue_room(data):
     room = f'clinic_{clinic_id}'
     leave_room(room)
     
-    print(f"User {user.username} left room {room}")
+    print(f"User {identity.id} left room {room}")
 
 @socketio.on('join_doctor_room')
 def handle_join_doctor_room(data):
     """Join a doctor queue room for real-time updates"""
-    # Get token from data or query params
-    token = None
-    if data and 'token' in data:
-        token = data['token']
-    elif request.args.get('token'):
-        token = request.args.get('token')
-    
-    if not token:
-        emit('error', {'message': 'Authentication required'})
+    identity = _authorized()
+    if not identity:
         return False
     
-    user = verify_jwt_token(token)
-    if not user:
-        emit('error', {'message': 'Invalid authentication'})
-        return False
-    
-    doctor_id = data.get('doctor_id')
+    doctor_id = data.get('doctor_id') if data else None
     if not doctor_id:
         emit('error', {'message': 'doctor_id is required'})
         return
+    if not can_watch(identity, doctor_id=doctor_id):
+        emit('error', {'message': 'Access denied'})
+        return
     
     # Join the room
     room = f'doctor_{doctor_id}'
     join_room(room)
     
-    # Send current queue state
-    queue_service = QueueService()
-    queue_data = queue_service.get_doctor_queue(doctor_id)
-    emit('queue_updated', queue_data)
+    # Send current queue state; deltas continue from its version
+    emit('queue_snapshot', queue_broadcaster.snapshot(doctor_id=doctor_id))
     
-    print(f"User {user.username} joined doctor room {room}")
+    print(f"User {identity.id} joined doctor room {room}")
 
 @socketio.on('leave_doctor_room')
 def handle_leave_doctor_room(data):
     """Leave a doctor queue room"""
-    # Get token from data or query params
-    token = None
-    if data and 'token' in data:
-        token = data['token']
-    elif request.args.get('token'):
-        token = request.args.get('token')
-    
-    if not token:
-        emit('error', {'message': 'Authentication required'})
-        return False
-    
-    user = verify_jwt_token(token)
-    if not user:
-        emit('error', {'message': 'Invalid authentication'})
+    identity = _authorized()
+    if not identity:
         return False
     
-    doctor_id = data.get('doctor_id')
+    doctor_id = data.get('doctor_id') if data else None
     if not doctor_id:
         emit('error', {'message': 'doctor_id is required'})
         return
@@ -185,18 +185,37 @@ def handle_leave_doctor_room(data):
     room = f'doctor_{doctor_id}'
     leave_room(room)
     
-    print(f"User {user.username} left doctor room {room}")
+    print(f"User {identity.id} left doctor room {room}")
+
+@socketio.on('queue_resync')
+def handle_queue_resync(data):
+    """Resend a room's queue to a client that missed a delta"""
+    identity = _authorized()
+    if not identity:
+        return False
+    
+    clinic_id = data.get('clinic_id') if data else None
+    doctor_id = data.get('doctor_id') if data else None
+    if not clinic_id and not doctor_id:
+        emit('error', {'message': 'clinic_id or doctor_id is required'})
+        return
+    if clinic_id:
+        doctor_id = None
+    if not can_watch(identity, clinic_id=clinic_id, doctor_id=doctor_id):
+        emit('error', {'message': 'Access denied'})
+        return
+    
+    # Only the version is sent back if the client is already up to date
+    emit('queue_snapshot', queue_broadcaster.snapshot(
+        clinic_id=clinic_id, doctor_id=doctor_id, known_version=data.get('version')
+    ))
 
 def broadcast_queue_update(clinic_id):
-    """Broadcast queue update to all clients in clinic room"""
-    queue_service = QueueService()
-    queue_data = queue_service.get_clinic_queue(clinic_id)
-    socketio.emit('queue_updated', queue_data, room=f'clinic_{clinic_id}')
+    """Broadcast a full queue snapshot to all clients in clinic room"""
+    socketio.emit('queue_snapshot', queue_broadcaster.snapshot(clinic_id=clinic_id), room=f'clinic_{clinic_id}')
 
 def broadcast_doctor_queue_update(doctor_id):
-    """Broadcast queue update to all clients in doctor room"""
-    queue_service = QueueService()
-    queue_data = queue_service.get_doctor_queue(doctor_id)
-    socketio.emit('queue_updated', queue_data, room=f'doctor_{doctor_id}')
+    """Broadcast a full queue snapshot to all clients in doctor room"""
+    socketio.emit('queue_snapshot', queue_broadcaster.snapshot(doctor_id=doctor_id), room=f'doctor_{doctor_id}')
 
-# Removed unused broadcast functions - functionality moved to individual route handlers
+# Visit changes reach the rooms as queue_delta events, see app/services/queue_broadcaster.py
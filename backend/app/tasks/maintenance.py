@@ -0,0 +1,14 @@
+from app.tasks.notifications import celery
+import logging
+
+@celery.task
+def prune_token_blocklist():
+    """Delete revoked token entries older than the refresh token lifetime"""
+    try:
+        from app.services.token_blocklist import token_blocklist
+        deleted = token_blocklist.prune()
+        logging.info(f"Pruned {deleted} revoked token entries")
+        return deleted
+    except Exception as e:
+        logging.error(f"Failed to prune token blocklist: {str(e)}")
+        return 0
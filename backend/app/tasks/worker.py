@@ -0,0 +1,95 @@
+"""
+Celery app and the Flask app its tasks run in
+
+The Flask app is built once per worker process, the first time a task needs
+it, rather than by every task run (which repeated logging setup, blueprint
+registration and extension init for each SMS). Tasks derive from
+AppContextTask: each run pushes the worker app's context, and popping it
+removes the run's scoped session, handing its connection back to the
+engine's pool for the next task.
+
+Prefork children dispose of the pool they inherit from the parent, so no
+database connection is shared across a fork.
+"""
+import threading
+from celery import Celery, Task
+from celery.schedules import crontab
+from celery.signals import worker_process_init
+from flask import has_app_context
+from app import create_app, db
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def get_worker_app():
+    """The worker's Flask app, built on first use"""
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                set_worker_app(create_app())
+    return _app
+
+
+def set_worker_app(app):
+    """Run tasks in an existing Flask app and take the broker settings and beat schedule from its config"""
+    global _app
+    _app = app
+    celery.conf.update(
+        broker_url=app.config.get('CELERY_BROKER_URL', celery.conf.broker_url),
+        result_backend=app.config.get('CELERY_RESULT_BACKEND', celery.conf.result_backend),
+        beat_schedule=beat_schedule(app.config),
+    )
+
+
+def beat_schedule(config):
+    """Periodic tasks for `celery beat`"""
+    return {
+        'dispatch-due-notifications': {
+            'task': 'app.tasks.notifications.process_pending_notifications',
+            'schedule': config.get('SMS_DISPATCH_INTERVAL', 30),
+            # A run that waited longer than an interval would just overlap the next one
+            'options': {'expires': config.get('SMS_DISPATCH_INTERVAL', 30)},
+        },
+        'schedule-daily-reminders': {
+            'task': 'app.tasks.notifications.schedule_daily_reminders',
+            'schedule': crontab(hour=config.get('SMS_REMINDER_HOUR', 18), minute=0),
+        },
+        'prune-token-blocklist': {
+            'task': 'app.tasks.maintenance.prune_token_blocklist',
+            'schedule': crontab(hour=config.get('TOKEN_BLOCKLIST_PRUNE_HOUR', 3), minute=0),
+        },
+    }
+
+
+class AppContextTask(Task):
+    """Runs in the worker app's context with a session of its own"""
+
+    def __call__(self, *args, **kwargs):
+        if has_app_context():
+            # Called directly from app code (or eagerly): use the caller's app
+            return super().__call__(*args, **kwargs)
+        with get_worker_app().app_context():
+            return super().__call__(*args, **kwargs)
+
+
+@worker_process_init.connect
+def _reset_inherited_pool(**kwargs):
+    if _app is not None:
+        with _app.app_context():
+            db.engine.dispose(close=False)
+
+
+# Create Celery instance
+celery = Celery('medical_crm', task_cls=AppContextTask)
+
+# Configure Celery
+celery.conf.update(
+    broker_url='redis://localhost:6379/0',
+    result_backend='redis://localhost:6379/0',
+    task_serializer='json',
+    accept_content=['json'],
+    result_serializer='json',
+    timezone='UTC',
+    enable_utc=True,
+)
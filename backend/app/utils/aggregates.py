@@ -0,0 +1,113 @@
+"""
+Conditional aggregates for the statistics endpoints
+
+count_if/sum_if let one SELECT compute several filtered counts and sums over
+the same rows. On PostgreSQL they compile to aggregate FILTER (WHERE ...)
+clauses; other databases (SQLite in development and tests) get the equivalent
+SUM(CASE WHEN ...) form.
+"""
+from sqlalchemy import Integer, Numeric
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from app import db
+
+
+class count_if(FunctionElement):
+    """COUNT of the rows matching `condition`"""
+    type = Integer()
+    name = 'count_if'
+    inherit_cache = True
+
+
+class sum_if(FunctionElement):
+    """SUM of `value` over the rows matching `condition`"""
+    type = Numeric()
+    name = 'sum_if'
+    inherit_cache = True
+
+
+@compiles(count_if)
+def _count_if_default(element, compiler, **kw):
+    condition, = element.clauses
+    return 'SUM(CASE WHEN %s THEN 1 ELSE 0 END)' % compiler.process(condition, **kw)
+
+
+@compiles(count_if, 'postgresql')
+def _count_if_postgresql(element, compiler, **kw):
+    condition, = element.clauses
+    return 'COUNT(*) FILTER (WHERE %s)' % compiler.process(condition, **kw)
+
+
+@compiles(sum_if)
+def _sum_if_default(element, compiler, **kw):
+    value, condition = element.clauses
+    return 'SUM(CASE WHEN %s THEN %s END)' % (
+        compiler.process(condition, **kw), compiler.process(value, **kw)
+    )
+
+
+@compiles(sum_if, 'postgresql')
+def _sum_if_postgresql(element, compiler, **kw):
+    value, condition = element.clauses
+    return 'SUM(%s) FILTER (WHERE %s)' % (
+        compiler.process(value, **kw), compiler.process(condition, **kw)
+    )
+
+
+def aggregate_row(query, **columns):
+    """
+    Evaluate named aggregate expressions over a filtered query in one SELECT
+
+    `query` supplies the FROM/JOIN/WHERE clauses; its selected entities are
+    replaced by the given columns. Returns {name: value} with NULL sums as 0.
+    """
+    row = query.with_entities(
+        *[expression.label(name) for name, expression in columns.items()]
+    ).order_by(None).one()
+    return {name: (value if value is not None else 0) for name, value in row._mapping.items()}
+
+
+def aggregate_scalars(**subqueries):
+    """
+    Evaluate several single-value queries over different tables in one SELECT
+
+    Each value is a query selecting one aggregate, e.g.
+    Clinic.query.with_entities(db.func.count(Clinic.id)).
+    """
+    row = db.session.query(
+        *[subquery.scalar_subquery().label(name) for name, subquery in subqueries.items()]
+    ).one()
+    return {name: (value if value is not None else 0) for name, value in row._mapping.items()}
+
+
+def aggregate_groups(query, group_by, **columns):
+    """
+    Evaluate named aggregates per group in one SELECT
+
+    group_by maps names to grouping columns. Returns a list of dicts holding
+    the group values and the aggregates; several breakdowns can then be
+    rolled up in Python from the finest grouping with rollup().
+    """
+    rows = query.with_entities(
+        *[column.label(name) for name, column in group_by.items()],
+        *[expression.label(name) for name, expression in columns.items()]
+    ).group_by(*group_by.values()).order_by(None).all()
+    results = []
+    for row in rows:
+        result = dict(row._mapping)
+        for name in columns:
+            if result[name] is None:
+                result[name] = 0
+        results.append(result)
+    return results
+
+
+def rollup(rows, key, value):
+    """Sum `value` over rows grouped by key(row), skipping rows where the key is None"""
+    totals = {}
+    for row in rows:
+        group = key(row)
+        if group is None:
+            continue
+        totals[group] = totals.get(group, 0) + row[value]
+    return totals
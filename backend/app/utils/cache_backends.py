@@ -0,0 +1,183 @@
+"""
+Cache backends selected by CACHE_BACKEND
+
+- simple: Flask-Caching's per-process SimpleCache (development, tests)
+- redis: one Redis cache shared by every worker
+- tiered: a small per-process L1 in front of the shared Redis L2, so hot
+  entries skip the network round trip and deserialization of big payloads
+
+Redis entries are serialized with msgpack (CACHE_SERIALIZER), which is
+smaller and faster than pickle for the plain dict/list payloads the API
+caches; anything msgpack can't represent is embedded as a pickle extension.
+Multi-key reads go to Redis as one MGET.
+"""
+import pickle
+from cachelib.serializers import RedisSerializer
+from flask_caching.backends.base import BaseCache
+from flask_caching.backends.rediscache import RedisCache as FlaskRedisCache
+from flask_caching.backends.simplecache import SimpleCache
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+BACKENDS = {
+    'simple': 'SimpleCache',
+    'redis': 'app.utils.cache_backends.RedisCache',
+    'tiered': 'app.utils.cache_backends.TieredCache',
+}
+
+# msgpack extension code for values stored as pickle
+_PICKLED = 1
+
+
+def configure_cache(app):
+    """Set Flask-Caching's CACHE_TYPE from the app's CACHE_BACKEND"""
+    backend = app.config.get('CACHE_BACKEND', 'simple')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown CACHE_BACKEND '{backend}'. Use one of: {', '.join(BACKENDS)}")
+    app.config['CACHE_TYPE'] = BACKENDS[backend]
+
+
+def _pack_default(value):
+    return msgpack.ExtType(_PICKLED, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def _unpack_ext(code, data):
+    if code == _PICKLED:
+        return pickle.loads(data)
+    return msgpack.ExtType(code, data)
+
+
+class MsgpackSerializer(RedisSerializer):
+    """
+    msgpack with a pickle fallback
+
+    Values are prefixed with '~' and integers are stored as digits; pickled
+    ('!') values written by the stock serializer still load, so switching
+    serializers needs no flush. Tuples come back as lists.
+    """
+
+    def dumps(self, value, protocol=pickle.HIGHEST_PROTOCOL):
+        if type(value) is int:
+            # Plain digits keep INCRBY working
+            return str(value).encode('ascii')
+        return b'~' + msgpack.packb(value, default=_pack_default, use_bin_type=True)
+
+    def loads(self, value):
+        if value is not None and value.startswith(b'~'):
+            return msgpack.unpackb(value[1:], ext_hook=_unpack_ext, raw=False, strict_map_key=False)
+        return super().loads(value)
+
+
+def make_serializer(name):
+    if name == 'pickle':
+        return RedisSerializer()
+    if name == 'msgpack':
+        if msgpack is None:
+            raise RuntimeError("CACHE_SERIALIZER 'msgpack' needs the msgpack package")
+        return MsgpackSerializer()
+    raise ValueError(f"Unknown CACHE_SERIALIZER '{name}'. Use 'msgpack' or 'pickle'")
+
+
+class RedisCache(FlaskRedisCache):
+    """Flask-Caching's RedisCache with a configurable serializer"""
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        cache = super().factory(app, config, args, kwargs)
+        cache.serializer = make_serializer(config.get('CACHE_SERIALIZER', 'msgpack'))
+        return cache
+
+
+class TieredCache(BaseCache):
+    """
+    In-process L1 copies of entries read from or written to a shared L2
+
+    L1 copies live for at most l1_timeout seconds, which bounds how stale
+    another worker's write can look here. Keys starting with one of
+    shared_prefixes (tag versions, queue room versions) are always read from
+    L2, so they change on every worker at once.
+    """
+
+    def __init__(self, l2, l1_timeout=5, l1_threshold=1000, shared_prefixes=('tag:', 'queue_version:'), default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        self.l1 = SimpleCache(threshold=l1_threshold, default_timeout=l1_timeout, ignore_errors=True)
+        self.l2 = l2
+        self.l1_timeout = l1_timeout
+        self.shared_prefixes = tuple(shared_prefixes)
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        l2 = RedisCache.factory(app, config, [], dict(kwargs))
+        kwargs.update(
+            l1_timeout=config.get('CACHE_L1_TIMEOUT', 5),
+            l1_threshold=config.get('CACHE_L1_THRESHOLD', 1000),
+        )
+        return cls(l2, *args, **kwargs)
+
+    def _local(self, key):
+        return not key.startswith(self.shared_prefixes)
+
+    def _l1_timeout(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return self.l1_timeout if timeout <= 0 else min(timeout, self.l1_timeout)
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys):
+        values = [None] * len(keys)
+        missing = []
+        for index, key in enumerate(keys):
+            if self._local(key):
+                values[index] = self.l1.get(key)
+            if values[index] is None:
+                missing.append(index)
+        if missing:
+            for index, value in zip(missing, self.l2.get_many(*(keys[index] for index in missing))):
+                values[index] = value
+                if value is not None and self._local(keys[index]):
+                    self.l1.set(keys[index], value, timeout=self.l1_timeout)
+        return values
+
+    def has(self, key):
+        return (self._local(key) and self.l1.has(key)) or self.l2.has(key)
+
+    def set(self, key, value, timeout=None):
+        if self._local(key):
+            self.l1.set(key, value, timeout=self._l1_timeout(timeout))
+        return self.l2.set(key, value, timeout=timeout)
+
+    def set_many(self, mapping, timeout=None):
+        local = {key: value for key, value in mapping.items() if self._local(key)}
+        if local:
+            self.l1.set_many(local, timeout=self._l1_timeout(timeout))
+        return self.l2.set_many(mapping, timeout=timeout)
+
+    def add(self, key, value, timeout=None):
+        added = self.l2.add(key, value, timeout=timeout)
+        if added and self._local(key):
+            self.l1.set(key, value, timeout=self._l1_timeout(timeout))
+        return added
+
+    def delete(self, key):
+        self.l1.delete(key)
+        return self.l2.delete(key)
+
+    def delete_many(self, *keys):
+        self.l1.delete_many(*keys)
+        return self.l2.delete_many(*keys)
+
+    def inc(self, key, delta=1):
+        self.l1.delete(key)
+        return self.l2.inc(key, delta)
+
+    def dec(self, key, delta=1):
+        self.l1.delete(key)
+        return self.l2.dec(key, delta)
+
+    def clear(self):
+        self.l1.clear()
+        return self.l2.clear()
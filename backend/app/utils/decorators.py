@@ -1,8 +1,8 @@
 from functools import wraps
 from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.user import User, UserRole
+from flask_jwt_extended import jwt_required
 from app.models.audit_log import AuditLog
+from app.services.identity_service import current_identity
 from app import db
 
 def role_required(roles):
@@ -11,8 +11,8 @@ def role_required(roles):
         @wraps(f)
         @jwt_required()
         def decorated_function(*args, **kwargs):
-            current_user_id = int(get_jwt_identity())
-            user = User.query.get(current_user_id)
+            # Cached identity (id, role, doctor_id, clinic_id), no query on a cache hit
+            user = current_identity()
             
             if not user:
                 return jsonify({'message': 'User not found'}), 401
@@ -20,7 +20,7 @@ def role_required(roles):
             if user.role.value not in roles:
                 return jsonify({'message': 'Insufficient permissions'}), 403
             
-            # Add user to kwargs for use in the function
+            # Add identity to kwargs for use in the function
             kwargs['current_user'] = user
             return f(*args, **kwargs)
         return decorated_function
@@ -1,31 +1,15 @@
-from datetime import datetime, timedelta
-from app.models.appointment import Appointment
+from datetime import datetime, time, timedelta
 from app import db
 
 def generate_booking_id():
     """Generate unique booking ID in format A-YYYY-MMDD-XXXX"""
-    today = datetime.now()
-    date_str = today.strftime('%Y-%m%d')
-    
-    # Get the last booking ID for today
-    last_appointment = db.session.query(Appointment).filter(
-        Appointment.booking_id.like(f'A-{date_str}-%')
-    ).order_by(Appointment.booking_id.desc()).first()
-    
-    if last_appointment:
-        # Extract sequence number and increment
-        try:
-            last_sequence = int(last_appointment.booking_id.split('-')[-1])
-            new_sequence = last_sequence + 1
-        except (ValueError, IndexError):
-            new_sequence = 1
-    else:
-        new_sequence = 1
-    
-    # Format with leading zeros (4 digits)
-    sequence_str = f"{new_sequence:04d}"
-    
-    return f"A-{date_str}-{sequence_str}"
+    from app.services.booking_ids import booking_ids
+    return booking_ids.generate()
+
+def generate_booking_ids(count):
+    """Generate count unique booking IDs at once (one round trip)"""
+    from app.services.booking_ids import booking_ids
+    return booking_ids.generate_many(count)
 
 def calculate_doctor_share(total_amount, doctor_share_percentage):
     """Calculate doctor's share of payment"""
@@ -36,19 +20,50 @@ def calculate_center_share(total_amount, doctor_share):
     return total_amount - doctor_share
 
 def get_next_queue_number(clinic_id, date=None):
-    """Get next queue number for clinic on given date"""
-    if date is None:
-        date = datetime.now().date()
-    
-    # Get the highest queue number for the clinic on the given date
-    from app.models.visit import Visit
-    
-    max_queue = db.session.query(db.func.max(Visit.queue_number)).filter(
-        Visit.clinic_id == clinic_id,
-        db.func.date(Visit.created_at) == date
-    ).scalar()
-    
-    return (max_queue or 0) + 1
+    """Allocate the next queue number for clinic on given date (today by default)"""
+    from app.services.queue_numbers import queue_numbers
+    return queue_numbers.allocate(clinic_id, date)
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    return value
+
+def day_bounds(start_date, end_date=None):
+    """
+    Return the half-open [start, end) datetimes covering start_date..end_date
+
+    Both dates are inclusive; end_date defaults to start_date.
+    """
+    start_date = _as_date(start_date)
+    end_date = start_date if end_date is None else _as_date(end_date)
+    return (
+        datetime.combine(start_date, time.min),
+        datetime.combine(end_date + timedelta(days=1), time.min)
+    )
+
+def date_range_filter(column, start_date=None, end_date=None):
+    """
+    Filter a timestamp column to the days start_date..end_date (both inclusive)
+
+    Either side may be None for an open range. Compares the raw column against
+    [start, end) timestamps instead of wrapping it in DATE(), so the database
+    can use a plain index on the column.
+    """
+    conditions = []
+    if start_date is not None:
+        conditions.append(column >= day_bounds(start_date)[0])
+    if end_date is not None:
+        conditions.append(column < day_bounds(end_date)[1])
+    if not conditions:
+        return db.true()
+    return db.and_(*conditions)
+
+def date_filter(column, day):
+    """Filter a timestamp column to a single day"""
+    return date_range_filter(column, day, day)
 
 def format_datetime_for_display(dt):
     """Format datetime for display in UI"""
@@ -0,0 +1,158 @@
+"""
+Column projections for list endpoints
+
+A Projection maps the field names a client may ask for (`?fields=id,start_time,
+patient.name`) to columns of a root model and of the models joined to it.
+select() narrows a filtered query to exactly those columns, outer-joining only
+the relations that are needed, and serialize() turns each result row into
+the same nested shape to_dict() produces - without building ORM objects.
+
+A bare relation name (`patient`) selects all of that relation's columns; a
+relation whose row is missing serializes as None, like in to_dict().
+"""
+import enum
+from datetime import date, datetime
+from decimal import Decimal
+
+
+def format_value(value):
+    """JSON-friendly value, formatted the way the models' to_dict() do"""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def model_columns(model, exclude=()):
+    """{column name: attribute} for every column of a model"""
+    return {
+        column.key: getattr(model, column.key)
+        for column in model.__table__.columns
+        if column.key not in exclude
+    }
+
+
+class Relation:
+    """A to-one relation reachable from the root model with an outer join"""
+
+    def __init__(self, model, onclause, columns=None, via=None):
+        self.model = model
+        self.onclause = onclause
+        self.columns = columns if columns is not None else model_columns(model)
+        # Relation that has to be joined first (e.g. payment via visit)
+        self.via = via
+
+
+class Projection:
+    """Field name -> column mapping for a root model and its to-one relations"""
+
+    def __init__(self, model, columns=None, relations=None):
+        self.model = model
+        self.columns = columns if columns is not None else model_columns(model)
+        self.relations = relations or {}
+
+    def resolve(self, fields):
+        """
+        Parse a comma separated field list into {relation or None: [column names]}
+
+        Raises ValueError for unknown fields.
+        """
+        selected = {}
+        for field in fields.split(','):
+            field = field.strip()
+            if not field:
+                continue
+            if field in self.relations:
+                owner, names = field, list(self.relations[field].columns)
+            elif '.' in field:
+                owner, name = field.split('.', 1)
+                relation = self.relations.get(owner)
+                if relation is None or name not in relation.columns:
+                    raise ValueError(f'Unknown field: {field}')
+                names = [name]
+            elif field in self.columns:
+                owner, names = None, [field]
+            else:
+                raise ValueError(f'Unknown field: {field}')
+            columns = selected.setdefault(owner, [])
+            columns.extend(name for name in names if name not in columns)
+        if not selected:
+            raise ValueError('No fields requested')
+        return selected
+
+    def _joins(self, selected):
+        order = []
+
+        def add(name):
+            relation = self.relations[name]
+            if relation.via:
+                add(relation.via)
+            if name not in order:
+                order.append(name)
+
+        for owner in selected:
+            if owner is not None:
+                add(owner)
+        return order
+
+    def select(self, query, fields):
+        """
+        Restrict a query on the root model to the requested fields
+
+        Returns (query, layout); pass each result row and the layout to
+        serialize(). Filters, ordering and pagination of `query` still apply.
+        """
+        selected = self.resolve(fields)
+        entities = []
+        layout = []
+        for name in selected.get(None, []):
+            entities.append(self.columns[name])
+            layout.append((None, name))
+        for owner in self._joins(selected):
+            relation = self.relations[owner]
+            query = query.outerjoin(relation.model, relation.onclause)
+            if owner not in selected:
+                continue
+            # The relation's primary key tells a missing row from NULL columns
+            entities.append(relation.model.id)
+            layout.append((owner, None))
+            for name in selected[owner]:
+                entities.append(relation.columns[name])
+                layout.append((owner, name))
+        return query.with_entities(*entities), layout
+
+    @staticmethod
+    def serialize(row, layout):
+        """Build the nested dict for one result row"""
+        result = {}
+        for value, (owner, name) in zip(row, layout):
+            if owner is None:
+                result[name] = format_value(value)
+            elif name is None:
+                result[owner] = {} if value is not None else None
+            elif result[owner] is not None:
+                result[owner][name] = format_value(value)
+        return result
+
+
+def appointment_projection():
+    """Fields selectable on appointment lists (mirrors Appointment.to_dict)"""
+    from app.models.appointment import Appointment
+    from app.models.patient import Patient
+    from app.models.doctor import Doctor
+    from app.models.clinic import Clinic
+    from app.models.service import Service
+    from app.models.visit import Visit
+    from app.models.payment import Payment
+
+    return Projection(Appointment, relations={
+        'patient': Relation(Patient, Patient.id == Appointment.patient_id),
+        'doctor': Relation(Doctor, Doctor.id == Appointment.doctor_id),
+        'clinic': Relation(Clinic, Clinic.id == Appointment.clinic_id),
+        'service': Relation(Service, Service.id == Appointment.service_id),
+        'visit': Relation(Visit, Visit.appointment_id == Appointment.id),
+        'payment': Relation(Payment, Payment.visit_id == Visit.id, via='visit'),
+    })
@@ -4,12 +4,11 @@ Celery Worker for Medical CRM
 Run this file to start the Celery worker for background tasks
 """
 
-import os
-from app import create_app
-from app.tasks.notifications import celery
+from app.tasks.worker import celery, get_worker_app
+from app.tasks import notifications, maintenance  # noqa: F401 (registers the tasks)
 
-# Create Flask app context
-app = create_app()
+# Build the Flask app the tasks run in once, before the worker forks
+app = get_worker_app()
 
 if __name__ == '__main__':
     # Start Celery worker
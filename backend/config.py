@@ -23,16 +23,79 @@ class Config:
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
-    # Rate limiting
-    RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL', 'memory://')
+    # Rate limiting (share counters between workers through Redis)
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URL') or os.environ.get('REDIS_URL', 'memory://')
+    
+    # Response cache: 'simple' (per process), 'redis' (shared by all workers) or
+    # 'tiered' (short-lived in-process copies in front of Redis)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'simple')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_KEY_PREFIX = 'medcrm:'
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_THRESHOLD = int(os.environ.get('CACHE_THRESHOLD', 2000))  # entries kept by the simple backend
+    # Redis value encoding: 'msgpack' or 'pickle'
+    CACHE_SERIALIZER = os.environ.get('CACHE_SERIALIZER', 'msgpack')
+    # Tiered backend: seconds and entries the in-process copies are kept
+    CACHE_L1_TIMEOUT = int(os.environ.get('CACHE_L1_TIMEOUT', 5))
+    CACHE_L1_THRESHOLD = int(os.environ.get('CACHE_L1_THRESHOLD', 1000))
+    
+    # Socket.IO message queue (redis:// or any kombu URL) so emits from every
+    # worker reach clients connected to the others; unset runs a single node
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'medcrm-socketio')
+    # Seconds queue deltas for one room are collected before being sent as one message (0 sends each at once)
+    QUEUE_DELTA_COALESCE_WINDOW = float(os.environ.get('QUEUE_DELTA_COALESCE_WINDOW', 0.1))
+    
+    # Queue numbers reserved per process at a time (1 takes each one from the counter row)
+    QUEUE_NUMBER_BLOCK_SIZE = int(os.environ.get('QUEUE_NUMBER_BLOCK_SIZE', 1))
+    # Booking ID sequence numbers reserved per process at a time
+    BOOKING_ID_BLOCK_SIZE = int(os.environ.get('BOOKING_ID_BLOCK_SIZE', 1))
+    
+    # Slot availability index (seconds before a cached doctor/day is reloaded)
+    AVAILABILITY_INDEX_TTL = int(os.environ.get('AVAILABILITY_INDEX_TTL', 60))
+    
+    # Exports (rows fetched per database round trip while streaming)
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+    
+    # Cached responses (seconds); entries are also dropped when the data they show changes
+    APPOINTMENTS_CACHE_TIMEOUT = int(os.environ.get('APPOINTMENTS_CACHE_TIMEOUT', 3600))
+    PATIENTS_CACHE_TIMEOUT = int(os.environ.get('PATIENTS_CACHE_TIMEOUT', 3600))
+    DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', 300))
+    
+    # Current user identity cache (seconds a user's role/doctor link is reused, 0 disables)
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 30))
+    
+    # JWT blocklist cache (seconds between pulls of other workers' revocations)
+    TOKEN_BLOCKLIST_SYNC_SECONDS = float(os.environ.get('TOKEN_BLOCKLIST_SYNC_SECONDS', 2))
+    TOKEN_BLOCKLIST_BLOOM_CAPACITY = int(os.environ.get('TOKEN_BLOCKLIST_BLOOM_CAPACITY', 100000))
+    TOKEN_BLOCKLIST_LRU_SIZE = int(os.environ.get('TOKEN_BLOCKLIST_LRU_SIZE', 10000))
+    # Share revocations through Redis instead of polling the table, e.g. redis://localhost:6379/1
+    TOKEN_BLOCKLIST_REDIS_URL = os.environ.get('TOKEN_BLOCKLIST_REDIS_URL')
+    # Nightly job deleting revocations past the refresh token lifetime (hour in UTC)
+    TOKEN_BLOCKLIST_PRUNE_HOUR = int(os.environ.get('TOKEN_BLOCKLIST_PRUNE_HOUR', 3))
     
     # Celery
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
     
-    # SMS Configuration
+    # SMS Configuration ('log' only logs messages, 'http' posts them to SMS_API_URL)
+    SMS_PROVIDER = os.environ.get('SMS_PROVIDER', 'log')
+    SMS_API_URL = os.environ.get('SMS_API_URL')
     SMS_API_KEY = os.environ.get('SMS_API_KEY')
     SMS_SENDER_ID = os.environ.get('SMS_SENDER_ID', 'MEDCRM')
+    SMS_POOL_SIZE = int(os.environ.get('SMS_POOL_SIZE', 10))
+    # Notifications claimed per batch and sent at once by the dispatcher
+    SMS_DISPATCH_BATCH_SIZE = int(os.environ.get('SMS_DISPATCH_BATCH_SIZE', 100))
+    SMS_DISPATCH_CONCURRENCY = int(os.environ.get('SMS_DISPATCH_CONCURRENCY', 10))
+    # Celery beat dispatch runs (seconds apart) and their send rate limits
+    SMS_DISPATCH_INTERVAL = int(os.environ.get('SMS_DISPATCH_INTERVAL', 30))
+    SMS_GLOBAL_RATE = float(os.environ.get('SMS_GLOBAL_RATE', 10))  # per second
+    SMS_GLOBAL_BURST = int(os.environ.get('SMS_GLOBAL_BURST', 100))
+    SMS_RECIPIENT_RATE = float(os.environ.get('SMS_RECIPIENT_RATE', 5))  # per hour
+    SMS_RECIPIENT_BURST = int(os.environ.get('SMS_RECIPIENT_BURST', 3))
+    # Nightly job creating the next day's reminders (hour in UTC), sent this long before each appointment
+    SMS_REMINDER_HOUR = int(os.environ.get('SMS_REMINDER_HOUR', 18))
+    SMS_REMINDER_LEAD_MINUTES = int(os.environ.get('SMS_REMINDER_LEAD_MINUTES', 60))
     
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -78,8 +141,14 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # Point at a PostgreSQL database (e.g. the docker-compose one) to run the suite against it
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
     WTF_CSRF_ENABLED = False
+    CACHE_BACKEND = 'simple'
+    RATELIMIT_STORAGE_URI = 'memory://'
+    # The Socket.IO test client needs a single node and synchronous emits
+    SOCKETIO_MESSAGE_QUEUE = None
+    QUEUE_DELTA_COALESCE_WINDOW = 0
 
 # Configuration mapping
 config = {
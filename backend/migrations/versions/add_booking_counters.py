@@ -0,0 +1,33 @@
+"""add booking_counters table
+
+Revision ID: add_booking_counters
+Revises: add_queue_counters
+Create Date: 2026-10-16 21:00:00.000000
+
+A day's counter starts from that day's highest existing booking ID on first
+use, so no backfill is needed.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_booking_counters'
+down_revision = 'add_queue_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'booking_counters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('last_number', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day')
+    )
+
+
+def downgrade():
+    op.drop_table('booking_counters')
@@ -0,0 +1,139 @@
+"""add daily report rollup tables
+
+Revision ID: add_daily_report_rollups
+Revises: add_date_range_indexes
+Create Date: 2026-10-16 14:00:00.000000
+
+Existing payments and visits are rolled up as part of the upgrade, so the
+reports (which read only the rollups) are complete right away.
+`flask rebuild-rollups` repairs a date range later on.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_daily_report_rollups'
+down_revision = 'add_date_range_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'daily_revenue_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('clinic_id', sa.Integer(), nullable=False),
+        sa.Column('doctor_id', sa.Integer(), nullable=False),
+        sa.Column('service_id', sa.Integer(), nullable=False),
+        # Reuse the enum type created with the payments table
+        sa.Column('payment_method', postgresql.ENUM('CASH', 'VISA', 'BANK_TRANSFER', name='paymentmethod',
+                                                    create_type=False), nullable=False),
+        sa.Column('payment_count', sa.Integer(), nullable=False),
+        sa.Column('total_revenue', sa.Numeric(12, 2), nullable=False),
+        sa.Column('doctor_share', sa.Numeric(12, 2), nullable=False),
+        sa.Column('center_share', sa.Numeric(12, 2), nullable=False),
+        sa.ForeignKeyConstraint(['clinic_id'], ['clinics.id']),
+        sa.ForeignKeyConstraint(['doctor_id'], ['doctors.id']),
+        sa.ForeignKeyConstraint(['service_id'], ['services.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'clinic_id', 'doctor_id', 'service_id', 'payment_method',
+                            name='_revenue_rollup_key_uc')
+    )
+    op.create_index('idx_revenue_rollup_doctor_day', 'daily_revenue_rollups', ['doctor_id', 'day'])
+    op.create_index('idx_revenue_rollup_clinic_day', 'daily_revenue_rollups', ['clinic_id', 'day'])
+
+    op.create_table(
+        'daily_visit_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('clinic_id', sa.Integer(), nullable=False),
+        sa.Column('doctor_id', sa.Integer(), nullable=False),
+        sa.Column('service_id', sa.Integer(), nullable=False),
+        sa.Column('total_visits', sa.Integer(), nullable=False),
+        sa.Column('scheduled_visits', sa.Integer(), nullable=False),
+        sa.Column('walk_in_visits', sa.Integer(), nullable=False),
+        sa.Column('completed_visits', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['clinic_id'], ['clinics.id']),
+        sa.ForeignKeyConstraint(['doctor_id'], ['doctors.id']),
+        sa.ForeignKeyConstraint(['service_id'], ['services.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'clinic_id', 'doctor_id', 'service_id', name='_visit_rollup_key_uc')
+    )
+    op.create_index('idx_visit_rollup_doctor_day', 'daily_visit_rollups', ['doctor_id', 'day'])
+    op.create_index('idx_visit_rollup_clinic_day', 'daily_visit_rollups', ['clinic_id', 'day'])
+
+    backfill()
+
+
+def count_if(condition):
+    return sa.func.coalesce(sa.func.sum(sa.case((condition, 1), else_=0)), 0)
+
+
+def backfill():
+    """Roll up every existing paid payment and visit, the same way ReportRollupService rebuilds a bucket"""
+    visits = sa.table(
+        'visits', sa.column('id'), sa.column('clinic_id'), sa.column('doctor_id'), sa.column('service_id'),
+        sa.column('visit_type'), sa.column('status'), sa.column('created_at')
+    )
+    payments = sa.table(
+        'payments', sa.column('id'), sa.column('visit_id'), sa.column('payment_method'), sa.column('status'),
+        sa.column('amount_paid'), sa.column('doctor_share'), sa.column('center_share'), sa.column('created_at')
+    )
+    revenue_rollups = sa.table(
+        'daily_revenue_rollups', sa.column('day'), sa.column('clinic_id'), sa.column('doctor_id'),
+        sa.column('service_id'), sa.column('payment_method'), sa.column('payment_count'),
+        sa.column('total_revenue'), sa.column('doctor_share'), sa.column('center_share')
+    )
+    visit_rollups = sa.table(
+        'daily_visit_rollups', sa.column('day'), sa.column('clinic_id'), sa.column('doctor_id'),
+        sa.column('service_id'), sa.column('total_visits'), sa.column('scheduled_visits'),
+        sa.column('walk_in_visits'), sa.column('completed_visits')
+    )
+
+    payment_day = sa.func.date(payments.c.created_at)
+    op.execute(revenue_rollups.insert().from_select(
+        ['day', 'clinic_id', 'doctor_id', 'service_id', 'payment_method',
+         'payment_count', 'total_revenue', 'doctor_share', 'center_share'],
+        sa.select(
+            payment_day, visits.c.clinic_id, visits.c.doctor_id, visits.c.service_id, payments.c.payment_method,
+            sa.func.count(payments.c.id),
+            sa.func.coalesce(sa.func.sum(payments.c.amount_paid), 0),
+            sa.func.coalesce(sa.func.sum(payments.c.doctor_share), 0),
+            sa.func.coalesce(sa.func.sum(payments.c.center_share), 0)
+        ).select_from(
+            payments.join(visits, payments.c.visit_id == visits.c.id)
+        ).where(
+            payments.c.status == 'PAID', payments.c.created_at.isnot(None)
+        ).group_by(
+            payment_day, visits.c.clinic_id, visits.c.doctor_id, visits.c.service_id, payments.c.payment_method
+        )
+    ))
+
+    visit_day = sa.func.date(visits.c.created_at)
+    op.execute(visit_rollups.insert().from_select(
+        ['day', 'clinic_id', 'doctor_id', 'service_id',
+         'total_visits', 'scheduled_visits', 'walk_in_visits', 'completed_visits'],
+        sa.select(
+            visit_day, visits.c.clinic_id, visits.c.doctor_id, visits.c.service_id,
+            sa.func.count(visits.c.id),
+            count_if(visits.c.visit_type == 'SCHEDULED'),
+            count_if(visits.c.visit_type == 'WALK_IN'),
+            count_if(visits.c.status == 'COMPLETED')
+        ).where(
+            visits.c.created_at.isnot(None)
+        ).group_by(
+            visit_day, visits.c.clinic_id, visits.c.doctor_id, visits.c.service_id
+        )
+    ))
+
+
+def downgrade():
+    op.drop_index('idx_visit_rollup_clinic_day', table_name='daily_visit_rollups')
+    op.drop_index('idx_visit_rollup_doctor_day', table_name='daily_visit_rollups')
+    op.drop_table('daily_visit_rollups')
+    op.drop_index('idx_revenue_rollup_clinic_day', table_name='daily_revenue_rollups')
+    op.drop_index('idx_revenue_rollup_doctor_day', table_name='daily_revenue_rollups')
+    op.drop_table('daily_revenue_rollups')
@@ -0,0 +1,32 @@
+"""add plain indexes for date range filters
+
+Revision ID: add_date_range_indexes
+Revises: add_is_active_to_doctors
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_date_range_indexes'
+down_revision = 'add_is_active_to_doctors'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Date filters compare the raw timestamp against [start, end) bounds, so they
+    # need plain btree indexes rather than DATE() expression indexes
+    op.create_index('idx_appointment_doctor_start', 'appointments', ['doctor_id', 'start_time'])
+    op.create_index('idx_appointment_clinic_start', 'appointments', ['clinic_id', 'start_time'])
+    op.create_index('idx_visit_clinic_created', 'visits', ['clinic_id', 'created_at'])
+    op.create_index('idx_visit_doctor_created', 'visits', ['doctor_id', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('idx_visit_doctor_created', table_name='visits')
+    op.drop_index('idx_visit_clinic_created', table_name='visits')
+    op.drop_index('idx_appointment_clinic_start', table_name='appointments')
+    op.drop_index('idx_appointment_doctor_start', table_name='appointments')
@@ -0,0 +1,26 @@
+"""add leased_until and attempts to notifications
+
+Revision ID: add_notification_leases
+Revises: add_visit_sort_keys
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_notification_leases'
+down_revision = 'add_visit_sort_keys'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('notifications', sa.Column('leased_until', sa.DateTime(), nullable=True))
+    op.add_column('notifications', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('notifications', 'attempts')
+    op.drop_column('notifications', 'leased_until')
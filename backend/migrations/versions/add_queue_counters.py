@@ -0,0 +1,35 @@
+"""add queue_counters table
+
+Revision ID: add_queue_counters
+Revises: add_token_blacklist_created_at
+Create Date: 2026-10-16 20:00:00.000000
+
+Counters start from the day's highest existing queue number on first use,
+so no backfill is needed.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_queue_counters'
+down_revision = 'add_token_blacklist_created_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'queue_counters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('clinic_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('last_number', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['clinic_id'], ['clinics.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('clinic_id', 'day', name='_queue_counter_key_uc')
+    )
+
+
+def downgrade():
+    op.drop_table('queue_counters')
@@ -0,0 +1,25 @@
+"""add created_at index to token_blacklist
+
+Revision ID: add_token_blacklist_created_at
+Revises: add_daily_report_rollups
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_token_blacklist_created_at'
+down_revision = 'add_daily_report_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The blocklist cache loads and syncs revocations by age, and pruning deletes by age
+    op.create_index('idx_token_blacklist_created_at', 'token_blacklist', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('idx_token_blacklist_created_at', table_name='token_blacklist')
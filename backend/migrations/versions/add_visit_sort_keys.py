@@ -0,0 +1,31 @@
+"""add sort_key to visits
+
+Revision ID: add_visit_sort_keys
+Revises: add_booking_counters
+Create Date: 2026-10-16 22:00:00.000000
+
+Existing visits keep their queue_number order: their keys are backfilled as
+queue_number * SORT_KEY_GAP, the default for new visits.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_visit_sort_keys'
+down_revision = 'add_booking_counters'
+branch_labels = None
+depends_on = None
+
+SORT_KEY_GAP = 1 << 16
+
+
+def upgrade():
+    op.add_column('visits', sa.Column('sort_key', sa.BigInteger(), nullable=True))
+    op.execute(f'UPDATE visits SET sort_key = queue_number * {SORT_KEY_GAP}')
+    with op.batch_alter_table('visits') as batch_op:
+        batch_op.alter_column('sort_key', existing_type=sa.BigInteger(), nullable=False)
+
+
+def downgrade():
+    op.drop_column('visits', 'sort_key')
@@ -4,6 +4,11 @@ Medical CRM Development Server
 Run this file to start the Flask development server with SocketIO support
 """
 
+# Patch before anything imports socket/threading: the Socket.IO message
+# queue's Redis listener would otherwise block the eventlet hub
+import eventlet
+eventlet.monkey_patch()
+
 import os
 from app import create_app, socketio
 
@@ -0,0 +1,29 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import db
+
+@contextmanager
+def captured_statements(match=None):
+    """Collect the SQL statements run inside the block, only those match() accepts if given"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if match is None or match(statement):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+def statements_during(fn, match=None):
+    """Run fn and return (result, SQL statements executed)"""
+    with captured_statements(match) as statements:
+        result = fn()
+    return result, statements
+
+def count_queries(fn, match=None):
+    """Run fn and return (result, number of SQL statements executed)"""
+    result, statements = statements_during(fn, match)
+    return result, len(statements)
@@ -0,0 +1,197 @@
+import pytest
+from datetime import datetime, timedelta, date
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, BookingSource
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.models.payment import PaymentStatus
+from app.routes import appointments as appointment_routes
+from app.services.booking_service import BookingService, series_start_times
+from app.services.queue_numbers import queue_numbers
+from tests.conftest import statements_during
+
+# A Monday far enough in the future that no slot is in the past
+MONDAY = date(2099, 6, 1)
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def test_data(app):
+    """Create a clinic with one doctor working 09:00-17:00 on weekdays"""
+    user = User(username='receptionist', password='password123', role=UserRole.RECEPTIONIST)
+    clinic = Clinic(name='Physiotherapy', room_number='101')
+    db.session.add_all([user, clinic])
+    db.session.flush()
+
+    doctor = Doctor(
+        name='Dr. Test',
+        specialty='Physiotherapy',
+        working_days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+        working_hours={'start': '09:00', 'end': '17:00'},
+        clinic_id=clinic.id
+    )
+    service = Service(clinic_id=clinic.id, name='Session', duration=30, price=100.00)
+    patient = Patient(name='Test Patient', phone='+1234567890')
+    db.session.add_all([doctor, service, patient])
+    db.session.commit()
+
+    return {
+        'token': create_access_token(identity=str(user.id)),
+        'user_id': user.id,
+        'clinic_id': clinic.id,
+        'doctor_id': doctor.id,
+        'patient_id': patient.id,
+        'service_id': service.id,
+    }
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
+
+def series_data(test_data, start_time):
+    return {
+        'clinic_id': test_data['clinic_id'],
+        'doctor_id': test_data['doctor_id'],
+        'patient_id': test_data['patient_id'],
+        'service_id': test_data['service_id'],
+        'start_time': start_time.isoformat(),
+        'booking_source': BookingSource.PHONE,
+        'created_by': test_data['user_id'],
+    }
+
+def book(test_data, start_time, booking_id='A-TEST-0001'):
+    db.session.add(Appointment(
+        booking_id=booking_id, clinic_id=test_data['clinic_id'], doctor_id=test_data['doctor_id'],
+        patient_id=test_data['patient_id'], service_id=test_data['service_id'],
+        start_time=start_time, end_time=start_time + timedelta(minutes=30),
+        booking_source=BookingSource.PHONE, created_by=test_data['user_id']
+    ))
+    db.session.commit()
+
+def test_series_start_times():
+    start = at(MONDAY, 10)
+    assert series_start_times(start, 3) == [start, start + timedelta(days=7), start + timedelta(days=14)]
+    assert series_start_times(start, 2, 'daily', 3) == [start, start + timedelta(days=3)]
+    with pytest.raises(ValueError):
+        series_start_times(start, 0)
+    with pytest.raises(ValueError):
+        series_start_times(start, 2, 'monthly')
+
+def test_series_is_booked_with_a_handful_of_queries(app, test_data):
+    (appointments, conflicts), statements = statements_during(lambda: BookingService().create_appointment_series(
+        series_data(test_data, at(MONDAY, 10)), {'count': 20, 'frequency': 'weekly'}
+    ))
+    assert conflicts == []
+    assert [appointment.start_time for appointment in appointments] == \
+        [at(MONDAY + timedelta(weeks=week), 10) for week in range(20)]
+    assert len({appointment.booking_id for appointment in appointments}) == 20
+    inserts = [statement for statement in statements
+               if statement.startswith(('INSERT INTO appointments', 'INSERT INTO visits', 'INSERT INTO payments'))]
+    # Queue numbers: one counter update (plus creating the counter) per day
+    counters = [statement for statement in statements
+                if 'queue_counters' in statement or 'max(visits.queue_number)' in statement]
+    savepoints = [statement for statement in statements if statement.startswith(('SAVEPOINT', 'RELEASE'))]
+    assert len(counters) <= 3 * 20
+    assert len(savepoints) <= 2 * (20 + 1)  # each new counter, and the booking ID counter
+    other = len(statements) - len(inserts) - len(counters) - len(savepoints)
+    # Service, calendar, booking IDs, the queue and rollup commit hooks, reload
+    assert other <= 20
+    if db.engine.dialect.name == 'postgresql':
+        # Batched into one INSERT ... RETURNING per table; SQLite has no ordered RETURNING for that
+        assert len(inserts) == 3
+        assert len(counters) == 20
+    assert Appointment.query.count() == 20
+
+def test_occurrences_are_queued_and_billed_like_single_bookings(app, test_data):
+    book(test_data, at(MONDAY, 9))
+    db.session.add(Visit(
+        appointment_id=Appointment.query.one().id, doctor_id=test_data['doctor_id'],
+        patient_id=test_data['patient_id'], service_id=test_data['service_id'],
+        clinic_id=test_data['clinic_id'], check_in_time=at(MONDAY, 9), visit_type=VisitType.SCHEDULED,
+        queue_number=queue_numbers.allocate(test_data['clinic_id'], MONDAY), status=VisitStatus.WAITING
+    ))
+    db.session.commit()
+
+    appointments, conflicts = BookingService().create_appointment_series(
+        series_data(test_data, at(MONDAY, 10)), {'count': 3, 'frequency': 'daily', 'interval': 1}
+    )
+    assert conflicts == []
+    visits = [appointment.visit for appointment in appointments]
+    # Numbers continue per day after the clinic's existing bookings
+    assert [visit.queue_number for visit in visits] == [2, 1, 1]
+    assert all(visit.status == VisitStatus.WAITING and visit.visit_type == VisitType.SCHEDULED for visit in visits)
+    assert [visit.check_in_time for visit in visits] == [appointment.start_time for appointment in appointments]
+    for visit in visits:
+        assert visit.payment.status == PaymentStatus.PENDING
+        assert float(visit.payment.total_amount) == 100.0
+        assert float(visit.payment.doctor_share) == 70.0 and float(visit.payment.center_share) == 30.0
+
+def test_conflicts_book_nothing_unless_partial(app, test_data):
+    book(test_data, at(MONDAY + timedelta(weeks=2), 10))
+    service = BookingService()
+    recurrence = {'count': 4, 'frequency': 'weekly', 'interval': 1}
+
+    appointments, conflicts = service.create_appointment_series(series_data(test_data, at(MONDAY, 10)), recurrence)
+    assert appointments == []
+    assert conflicts == [{
+        'occurrence': 2,
+        'start_time': at(MONDAY + timedelta(weeks=2), 10).isoformat(),
+        'message': 'Time slot conflicts with existing appointment'
+    }]
+    assert Appointment.query.count() == 1
+
+    appointments, conflicts = service.create_appointment_series(
+        series_data(test_data, at(MONDAY, 10)), recurrence, allow_partial=True
+    )
+    assert len(appointments) == 3 and len(conflicts) == 1
+    assert Appointment.query.count() == 4
+
+def test_any_unavailable_occurrence_blocks_the_series(app, test_data):
+    appointments, conflicts = BookingService().create_appointment_series(
+        series_data(test_data, at(MONDAY, 10)), {'count': 6, 'frequency': 'daily', 'interval': 1}
+    )
+    assert appointments == []
+    assert [conflict['occurrence'] for conflict in conflicts] == [5]  # Saturday
+    assert conflicts[0]['message'] == "Doctor doesn't work on Saturday"
+
+def test_series_endpoint(client, test_data, monkeypatch):
+    created = []
+    monkeypatch.setattr(appointment_routes, 'emit_appointment_created',
+                        lambda appointment, visit: created.append((appointment.id, visit.id)))
+    headers = {'Authorization': f"Bearer {test_data['token']}"}
+    payload = dict(series_data(test_data, at(MONDAY, 11)), booking_source='phone',
+                   recurrence={'count': 10, 'frequency': 'daily', 'interval': 7})
+    response = client.post('/api/appointments/series', json=payload, headers=headers)
+    assert response.status_code == 201
+    body = response.get_json()
+    assert len(body['appointments']) == 10
+    assert body['appointments'][0]['doctor']['name'] == 'Dr. Test'
+    assert [appointment_id for appointment_id, _ in created] == [appointment['id'] for appointment in body['appointments']]
+
+    response = client.post('/api/appointments/series', json=payload, headers=headers)
+    assert response.status_code == 409
+    assert len(response.get_json()['conflicts']) == 10
+
+    response = client.post('/api/appointments/series', json=dict(payload, recurrence='weekly'), headers=headers)
+    assert response.status_code == 400
+
+    for recurrence in ({'count': None}, {'count': 2, 'interval': 'x'}, {'count': 2.5}, {'frequency': ['weekly']}):
+        response = client.post('/api/appointments/series', json=dict(payload, recurrence=recurrence), headers=headers)
+        assert response.status_code == 400, recurrence
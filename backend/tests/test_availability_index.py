@@ -0,0 +1,221 @@
+import pytest
+from datetime import datetime, timedelta, date
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.doctor_schedule import DoctorSchedule
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, AppointmentStatus, BookingSource
+from app.services.availability_index import availability_index, interval_mask, hours_mask
+from app.services.booking_service import BookingService
+from app.services.conflict_engine import conflict_engine
+from tests.conftest import count_queries
+
+# A Monday far enough in the future that no slot is in the past
+MONDAY = date(2099, 6, 1)
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def test_data(app):
+    """Create a clinic with one doctor working 09:00-17:00 on weekdays"""
+    user = User(username='receptionist', password='password123', role=UserRole.RECEPTIONIST)
+    clinic = Clinic(name='Test Clinic', room_number='101')
+    db.session.add_all([user, clinic])
+    db.session.flush()
+
+    doctor = Doctor(
+        name='Dr. Test',
+        specialty='General Medicine',
+        working_days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+        working_hours={'start': '09:00', 'end': '17:00'},
+        clinic_id=clinic.id
+    )
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    patient = Patient(name='Test Patient', phone='+1234567890')
+    db.session.add_all([doctor, service, patient])
+    db.session.commit()
+
+    return {'user': user, 'clinic': clinic, 'doctor': doctor, 'service': service, 'patient': patient}
+
+def book(data, start_time, minutes=30, booking_id='A-TEST-0001'):
+    appointment = Appointment(
+        booking_id=booking_id,
+        clinic_id=data['clinic'].id,
+        doctor_id=data['doctor'].id,
+        patient_id=data['patient'].id,
+        service_id=data['service'].id,
+        start_time=start_time,
+        end_time=start_time + timedelta(minutes=minutes),
+        booking_source=BookingSource.PHONE,
+        created_by=data['user'].id
+    )
+    db.session.add(appointment)
+    db.session.commit()
+    return appointment
+
+def free_times(doctor_id, day):
+    return [slot['start_time'] for slot in BookingService().get_available_slots(doctor_id, day) if slot['available']]
+
+def test_interval_mask_covers_overlapped_slots():
+    """Appointments mark every half-hour slot they overlap"""
+    start = datetime.combine(MONDAY, datetime.min.time()) + timedelta(hours=9, minutes=10)
+    assert interval_mask(MONDAY, start, start + timedelta(minutes=30)) == 0b11 << 18
+    assert hours_mask([9]) == 0b11 << 18
+
+def test_slots_follow_working_hours_and_bookings(app, test_data):
+    """Slots come from the working hours and exclude booked ones"""
+    doctor_id = test_data['doctor'].id
+    assert len(free_times(doctor_id, MONDAY)) == 16
+
+    book(test_data, datetime.combine(MONDAY, datetime.min.time()) + timedelta(hours=10), minutes=60)
+
+    slots = BookingService().get_available_slots(doctor_id, MONDAY)
+    booked = [slot['start_time'] for slot in slots if slot.get('reason') == 'Booked']
+    assert booked == ['10:00', '10:30']
+    assert len(free_times(doctor_id, MONDAY)) == 14
+
+    # Sunday is not a working day
+    assert BookingService().get_available_slots(doctor_id, MONDAY - timedelta(days=1)) == []
+
+def test_working_hours_apply_only_on_working_days(app, test_data):
+    """Without schedule rows, slots are offered only on days the doctor could be booked"""
+    doctor = Doctor(
+        name='Dr. Unassigned',
+        specialty='General Medicine',
+        working_days=[],
+        working_hours={'start': '09:00', 'end': '17:00'},
+        clinic_id=test_data['clinic'].id
+    )
+    db.session.add(doctor)
+    db.session.commit()
+
+    assert BookingService().get_available_slots(doctor.id, MONDAY) == []
+    start = datetime.combine(MONDAY, datetime.min.time()) + timedelta(hours=9)
+    assert conflict_engine.validate(doctor.id, start, start + timedelta(minutes=30)) == \
+        (False, "Doctor doesn't work on Monday")
+
+def test_index_is_updated_on_commit(app, test_data):
+    """Creating and cancelling appointments updates cached days without reloading"""
+    doctor_id = test_data['doctor'].id
+    availability_index.get_day(doctor_id, MONDAY)
+
+    start = datetime.combine(MONDAY, datetime.min.time()) + timedelta(hours=9)
+    appointment = book(test_data, start)
+    times, queries = count_queries(lambda: free_times(doctor_id, MONDAY))
+    assert '09:00' not in times
+    assert queries == 0
+
+    appointment.status = AppointmentStatus.CANCELLED
+    db.session.commit()
+    times, queries = count_queries(lambda: free_times(doctor_id, MONDAY))
+    assert '09:00' in times
+    assert queries == 0
+
+    # Moving an appointment frees the old slot and books the new one
+    appointment.status = AppointmentStatus.CONFIRMED
+    db.session.commit()
+    appointment.start_time = start + timedelta(hours=2)
+    appointment.end_time = start + timedelta(hours=2, minutes=30)
+    db.session.commit()
+    times = free_times(doctor_id, MONDAY)
+    assert '09:00' in times and '11:00' not in times
+
+def test_rollback_does_not_leak_into_index(app, test_data):
+    """Rolled back bookings never show as booked"""
+    doctor_id = test_data['doctor'].id
+    start = datetime.combine(MONDAY, datetime.min.time()) + timedelta(hours=9)
+    db.session.add(Appointment(
+        booking_id='A-TEST-0002',
+        clinic_id=test_data['clinic'].id,
+        doctor_id=doctor_id,
+        patient_id=test_data['patient'].id,
+        service_id=test_data['service'].id,
+        start_time=start,
+        end_time=start + timedelta(minutes=30),
+        booking_source=BookingSource.PHONE,
+        created_by=test_data['user'].id
+    ))
+    db.session.flush()
+    assert '09:00' not in free_times(doctor_id, MONDAY)
+    db.session.rollback()
+    assert '09:00' in free_times(doctor_id, MONDAY)
+
+def test_schedule_change_invalidates_doctor(app, test_data):
+    """Replacing the DoctorSchedule rows reloads the doctor's week"""
+    doctor_id = test_data['doctor'].id
+    assert len(free_times(doctor_id, MONDAY)) == 16
+
+    DoctorSchedule.query.filter_by(doctor_id=doctor_id).delete()
+    db.session.add_all([DoctorSchedule(doctor_id, 1, hour) for hour in (14, 15)])
+    db.session.commit()
+
+    assert free_times(doctor_id, MONDAY) == ['14:00', '14:30', '15:00', '15:30']
+
+def test_next_free_slots_spans_days(app, test_data):
+    """The next-N query skips booked slots and non-working days in one pass"""
+    doctor_id = test_data['doctor'].id
+    friday = MONDAY + timedelta(days=4)
+    for i in range(16):
+        book(test_data, datetime.combine(friday, datetime.min.time()) + timedelta(hours=9, minutes=30 * i),
+             booking_id=f'A-TEST-{i:04d}')
+    db.session.expire_all()
+
+    slots, queries = count_queries(
+        lambda: BookingService().get_next_free_slots(doctor_id, 3, start_date=friday, days=7)
+    )
+
+    next_monday = datetime.combine(MONDAY + timedelta(days=7), datetime.min.time())
+    assert slots == [next_monday + timedelta(hours=9, minutes=30 * i) for i in range(3)]
+    # Doctor, schedule rows and one appointment query for the whole range
+    assert queries <= 3
+
+def test_clinic_availability_matrix(app, test_data):
+    """The clinic matrix matches the per-doctor slot lists"""
+    doctor_id = test_data['doctor'].id
+    book(test_data, datetime.combine(MONDAY, datetime.min.time()) + timedelta(hours=10), minutes=60)
+
+    result = BookingService().get_clinic_availability(test_data['clinic'].id, MONDAY - timedelta(days=1), 3)
+
+    assert result['dates'] == [(MONDAY + timedelta(days=i - 1)).isoformat() for i in range(3)]
+    row = result['doctors'][0]
+    assert row['id'] == doctor_id
+    assert row['schedule'][0] == 0  # Sunday
+    assert row['booked'][1] == 0b11 << 20
+    for offset in (1, 2):
+        day = MONDAY + timedelta(days=offset - 1)
+        expected = [i for i in range(48) if row['free'][offset] >> i & 1]
+        assert [f'{i // 2:02d}:{i % 2 * 30:02d}' for i in expected] == free_times(doctor_id, day)
+
+def test_clinic_availability_query_count_is_constant(app, test_data):
+    """Adding doctors and days does not add queries"""
+    clinic_id = test_data['clinic'].id
+    _, small_count = count_queries(
+        lambda: BookingService().get_clinic_availability(clinic_id, MONDAY, 1)
+    )
+
+    for i in range(14):
+        db.session.add(Doctor(
+            name=f'Dr. {i}',
+            specialty='General Medicine',
+            working_days=['Monday'],
+            working_hours={'start': '08:00', 'end': '12:00'},
+            clinic_id=clinic_id
+        ))
+    db.session.commit()
+    db.session.expire_all()
+
+    result, large_count = count_queries(
+        lambda: BookingService().get_clinic_availability(clinic_id, MONDAY, 7)
+    )
+    assert len(result['doctors']) == 15
+    assert large_count == small_count == 3
@@ -0,0 +1,146 @@
+"""
+Booking IDs from the daily counter
+
+test_booking_id_benchmark creates appointments from parallel threads with the
+old LIKE-based generator and with the counter, and reports duplicates and
+throughput. It is skipped unless BOOKING_ID_BENCHMARK is set.
+"""
+import os
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, BookingSource
+from app.services.booking_ids import booking_ids, format_booking_id
+from app.utils.helpers import generate_booking_id, generate_booking_ids
+from config import TestingConfig
+from tests.conftest import statements_during
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def create_scope():
+    user = User(username='admin', password='password123', role=UserRole.ADMIN)
+    clinic = Clinic(name='Clinic A', room_number='101')
+    patient = Patient(name='Test Patient', phone='+1234567890')
+    db.session.add_all([user, clinic, patient])
+    db.session.flush()
+    doctor = Doctor(name='Dr. A', specialty='General', working_days=['Monday'],
+                    working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    db.session.add_all([doctor, service])
+    db.session.commit()
+    return {'clinic_id': clinic.id, 'doctor_id': doctor.id, 'patient_id': patient.id,
+            'service_id': service.id, 'created_by': user.id}
+
+def add_appointment(scope, booking_id, offset=0):
+    start = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1, minutes=offset)
+    db.session.add(Appointment(booking_id=booking_id, start_time=start, end_time=start + timedelta(minutes=30),
+                               booking_source=BookingSource.PHONE, **scope))
+
+def legacy_booking_id():
+    """The LIKE-based generator the counter replaced"""
+    date_str = datetime.now().strftime('%Y-%m%d')
+    last = db.session.query(Appointment.booking_id).filter(
+        Appointment.booking_id.like(f'A-{date_str}-%')
+    ).order_by(Appointment.booking_id.desc()).first()
+    return f"A-{date_str}-{(int(last[0].split('-')[-1]) + 1 if last else 1):04d}"
+
+def test_ids_are_sequential_per_day(app):
+    today = datetime.now().date()
+    assert generate_booking_id() == format_booking_id(today, 1)
+    assert generate_booking_id() == format_booking_id(today, 2)
+    assert booking_ids.generate(today + timedelta(days=1)) == format_booking_id(today + timedelta(days=1), 1)
+
+def test_counter_continues_after_existing_ids(app):
+    scope = create_scope()
+    today = datetime.now().date()
+    add_appointment(scope, format_booking_id(today, 41))
+    add_appointment(scope, format_booking_id(today - timedelta(days=1), 99), offset=30)
+    db.session.commit()
+    assert generate_booking_id() == format_booking_id(today, 42)
+
+def test_batch_reserves_ids_without_like_scans(app):
+    generate_booking_id()
+    ids, statements = statements_during(lambda: generate_booking_ids(5))
+    today = datetime.now().date()
+    assert ids == [format_booking_id(today, sequence) for sequence in range(2, 7)]
+    assert not any('LIKE' in statement for statement in statements)
+    assert len(statements) <= 2  # UPDATE + SELECT here, one upsert on PostgreSQL
+    assert generate_booking_ids(0) == []
+
+def create_in_parallel(app, generator, threads=10, per_thread=20):
+    """Create appointments from parallel threads; returns (booking IDs, errors, seconds)"""
+    with app.app_context():
+        scope = create_scope()
+    barrier = threading.Barrier(threads)
+    errors = []
+
+    def create(index):
+        with app.app_context():
+            barrier.wait()
+            for number in range(per_thread):
+                try:
+                    add_appointment(scope, generator(), offset=index * per_thread + number)
+                    db.session.commit()
+                except IntegrityError as e:
+                    db.session.rollback()
+                    errors.append(e)
+            db.session.remove()
+
+    workers = [threading.Thread(target=create, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    with app.app_context():
+        created = [booking_id for booking_id, in db.session.query(Appointment.booking_id)]
+        db.session.remove()
+        db.drop_all()
+    return created, errors, elapsed
+
+def file_app(monkeypatch, tmp_path):
+    if not os.environ.get('TEST_DATABASE_URL'):
+        # Threads need their own connections to a shared database file
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'booking.db'}")
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_ENGINE_OPTIONS',
+                            {'connect_args': {'timeout': 30}, 'pool_size': 20}, raising=False)
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+    return app
+
+def test_parallel_creates_never_collide(monkeypatch, tmp_path):
+    app = file_app(monkeypatch, tmp_path)
+    created, errors, _ = create_in_parallel(app, generate_booking_id)
+    assert errors == []
+    assert len(created) == len(set(created)) == 200
+
+@pytest.mark.skipif(not os.environ.get('BOOKING_ID_BENCHMARK'), reason='set BOOKING_ID_BENCHMARK to run')
+def test_booking_id_benchmark(monkeypatch, tmp_path):
+    print()
+    for label, generator in (('LIKE scan', legacy_booking_id), ('counter', generate_booking_id)):
+        directory = tmp_path / label.replace(' ', '_')
+        directory.mkdir()
+        app = file_app(monkeypatch, directory)
+        created, errors, elapsed = create_in_parallel(app, generator)
+        print(f'{label:>10}: {len(created)} created, {len(errors)} duplicate-ID failures, '
+              f'{len(created) / elapsed:7.1f} appointments/s')
+        if generator is generate_booking_id:
+            assert errors == []
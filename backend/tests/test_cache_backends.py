@@ -0,0 +1,135 @@
+"""
+Cache backend selection, the tiered cache and the msgpack serializer
+
+The Redis tests run against fakeredis and are skipped when it (or msgpack)
+is not installed.
+"""
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from cachelib.serializers import RedisSerializer
+from flask_caching.backends.simplecache import SimpleCache
+from app import create_app, db, cache
+from app.utils.cache_backends import TieredCache, RedisCache, make_serializer
+from app.services.tagged_cache import tagged_cache
+from config import TestingConfig
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+class CountingCache(SimpleCache):
+    """SimpleCache that counts round trips"""
+
+    def __init__(self):
+        super().__init__(ignore_errors=True)
+        self.calls = 0
+
+    def get_many(self, *keys):
+        self.calls += 1
+        return super().get_many(*keys)
+
+def make_app(monkeypatch, backend):
+    monkeypatch.setattr(TestingConfig, 'CACHE_BACKEND', backend)
+    return create_app('testing')
+
+def use_fakeredis(app, server):
+    """Point an app's Redis cache (or the tiered cache's L2) at a fakeredis server"""
+    fakeredis = pytest.importorskip('fakeredis')
+    backend = app.extensions['cache'][cache]
+    redis_cache = backend.l2 if isinstance(backend, TieredCache) else backend
+    redis_cache._read_client = redis_cache._write_client = fakeredis.FakeRedis(server=server)
+    return redis_cache
+
+def test_simple_backend_by_default(app):
+    assert type(app.extensions['cache'][cache]).__name__ == 'SimpleCache'
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        make_app(monkeypatch, 'memcached')
+
+def test_tiered_cache_serves_hot_entries_locally():
+    l2 = CountingCache()
+    tiered = TieredCache(l2, l1_timeout=60)
+    tiered.set('appointments_1', {'total': 1})
+    assert tiered.get_many('appointments_1', 'appointments_2') == [{'total': 1}, None]
+    assert l2.calls == 1  # only the miss went to L2
+
+    # Entries written by another worker are fetched once, then served from L1
+    l2.set('appointments_2', {'total': 2})
+    assert tiered.get('appointments_2') == {'total': 2}
+    calls = l2.calls
+    assert tiered.get('appointments_2') == {'total': 2}
+    assert l2.calls == calls
+
+def test_tag_versions_are_always_read_from_l2():
+    l2 = CountingCache()
+    worker, other_worker = TieredCache(l2), TieredCache(l2)
+    worker.set('tag:clinic:1', 'v1', timeout=0)
+    assert worker.get('tag:clinic:1') == 'v1'
+
+    other_worker.set_many({'tag:clinic:1': 'v2'}, timeout=0)
+    assert worker.get('tag:clinic:1') == 'v2'
+
+def test_tiered_cache_deletes_both_levels():
+    l2 = CountingCache()
+    tiered = TieredCache(l2)
+    tiered.set('key', 'value')
+    tiered.delete_many('key', 'missing')
+    assert tiered.get('key') is None
+    assert l2.get('key') is None
+
+def test_msgpack_serializer_round_trip():
+    pytest.importorskip('msgpack')
+    serializer = make_serializer('msgpack')
+    payload = {'appointments': [{'id': 1, 'notes': None, 'price': 10.5}], 'total': 1}
+    assert serializer.loads(serializer.dumps(payload)) == payload
+    # Types msgpack lacks are pickled inside the message
+    value = {'at': datetime(2030, 1, 1, 9, 0), 'amount': Decimal('10.50')}
+    assert serializer.loads(serializer.dumps(value)) == value
+    # Integers stay INCRBY-compatible and pickled entries still load
+    assert serializer.dumps(42) == b'42' and serializer.loads(b'42') == 42
+    assert serializer.loads(RedisSerializer().dumps(payload)) == payload
+
+def test_redis_backend_uses_one_mget(monkeypatch):
+    pytest.importorskip('msgpack')
+    fakeredis = pytest.importorskip('fakeredis')
+    app = make_app(monkeypatch, 'redis')
+    redis_cache = use_fakeredis(app, fakeredis.FakeServer())
+    assert isinstance(redis_cache, RedisCache)
+
+    client = redis_cache._read_client
+    mget_calls = []
+    monkeypatch.setattr(client, 'mget', lambda *args, **kwargs: mget_calls.append(args) or
+                        fakeredis.FakeRedis.mget(client, *args, **kwargs))
+    with app.app_context():
+        cache.set_many({'a': {'x': 1}, 'b': [1, 2]})
+        assert cache.get_many('a', 'b', 'c') == [{'x': 1}, [1, 2], None]
+    assert len(mget_calls) == 1
+    assert client.get('medcrm:a').startswith(b'~')
+
+def test_tag_invalidation_reaches_other_workers(monkeypatch):
+    pytest.importorskip('msgpack')
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    worker, other_worker = make_app(monkeypatch, 'tiered'), make_app(monkeypatch, 'tiered')
+    use_fakeredis(worker, server)
+    use_fakeredis(other_worker, server)
+
+    with worker.app_context():
+        entry = tagged_cache.entry('appointments_1', ['clinic:1', 'reference'])
+        assert entry.get() is None
+        entry.set({'total': 1}, timeout=3600)
+        assert tagged_cache.entry('appointments_1', ['clinic:1', 'reference']).get() == {'total': 1}
+    with other_worker.app_context():
+        assert tagged_cache.entry('appointments_1', ['clinic:1', 'reference']).get() == {'total': 1}
+        tagged_cache.invalidate({'clinic:1'})
+    with worker.app_context():
+        # Still in this worker's L1, but stamped with the old tag version
+        assert tagged_cache.entry('appointments_1', ['clinic:1', 'reference']).get() is None
@@ -0,0 +1,155 @@
+import pytest
+from datetime import datetime, timedelta, date
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.doctor_schedule import DoctorSchedule
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, AppointmentStatus, BookingSource
+from app.services.booking_service import BookingService
+from app.services.conflict_engine import conflict_engine, IntervalSet, covered_hours
+from app.utils.validators import validate_appointment_time
+from tests.conftest import count_queries
+
+# A Monday far enough in the future that no slot is in the past
+MONDAY = date(2099, 6, 1)
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def test_data(app):
+    """Create a clinic with one doctor working 09:00-17:00 on weekdays"""
+    user = User(username='receptionist', password='password123', role=UserRole.RECEPTIONIST)
+    clinic = Clinic(name='Test Clinic', room_number='101')
+    db.session.add_all([user, clinic])
+    db.session.flush()
+
+    doctor = Doctor(
+        name='Dr. Test',
+        specialty='General Medicine',
+        working_days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+        working_hours={'start': '09:00', 'end': '17:00'},
+        clinic_id=clinic.id
+    )
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    patient = Patient(name='Test Patient', phone='+1234567890')
+    db.session.add_all([doctor, service, patient])
+    db.session.commit()
+
+    return {'user': user, 'clinic': clinic, 'doctor': doctor, 'service': service, 'patient': patient}
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
+
+def book(data, start_time, minutes=30, booking_id='A-TEST-0001', status=AppointmentStatus.CONFIRMED):
+    appointment = Appointment(
+        booking_id=booking_id,
+        clinic_id=data['clinic'].id,
+        doctor_id=data['doctor'].id,
+        patient_id=data['patient'].id,
+        service_id=data['service'].id,
+        start_time=start_time,
+        end_time=start_time + timedelta(minutes=minutes),
+        booking_source=BookingSource.PHONE,
+        created_by=data['user'].id,
+        status=status
+    )
+    db.session.add(appointment)
+    db.session.commit()
+    return appointment
+
+def test_interval_set_finds_overlaps_behind_short_intervals():
+    """A long interval that starts early is found past shorter ones that end before the query"""
+    intervals = IntervalSet()
+    intervals.add(at(MONDAY, 9), at(MONDAY, 12), 'long')
+    intervals.add(at(MONDAY, 9, 30), at(MONDAY, 10), 'short')
+    intervals.add(at(MONDAY, 13), at(MONDAY, 14), 'later')
+    assert intervals.overlapping(at(MONDAY, 11), at(MONDAY, 11, 30)) == ['long']
+    assert intervals.overlapping(at(MONDAY, 9, 45), at(MONDAY, 13, 15)) == ['later', 'short', 'long']
+    assert intervals.overlapping(at(MONDAY, 12), at(MONDAY, 13)) == []
+    assert intervals.overlapping(at(MONDAY, 9), at(MONDAY, 10), ignore='long') == ['short']
+
+def test_covered_hours_include_the_partial_last_hour():
+    assert covered_hours(at(MONDAY, 9, 50), at(MONDAY, 10, 20)) == [9, 10]
+    assert covered_hours(at(MONDAY, 9), at(MONDAY, 10)) == [9]
+
+def test_conflicts_and_working_hours(app, test_data):
+    doctor_id = test_data['doctor'].id
+    book(test_data, at(MONDAY, 10))
+
+    assert validate_appointment_time(doctor_id, at(MONDAY, 9, 45), at(MONDAY, 10, 15)) == \
+        (False, 'Time slot conflicts with existing appointment')
+    assert validate_appointment_time(doctor_id, at(MONDAY, 10, 30), at(MONDAY, 11)) == (True, 'Valid')
+    assert validate_appointment_time(doctor_id, at(MONDAY, 16, 45), at(MONDAY, 17, 15)) == \
+        (False, 'Appointment outside working hours')
+    sunday = MONDAY - timedelta(days=1)
+    assert validate_appointment_time(doctor_id, at(sunday, 10), at(sunday, 10, 30)) == \
+        (False, "Doctor doesn't work on Sunday")
+    assert validate_appointment_time(9999, at(MONDAY, 10), at(MONDAY, 10, 30)) == (False, 'Doctor not found')
+
+def test_cancelled_and_moved_appointments_do_not_conflict(app, test_data):
+    doctor_id = test_data['doctor'].id
+    moving = book(test_data, at(MONDAY, 10))
+    book(test_data, at(MONDAY, 11), booking_id='A-TEST-0002', status=AppointmentStatus.CANCELLED)
+
+    assert validate_appointment_time(doctor_id, at(MONDAY, 11), at(MONDAY, 11, 30)) == (True, 'Valid')
+    assert validate_appointment_time(doctor_id, at(MONDAY, 10, 15), at(MONDAY, 10, 45), moving.id) == (True, 'Valid')
+
+def test_schedule_rows_take_precedence(app, test_data):
+    doctor_id = test_data['doctor'].id
+    db.session.add_all([DoctorSchedule(doctor_id, 1, hour) for hour in (8, 9)])
+    db.session.commit()
+
+    assert validate_appointment_time(doctor_id, at(MONDAY, 8), at(MONDAY, 8, 30)) == (True, 'Valid')
+    assert validate_appointment_time(doctor_id, at(MONDAY, 9, 50), at(MONDAY, 10, 20)) == \
+        (False, "Appointment spans hours not in doctor's schedule: [10]")
+
+def test_series_is_validated_with_one_load(app, test_data):
+    doctor_id = test_data['doctor'].id
+    book(test_data, at(MONDAY + timedelta(days=14), 10))
+    proposals = [(at(MONDAY + timedelta(days=7 * week), 10), at(MONDAY + timedelta(days=7 * week), 10, 30))
+                 for week in range(4)]
+    proposals.append((at(MONDAY, 10, 15), at(MONDAY, 10, 45)))
+
+    results, queries = count_queries(lambda: conflict_engine.validate_many(doctor_id, proposals))
+    assert queries <= 3  # doctor, schedule, appointments
+    assert results == [
+        (True, 'Valid'),
+        (True, 'Valid'),
+        (False, 'Time slot conflicts with existing appointment'),
+        (True, 'Valid'),
+        (False, 'Time slot conflicts with another appointment in this request'),
+    ]
+
+def test_booking_service_uses_the_engine(app, test_data):
+    book(test_data, at(MONDAY, 10))
+    data = {
+        'booking_id': 'A-TEST-0002',
+        'clinic_id': test_data['clinic'].id,
+        'doctor_id': test_data['doctor'].id,
+        'patient_id': test_data['patient'].id,
+        'service_id': test_data['service'].id,
+        'start_time': at(MONDAY, 10, 15).isoformat(),
+        'booking_source': BookingSource.PHONE,
+        'created_by': test_data['user'].id,
+    }
+    with pytest.raises(ValueError, match='conflicts with existing appointment'):
+        BookingService().create_appointment(data)
+
+    appointment = BookingService().create_appointment(dict(data, start_time=at(MONDAY, 10, 30).isoformat()))
+    assert appointment.end_time == at(MONDAY, 11)
+
+    test_data['doctor'].is_active = False
+    db.session.commit()
+    with pytest.raises(ValueError, match='Doctor is not active'):
+        BookingService().create_appointment(dict(data, booking_id='A-TEST-0003', start_time=at(MONDAY, 12).isoformat()))
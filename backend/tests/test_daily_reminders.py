@@ -0,0 +1,133 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+from celery.schedules import crontab
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, AppointmentStatus, BookingSource
+from app.models.notification import Notification, NotificationType, NotificationStatus
+from app.services.notification_service import NotificationService
+from app.tasks.notifications import schedule_daily_reminders
+from app.tasks.worker import beat_schedule
+from tests.conftest import statements_during
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def test_data(app):
+    """A clinic with one doctor, service and receptionist"""
+    receptionist = User(username='receptionist', password='password123', role=UserRole.RECEPTIONIST)
+    clinic = Clinic(name='Test Clinic', room_number='101')
+    db.session.add_all([receptionist, clinic])
+    db.session.flush()
+
+    doctor = Doctor(
+        name='Test',
+        specialty='General Medicine',
+        working_days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+        working_hours={'start': '09:00', 'end': '17:00'},
+        clinic_id=clinic.id
+    )
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    db.session.add_all([doctor, service])
+    db.session.commit()
+
+    return {
+        'user_id': receptionist.id,
+        'clinic_id': clinic.id,
+        'doctor_id': doctor.id,
+        'service_id': service.id,
+    }
+
+def tomorrow():
+    return (datetime.now() + timedelta(days=1)).date()
+
+def add_appointments(data, count, day=None, status=AppointmentStatus.CONFIRMED):
+    """`count` appointments ten seconds apart from 09:00 on day (tomorrow by default); returns their IDs"""
+    day = day or tomorrow()
+    existing = Appointment.query.count()
+    patients = [Patient(name=f'Patient {existing + i}', phone=f'+1555{existing + i:07d}') for i in range(count)]
+    db.session.add_all(patients)
+    db.session.flush()
+    appointments = []
+    for i, patient in enumerate(patients):
+        n = existing + i
+        start_time = datetime.combine(day, datetime.min.time()) + timedelta(hours=9, seconds=10 * i)
+        appointments.append(Appointment(
+            booking_id=f'A-TEST-{n:05d}', clinic_id=data['clinic_id'], doctor_id=data['doctor_id'],
+            patient_id=patient.id, service_id=data['service_id'], start_time=start_time,
+            end_time=start_time + timedelta(minutes=30), booking_source=BookingSource.PHONE,
+            created_by=data['user_id'], status=status
+        ))
+    db.session.add_all(appointments)
+    db.session.commit()
+    return [appointment.id for appointment in appointments]
+
+def reminders():
+    return Notification.query.filter_by(notification_type=NotificationType.SMS_REMINDER) \
+        .order_by(Notification.related_appointment_id).all()
+
+def test_reminders_for_confirmed_appointments(app, test_data):
+    confirmed = add_appointments(test_data, 3)
+    add_appointments(test_data, 1, status=AppointmentStatus.CANCELLED)
+    add_appointments(test_data, 1, day=tomorrow() + timedelta(days=1))
+
+    assert NotificationService().schedule_reminders_for_day(tomorrow()) == 3
+    created = reminders()
+    assert [notification.related_appointment_id for notification in created] == confirmed
+    for notification in created:
+        appointment = db.session.get(Appointment, notification.related_appointment_id)
+        assert notification.recipient == appointment.patient.phone
+        assert notification.scheduled_time == appointment.start_time - timedelta(hours=1)
+        assert notification.status == NotificationStatus.PENDING and notification.attempts == 0
+        # The same message the per-appointment helper writes
+        assert notification.message == NotificationService().create_appointment_reminder_message(appointment)
+
+def test_reruns_skip_appointments_with_a_reminder(app, test_data):
+    first = add_appointments(test_data, 2)
+    service = NotificationService()
+    assert service.schedule_reminders_for_day(tomorrow()) == 2
+    assert service.schedule_reminders_for_day(tomorrow()) == 0
+
+    # Only appointments booked since get one
+    later = add_appointments(test_data, 1)
+    assert service.schedule_reminders_for_day(tomorrow()) == 1
+    assert [notification.related_appointment_id for notification in reminders()] == first + later
+
+def test_bulk_job_uses_a_fixed_number_of_statements(app, test_data):
+    add_appointments(test_data, 2000)
+    db.session.expire_all()
+
+    started = time.perf_counter()
+    created, statements = statements_during(lambda: NotificationService().schedule_reminders_for_day(tomorrow()))
+    elapsed = time.perf_counter() - started
+    assert created == 2000
+    # One joined SELECT, then multi-row INSERTs: nothing per appointment
+    assert statements[0].lstrip().startswith('SELECT')
+    assert len(statements) < 10
+    assert all(statement.startswith('INSERT INTO notifications') for statement in statements[1:])
+    assert elapsed < 5
+
+def test_task_defaults_to_tomorrow(app, test_data):
+    add_appointments(test_data, 2)
+    add_appointments(test_data, 1, day=datetime.now().date())
+    assert schedule_daily_reminders() == 2
+    assert schedule_daily_reminders() == 0
+    assert schedule_daily_reminders(tomorrow().isoformat()) == 0
+
+def test_beat_runs_the_reminder_job_nightly(app):
+    schedule = beat_schedule(app.config)['schedule-daily-reminders']
+    assert schedule['task'] == schedule_daily_reminders.name
+    assert schedule['schedule'] == crontab(hour=app.config['SMS_REMINDER_HOUR'], minute=0)
@@ -0,0 +1,123 @@
+"""
+Date range filters must stay sargable
+
+The plan checks run on SQLite by default. Set TEST_DATABASE_URL to a
+PostgreSQL database (e.g. the docker-compose one) to check the PostgreSQL plans.
+"""
+import pytest
+from datetime import datetime, date
+from sqlalchemy import event
+from app import create_app, db
+from app.models.clinic import Clinic
+from app.models.payment import Payment, PaymentMethod
+from app.models.visit import Visit
+from app.services.queue_service import QueueService
+from app.services.queue_phase_builder import QueuePhaseBuilder
+from app.utils.helpers import day_bounds, date_filter, date_range_filter
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def clinic(app):
+    clinic = Clinic(name='Test Clinic', room_number='101')
+    db.session.add(clinic)
+    db.session.commit()
+    return clinic
+
+def explain_plans(fn, table):
+    """Run fn and return the query plan of each statement it issued against `table`"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if f'FROM {table}' in statement:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert statements, f'no query against {table}'
+
+    plans = []
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'postgresql':
+        # Tables are tiny in tests - make the planner show which indexes it can use
+        connection.exec_driver_sql('SET enable_seqscan = off')
+        prefix = 'EXPLAIN '
+    else:
+        prefix = 'EXPLAIN QUERY PLAN '
+    for statement, parameters in statements:
+        rows = connection.exec_driver_sql(prefix + statement, parameters).fetchall()
+        plans.append('\n'.join(str(row[-1]) for row in rows))
+    return plans
+
+def assert_range_on_index(plan, index_name, column):
+    """The plan uses `index_name` with a range condition on `column`"""
+    assert index_name in plan, plan
+    if db.engine.dialect.name == 'postgresql':
+        assert f'{column} >=' in plan and f'{column} <' in plan, plan
+    else:
+        assert f'{column}>?' in plan and f'{column}<?' in plan, plan
+
+def test_day_bounds_are_half_open():
+    """A day covers [midnight, next midnight)"""
+    assert day_bounds(date(2024, 2, 28)) == (datetime(2024, 2, 28), datetime(2024, 2, 29))
+    assert day_bounds(date(2024, 2, 28), date(2024, 3, 1)) == (datetime(2024, 2, 28), datetime(2024, 3, 2))
+    assert day_bounds('2024-12-31') == (datetime(2024, 12, 31), datetime(2025, 1, 1))
+
+def test_date_filter_matches_whole_day(app, clinic):
+    """Rows at midnight and just before the next midnight are included, the next day is not"""
+    day = date(2024, 5, 10)
+    for created_at in (datetime(2024, 5, 9, 23, 59, 59), datetime(2024, 5, 10),
+                       datetime(2024, 5, 10, 23, 59, 59, 999999), datetime(2024, 5, 11)):
+        payment = Payment(
+            visit_id=1, patient_id=1, total_amount=100, amount_paid=100,
+            payment_method=PaymentMethod.CASH, doctor_share=70, center_share=30
+        )
+        payment.created_at = created_at
+        db.session.add(payment)
+    db.session.commit()
+
+    assert Payment.query.filter(date_filter(Payment.created_at, day)).count() == 2
+    assert Payment.query.filter(date_range_filter(Payment.created_at, day)).count() == 3
+    assert Payment.query.filter(date_range_filter(Payment.created_at, end_date=day)).count() == 3
+
+def test_clinic_queue_uses_created_at_index(app, clinic):
+    """The clinic queue filters visits through the (clinic_id, created_at) index"""
+    plans = explain_plans(lambda: QueueService().get_clinic_queue(clinic.id, date.today()), 'visits')
+    assert_range_on_index(plans[0], 'idx_visit_clinic_created', 'created_at')
+
+def test_queue_phases_use_start_time_index(app, clinic):
+    """Queue phase rows are found through the (clinic_id, start_time) index"""
+    plans = explain_plans(lambda: QueuePhaseBuilder(date.today(), clinic.id).build(), 'appointments')
+    assert_range_on_index(plans[0], 'idx_appointment_clinic_start', 'start_time')
+
+def test_payment_range_uses_created_at_index(app, clinic):
+    """Payment date ranges are answered from the created_at index"""
+    plans = explain_plans(
+        lambda: Payment.query.filter(
+            date_range_filter(Payment.created_at, date(2024, 1, 1), date(2024, 1, 31))
+        ).all(),
+        'payments'
+    )
+    assert_range_on_index(plans[0], 'idx_payments_created_at', 'created_at')
+
+def test_date_function_filter_cannot_use_range(app, clinic):
+    """Sanity check: the old DATE() form gives the planner no created_at range"""
+    plans = explain_plans(
+        lambda: Visit.query.filter(
+            Visit.clinic_id == clinic.id,
+            db.func.date(Visit.created_at) == date.today()
+        ).all(),
+        'visits'
+    )
+    assert 'created_at>' not in plans[0] and 'created_at >=' not in plans[0]
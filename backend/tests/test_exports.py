@@ -0,0 +1,162 @@
+"""
+Streaming exports
+
+test_export_benchmark exports EXPORT_BENCHMARK_ROWS synthetic patients (e.g.
+EXPORT_BENCHMARK_ROWS=1000000) and checks that peak RSS stays flat while the
+CSV streams. It is skipped unless the variable is set.
+"""
+import pytest
+import csv
+import io
+import os
+import time
+from datetime import datetime
+from flask_jwt_extended import create_access_token
+from openpyxl import load_workbook
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient, Gender
+from app.models.service import Service
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.models.payment import Payment, PaymentMethod, PaymentStatus
+from app.utils.exports import iter_csv, CSV_CHUNK_SIZE
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def headers(app):
+    user = User(username='admin', password='password123', role=UserRole.ADMIN)
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+@pytest.fixture
+def test_data(app):
+    """Two paid visits and one without a payment"""
+    clinic = Clinic(name='Clinic A', room_number='101')
+    db.session.add(clinic)
+    db.session.flush()
+    doctor = Doctor(name='Smith', specialty='Cardiology', working_days=['Monday'],
+                    working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    db.session.add_all([doctor, service])
+    db.session.flush()
+
+    for i in range(3):
+        patient = Patient(name=f'Patient {i}', phone=f'+1555000{i:04d}', gender=Gender.FEMALE, age=30 + i)
+        db.session.add(patient)
+        db.session.flush()
+        visit = Visit(
+            doctor_id=doctor.id, patient_id=patient.id, service_id=service.id, clinic_id=clinic.id,
+            check_in_time=datetime.utcnow(), visit_type=VisitType.WALK_IN, queue_number=i + 1,
+            status=VisitStatus.COMPLETED
+        )
+        db.session.add(visit)
+        db.session.flush()
+        if i < 2:
+            db.session.add(Payment(
+                visit_id=visit.id, patient_id=patient.id, total_amount=100, discount_amount=10 * i,
+                amount_paid=80, payment_method=PaymentMethod.CASH, doctor_share=56, center_share=24,
+                status=PaymentStatus.PAID
+            ))
+    db.session.commit()
+
+def read_csv(response):
+    assert response.status_code == 200, response.data
+    assert response.mimetype == 'text/csv'
+    assert response.is_streamed
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('\ufeff'))))
+
+def test_iter_csv_yields_chunks():
+    rows = ([i, 'x' * 100] for i in range(5000))
+    chunks = list(iter_csv(['ID', 'Value'], rows))
+    assert len(chunks) > 1
+    assert all(len(chunk) < CSV_CHUNK_SIZE + 1024 for chunk in chunks)
+    text = b''.join(chunks).decode('utf-8')
+    assert text.startswith('\ufeffID,Value\r\n0,')
+    assert text.count('\r\n') == 5001
+
+def test_export_patients_streams_csv(client, headers, test_data):
+    rows = read_csv(client.get('/api/patients/export', headers=headers))
+    assert rows[0] == ['ID', 'Name', 'Phone', 'Age', 'Gender', 'Address', 'Medical History', 'Created At']
+    assert [row[1] for row in rows[1:]] == ['Patient 0', 'Patient 1', 'Patient 2']
+    assert rows[1][3:6] == ['30', 'female', '']
+
+def test_export_payments_writes_xlsx(client, headers, test_data):
+    response = client.get('/api/payments/export', headers=headers)
+    assert response.status_code == 200, response.data
+    sheet = load_workbook(io.BytesIO(response.data))['Payments']
+    rows = list(sheet.iter_rows(values_only=True))
+    assert rows[0][0] == 'Payment ID' and rows[0][12] == 'Status'
+    assert sheet['A1'].font.bold
+    assert len(rows) == 4
+    assert rows[1][2:7] == ('Patient 0', '+15550000000', 'Dr. Smith', 'Clinic A', 'Consultation')
+    assert rows[2][7:11] == (100, 10, 80, 10)
+    assert rows[3][6:11] == ('TOTAL', '=SUM(H2:H3)', '=SUM(I2:I3)', '=SUM(J2:J3)', '=SUM(K2:K3)')
+    assert sheet.column_dimensions['A'].width == 12
+
+def test_export_payments_filters(client, headers, test_data):
+    response = client.get('/api/payments/export?status=refunded', headers=headers)
+    rows = list(load_workbook(io.BytesIO(response.data))['Payments'].iter_rows(values_only=True))
+    assert len(rows) == 2 and rows[1][6] == 'TOTAL'
+    assert client.get('/api/payments/export?method=bitcoin', headers=headers).status_code == 400
+
+def test_export_reports(client, headers, test_data):
+    rows = read_csv(client.get('/api/reports/export?type=revenue', headers=headers))
+    assert rows[0] == ['Date', 'Doctor', 'Patient', 'Service', 'Amount Paid', 'Doctor Share', 'Center Share']
+    assert [row[1:5] for row in rows[1:]] == [
+        ['Smith', 'Patient 0', 'Consultation', '80.00'], ['Smith', 'Patient 1', 'Consultation', '80.00']
+    ]
+
+    rows = read_csv(client.get('/api/reports/export?type=visits', headers=headers))
+    assert len(rows) == 4
+    assert rows[1][1:] == ['Clinic A', 'Smith', 'Patient 0', 'Consultation', 'walk_in', 'completed']
+
+    assert client.get('/api/reports/export?type=other', headers=headers).status_code == 400
+
+@pytest.mark.skipif(not os.environ.get('EXPORT_BENCHMARK_ROWS'), reason='set EXPORT_BENCHMARK_ROWS to run')
+def test_export_benchmark(client, headers):
+    import psutil
+    total = int(os.environ['EXPORT_BENCHMARK_ROWS'])
+    for offset in range(0, total, 10000):
+        db.session.execute(Patient.__table__.insert(), [
+            {'name': f'Patient {i:07d}', 'phone': f'+1{i:010d}', 'age': i % 90,
+             'gender': Gender.MALE.name, 'address': '1 Main Street', 'created_at': datetime(2024, 1, 1)}
+            for i in range(offset, min(offset + 10000, total))
+        ])
+    db.session.commit()
+
+    process = psutil.Process()
+    started = time.perf_counter()
+    baseline = peak = process.memory_info().rss
+    size = lines = 0
+    response = client.get('/api/patients/export', headers=headers, buffered=False)
+    for number, chunk in enumerate(response.response):
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+        if number % 16 == 0:
+            peak = max(peak, process.memory_info().rss)
+    response.close()
+    elapsed = time.perf_counter() - started
+
+    growth = (peak - baseline) / 2 ** 20
+    print(f'\nexported {total} patients ({size / 2 ** 20:.1f} MiB) in {elapsed:.1f}s, '
+          f'peak RSS growth {growth:.1f} MiB')
+    assert lines == total + 1
+    # Streaming holds one batch of rows and one chunk of output at a time
+    assert growth < 64
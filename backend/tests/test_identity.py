@@ -0,0 +1,116 @@
+import pytest
+from datetime import date
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.services.identity_service import identity_cache
+from tests.conftest import captured_statements
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def test_data(app):
+    """An admin, a receptionist and a doctor user linked to a doctor in clinic A"""
+    admin = User(username='admin', password='password123', role=UserRole.ADMIN)
+    receptionist = User(username='reception', password='password123', role=UserRole.RECEPTIONIST)
+    doctor_user = User(username='doctor', password='password123', role=UserRole.DOCTOR)
+    clinics = [Clinic(name='Clinic A', room_number='101'), Clinic(name='Clinic B', room_number='102')]
+    db.session.add_all([admin, receptionist, doctor_user, *clinics])
+    db.session.flush()
+    doctors = [
+        Doctor(name=f'Dr. {clinic.name}', specialty='General', working_days=['Monday'],
+               working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+        for clinic in clinics
+    ]
+    doctors[0].user_id = doctor_user.id
+    db.session.add_all(doctors)
+    db.session.commit()
+
+    def headers(user):
+        return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+    return {
+        'admin': headers(admin),
+        'receptionist': headers(receptionist),
+        'doctor': headers(doctor_user),
+        'receptionist_id': receptionist.id,
+        'doctor_user_id': doctor_user.id,
+        'clinics': [clinic.id for clinic in clinics],
+        'doctors': [doctor.id for doctor in doctors],
+    }
+
+def get(client, url, headers):
+    """GET url and return (response, number of users/doctors queries)"""
+    with captured_statements(lambda statement: 'FROM users' in statement or 'FROM doctors' in statement) as statements:
+        response = client.get(url, headers=headers)
+    return response, len(statements)
+
+def phases_url(clinic_id):
+    return f'/api/queue/phases/{clinic_id}?date={date.today().isoformat()}'
+
+def test_role_checks_reuse_cached_identity(client, test_data):
+    response, queries = get(client, '/api/auth/users', test_data['receptionist'])
+    assert response.status_code == 200
+    first = queries
+
+    response, queries = get(client, '/api/auth/users', test_data['receptionist'])
+    assert response.status_code == 200
+    # Only the handler's own listing query remains
+    assert queries == first - 1
+
+def test_doctor_access_checks_need_no_lookup(client, test_data):
+    url = phases_url(test_data['clinics'][0])
+    assert get(client, url, test_data['doctor'])[0].status_code == 200
+
+    response, queries = get(client, url, test_data['doctor'])
+    assert response.status_code == 200
+    assert queries == 0
+    assert get(client, phases_url(test_data['clinics'][1]), test_data['doctor'])[0].status_code == 403
+
+def test_role_change_takes_effect_immediately(client, test_data):
+    assert get(client, '/api/auth/users', test_data['receptionist'])[0].status_code == 200
+
+    response = client.put(f"/api/auth/users/{test_data['receptionist_id']}",
+                          json={'role': 'DOCTOR'}, headers=test_data['admin'])
+    assert response.status_code == 200
+    assert get(client, '/api/auth/users', test_data['receptionist'])[0].status_code == 403
+
+def test_doctor_link_changes_take_effect_immediately(client, test_data):
+    user_id = test_data['doctor_user_id']
+    assert get(client, phases_url(test_data['clinics'][0]), test_data['doctor'])[0].status_code == 200
+
+    assert client.post(f'/api/auth/users/{user_id}/unlink-doctor', headers=test_data['admin']).status_code == 200
+    assert get(client, phases_url(test_data['clinics'][0]), test_data['doctor'])[0].status_code == 403
+
+    response = client.post(f'/api/auth/users/{user_id}/link-doctor',
+                           json={'doctor_id': test_data['doctors'][1]}, headers=test_data['admin'])
+    assert response.status_code == 200
+    assert get(client, phases_url(test_data['clinics'][1]), test_data['doctor'])[0].status_code == 200
+
+def test_deleted_user_is_rejected(client, test_data):
+    assert get(client, '/api/auth/users', test_data['receptionist'])[0].status_code == 200
+
+    response = client.delete(f"/api/auth/users/{test_data['receptionist_id']}", headers=test_data['admin'])
+    assert response.status_code == 200
+    assert get(client, '/api/auth/users', test_data['receptionist'])[0].status_code == 401
+
+def test_cache_can_be_disabled(app, client, test_data):
+    identity_cache.ttl = 0
+    get(client, '/api/auth/users', test_data['receptionist'])
+    _, queries = get(client, '/api/auth/users', test_data['receptionist'])
+    assert queries == 2
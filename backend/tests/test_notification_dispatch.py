@@ -0,0 +1,177 @@
+"""
+Batched SMS dispatch against a local fake SMS gateway
+
+FakeSMSGateway is a keep-alive HTTP server on a free local port that records
+every message, the connections they came over and how many were in flight
+at once, and answers with a configurable status per recipient.
+"""
+import json
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app import create_app, db
+from app.models.notification import Notification, NotificationType, NotificationStatus
+from app.services.notification_dispatcher import notification_dispatcher
+from app.services.sms_providers import HTTPProvider
+from app.tasks.notifications import send_sms_confirmation
+from tests.conftest import statements_during
+
+class FakeSMSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+
+    def do_POST(self):
+        gateway = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with gateway.lock:
+            gateway.in_flight += 1
+            gateway.max_in_flight = max(gateway.max_in_flight, gateway.in_flight)
+        time.sleep(gateway.delay)
+        with gateway.lock:
+            gateway.in_flight -= 1
+            gateway.messages.append(payload)
+            gateway.connections.add(self.client_address)
+            gateway.authorization.add(self.headers.get('Authorization'))
+        status, headers = gateway.responses.get(payload['to'], (200, {}))
+        body = b'{}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeSMSGateway(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeSMSHandler)
+        self.lock = threading.Lock()
+        self.delay = 0
+        self.responses = {}  # recipient -> (status, headers)
+        self.messages = []
+        self.connections = set()
+        self.authorization = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+@pytest.fixture
+def gateway():
+    server = FakeSMSGateway()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def app(gateway):
+    """Create test app sending through the fake gateway"""
+    app = create_app('testing')
+    app.config.update(
+        SMS_PROVIDER='http',
+        SMS_API_URL=f'http://127.0.0.1:{gateway.server_port}/messages',
+        SMS_API_KEY='test-key',
+        SMS_DISPATCH_BATCH_SIZE=20,
+        SMS_DISPATCH_CONCURRENCY=5,
+        SMS_POOL_SIZE=5,
+    )
+    with app.app_context():
+        db.create_all()
+        yield app
+        notification_dispatcher.provider.close()
+        db.session.remove()
+        db.drop_all()
+
+def add_notifications(count, recipient='+1555{n:07d}', due=True, notification_type=NotificationType.SMS_REMINDER):
+    scheduled_time = datetime.utcnow() + (timedelta(minutes=-5) if due else timedelta(hours=2))
+    notifications = [
+        Notification(recipient=recipient.format(n=n), notification_type=notification_type,
+                     message=f'Reminder {n}', scheduled_time=scheduled_time)
+        for n in range(count)
+    ]
+    db.session.add_all(notifications)
+    db.session.commit()
+    return [notification.id for notification in notifications]
+
+def statuses():
+    return {status: count for status, count in db.session.query(
+        Notification.status, db.func.count(Notification.id)
+    ).group_by(Notification.status)}
+
+def test_due_notifications_are_sent_in_batches(app, gateway):
+    gateway.delay = 0.02
+    add_notifications(45)
+    add_notifications(2, recipient='+1666{n:07d}', due=False)
+
+    counts, statements = statements_during(notification_dispatcher.dispatch_pending)
+    assert counts == {'claimed': 45, 'sent': 45, 'failed': 0, 'retrying': 0, 'throttled': 0}
+    assert statuses() == {NotificationStatus.SENT: 45, NotificationStatus.PENDING: 2}
+    assert sorted(message['to'] for message in gateway.messages) == [f'+1555{n:07d}' for n in range(45)]
+    assert gateway.authorization == {'Bearer test-key'}
+
+    # Three batches (20, 20, 5): a claim and a bulk update each, nothing per row
+    assert len(statements) == 6
+    assert all(statement.startswith('UPDATE notifications') for statement in statements)
+
+    # Concurrent, but bounded, over reused connections
+    assert 1 < gateway.max_in_flight <= 5
+    assert len(gateway.connections) <= 5
+
+def test_failures_and_retries(app, gateway):
+    app.config['SMS_MAX_ATTEMPTS'] = 2
+    rejected, = add_notifications(1, recipient='+1000')
+    throttled, = add_notifications(1, recipient='+2000')
+    gateway.responses = {'+1000': (400, {}), '+2000': (503, {'Retry-After': '30'})}
+
+    assert notification_dispatcher.dispatch_pending() == \
+        {'claimed': 2, 'sent': 0, 'failed': 1, 'retrying': 1, 'throttled': 0}
+    assert db.session.get(Notification, rejected).status == NotificationStatus.FAILED
+    held_back = db.session.get(Notification, throttled)
+    assert held_back.status == NotificationStatus.PENDING and held_back.attempts == 1
+    assert held_back.leased_until > datetime.utcnow() + timedelta(seconds=25)
+
+    # Held back until Retry-After has passed
+    assert notification_dispatcher.dispatch_pending()['claimed'] == 0
+    held_back.leased_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert notification_dispatcher.dispatch_pending() == \
+        {'claimed': 1, 'sent': 0, 'failed': 1, 'retrying': 0, 'throttled': 0}
+    assert db.session.get(Notification, throttled).attempts == 2
+
+def test_claims_do_not_overlap(app):
+    ids = add_notifications(15)
+    first = notification_dispatcher.claim(limit=10)
+    second = notification_dispatcher.claim(limit=10)
+    assert len(first) == 10 and len(second) == 5
+    assert {claimed.id for claimed in first} | {claimed.id for claimed in second} == set(ids)
+    assert notification_dispatcher.claim() == []
+
+    # A dispatcher that died leaves a lease that runs out
+    db.session.get(Notification, ids[0]).leased_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert [claimed.id for claimed in notification_dispatcher.claim()] == [ids[0]]
+
+def test_send_task_sends_one_notification(app, gateway):
+    notification_id, = add_notifications(1, due=False, notification_type=NotificationType.SMS_CONFIRMATION)
+    assert send_sms_confirmation(notification_id) is True
+    assert [message['message'] for message in gateway.messages] == ['Reminder 0']
+    assert send_sms_confirmation(notification_id) is False
+    assert send_sms_confirmation(999) is False
+
+def test_throttled_sends_are_held_back_without_using_an_attempt(app, gateway):
+    notification_id, = add_notifications(1, recipient='+3000')
+    gateway.responses = {'+3000': (429, {'Retry-After': '20'})}
+    assert notification_dispatcher.dispatch_pending()['throttled'] == 1
+    notification = db.session.get(Notification, notification_id)
+    assert notification.attempts == 0 and notification.status == NotificationStatus.PENDING
+    assert notification.leased_until > datetime.utcnow() + timedelta(seconds=15)
+
+def test_unreachable_provider_is_retryable():
+    result = HTTPProvider('http://127.0.0.1:1/messages', timeout=2).send('+1555', 'Hi')
+    assert not result.ok and result.retryable
@@ -0,0 +1,136 @@
+import pytest
+from datetime import datetime, timedelta
+from app import create_app, db, cache
+from app.models.notification import Notification, NotificationType, NotificationStatus
+from app.services.notification_dispatcher import notification_dispatcher
+from app.services.notification_scheduler import notification_scheduler, TokenBucket
+from app.services.sms_providers import SMSProvider, SendResult
+from app.tasks.notifications import process_pending_notifications
+from app.tasks.worker import beat_schedule
+
+class RecordingProvider(SMSProvider):
+    """Records messages; answers every send with `result`"""
+
+    def __init__(self):
+        self.sent = []
+        self.result = SendResult(True)
+
+    def send(self, recipient, message):
+        self.sent.append((recipient, message))
+        return self.result
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    app.config.update(SMS_GLOBAL_RATE=0.001, SMS_GLOBAL_BURST=100, SMS_RECIPIENT_BURST=3)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def provider(app):
+    provider = RecordingProvider()
+    notification_dispatcher.provider = provider
+    return provider
+
+def add_notifications(count, recipient='+1555{n:07d}', minutes_ago=5):
+    notifications = [
+        Notification(recipient=recipient.format(n=n), notification_type=NotificationType.SMS_REMINDER,
+                     message=f'Reminder {n}', scheduled_time=datetime.utcnow() - timedelta(minutes=minutes_ago))
+        for n in range(count)
+    ]
+    db.session.add_all(notifications)
+    db.session.commit()
+    return [notification.id for notification in notifications]
+
+def pending_count():
+    return Notification.query.filter_by(status=NotificationStatus.PENDING).count()
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.take(100.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait(100.0) == 0.5
+    assert bucket.available(101.0) == 2
+    assert bucket.available(1000.0) == 3
+
+def test_global_rate_limits_each_run(app, provider):
+    app.config['SMS_GLOBAL_BURST'] = 10
+    add_notifications(25)
+    stats = notification_scheduler.run()
+    assert stats['sent'] == 10 and stats['claimed'] == 10
+    assert len(provider.sent) == 10 and pending_count() == 15
+    # The global bucket is shared between runs
+    assert notification_scheduler.run()['claimed'] == 0
+
+def test_recipient_limit_defers_the_rest(app, provider):
+    ids = add_notifications(5, recipient='+1555000')
+    stats = notification_scheduler.run()
+    assert stats['sent'] == 3 and stats['deferred'] == 2
+    deferred = Notification.query.filter_by(status=NotificationStatus.PENDING).all()
+    assert [notification.id for notification in deferred] == ids[3:]
+    for notification in deferred:
+        assert notification.attempts == 0
+        assert notification.leased_until >= datetime.utcnow() + timedelta(minutes=10)
+
+def test_oldest_buckets_drain_first(app, provider):
+    app.config['SMS_GLOBAL_BURST'] = 2
+    add_notifications(1, recipient='+1000', minutes_ago=1)
+    add_notifications(1, recipient='+2000', minutes_ago=19)
+    add_notifications(1, recipient='+3000', minutes_ago=20)
+    notification_scheduler.run()
+    assert {recipient for recipient, _ in provider.sent} == {'+3000', '+2000'}
+
+def test_throttling_backs_off(app, provider):
+    add_notifications(5)
+    provider.result = SendResult(False, error='HTTP 429', throttled=True, retry_after=60)
+    stats = notification_scheduler.run()
+    assert stats['throttled'] == 5 and stats['sent'] == 0
+    assert stats['backoff_until']
+    assert notification_scheduler.run()['skipped'] == 'provider throttling backoff'
+    assert Notification.query.filter(Notification.attempts > 0).count() == 0
+
+def test_exponential_backoff_without_retry_after(app, provider):
+    app.config['SMS_BACKOFF_SECONDS'] = 10
+    provider.result = SendResult(False, error='HTTP 429', throttled=True)
+    add_notifications(1)
+
+    def backoff_seconds():
+        started = datetime.utcnow()
+        return (datetime.fromisoformat(notification_scheduler.run()['backoff_until']) - started).total_seconds()
+
+    assert 9 < backoff_seconds() <= 11
+    cache.set('sms_scheduler:backoff', dict(cache.get('sms_scheduler:backoff'), until=0))
+    add_notifications(1, recipient='+1666{n:07d}')
+    assert 19 < backoff_seconds() <= 21
+
+def test_overlapping_runs_are_skipped(app, provider):
+    add_notifications(1)
+    cache.add('sms_scheduler:lock', True)
+    assert notification_scheduler.run() == {'skipped': 'another run is in progress'}
+    assert provider.sent == []
+
+def test_metrics(client, provider):
+    add_notifications(4, minutes_ago=10)
+    response = client.get('/api/health/notifications')
+    metrics = response.get_json()
+    assert metrics['depth'] == 4 and metrics['scheduled'] == 0
+    assert metrics['lag_seconds'] >= 600
+
+    notification_scheduler.run()
+    metrics = client.get('/api/health/notifications').get_json()
+    assert metrics['depth'] == 0 and metrics['lag_seconds'] == 0
+    assert metrics['sent_per_minute'] == 4 / 5
+    assert metrics['last_run']['sent'] == 4
+
+def test_beat_runs_the_dispatch_task(app):
+    schedule = beat_schedule(app.config)['dispatch-due-notifications']
+    assert schedule['task'] == process_pending_notifications.name
+    assert schedule['schedule'] == app.config['SMS_DISPATCH_INTERVAL']
@@ -0,0 +1,135 @@
+"""
+?fields= projections on the appointment list
+
+test_projection_benchmark compares the full to_dict() path with the projection
+path at 50/500/5000 rows. It is skipped unless PROJECTION_BENCHMARK is set.
+"""
+import pytest
+import os
+import time
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from app import create_app, db, cache
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment
+from app.models.visit import Visit, VisitType
+from app.models.payment import Payment, PaymentMethod
+from tests.conftest import captured_statements
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+def create_appointments(count, with_visits=2):
+    """count appointments a day apart; the first with_visits have a visit and payment"""
+    user = User(username='admin', password='password123', role=UserRole.ADMIN)
+    clinic = Clinic(name='Clinic A', room_number='101')
+    db.session.add_all([user, clinic])
+    db.session.flush()
+    doctor = Doctor(name='Dr. A', specialty='Cardiology', working_days=['Monday'],
+                    working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    db.session.add_all([doctor, service])
+    db.session.flush()
+
+    base = datetime(2030, 1, 1, 9, 0)
+    patients = [{'name': f'Patient {i}', 'phone': f'+1{i:010d}'} for i in range(count)]
+    db.session.execute(Patient.__table__.insert(), patients)
+    patient_ids = [id for id, in db.session.query(Patient.id).order_by(Patient.id)]
+    db.session.execute(Appointment.__table__.insert(), [
+        {'booking_id': f'A-{i:06d}', 'clinic_id': clinic.id, 'doctor_id': doctor.id, 'patient_id': patient_ids[i],
+         'service_id': service.id, 'start_time': base + timedelta(days=i),
+         'end_time': base + timedelta(days=i, minutes=30), 'status': 'CONFIRMED', 'booking_source': 'PHONE',
+         'created_by': user.id, 'created_at': base}
+        for i in range(count)
+    ])
+    for appointment in Appointment.query.order_by(Appointment.id).limit(with_visits):
+        visit = Visit(appointment_id=appointment.id, doctor_id=doctor.id, patient_id=appointment.patient_id,
+                      service_id=service.id, clinic_id=clinic.id, check_in_time=appointment.start_time,
+                      visit_type=VisitType.SCHEDULED, queue_number=appointment.id)
+        db.session.add(visit)
+        db.session.flush()
+        db.session.add(Payment(visit_id=visit.id, patient_id=appointment.patient_id, total_amount=100,
+                               amount_paid=100, payment_method=PaymentMethod.CASH, doctor_share=70, center_share=30))
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+def get_appointments(client, headers, query=''):
+    """GET the appointment list, returning (json, number of statements issued)"""
+    with captured_statements(lambda statement: 'token_blacklist' not in statement and 'FROM users' not in statement) as statements:
+        response = client.get(f'/api/appointments?{query}', headers=headers)
+    assert response.status_code == 200, response.data
+    return response.get_json(), len(statements)
+
+def test_projection_matches_to_dict(client):
+    headers = create_appointments(4)
+    full, _ = get_appointments(client, headers)
+    data, queries = get_appointments(
+        client, headers, 'fields=id,start_time,status,patient.name,service.price,visit.queue_number,payment.amount_paid'
+    )
+    assert queries == 2  # count + one SELECT
+    assert data['total'] == 4
+
+    for projected, complete in zip(data['appointments'], full['appointments']):
+        assert set(projected) == {'id', 'start_time', 'status', 'patient', 'service', 'visit', 'payment'}
+        assert projected['id'] == complete['id']
+        assert projected['start_time'] == complete['start_time']
+        assert projected['status'] == complete['status']
+        assert projected['patient'] == {'name': complete['patient']['name']}
+        assert projected['service'] == {'price': complete['service']['price']}
+        if complete['visit'] is None:
+            assert projected['visit'] is None and projected['payment'] is None
+        else:
+            assert projected['visit'] == {'queue_number': complete['visit']['queue_number']}
+            assert projected['payment'] == {'amount_paid': complete['payment']['amount_paid']}
+    assert sum(item['visit'] is not None for item in data['appointments']) == 2
+
+def test_bare_relation_selects_all_its_columns(client):
+    headers = create_appointments(1)
+    data, _ = get_appointments(client, headers, 'fields=booking_id,clinic')
+    assert data['appointments'][0]['booking_id'] == 'A-000000'
+    assert data['appointments'][0]['clinic']['name'] == 'Clinic A'
+    assert data['appointments'][0]['clinic']['room_number'] == '101'
+
+def test_payment_alone_joins_through_visit(client):
+    headers = create_appointments(3, with_visits=1)
+    data, _ = get_appointments(client, headers, 'fields=id,payment.status&per_page=2')
+    assert data['pages'] == 2
+    assert all(set(item) == {'id', 'payment'} for item in data['appointments'])
+
+def test_unknown_fields_are_rejected(client):
+    headers = create_appointments(1)
+    for fields in ('password', 'patient.password', 'nothing.name', ','):
+        response = client.get(f'/api/appointments?fields={fields}', headers=headers)
+        assert response.status_code == 400, fields
+
+@pytest.mark.skipif(not os.environ.get('PROJECTION_BENCHMARK'), reason='set PROJECTION_BENCHMARK to run')
+def test_projection_benchmark(client):
+    headers = create_appointments(5000, with_visits=2500)
+    fields = 'fields=id,start_time,status,patient.name,doctor.name,visit.status'
+    print()
+    for rows in (50, 500, 5000):
+        timings = {}
+        for label, query in (('to_dict', ''), ('projection', fields)):
+            cache.clear()
+            started = time.perf_counter()
+            _, queries = get_appointments(client, headers, f'per_page={rows}&{query}')
+            timings[label] = (time.perf_counter() - started, queries)
+        print(f'{rows:>5} rows: to_dict {timings["to_dict"][0] * 1000:8.1f} ms ({timings["to_dict"][1]} queries), '
+              f'projection {timings["projection"][0] * 1000:8.1f} ms ({timings["projection"][1]} queries)')
+        assert timings['projection'][0] < timings['to_dict'][0]
@@ -0,0 +1,205 @@
+import pytest
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from app import create_app, db, socketio
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, AppointmentStatus, BookingSource
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.services.queue_service import QueueService
+from tests.conftest import count_queries
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def test_data(app):
+    """A clinic with one doctor (with a user account), service and receptionist"""
+    receptionist = User(username='receptionist', password='password123', role=UserRole.RECEPTIONIST)
+    doctor_user = User(username='doctor', password='password123', role=UserRole.DOCTOR)
+    clinic = Clinic(name='Test Clinic', room_number='101')
+    db.session.add_all([receptionist, doctor_user, clinic])
+    db.session.flush()
+
+    doctor = Doctor(
+        name='Dr. Test',
+        specialty='General Medicine',
+        working_days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+        working_hours={'start': '09:00', 'end': '17:00'},
+        clinic_id=clinic.id
+    )
+    doctor.user_id = doctor_user.id
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    db.session.add_all([doctor, service])
+    db.session.commit()
+
+    return {
+        'receptionist': create_access_token(identity=str(receptionist.id)),
+        'doctor': create_access_token(identity=str(doctor_user.id)),
+        'user_id': receptionist.id,
+        'clinic_id': clinic.id,
+        'doctor_id': doctor.id,
+        'service_id': service.id,
+    }
+
+def add_appointments(data, count, with_visits=False):
+    """Confirmed appointments for today, optionally with their auto-created visits"""
+    today = datetime.now().date()
+    appointments = []
+    for n in range(count):
+        patient = Patient(name=f'Patient {n}', phone=f'+1555{n:07d}')
+        db.session.add(patient)
+        db.session.flush()
+        start_time = datetime.combine(today, datetime.min.time()) + timedelta(hours=9, minutes=10 * n)
+        appointment = Appointment(
+            booking_id=f'A-TEST-{n:04d}', clinic_id=data['clinic_id'], doctor_id=data['doctor_id'],
+            patient_id=patient.id, service_id=data['service_id'], start_time=start_time,
+            end_time=start_time + timedelta(minutes=30), booking_source=BookingSource.PHONE,
+            created_by=data['user_id']
+        )
+        db.session.add(appointment)
+        db.session.flush()
+        if with_visits:
+            db.session.add(Visit(
+                appointment_id=appointment.id, doctor_id=data['doctor_id'], patient_id=patient.id,
+                service_id=data['service_id'], clinic_id=data['clinic_id'], check_in_time=start_time,
+                visit_type=VisitType.SCHEDULED, queue_number=n + 1, status=VisitStatus.WAITING
+            ))
+        appointments.append(appointment)
+    db.session.commit()
+    return [appointment.id for appointment in appointments]
+
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+def test_check_in_many_assigns_queue_numbers_in_bulk(app, test_data):
+    appointment_ids = add_appointments(test_data, 30)
+    (visits, errors), small = count_queries(lambda: QueueService().check_in_many(appointment_ids[:3]))
+    assert errors == []
+    assert [visit.queue_number for visit in visits] == [1, 2, 3]
+
+    (visits, errors), large = count_queries(lambda: QueueService().check_in_many(appointment_ids[3:] + [999]))
+    assert sorted(visit.queue_number for visit in visits) == list(range(4, 31))
+    assert errors == [{'appointment_id': 999, 'message': 'Appointment not found'}]
+    assert {appointment.status for appointment in Appointment.query} == {AppointmentStatus.CHECKED_IN}
+    # Only the visit INSERTs (one per row on SQLite) grow with the batch
+    assert large - small <= 24 + 2
+
+def test_already_checked_in_appointments_are_reported(app, test_data):
+    appointment_ids = add_appointments(test_data, 2, with_visits=True)
+    QueueService().check_in_many(appointment_ids[:1])
+    visits, errors = QueueService().check_in_many(appointment_ids)
+    assert [visit.appointment_id for visit in visits] == appointment_ids[1:]
+    assert errors == [{'appointment_id': appointment_ids[0], 'message': 'Only confirmed appointments can be checked in'}]
+
+def test_transitions_check_each_visit(app, test_data):
+    appointment_ids = add_appointments(test_data, 3, with_visits=True)
+    visits, _ = QueueService().check_in_many(appointment_ids)
+    visit_ids = [visit.id for visit in visits]
+    queue_service = QueueService()
+
+    called, errors = queue_service.transition_many(visit_ids[:2], 'call')
+    assert [visit.status for visit in called] == [VisitStatus.CALLED] * 2 and errors == []
+
+    started, errors = queue_service.transition_many(visit_ids, 'start')
+    assert [visit.id for visit in started] == visit_ids[:2]
+    assert errors == [{'visit_id': visit_ids[2], 'message': 'Patient must be called first'}]
+
+    completed, errors = queue_service.transition_many(visit_ids[:2], 'complete', doctor_id=test_data['doctor_id'] + 1)
+    assert completed == [] and len(errors) == 2
+
+    completed, errors = queue_service.transition_many(visit_ids[:2], 'complete', doctor_id=test_data['doctor_id'])
+    assert [visit.appointment.status for visit in completed] == [AppointmentStatus.COMPLETED] * 2
+
+    with pytest.raises(ValueError):
+        queue_service.transition_many(visit_ids, 'teleport')
+
+def test_batch_sends_one_delta_per_room(app, client, test_data):
+    appointment_ids = add_appointments(test_data, 5, with_visits=True)
+    socket = socketio.test_client(app, auth={'token': test_data['receptionist']})
+    socket.emit('join_queue_room', {'clinic_id': test_data['clinic_id']})
+    socket.get_received()
+
+    response = client.post('/api/queue/checkin/batch', json={'appointment_ids': appointment_ids},
+                           headers=auth(test_data['receptionist']))
+    assert response.status_code == 200
+    assert len(response.get_json()['visits']) == 5
+
+    received = socket.get_received()
+    deltas = [message['args'][0] for message in received if message['name'] == 'queue_delta']
+    assert len(deltas) == 1
+    assert len(deltas[0]['versions']) == 5
+    assert [message['name'] for message in received].count('new_checkin') == 1
+    socket.disconnect()
+
+def test_batch_endpoint_roles(client, test_data):
+    appointment_ids = add_appointments(test_data, 2, with_visits=True)
+    client.post('/api/queue/checkin/batch', json={'appointment_ids': appointment_ids},
+                headers=auth(test_data['receptionist']))
+    visit_ids = [visit.id for visit in Visit.query.order_by(Visit.id)]
+
+    response = client.post('/api/queue/batch', json={'action': 'start', 'visit_ids': visit_ids},
+                           headers=auth(test_data['doctor']))
+    assert response.status_code == 403
+
+    response = client.post('/api/queue/batch', json={'action': 'call', 'visit_ids': visit_ids},
+                           headers=auth(test_data['doctor']))
+    assert response.status_code == 200
+    assert len(response.get_json()['visits']) == 2
+
+    response = client.post('/api/queue/batch', json={'action': 'call', 'visit_ids': []},
+                           headers=auth(test_data['receptionist']))
+    assert response.status_code == 400
+
+def test_phase_moves_in_one_request(client, test_data):
+    appointment_ids = add_appointments(test_data, 3)
+    moves = [{'appointment_id': appointment_id, 'from_phase': 'appointments_today', 'to_phase': 'waiting'}
+             for appointment_id in appointment_ids]
+    response = client.post('/api/queue/phases/move/batch', json={'moves': moves},
+                           headers=auth(test_data['receptionist']))
+    assert response.status_code == 200
+    visits = response.get_json()['visits']
+    assert sorted(visit['queue_number'] for visit in visits) == [1, 2, 3]
+
+    moves = [
+        {'visit_id': visits[0]['id'], 'from_phase': 'waiting', 'to_phase': 'with_doctor'},
+        {'visit_id': visits[1]['id'], 'from_phase': 'waiting', 'to_phase': 'completed'},
+        {'visit_id': 999, 'from_phase': 'waiting', 'to_phase': 'completed'},
+    ]
+    response = client.post('/api/queue/phases/move/batch', json={'moves': moves},
+                           headers=auth(test_data['doctor']))
+    body = response.get_json()
+    assert [visit['status'] for visit in body['visits']] == ['completed']
+    assert [error['index'] for error in body['errors']] == [0, 2]
+
+def test_phase_moves_check_each_appointment_in_once(client, test_data):
+    confirmed, cancelled = add_appointments(test_data, 2)
+    db.session.get(Appointment, cancelled).status = AppointmentStatus.CANCELLED
+    db.session.commit()
+    moves = [{'appointment_id': appointment_id, 'from_phase': 'appointments_today', 'to_phase': 'waiting'}
+             for appointment_id in (confirmed, confirmed, cancelled)]
+    response = client.post('/api/queue/phases/move/batch', json={'moves': moves},
+                           headers=auth(test_data['receptionist']))
+    body = response.get_json()
+    assert body['message'] == '1 patients moved'
+    assert body['errors'] == [
+        {'index': 1, 'message': 'Appointment already in this batch'},
+        {'index': 2, 'message': 'Only confirmed appointments can be checked in'},
+    ]
+    assert [visit.appointment_id for visit in Visit.query.all()] == [confirmed]
+    assert db.session.get(Appointment, cancelled).status == AppointmentStatus.CANCELLED
@@ -0,0 +1,167 @@
+import pytest
+from datetime import datetime
+from flask_jwt_extended import create_access_token
+from app import create_app, db, socketio
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.services.queue_broadcaster import queue_broadcaster, merge_deltas
+from config import TestingConfig
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def test_data(app):
+    """A clinic with one doctor, service and patient"""
+    user = User(username='reception', password='password123', role=UserRole.RECEPTIONIST)
+    clinic = Clinic(name='Clinic A', room_number='101')
+    patient = Patient(name='Test Patient', phone='+1234567890')
+    db.session.add_all([user, clinic, patient])
+    db.session.flush()
+    doctor = Doctor(name='Dr. Test', specialty='General', working_days=['Monday'],
+                    working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    db.session.add_all([doctor, service])
+    db.session.commit()
+
+    return {
+        'token': create_access_token(identity=str(user.id)),
+        'clinic_id': clinic.id,
+        'doctor_id': doctor.id,
+        'patient_id': patient.id,
+        'service_id': service.id,
+    }
+
+@pytest.fixture
+def socket_client(app, test_data):
+    """Socket.IO client that joined the clinic room and received its snapshot"""
+    client = socketio.test_client(app, auth={'token': test_data['token']})
+    client.emit('join_queue_room', {'clinic_id': test_data['clinic_id'], 'token': test_data['token']})
+    client.get_received()
+    yield client
+    client.disconnect()
+
+def received(client, name):
+    return [message['args'][0] for message in client.get_received() if message['name'] == name]
+
+def add_visit(test_data, queue_number=1):
+    visit = Visit(doctor_id=test_data['doctor_id'], patient_id=test_data['patient_id'],
+                  service_id=test_data['service_id'], clinic_id=test_data['clinic_id'],
+                  check_in_time=datetime.now(), visit_type=VisitType.WALK_IN, queue_number=queue_number)
+    db.session.add(visit)
+    db.session.commit()
+    return visit
+
+def test_join_sends_versioned_snapshot(app, test_data):
+    add_visit(test_data)
+    client = socketio.test_client(app, auth={'token': test_data['token']})
+    client.emit('join_queue_room', {'clinic_id': test_data['clinic_id'], 'token': test_data['token']})
+    snapshot, = received(client, 'queue_snapshot')
+    assert snapshot['room'] == f"clinic_{test_data['clinic_id']}"
+    assert snapshot['version'] == 1
+    assert snapshot['date'] == datetime.now().date().isoformat()
+    assert [entry['queue_number'] for entry in snapshot['queue']['waiting']] == [1]
+    client.disconnect()
+
+def test_committed_changes_are_sent_as_deltas(socket_client, test_data):
+    visit = add_visit(test_data)
+    added, = received(socket_client, 'queue_delta')
+    assert added['op'] == 'added'
+    assert added['visit_id'] == visit.id
+    assert added['visit']['status'] == 'waiting'
+    assert added['visit']['doctor_name'] == 'Dr. Test'
+
+    visit.status = VisitStatus.CALLED
+    db.session.commit()
+    changed, = received(socket_client, 'queue_delta')
+    assert changed['op'] == 'status_changed'
+    assert changed['visit']['status'] == 'called'
+    assert changed['version'] == added['version'] + 1
+
+    visit.queue_number = 5
+    db.session.commit()
+    moved, = received(socket_client, 'queue_delta')
+    assert moved['op'] == 'moved'
+    assert moved['visit']['queue_number'] == 5
+
+def test_leaving_the_queue_statuses_removes_the_visit(socket_client, test_data):
+    visit = add_visit(test_data)
+    received(socket_client, 'queue_delta')
+
+    visit.status = VisitStatus.PENDING_PAYMENT
+    db.session.commit()
+    removed, = received(socket_client, 'queue_delta')
+    assert removed['op'] == 'removed'
+    assert 'visit' not in removed
+
+def test_rolled_back_changes_are_not_sent(socket_client, test_data):
+    visit = add_visit(test_data)
+    received(socket_client, 'queue_delta')
+
+    visit.status = VisitStatus.CALLED
+    db.session.flush()
+    db.session.rollback()
+    assert received(socket_client, 'queue_delta') == []
+
+def test_resync_sends_only_the_version_when_current(socket_client, test_data):
+    add_visit(test_data)
+    delta, = received(socket_client, 'queue_delta')
+
+    resync = {'clinic_id': test_data['clinic_id'], 'token': test_data['token']}
+    socket_client.emit('queue_resync', dict(resync, version=delta['version']))
+    snapshot, = received(socket_client, 'queue_snapshot')
+    assert snapshot == {'room': delta['room'], 'version': delta['version'], 'unchanged': True}
+
+    socket_client.emit('queue_resync', dict(resync, version=delta['version'] - 1))
+    snapshot, = received(socket_client, 'queue_snapshot')
+    assert snapshot['version'] == delta['version']
+    assert len(snapshot['queue']['waiting']) == 1
+    assert queue_broadcaster.version(delta['room']) == delta['version']
+
+def test_merge_keeps_last_change_per_visit():
+    deltas = [
+        {'room': 'clinic_1', 'version': 3, 'op': 'added', 'visit_id': 1, 'date': None, 'visit': {'status': 'waiting'}},
+        {'room': 'clinic_1', 'version': 4, 'op': 'added', 'visit_id': 2, 'date': None, 'visit': {'status': 'waiting'}},
+        {'room': 'clinic_1', 'version': 5, 'op': 'status_changed', 'visit_id': 1, 'date': None, 'visit': {'status': 'called'}},
+        {'room': 'clinic_1', 'version': 6, 'op': 'removed', 'visit_id': 2, 'date': None},
+    ]
+    assert merge_deltas(deltas[:1]) == deltas[0]
+    merged = merge_deltas(deltas)
+    assert merged['version'] == 6 and merged['versions'] == [3, 4, 5, 6]
+    assert merged['changes'] == [
+        {'op': 'added', 'visit_id': 1, 'date': None, 'visit': {'status': 'called'}},
+        {'op': 'removed', 'visit_id': 2, 'date': None},
+    ]
+
+def test_bursts_are_sent_as_one_message(socket_client, test_data, monkeypatch):
+    monkeypatch.setattr(queue_broadcaster, 'coalesce_window', 0.05)
+    first = add_visit(test_data, queue_number=1)
+    add_visit(test_data, queue_number=2)
+    first.status = VisitStatus.CALLED
+    db.session.commit()
+    assert received(socket_client, 'queue_delta') == []
+
+    socketio.sleep(0.2)
+    message, = received(socket_client, 'queue_delta')
+    assert message['versions'] == [1, 2, 3]
+    assert [(change['op'], change['visit']['queue_number']) for change in message['changes']] == [('added', 2), ('added', 1)]
+
+def test_message_queue_connects_nodes(monkeypatch):
+    pytest.importorskip('redis')
+    monkeypatch.setattr(socketio, 'server_options', dict(socketio.server_options))
+    monkeypatch.setattr(TestingConfig, 'SOCKETIO_MESSAGE_QUEUE', 'redis://localhost:6379/0')
+    create_app('testing')
+    manager = socketio.server.manager
+    assert type(manager).__name__ == 'RedisManager'
+    assert manager.channel == TestingConfig.SOCKETIO_CHANNEL
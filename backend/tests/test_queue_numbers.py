@@ -0,0 +1,119 @@
+import os
+import threading
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql
+from app import create_app, db
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.visit import Visit, VisitType
+from app.models.queue_counter import QueueCounter
+from app.services.queue_numbers import queue_numbers
+from config import TestingConfig
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def create_clinics(count=2):
+    clinics = [Clinic(name=f'Clinic {index}', room_number=str(100 + index)) for index in range(count)]
+    patient = Patient(name='Test Patient', phone='+1234567890')
+    db.session.add_all([patient, *clinics])
+    db.session.flush()
+    doctors = [
+        Doctor(name=f'Dr. {clinic.name}', specialty='General', working_days=['Monday'],
+               working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+        for clinic in clinics
+    ]
+    services = [Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00) for clinic in clinics]
+    db.session.add_all(doctors + services)
+    db.session.commit()
+    return [
+        {'clinic_id': clinic.id, 'doctor_id': doctor.id, 'service_id': service.id, 'patient_id': patient.id}
+        for clinic, doctor, service in zip(clinics, doctors, services)
+    ]
+
+def add_walkin(scope, queue_number):
+    db.session.add(Visit(check_in_time=datetime.now(), visit_type=VisitType.WALK_IN,
+                         queue_number=queue_number, **scope))
+
+def test_numbers_are_sequential_per_clinic_and_day(app):
+    first, second = create_clinics()
+    assert [queue_numbers.allocate(first['clinic_id']) for _ in range(3)] == [1, 2, 3]
+    assert queue_numbers.allocate(second['clinic_id']) == 1
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    assert queue_numbers.allocate(first['clinic_id'], tomorrow) == 1
+    db.session.commit()
+    assert db.session.query(QueueCounter).count() == 3
+
+def test_counter_starts_after_existing_visits(app):
+    scope, = create_clinics(1)
+    add_walkin(scope, 7)
+    db.session.commit()
+    assert queue_numbers.allocate(scope['clinic_id']) == 8
+
+def test_rolled_back_check_in_returns_its_number(app):
+    scope, = create_clinics(1)
+    queue_numbers.allocate(scope['clinic_id'])
+    db.session.commit()
+    assert queue_numbers.allocate(scope['clinic_id']) == 2
+    db.session.rollback()
+    assert queue_numbers.allocate(scope['clinic_id']) == 2
+
+def test_postgresql_uses_one_upsert():
+    statement = queue_numbers._upsert(datetime(2030, 1, 1).date(), {'clinic_id': 1}, 1)
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (clinic_id, day) DO UPDATE' in sql
+    assert 'RETURNING queue_counters.last_number' in sql
+
+@pytest.mark.parametrize('block_size', [1, 8])
+def test_parallel_check_ins_get_unique_numbers(monkeypatch, tmp_path, block_size):
+    if not os.environ.get('TEST_DATABASE_URL'):
+        # Threads need their own connections to a shared database file
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'queue.db'}")
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_ENGINE_OPTIONS',
+                            {'connect_args': {'timeout': 30}, 'pool_size': 50}, raising=False)
+    monkeypatch.setattr(TestingConfig, 'QUEUE_NUMBER_BLOCK_SIZE', block_size)
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        scope, = create_clinics(1)
+
+    check_ins = 50
+    barrier = threading.Barrier(check_ins)
+    numbers, errors = [], []
+
+    def check_in():
+        with app.app_context():
+            try:
+                barrier.wait()
+                add_walkin(scope, queue_numbers.allocate(scope['clinic_id']))
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=check_in) for _ in range(check_ins)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        numbers = [number for number, in db.session.query(Visit.queue_number)]
+        db.session.remove()
+        db.drop_all()
+    assert errors == []
+    assert len(numbers) == check_ins
+    assert len(set(numbers)) == check_ins
+    if block_size == 1:
+        assert sorted(numbers) == list(range(1, check_ins + 1))
@@ -0,0 +1,167 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, AppointmentStatus, BookingSource
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.models.payment import Payment, PaymentMethod, PaymentStatus
+from app.services.queue_service import QueueService
+from tests.conftest import count_queries
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def test_data(app):
+    """Create a clinic with one doctor, service and receptionist"""
+    user = User(username='receptionist', password='password123', role=UserRole.RECEPTIONIST)
+    clinic = Clinic(name='Test Clinic', room_number='101')
+    db.session.add_all([user, clinic])
+    db.session.flush()
+
+    doctor = Doctor(
+        name='Dr. Test',
+        specialty='General Medicine',
+        working_days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+        working_hours={'start': '09:00', 'end': '17:00'},
+        clinic_id=clinic.id
+    )
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    db.session.add_all([doctor, service])
+    db.session.commit()
+
+    return {'user': user, 'clinic': clinic, 'doctor': doctor, 'service': service}
+
+def add_appointments(data, count, day):
+    """Add `count` appointments on `day`, cycling through every queue phase"""
+    visit_states = [
+        (AppointmentStatus.CONFIRMED, None),
+        (AppointmentStatus.CONFIRMED, VisitStatus.WAITING),
+        (AppointmentStatus.CHECKED_IN, VisitStatus.WAITING),
+        (AppointmentStatus.CHECKED_IN, VisitStatus.IN_PROGRESS),
+        (AppointmentStatus.COMPLETED, VisitStatus.COMPLETED),
+    ]
+    existing = Appointment.query.count()
+    for i in range(count):
+        n = existing + i
+        patient = Patient(name=f'Patient {n}', phone=f'+1555{n:07d}')
+        db.session.add(patient)
+        db.session.flush()
+
+        start_time = datetime.combine(day, datetime.min.time()) + timedelta(hours=9, minutes=10 * n)
+        apt_status, visit_status = visit_states[n % len(visit_states)]
+        appointment = Appointment(
+            booking_id=f'A-TEST-{n:04d}',
+            clinic_id=data['clinic'].id,
+            doctor_id=data['doctor'].id,
+            patient_id=patient.id,
+            service_id=data['service'].id,
+            start_time=start_time,
+            end_time=start_time + timedelta(minutes=30),
+            booking_source=BookingSource.PHONE,
+            created_by=data['user'].id,
+            status=apt_status
+        )
+        db.session.add(appointment)
+        db.session.flush()
+
+        if visit_status is None:
+            continue
+        visit = Visit(
+            appointment_id=appointment.id,
+            doctor_id=data['doctor'].id,
+            patient_id=patient.id,
+            service_id=data['service'].id,
+            clinic_id=data['clinic'].id,
+            # Auto-created visits share the appointment start time
+            check_in_time=start_time,
+            visit_type=VisitType.SCHEDULED,
+            queue_number=n + 1,
+            status=visit_status
+        )
+        db.session.add(visit)
+        db.session.flush()
+        db.session.add(Payment(
+            visit_id=visit.id,
+            patient_id=patient.id,
+            total_amount=100,
+            amount_paid=0,
+            payment_method=PaymentMethod.CASH,
+            doctor_share=70,
+            center_share=30,
+            status=PaymentStatus.PENDING
+        ))
+    db.session.commit()
+
+def test_phase_rows_match_appointment_state(app, test_data):
+    """Each appointment lands in the phase implied by its appointment/visit status"""
+    today = datetime.now().date()
+    add_appointments(test_data, 5, today)
+
+    rows = QueueService().get_all_appointments_for_date(today, test_data['clinic'].id)
+
+    assert [row['queue_phase'] for row in rows] == [
+        'appointments_today', 'appointments_today', 'waiting', 'with_doctor', 'completed'
+    ]
+    assert [row['visit_status'] for row in rows] == [
+        'scheduled', 'scheduled', 'waiting', 'in_progress', 'completed'
+    ]
+    assert rows[0]['visit_id'] is None and rows[0]['payment_id'] is None
+    assert all(row['payment_id'] for row in rows[1:])
+    assert rows[0]['patient_name'] == 'Patient 0'
+    assert rows[0]['doctor_name'] == 'Dr. Test'
+    assert rows[0]['clinic_name'] == 'Test Clinic'
+    assert rows[0]['service_name'] == 'Consultation'
+
+def test_phase_query_count_is_constant(app, test_data):
+    """Building phases must not issue queries per appointment"""
+    today = datetime.now().date()
+    queue_service = QueueService()
+    clinic_id = test_data['clinic'].id
+
+    add_appointments(test_data, 5, today)
+    db.session.expire_all()
+    phases, small_count = count_queries(lambda: queue_service.get_queue_phases(today, clinic_id))
+    assert sum(len(rows) for rows in phases.values()) == 5
+
+    add_appointments(test_data, 45, today)
+    db.session.expire_all()
+    phases, large_count = count_queries(lambda: queue_service.get_queue_phases(today, clinic_id))
+    assert sum(len(rows) for rows in phases.values()) == 50
+
+    assert large_count == small_count
+    assert large_count <= 2
+
+def test_get_queue_phases_endpoint(client, test_data):
+    """The phases endpoint returns the four phase lists"""
+    today = datetime.now().date()
+    add_appointments(test_data, 5, today)
+    token = create_access_token(identity=str(test_data['user'].id))
+
+    response = client.get(
+        f"/api/queue/phases/{test_data['clinic'].id}?date={today.isoformat()}",
+        headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert {phase: len(rows) for phase, rows in data['phases'].items()} == {
+        'appointments_today': 2, 'waiting': 1, 'with_doctor': 1, 'completed': 1
+    }
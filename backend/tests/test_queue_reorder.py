@@ -0,0 +1,177 @@
+import pytest
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from app import create_app, db, socketio
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, AppointmentStatus, BookingSource
+from app.models.visit import Visit, SORT_KEY_GAP
+from app.services.queue_service import QueueService
+from tests.conftest import statements_during
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def test_data(app):
+    """A clinic with one doctor, service and receptionist"""
+    receptionist = User(username='receptionist', password='password123', role=UserRole.RECEPTIONIST)
+    clinic = Clinic(name='Test Clinic', room_number='101')
+    db.session.add_all([receptionist, clinic])
+    db.session.flush()
+
+    doctor = Doctor(
+        name='Dr. Test',
+        specialty='General Medicine',
+        working_days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'],
+        working_hours={'start': '09:00', 'end': '17:00'},
+        clinic_id=clinic.id
+    )
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    db.session.add_all([doctor, service])
+    db.session.commit()
+
+    return {
+        'token': create_access_token(identity=str(receptionist.id)),
+        'user_id': receptionist.id,
+        'clinic_id': clinic.id,
+        'doctor_id': doctor.id,
+        'service_id': service.id,
+    }
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    """Background tasks started by the queue service, recorded instead of run"""
+    tasks = []
+    monkeypatch.setattr(socketio, 'start_background_task', lambda target, *args: tasks.append(args))
+    return tasks
+
+def check_in(data, count):
+    """Check in `count` patients with today's appointments; returns their visit IDs in queue order"""
+    today = datetime.now().date()
+    existing = Appointment.query.count()
+    appointment_ids = []
+    for i in range(count):
+        n = existing + i
+        patient = Patient(name=f'Patient {n}', phone=f'+1555{n:07d}')
+        db.session.add(patient)
+        db.session.flush()
+        start_time = datetime.combine(today, datetime.min.time()) + timedelta(hours=9, minutes=10 * n)
+        appointment = Appointment(
+            booking_id=f'A-TEST-{n:04d}', clinic_id=data['clinic_id'], doctor_id=data['doctor_id'],
+            patient_id=patient.id, service_id=data['service_id'], start_time=start_time,
+            end_time=start_time + timedelta(minutes=30), booking_source=BookingSource.PHONE,
+            created_by=data['user_id']
+        )
+        db.session.add(appointment)
+        db.session.flush()
+        appointment_ids.append(appointment.id)
+    db.session.commit()
+    visits, errors = QueueService().check_in_many(appointment_ids)
+    assert errors == []
+    return [visit.id for visit in visits]
+
+def waiting_order(data):
+    queue = QueueService().get_clinic_queue(data['clinic_id'])
+    return [entry['id'] for entry in queue['waiting']]
+
+def visit_updates(fn):
+    """Run fn and return (result, UPDATE statements on visits)"""
+    return statements_during(fn, lambda statement: statement.startswith('UPDATE visits'))
+
+def test_new_visits_follow_queue_number(app, test_data):
+    visit_ids = check_in(test_data, 3)
+    visits = [db.session.get(Visit, visit_id) for visit_id in visit_ids]
+    assert [visit.sort_key for visit in visits] == [number * SORT_KEY_GAP for number in (1, 2, 3)]
+    assert waiting_order(test_data) == visit_ids
+
+def test_move_writes_one_row(app, test_data, scheduled):
+    visit_ids = check_in(test_data, 5)
+    queue_service = QueueService()
+
+    visit, updates = visit_updates(lambda: queue_service.reorder_queue(visit_ids[4], 2))
+    assert len(updates) == 1
+    assert visit.queue_number == 5
+    assert waiting_order(test_data) == [visit_ids[0], visit_ids[4], visit_ids[1], visit_ids[2], visit_ids[3]]
+
+    queue_service.reorder_queue(visit_ids[0], 1)
+    queue_service.reorder_queue(visit_ids[2], 1)
+    queue_service.reorder_queue(visit_ids[4], 99)
+    assert waiting_order(test_data) == [visit_ids[2], visit_ids[0], visit_ids[1], visit_ids[3], visit_ids[4]]
+    assert [entry['queue_number'] for entry in queue_service.get_clinic_queue(test_data['clinic_id'])['waiting']] == \
+        [3, 1, 2, 4, 5]
+    assert queue_service.get_next_patient(test_data['doctor_id']).id == visit_ids[2]
+    assert queue_service.get_queue_position(visit_ids[1]) == 3
+    assert scheduled == []
+
+def test_moves_to_the_end_stay_ahead_of_new_check_ins(app, test_data, scheduled):
+    visit_ids = check_in(test_data, 3)
+    queue_service = QueueService()
+    for visit_id in visit_ids[:2] * 3:
+        queue_service.reorder_queue(visit_id, 3)
+    later = check_in(test_data, 1)
+    assert waiting_order(test_data) == [visit_ids[2], visit_ids[0], visit_ids[1], later[0]]
+
+def test_used_up_gap_is_respaced(app, test_data, scheduled):
+    visit_ids = check_in(test_data, 3)
+    for visit_id, sort_key in zip(visit_ids, (10, 11, 14)):
+        db.session.get(Visit, visit_id).sort_key = sort_key
+    db.session.commit()
+    queue_service = QueueService()
+
+    # Between 10 and 11 there is no free key: respace first
+    queue_service.reorder_queue(visit_ids[2], 2)
+    assert waiting_order(test_data) == [visit_ids[0], visit_ids[2], visit_ids[1]]
+    assert db.session.get(Visit, visit_ids[0]).sort_key == SORT_KEY_GAP
+    assert scheduled == []
+
+    # Landing next to a neighbour leaves no room for the next move: respace later
+    db.session.get(Visit, visit_ids[1]).sort_key = SORT_KEY_GAP + 3
+    db.session.commit()
+    queue_service.reorder_queue(visit_ids[2], 2)
+    assert [args[1:] for args in scheduled] == [(test_data['clinic_id'], datetime.now().date())]
+
+    queue_service.rebalance_sort_keys(test_data['clinic_id'], datetime.now().date())
+    assert [db.session.get(Visit, visit_id).sort_key for visit_id in waiting_order(test_data)] == \
+        [SORT_KEY_GAP, 2 * SORT_KEY_GAP, 3 * SORT_KEY_GAP]
+
+def test_only_waiting_visits_move(app, test_data):
+    visit_ids = check_in(test_data, 2)
+    QueueService().call_patient(visit_ids[0])
+    with pytest.raises(ValueError, match='Only waiting patients'):
+        QueueService().reorder_queue(visit_ids[0], 2)
+
+def test_phases_and_deltas_follow_the_new_order(app, client, test_data, scheduled):
+    visit_ids = check_in(test_data, 3)
+    socket = socketio.test_client(app, auth={'token': test_data['token']})
+    socket.emit('join_queue_room', {'clinic_id': test_data['clinic_id']})
+    socket.get_received()
+
+    response = client.put('/api/queue/reorder', json={'visit_id': visit_ids[2], 'new_position': 1},
+                          headers={'Authorization': f"Bearer {test_data['token']}"})
+    assert response.status_code == 200
+
+    deltas = [message['args'][0] for message in socket.get_received() if message['name'] == 'queue_delta']
+    assert [(delta['op'], delta['visit_id']) for delta in deltas] == [('moved', visit_ids[2])]
+    assert deltas[0]['visit']['sort_key'] < SORT_KEY_GAP
+    socket.disconnect()
+
+    phases = QueueService().get_queue_phases(datetime.now().date(), test_data['clinic_id'])
+    assert [row['visit_id'] for row in phases['waiting']] == [visit_ids[2], visit_ids[0], visit_ids[1]]
+    assert {row['queue_phase'] for row in phases['waiting']} == {'waiting'}
+    assert Appointment.query.filter_by(status=AppointmentStatus.CHECKED_IN).count() == 3
@@ -0,0 +1,157 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.models.payment import Payment, PaymentMethod
+from app.models.report_rollup import DailyRevenueRollup, DailyVisitRollup
+from app.services.payment_service import PaymentService
+from tests.conftest import statements_during
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def test_data(app):
+    """One clinic and doctor with three visits waiting for payment"""
+    user = User(username='admin', password='password123', role=UserRole.ADMIN)
+    clinic = Clinic(name='Clinic A', room_number='101')
+    db.session.add_all([user, clinic])
+    db.session.flush()
+
+    doctor = Doctor(name='Dr. A', specialty='Cardiology', working_days=['Monday'],
+                    working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+    service = Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00)
+    patient = Patient(name='Patient', phone='+15550000001')
+    db.session.add_all([doctor, service, patient])
+    db.session.flush()
+
+    visits = []
+    for i, visit_type in enumerate([VisitType.SCHEDULED, VisitType.SCHEDULED, VisitType.WALK_IN]):
+        visit = Visit(
+            doctor_id=doctor.id, patient_id=patient.id, service_id=service.id, clinic_id=clinic.id,
+            check_in_time=datetime.utcnow(), visit_type=visit_type, queue_number=i + 1,
+            status=VisitStatus.PENDING_PAYMENT
+        )
+        db.session.add(visit)
+        visits.append(visit)
+    db.session.commit()
+
+    token = create_access_token(identity=str(user.id))
+    return {
+        'headers': {'Authorization': f'Bearer {token}'},
+        'clinic_id': clinic.id,
+        'doctor_id': doctor.id,
+        'visits': [visit.id for visit in visits],
+    }
+
+def revenue_totals():
+    rows = DailyRevenueRollup.query.all()
+    return sum(row.payment_count for row in rows), sum(float(row.total_revenue) for row in rows)
+
+def rollup_statements_during(fn):
+    return statements_during(fn, lambda statement: '_rollups' in statement)[1]
+
+def test_visits_are_rolled_up_on_commit(app, test_data):
+    rows = DailyVisitRollup.query.all()
+    assert len(rows) == 1
+    assert (rows[0].total_visits, rows[0].scheduled_visits, rows[0].walk_in_visits, rows[0].completed_visits) == (3, 2, 1, 0)
+    assert rows[0].day == datetime.utcnow().date()
+
+def test_payments_and_refunds_update_rollups(app, test_data):
+    service = PaymentService()
+    first = service.process_payment(test_data['visits'][0], PaymentMethod.CASH, 100)
+    service.process_payment(test_data['visits'][1], PaymentMethod.VISA, 100)
+
+    assert revenue_totals() == (2, 200.0)
+    assert DailyRevenueRollup.query.count() == 2
+    # Paying completes the visit
+    assert DailyVisitRollup.query.one().completed_visits == 2
+
+    service.refund_payment(first.id)
+    assert revenue_totals() == (1, 100.0)
+    assert DailyVisitRollup.query.one().completed_visits == 1
+
+def test_only_aggregated_changes_rebuild_rollups(app, test_data):
+    visit = db.session.get(Visit, test_data['visits'][0])
+
+    def update(**values):
+        for name, value in values.items():
+            setattr(visit, name, value)
+        db.session.commit()
+
+    # Queue moves and other columns leave the rollups alone
+    assert rollup_statements_during(lambda: update(status=VisitStatus.CALLED)) == []
+    assert rollup_statements_during(lambda: update(status=VisitStatus.IN_PROGRESS, start_time=datetime.utcnow(), sort_key=1)) == []
+
+    assert rollup_statements_during(lambda: update(status=VisitStatus.COMPLETED))
+    assert DailyVisitRollup.query.one().completed_visits == 1
+    assert rollup_statements_during(lambda: update(visit_type=VisitType.WALK_IN))
+    assert DailyVisitRollup.query.one().walk_in_visits == 2
+
+def test_rolled_back_changes_are_not_rolled_up(app, test_data):
+    visit = Visit.query.get(test_data['visits'][0])
+    visit.visit_type = VisitType.WALK_IN
+    db.session.flush()
+    db.session.rollback()
+    assert DailyVisitRollup.query.one().walk_in_visits == 1
+
+def test_reports_read_rollups(client, test_data):
+    PaymentService().process_payment(test_data['visits'][0], PaymentMethod.CASH, 100)
+    headers = test_data['headers']
+
+    data = json.loads(client.get('/api/reports/revenue', headers=headers).data)
+    assert data['summary']['total_revenue'] == 100.0
+    assert data['summary']['payment_count'] == 1
+    assert data['by_doctor']['Dr. A']['visit_count'] == 1
+
+    data = json.loads(client.get('/api/reports/visits', headers=headers).data)
+    assert data['total_visits'] == 3
+    assert data['by_clinic']['Clinic A'] == {
+        'total_visits': 3, 'scheduled_visits': 2, 'walk_in_visits': 1, 'completed_visits': 1
+    }
+    assert data['by_doctor']['Dr. A']['completed_visits'] == 1
+
+    response = client.get('/api/reports/doctor-shares', headers=headers)
+    assert response.status_code == 200
+
+    # Other days and doctors are excluded
+    tomorrow = (datetime.now().date() + timedelta(days=1)).isoformat()
+    data = json.loads(client.get(f'/api/reports/visits?start_date={tomorrow}&end_date={tomorrow}', headers=headers).data)
+    assert data['total_visits'] == 0
+    data = json.loads(client.get(f"/api/reports/revenue?doctor_id={test_data['doctor_id'] + 1}", headers=headers).data)
+    assert data['summary']['total_revenue'] == 0
+
+def test_rebuild_command_backfills_rollups(app, test_data):
+    PaymentService().process_payment(test_data['visits'][0], PaymentMethod.CASH, 100)
+    DailyRevenueRollup.query.delete()
+    DailyVisitRollup.query.delete()
+    db.session.commit()
+    assert Payment.query.count() == 1 and DailyVisitRollup.query.count() == 0
+
+    today = datetime.utcnow().date()
+    result = app.test_cli_runner().invoke(args=[
+        'rebuild-rollups', '--start-date', (today - timedelta(days=40)).isoformat(),
+        '--end-date', today.isoformat(), '--chunk-days', '7'
+    ])
+    assert result.exit_code == 0, result.output
+    assert revenue_totals() == (1, 100.0)
+    assert DailyVisitRollup.query.one().total_visits == 3
@@ -0,0 +1,98 @@
+import pytest
+from flask_jwt_extended import create_access_token, decode_token
+from app import create_app, db, socketio
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.services.token_blocklist import token_blocklist
+from tests.conftest import captured_statements
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def test_data(app):
+    """A receptionist and a doctor user linked to a doctor in clinic A"""
+    receptionist = User(username='reception', password='password123', role=UserRole.RECEPTIONIST)
+    doctor_user = User(username='doctor', password='password123', role=UserRole.DOCTOR)
+    clinics = [Clinic(name='Clinic A', room_number='101'), Clinic(name='Clinic B', room_number='102')]
+    db.session.add_all([receptionist, doctor_user, *clinics])
+    db.session.flush()
+    doctors = [
+        Doctor(name=f'Dr. {clinic.name}', specialty='General', working_days=['Monday'],
+               working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+        for clinic in clinics
+    ]
+    doctors[0].user_id = doctor_user.id
+    db.session.add_all(doctors)
+    db.session.commit()
+
+    return {
+        'receptionist': create_access_token(identity=str(receptionist.id)),
+        'doctor': create_access_token(identity=str(doctor_user.id)),
+        'clinics': [clinic.id for clinic in clinics],
+        'doctors': [doctor.id for doctor in doctors],
+    }
+
+def identity_queries():
+    """Collects users/doctors queries while active"""
+    return captured_statements(lambda statement: 'FROM users' in statement or 'FROM doctors' in statement)
+
+def errors(client):
+    return [message['args'][0]['message'] for message in client.get_received() if message['name'] == 'error']
+
+def snapshots(client):
+    return [message['args'][0] for message in client.get_received() if message['name'] == 'queue_snapshot']
+
+def test_room_events_need_no_token_or_lookup(app, test_data):
+    client = socketio.test_client(app, auth={'token': test_data['receptionist']})
+    assert client.is_connected()
+    client.get_received()
+
+    with identity_queries() as statements:
+        client.emit('join_queue_room', {'clinic_id': test_data['clinics'][1]})
+        client.emit('leave_queue_room', {'clinic_id': test_data['clinics'][1]})
+        client.emit('join_doctor_room', {'doctor_id': test_data['doctors'][1]})
+    assert statements == []
+    assert len(snapshots(client)) == 2
+
+def test_reconnects_reuse_the_cached_identity(app, test_data):
+    socketio.test_client(app, auth={'token': test_data['receptionist']}).disconnect()
+    with identity_queries() as statements:
+        for _ in range(10):
+            client = socketio.test_client(app, auth={'token': test_data['receptionist']})
+            assert client.is_connected()
+            client.disconnect()
+    assert statements == []
+
+def test_invalid_tokens_are_refused(app, test_data):
+    assert not socketio.test_client(app, auth={'token': 'not-a-token'}).is_connected()
+    assert not socketio.test_client(app).is_connected()
+
+def test_revoked_token_loses_access(app, test_data):
+    client = socketio.test_client(app, auth={'token': test_data['receptionist']})
+    client.get_received()
+
+    token_blocklist.revoke(decode_token(test_data['receptionist'])['jti'])
+    client.emit('join_queue_room', {'clinic_id': test_data['clinics'][0]})
+    assert not client.is_connected()
+    assert not socketio.test_client(app, auth={'token': test_data['receptionist']}).is_connected()
+
+def test_doctors_only_watch_their_own_queues(app, test_data):
+    client = socketio.test_client(app, auth={'token': test_data['doctor']})
+    client.get_received()
+
+    client.emit('join_doctor_room', {'doctor_id': test_data['doctors'][0]})
+    client.emit('join_queue_room', {'clinic_id': test_data['clinics'][0]})
+    assert len(snapshots(client)) == 2
+
+    client.emit('join_doctor_room', {'doctor_id': test_data['doctors'][1]})
+    client.emit('join_queue_room', {'clinic_id': test_data['clinics'][1]})
+    assert errors(client) == ['Access denied', 'Access denied']
@@ -0,0 +1,168 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient, Gender
+from app.models.service import Service
+from app.models.appointment import Appointment, AppointmentStatus, BookingSource
+from app.models.visit import Visit, VisitStatus, VisitType
+from app.models.payment import Payment, PaymentMethod, PaymentStatus
+from app.utils.aggregates import count_if, sum_if
+from tests.conftest import captured_statements
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def test_data(app):
+    """Two clinics with appointments, visits and payments for today"""
+    user = User(username='admin', password='password123', role=UserRole.ADMIN)
+    clinics = [Clinic(name='Clinic A', room_number='101'), Clinic(name='Clinic B', room_number='102')]
+    db.session.add_all([user, *clinics])
+    db.session.flush()
+
+    doctors = [
+        Doctor(name='Dr. A', specialty='Cardiology', working_days=['Monday'],
+               working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinics[0].id),
+        Doctor(name='Dr. B', specialty='Dermatology', working_days=['Monday'],
+               working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinics[1].id),
+    ]
+    services = [Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00) for clinic in clinics]
+    db.session.add_all([*doctors, *services])
+    db.session.flush()
+
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    statuses = [AppointmentStatus.CONFIRMED, AppointmentStatus.COMPLETED, AppointmentStatus.CANCELLED]
+    methods = [PaymentMethod.CASH, PaymentMethod.VISA, PaymentMethod.CASH]
+    payment_statuses = [PaymentStatus.PAID, PaymentStatus.PENDING, PaymentStatus.REFUNDED]
+    genders = [Gender.MALE, Gender.FEMALE, Gender.MALE]
+    for i in range(6):
+        side = i % 2
+        patient = Patient(name=f'Patient {i}', phone=f'+1555000{i:04d}', gender=genders[i % 3])
+        db.session.add(patient)
+        db.session.flush()
+        start_time = today + timedelta(hours=9, minutes=30 * i)
+        appointment = Appointment(
+            booking_id=f'A-TEST-{i:04d}',
+            clinic_id=clinics[side].id,
+            doctor_id=doctors[side].id,
+            patient_id=patient.id,
+            service_id=services[side].id,
+            start_time=start_time,
+            end_time=start_time + timedelta(minutes=30),
+            booking_source=BookingSource.PHONE if i < 4 else BookingSource.WALK_IN,
+            created_by=user.id,
+            status=statuses[i % 3]
+        )
+        db.session.add(appointment)
+        db.session.flush()
+        visit = Visit(
+            appointment_id=appointment.id, doctor_id=doctors[side].id, patient_id=patient.id,
+            service_id=services[side].id, clinic_id=clinics[side].id, check_in_time=start_time,
+            visit_type=VisitType.SCHEDULED, queue_number=i + 1, status=VisitStatus.WAITING
+        )
+        db.session.add(visit)
+        db.session.flush()
+        db.session.add(Payment(
+            visit_id=visit.id, patient_id=patient.id, total_amount=100, amount_paid=40 * (i % 3),
+            payment_method=methods[i % 3], doctor_share=70, center_share=30,
+            status=payment_statuses[i % 3]
+        ))
+    db.session.commit()
+
+    token = create_access_token(identity=str(user.id))
+    return {
+        'headers': {'Authorization': f'Bearer {token}'},
+        'clinics': [clinic.id for clinic in clinics],
+    }
+
+def get_stats(client, url, headers):
+    """GET a statistics endpoint and return (json, statistics queries issued)"""
+    # The JWT blocklist check is not part of the statistics work
+    with captured_statements(lambda statement: 'token_blacklist' not in statement) as statements:
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.data
+    return json.loads(response.data), len(statements)
+
+def test_conditional_aggregates_compile_per_dialect():
+    """PostgreSQL gets FILTER (WHERE ...), other databases SUM(CASE ...)"""
+    statement = select(count_if(Payment.status == PaymentStatus.PAID), sum_if(Payment.amount_paid, Payment.id > 1))
+    pg_sql = str(statement.compile(dialect=postgresql.dialect()))
+    sqlite_sql = str(statement.compile(dialect=sqlite.dialect()))
+    assert 'COUNT(*) FILTER (WHERE payments.status =' in pg_sql
+    assert 'SUM(payments.amount_paid) FILTER (WHERE payments.id >' in pg_sql
+    assert 'SUM(CASE WHEN payments.status =' in sqlite_sql
+    assert 'SUM(CASE WHEN payments.id >' in sqlite_sql
+
+def test_appointment_statistics(client, test_data):
+    data, queries = get_stats(client, '/api/appointments/statistics', test_data['headers'])
+    assert queries == 1
+    assert data['total'] == 6
+    assert data['by_status'] == {'confirmed': 2, 'checked_in': 0, 'completed': 2, 'cancelled': 2, 'no_show': 0}
+    assert data['by_clinic'] == {'Clinic A': 3, 'Clinic B': 3}
+    assert data['by_doctor'] == {'Dr. A': 3, 'Dr. B': 3}
+    assert data['by_booking_source'] == {'phone': 4, 'walk_in': 2}
+    assert data['recent'] == 6 and data['this_week'] == 6
+
+    # Clinic filter narrows the totals but not the breakdowns
+    clinic_id = test_data['clinics'][0]
+    data, _ = get_stats(client, f'/api/appointments/statistics?clinic_id={clinic_id}', test_data['headers'])
+    assert data['total'] == 3
+    assert data['by_clinic'] == {'Clinic A': 3, 'Clinic B': 3}
+
+    tomorrow = (datetime.now().date() + timedelta(days=1)).isoformat()
+    data, _ = get_stats(client, f'/api/appointments/statistics?date={tomorrow}', test_data['headers'])
+    assert data['total'] == 0 and data['by_clinic'] == {}
+    assert data['recent'] == 6
+
+def test_payment_statistics(client, test_data):
+    data, queries = get_stats(client, '/api/payments/statistics', test_data['headers'])
+    assert queries == 1
+    assert data['total'] == 6
+    assert data['by_status'] == {'pending': 2, 'partially_paid': 0, 'paid': 2, 'refunded': 2}
+    assert data['by_method'] == {'cash': 4, 'visa': 2, 'bank_transfer': 0}
+    assert data['totals'] == {'revenue': 0.0, 'refunds': 160.0, 'pending_amount': 120.0}
+
+    clinic_id = test_data['clinics'][0]
+    data, queries = get_stats(client, f'/api/payments/statistics?clinic_id={clinic_id}', test_data['headers'])
+    assert queries == 1
+    assert data['total'] == 3
+
+def test_patient_statistics(client, test_data):
+    data, queries = get_stats(client, '/api/patients/statistics', test_data['headers'])
+    assert queries == 1
+    assert data == {'total': 6, 'by_gender': {'male': 4, 'female': 2, 'other': 0}, 'recent': 6}
+
+def test_clinic_statistics(client, test_data):
+    data, queries = get_stats(client, '/api/clinics/statistics', test_data['headers'])
+    assert queries == 1
+    assert data == {
+        'total_clinics': 2, 'active_clinics': 2, 'inactive_clinics': 0,
+        'total_services': 2, 'active_services': 2, 'total_doctors': 2
+    }
+
+def test_doctor_statistics(client, test_data):
+    data, queries = get_stats(client, '/api/doctors/statistics', test_data['headers'])
+    assert queries == 1
+    assert data == {
+        'total_doctors': 2,
+        'by_clinic': {'Clinic A': 1, 'Clinic B': 1},
+        'by_specialty': {'Cardiology': 1, 'Dermatology': 1}
+    }
@@ -0,0 +1,182 @@
+import pytest
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.user import User, UserRole
+from app.models.clinic import Clinic
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.models.service import Service
+from app.models.appointment import Appointment, AppointmentStatus, BookingSource
+from app.models.visit import Visit, VisitType
+from app.models.payment import Payment, PaymentMethod, PaymentStatus
+from app.services.tagged_cache import activity_scope
+from tests.conftest import captured_statements
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def test_data(app):
+    """Two clinics with a doctor each and one appointment per clinic tomorrow"""
+    user = User(username='admin', password='password123', role=UserRole.ADMIN)
+    clinics = [Clinic(name='Clinic A', room_number='101'), Clinic(name='Clinic B', room_number='102')]
+    patient = Patient(name='Test Patient', phone='+1234567890')
+    db.session.add_all([user, patient, *clinics])
+    db.session.flush()
+    doctors = [
+        Doctor(name=f'Dr. {clinic.name}', specialty='General', working_days=['Monday'],
+               working_hours={'start': '09:00', 'end': '17:00'}, clinic_id=clinic.id)
+        for clinic in clinics
+    ]
+    services = [Service(clinic_id=clinic.id, name='Consultation', duration=30, price=100.00) for clinic in clinics]
+    db.session.add_all(doctors + services)
+    db.session.flush()
+
+    start = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    appointments = [
+        Appointment(booking_id=f'B-{index}', clinic_id=clinics[index].id, doctor_id=doctors[index].id,
+                    patient_id=patient.id, service_id=services[index].id, start_time=start,
+                    end_time=start + timedelta(minutes=30), status=AppointmentStatus.CONFIRMED,
+                    booking_source=BookingSource.PHONE, created_by=user.id)
+        for index in range(2)
+    ]
+    db.session.add_all(appointments)
+    db.session.commit()
+
+    return {
+        'headers': {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'},
+        'user_id': user.id,
+        'patient_id': patient.id,
+        'clinics': [clinic.id for clinic in clinics],
+        'doctors': [doctor.id for doctor in doctors],
+        'services': [service.id for service in services],
+        'appointments': [appointment.id for appointment in appointments],
+        'day': start.date().isoformat(),
+    }
+
+def get(client, url, headers):
+    """GET url and return (json, number of queries outside authentication)"""
+    with captured_statements(lambda statement: 'token_blacklist' not in statement and 'FROM users' not in statement) as statements:
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.data
+    return response.get_json(), len(statements)
+
+def clinic_url(test_data, index):
+    return f"/api/appointments?clinic_id={test_data['clinics'][index]}&date={test_data['day']}"
+
+def create_visit(test_data, index):
+    appointment = db.session.get(Appointment, test_data['appointments'][index])
+    visit = Visit(appointment_id=appointment.id, doctor_id=appointment.doctor_id, patient_id=appointment.patient_id,
+                  service_id=appointment.service_id, clinic_id=appointment.clinic_id,
+                  check_in_time=datetime.now(), visit_type=VisitType.SCHEDULED, queue_number=1)
+    db.session.add(visit)
+    db.session.commit()
+    return visit
+
+def test_scope_picks_narrowest_tag():
+    assert activity_scope() == ['all', 'reference']
+    assert activity_scope(clinic_id=1)[0] == 'clinic:1'
+    assert activity_scope(clinic_id=1, doctor_id=2, day='2030-01-01')[0] == 'doctor:2:day:2030-01-01'
+    assert activity_scope(clinic_id=1, patient_id=3, day='2030-01-01')[0] == 'patient:3'
+
+def test_appointment_list_is_served_from_cache(client, test_data):
+    first, queries = get(client, clinic_url(test_data, 0), test_data['headers'])
+    assert queries > 0
+    second, queries = get(client, clinic_url(test_data, 0), test_data['headers'])
+    assert queries == 0
+    assert second == first
+
+def test_changes_invalidate_only_matching_entries(client, test_data):
+    get(client, clinic_url(test_data, 0), test_data['headers'])
+    get(client, clinic_url(test_data, 1), test_data['headers'])
+
+    appointment = db.session.get(Appointment, test_data['appointments'][1])
+    appointment.status = AppointmentStatus.CANCELLED
+    db.session.commit()
+
+    assert get(client, clinic_url(test_data, 0), test_data['headers'])[1] == 0
+    data, queries = get(client, clinic_url(test_data, 1), test_data['headers'])
+    assert queries > 0
+    assert data['appointments'][0]['status'] == 'cancelled'
+
+def test_rescheduling_invalidates_old_and_new_day(client, test_data):
+    get(client, clinic_url(test_data, 0), test_data['headers'])
+
+    appointment = db.session.get(Appointment, test_data['appointments'][0])
+    appointment.start_time += timedelta(days=7)
+    appointment.end_time += timedelta(days=7)
+    db.session.commit()
+
+    assert get(client, clinic_url(test_data, 0), test_data['headers'])[0]['total'] == 0
+
+def test_visits_and_payments_invalidate_the_appointment_list(client, test_data):
+    get(client, clinic_url(test_data, 0), test_data['headers'])
+    visit = create_visit(test_data, 0)
+    data, _ = get(client, clinic_url(test_data, 0), test_data['headers'])
+    assert data['appointments'][0]['visit']['id'] == visit.id
+
+    payment = Payment(visit_id=visit.id, patient_id=visit.patient_id, total_amount=100, amount_paid=0,
+                      payment_method=PaymentMethod.CASH, doctor_share=70, center_share=30)
+    db.session.add(payment)
+    db.session.commit()
+    data, _ = get(client, clinic_url(test_data, 0), test_data['headers'])
+    assert data['appointments'][0]['payment']['status'] == 'pending'
+
+    payment.status = PaymentStatus.PAID
+    db.session.commit()
+    data, _ = get(client, clinic_url(test_data, 0), test_data['headers'])
+    assert data['appointments'][0]['payment']['status'] == 'paid'
+
+def test_rolled_back_changes_keep_the_cache(client, test_data):
+    get(client, clinic_url(test_data, 0), test_data['headers'])
+
+    appointment = db.session.get(Appointment, test_data['appointments'][0])
+    appointment.status = AppointmentStatus.CANCELLED
+    db.session.flush()
+    db.session.rollback()
+
+    data, queries = get(client, clinic_url(test_data, 0), test_data['headers'])
+    assert queries == 0
+    assert data['appointments'][0]['status'] == 'confirmed'
+
+def test_reference_changes_invalidate_everything(client, test_data):
+    get(client, clinic_url(test_data, 0), test_data['headers'])
+
+    db.session.get(Patient, test_data['patient_id']).name = 'Renamed Patient'
+    db.session.commit()
+
+    data, _ = get(client, clinic_url(test_data, 0), test_data['headers'])
+    assert data['appointments'][0]['patient']['name'] == 'Renamed Patient'
+
+def test_dashboard_is_invalidated_by_todays_visits(client, test_data):
+    stats, _ = get(client, '/api/dashboard/stats', test_data['headers'])
+    assert get(client, '/api/dashboard/stats', test_data['headers'])[1] == 0
+
+    create_visit(test_data, 0)
+    stats_after, queries = get(client, '/api/dashboard/stats', test_data['headers'])
+    assert queries > 0
+    assert stats_after['visits']['total'] == stats['visits']['total'] + 1
+
+def test_new_patients_invalidate_patient_lists_only(client, test_data):
+    get(client, '/api/patients', test_data['headers'])
+    get(client, clinic_url(test_data, 0), test_data['headers'])
+
+    db.session.add(Patient(name='New Patient', phone='+1987654321'))
+    db.session.commit()
+
+    assert get(client, clinic_url(test_data, 0), test_data['headers'])[1] == 0
+    data, _ = get(client, '/api/patients', test_data['headers'])
+    assert data['total'] == 2
@@ -0,0 +1,180 @@
+import pytest
+import uuid
+from datetime import datetime, timedelta
+from celery.schedules import crontab
+from flask_jwt_extended import create_access_token, decode_token
+from app import create_app, db
+from config import TestingConfig
+from app.models.user import User, UserRole, TokenBlocklist
+from app.services.token_blocklist import token_blocklist, BloomFilter
+from app.tasks.maintenance import prune_token_blocklist
+from app.tasks.worker import beat_schedule
+from tests.conftest import count_queries
+
+@pytest.fixture
+def app():
+    """Create test app"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+@pytest.fixture
+def token(app):
+    user = User(username='admin', password='password123', role=UserRole.ADMIN)
+    db.session.add(user)
+    db.session.commit()
+    return create_access_token(identity=str(user.id))
+
+class FakeRedis:
+    """The sorted-set subset of redis.Redis the cache uses"""
+
+    def __init__(self):
+        self.scores = {}
+
+    def zadd(self, key, mapping):
+        self.scores.update(mapping)
+
+    def zrangebyscore(self, key, low, high):
+        return [jti.encode() for jti, score in self.scores.items() if score >= float(low)]
+
+    def zremrangebyscore(self, key, low, high):
+        for jti in [jti for jti, score in self.scores.items() if score <= high]:
+            del self.scores[jti]
+
+def count_blocklist_queries(fn):
+    return count_queries(fn, lambda statement: 'token_blacklist' in statement)
+
+def revoke_elsewhere(jti, created_at=None):
+    """Revocation committed by another worker"""
+    db.session.add(TokenBlocklist(jti=jti, created_at=created_at or datetime.utcnow()))
+    db.session.commit()
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    members = [str(uuid.uuid4()) for _ in range(1000)]
+    for member in members:
+        bloom.add(member)
+    assert all(member in bloom for member in members)
+    false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(10000))
+    assert false_positives < 300
+
+def test_lookups_are_served_from_memory(app, client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/api/auth/me', headers=headers)
+
+    response, queries = count_blocklist_queries(lambda: client.get('/api/auth/me', headers=headers))
+    assert response.status_code == 200
+    assert queries == 0
+
+def test_logout_revokes_immediately(app, client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+    assert client.post('/api/auth/logout', headers=headers).status_code == 200
+
+    response, queries = count_blocklist_queries(lambda: client.get('/api/auth/me', headers=headers))
+    assert response.status_code == 401
+    assert queries == 0
+
+def test_other_workers_revocations_are_synced(app, token):
+    jti = decode_token(token)['jti']
+    assert token_blocklist.is_revoked(jti) is False
+
+    revoke_elsewhere(jti)
+    # Not visible until the next sync
+    assert token_blocklist.is_revoked(jti) is False
+    app.config['TOKEN_BLOCKLIST_SYNC_SECONDS'] = 0
+    assert token_blocklist.is_revoked(jti) is True
+
+def test_false_positives_are_checked_once(app):
+    token_blocklist.is_revoked('warm-up')
+    # A JTI that collides with the filter but was never revoked
+    jti = str(uuid.uuid4())
+    app.extensions['token_blocklist']['state'].bloom.add(jti)
+
+    revoked, queries = count_blocklist_queries(lambda: token_blocklist.is_revoked(jti))
+    assert revoked is False and queries == 1
+    revoked, queries = count_blocklist_queries(lambda: token_blocklist.is_revoked(jti))
+    assert revoked is False and queries == 0
+
+def test_filter_is_rebuilt_when_full(app):
+    app.config['TOKEN_BLOCKLIST_BLOOM_CAPACITY'] = 4
+    app.config['TOKEN_BLOCKLIST_SYNC_SECONDS'] = 0
+    token_blocklist.is_revoked('warm-up')
+    jtis = [str(uuid.uuid4()) for _ in range(10)]
+    for jti in jtis:
+        revoke_elsewhere(jti)
+    token_blocklist.is_revoked('sync')
+
+    bloom = app.extensions['token_blocklist']['state'].bloom
+    assert bloom.capacity >= 20
+    assert all(token_blocklist.is_revoked(jti) for jti in jtis)
+
+def test_old_revocations_are_not_loaded_and_pruned(app):
+    old_jti, recent_jti = str(uuid.uuid4()), str(uuid.uuid4())
+    revoke_elsewhere(old_jti, datetime.utcnow() - timedelta(days=31))
+    revoke_elsewhere(recent_jti)
+
+    # Tokens older than the refresh lifetime have expired anyway
+    assert token_blocklist.is_revoked(recent_jti) is True
+    assert token_blocklist.is_revoked(old_jti) is False
+
+    result = app.test_cli_runner().invoke(args=['prune-token-blocklist'])
+    assert result.exit_code == 0, result.output
+    assert 'Deleted 1' in result.output
+    assert [row.jti for row in TokenBlocklist.query.all()] == [recent_jti]
+    assert token_blocklist.is_revoked(recent_jti) is True
+
+def test_prune_keeps_revocations_of_live_refresh_tokens(app):
+    jti = str(uuid.uuid4())
+    revoke_elsewhere(jti, datetime.utcnow() - timedelta(days=2))
+
+    result = app.test_cli_runner().invoke(args=['prune-token-blocklist', '--days', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'Deleted 0' in result.output
+    assert token_blocklist.is_revoked(jti) is True
+
+def test_revocations_are_shared_through_redis(app):
+    redis = FakeRedis()
+    app.config['TOKEN_BLOCKLIST_REDIS_URL'] = 'redis://localhost:6379/1'
+    app.extensions['token_blocklist']['redis'] = redis
+    token_blocklist.is_revoked('warm-up')
+
+    token_blocklist.revoke('from-this-worker')
+    assert 'from-this-worker' in redis.scores
+
+    # Another worker's logout reaches this one through Redis without a table query
+    redis.zadd('token_blocklist', {'from-other-worker': datetime.utcnow().timestamp()})
+    app.config['TOKEN_BLOCKLIST_SYNC_SECONDS'] = 0
+    revoked, queries = count_blocklist_queries(lambda: token_blocklist.is_revoked('from-other-worker'))
+    assert revoked is True
+    assert queries == 0
+
+def test_cache_is_warmed_at_startup(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "blocklist.db"}')
+    first = create_app('testing')
+    with first.app_context():
+        # No table yet: left to load on first use
+        assert first.extensions['token_blocklist']['state'] is None
+        db.create_all()
+        db.session.add(TokenBlocklist(jti='revoked-jti'))
+        db.session.commit()
+
+    second = create_app('testing')
+    with second.app_context():
+        assert second.extensions['token_blocklist']['state'] is not None
+        revoked, queries = count_blocklist_queries(lambda: token_blocklist.is_revoked('revoked-jti'))
+        assert revoked is True and queries == 0
+        db.drop_all()
+
+def test_beat_prunes_the_blocklist_nightly(app):
+    schedule = beat_schedule(app.config)['prune-token-blocklist']
+    assert schedule['task'] == prune_token_blocklist.name
+    assert schedule['schedule'] == crontab(hour=app.config['TOKEN_BLOCKLIST_PRUNE_HOUR'], minute=0)
@@ -0,0 +1,86 @@
+"""
+Worker app bootstrap for the Celery tasks
+
+test_task_overhead_benchmark runs a task the old way (create_app() and a new
+app context per run) and through AppContextTask, and reports the time per
+task. It is skipped unless TASK_OVERHEAD_BENCHMARK is set.
+"""
+import os
+import time
+import pytest
+from flask import has_app_context
+
+pytest.importorskip('celery')
+
+from app import create_app, db
+from app.services.notification_service import NotificationService
+from app.tasks import worker
+from app.tasks.maintenance import prune_token_blocklist
+from app.tasks.notifications import process_pending_notifications, send_sms_reminder
+from config import TestingConfig
+
+@pytest.fixture
+def built_apps(monkeypatch, tmp_path):
+    """Apps the worker bootstrap creates, all on one fresh database"""
+    if not os.environ.get('TEST_DATABASE_URL'):
+        # Every app gets its own engine, so they can't share an in-memory database
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'worker.db'}")
+    apps = []
+
+    def create_testing_app():
+        app = create_app('testing')
+        with app.app_context():
+            db.create_all()
+        apps.append(app)
+        return app
+
+    monkeypatch.setattr(worker, 'create_app', create_testing_app)
+    monkeypatch.setattr(worker, '_app', None)
+    yield apps
+    for app in apps:
+        with app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+
+def test_tasks_share_one_app(built_apps):
+    assert process_pending_notifications() == 0
+    assert send_sms_reminder(999) is False
+    assert prune_token_blocklist() == 0
+    assert len(built_apps) == 1
+    assert worker.celery.conf.broker_url == built_apps[0].config['CELERY_BROKER_URL']
+
+def test_connections_go_back_to_the_pool(built_apps):
+    process_pending_notifications()
+    process_pending_notifications()
+    assert not has_app_context()
+    with built_apps[0].app_context():
+        assert db.engine.pool.checkedout() == 0
+
+def test_tasks_called_in_an_app_context_use_it(monkeypatch):
+    monkeypatch.setattr(worker, 'create_app', lambda: pytest.fail('worker app should not be built'))
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        assert process_pending_notifications() == 0
+        db.session.remove()
+        db.drop_all()
+
+@pytest.mark.skipif(not os.environ.get('TASK_OVERHEAD_BENCHMARK'), reason='set TASK_OVERHEAD_BENCHMARK to run')
+def test_task_overhead_benchmark(built_apps):
+    runs = 50
+    worker.get_worker_app()  # creates the tables
+
+    def legacy_task():
+        """process_pending_notifications as it was: a new app for every run"""
+        app = create_app('testing')
+        with app.app_context():
+            return len(NotificationService().get_pending_notifications(limit=50))
+
+    print()
+    for label, task in (('create_app per task', legacy_task), ('worker app', process_pending_notifications)):
+        task()  # warm up
+        started = time.perf_counter()
+        for _ in range(runs):
+            assert task() == 0
+        elapsed = time.perf_counter() - started
+        print(f'{label:>20}: {elapsed / runs * 1000:8.2f} ms/task')
@@ -0,0 +1,145 @@
+import { useEffect, useRef, useState } from 'react'
+import { useQueryClient } from '@tanstack/react-query'
+import { useQueueStore } from '../stores/queueStore'
+
+const QUEUE_LISTS = ['waiting', 'called', 'in_progress', 'completed']
+
+const byQueueOrder = (a, b) => (a.sort_key - b.sort_key) || (a.id - b.id)
+
+// Upsert or remove one visit; the entry's status decides which list holds it
+const applyChange = (queue, change) => {
+  const next = { ...queue }
+  QUEUE_LISTS.forEach((list) => {
+    if (queue[list].some((entry) => entry.id === change.visit_id)) {
+      next[list] = queue[list].filter((entry) => entry.id !== change.visit_id)
+    }
+  })
+  const list = change.visit?.status
+  if (change.op !== 'removed' && QUEUE_LISTS.includes(list)) {
+    next[list] = [...next[list], change.visit].sort(byQueueOrder)
+  }
+  return next
+}
+
+// The versions a queue_delta covers and the changes it carries: one delta, or
+// a burst merged into {versions, changes} with the last change of each visit
+const deltaParts = (message) => (message.changes ? {
+  versions: message.versions,
+  changes: message.changes
+} : {
+  versions: [message.version],
+  changes: [message]
+})
+
+/**
+ * Live queue for a clinic or doctor room, kept from versioned socket messages
+ *
+ * A queue_snapshot replaces the queue; each queue_delta is applied by visit id
+ * if it continues from the last version seen; a merged burst must cover the
+ * next versions without holes and its changes are applied in order. On a gap
+ * (or a version that went backwards) the hook sends queue_resync and holds
+ * deltas until the snapshot arrives. The queue is also written to the queue
+ * store and to the ['queue', clinicId] / ['doctor-queue', doctorId] queries.
+ */
+export const useQueueSync = (socket, { clinicId, doctorId } = {}) => {
+  const queryClient = useQueryClient()
+  const { updateClinicQueue, updateDoctorQueue } = useQueueStore()
+  const [queue, setQueue] = useState(null)
+  const stateRef = useRef(null) // { version, date, queue }
+  const heldRef = useRef(null) // deltas received while waiting for a snapshot
+
+  const room = clinicId ? `clinic_${clinicId}` : doctorId ? `doctor_${doctorId}` : null
+
+  useEffect(() => {
+    if (!socket || !room) return
+
+    stateRef.current = null
+    heldRef.current = []
+    setQueue(null)
+
+    const publish = (nextQueue) => {
+      setQueue(nextQueue)
+      if (clinicId) {
+        updateClinicQueue(clinicId, nextQueue)
+        queryClient.setQueryData(['queue', clinicId], nextQueue)
+      } else {
+        updateDoctorQueue(doctorId, nextQueue)
+        queryClient.setQueryData(['doctor-queue', doctorId], nextQueue)
+      }
+    }
+
+    const resync = () => {
+      if (heldRef.current === null) heldRef.current = []
+      socket.emit('queue_resync', {
+        ...(clinicId ? { clinic_id: clinicId } : { doctor_id: doctorId }),
+        version: stateRef.current?.version
+      })
+    }
+
+    // Apply a delta on top of the current state; false if it does not follow on
+    const apply = (message, replaying = false) => {
+      const state = stateRef.current
+      const { versions, changes } = deltaParts(message)
+      const last = versions[versions.length - 1]
+      if (replaying && last <= state.version) return true
+      // A held burst may overlap the snapshot; its changes are each visit's
+      // latest, so applying them again is harmless
+      const first = replaying ? Math.max(versions[0], state.version + 1) : versions[0]
+      const follows = first === state.version + 1 &&
+        versions.every((version, i) => version === versions[0] + i)
+      // A change for a later day means the queue rolled over
+      if (!follows || changes.some((change) => change.date > state.date)) return false
+
+      const nextQueue = changes
+        .filter((change) => !change.date || change.date === state.date)
+        .reduce(applyChange, state.queue)
+      stateRef.current = { ...state, version: last, queue: nextQueue }
+      return true
+    }
+
+    const handleSnapshot = (snapshot) => {
+      if (snapshot.room !== room) return
+      const state = stateRef.current
+      const waiting = heldRef.current !== null
+      // A snapshot older than what we have only matters if we asked for one
+      if (!waiting && state && snapshot.version <= state.version) return
+
+      if (snapshot.unchanged) {
+        if (!state) return resync()
+        stateRef.current = { ...state, version: snapshot.version }
+      } else {
+        stateRef.current = { version: snapshot.version, date: snapshot.date, queue: snapshot.queue }
+      }
+
+      const held = heldRef.current || []
+      heldRef.current = null
+      if (!held.every((message) => apply(message, true))) return resync()
+      publish(stateRef.current.queue)
+    }
+
+    const handleDelta = (message) => {
+      if (message.room !== room) return
+      if (heldRef.current !== null) {
+        heldRef.current.push(message)
+        return
+      }
+      if (!apply(message)) {
+        heldRef.current = [message]
+        return resync()
+      }
+      publish(stateRef.current.queue)
+    }
+
+    socket.on('queue_snapshot', handleSnapshot)
+    socket.on('queue_delta', handleDelta)
+    // Joining the room also sends a snapshot; this one covers a join made earlier
+    resync()
+
+    return () => {
+      socket.off('queue_snapshot', handleSnapshot)
+      socket.off('queue_delta', handleDelta)
+    }
+  }, [socket, room, clinicId, doctorId, queryClient, updateClinicQueue, updateDoctorQueue])
+
+  return queue
+}
@@ -146,9 +146,17 @@ export const useSocket = () => {
     }
   }
 
-  const onQueueUpdate = (callback) => {
+  // Deltas continue from the last snapshot's version; see useQueueSync
+  const onQueueDelta = (callback) => {
     if (socketRef.current) {
-      socketRef.current.on('queue_updated', callback)
+      socketRef.current.on('queue_delta', callback)
+    }
+  }
+
+  // Snapshots follow joins and queue_resync requests
+  const onQueueSnapshot = (callback) => {
+    if (socketRef.current) {
+      socketRef.current.on('queue_snapshot', callback)
     }
   }
 
@@ -216,7 +224,8 @@ export const useSocket = () => {
     leaveQueueRoom,
     joinDoctorRoom,
     leaveDoctorRoom,
-    onQueueUpdate,
+    onQueueDelta,
+    onQueueSnapshot,
     onNewCheckin,
     onVisitStatusChange,
     onAppointmentCreated,
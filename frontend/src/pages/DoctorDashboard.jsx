@@ -3,6 +3,7 @@ import { useQuery } from '@tanstack/react-query'
 import { useNavigate } from 'react-router-dom'
 import { useAuthStore } from '../stores/authStore'
 import { useSocket } from '../hooks/useSocket'
+import { useQueueSync } from '../hooks/useQueueSync'
 import { dashboardApi } from '../api/dashboard'
 import { appointmentsApi } from '../api/appointments'
 import { Card, CardHeader, CardTitle, CardContent } from '../components/common/Card'
@@ -36,6 +37,14 @@ const DoctorDashboard = () => {
     refetchInterval: 30000 // Refresh every 30 seconds
   })
 
+  // Queue counts follow the doctor room's deltas instead of refetching stats
+  const liveQueue = useQueueSync(isConnected ? socket : null, { doctorId })
+  const visitCounts = liveQueue ? {
+    waiting: liveQueue.waiting.length,
+    in_progress: liveQueue.in_progress.length,
+    completed: liveQueue.completed.length
+  } : stats?.visits
+
   // Debounced refetch function to prevent excessive API calls
   const debouncedRefetch = useCallback((eventType, data) => {
     // Add event to pending set
@@ -63,11 +72,6 @@ const DoctorDashboard = () => {
         token: token 
       })
 
-      // Listen for queue updates
-      socket.on('queue_updated', (data) => {
-        debouncedRefetch('queue_updated', data)
-      })
-
       // Listen for new check-ins
       socket.on('new_checkin', (data) => {
         debouncedRefetch('new_checkin', data)
@@ -123,7 +127,6 @@ const DoctorDashboard = () => {
           doctor_id: doctorId,
           token: token 
         })
-        socket.off('queue_updated')
         socket.off('new_checkin')
         socket.off('visit_status_changed')
         socket.off('appointment_created')
@@ -285,7 +288,7 @@ const DoctorDashboard = () => {
                   <div className="ml-4">
                     <p className="text-sm font-medium text-gray-500">Waiting</p>
                     <p className="text-2xl font-semibold text-gray-900">
-                      {stats.visits?.waiting || 0}
+                      {visitCounts?.waiting || 0}
                     </p>
                   </div>
                 </div>
@@ -301,7 +304,7 @@ const DoctorDashboard = () => {
                   <div className="ml-4">
                     <p className="text-sm font-medium text-gray-500">In Progress</p>
                     <p className="text-2xl font-semibold text-gray-900">
-                      {stats.visits?.in_progress || 0}
+                      {visitCounts?.in_progress || 0}
                     </p>
                   </div>
                 </div>
@@ -317,7 +320,7 @@ const DoctorDashboard = () => {
                   <div className="ml-4">
                     <p className="text-sm font-medium text-gray-500">Completed</p>
                     <p className="text-2xl font-semibold text-gray-900">
-                      {stats.visits?.completed || 0}
+                      {visitCounts?.completed || 0}
                     </p>
                   </div>
                 </div>
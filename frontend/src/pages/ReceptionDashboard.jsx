@@ -3,6 +3,7 @@ import { useQuery } from '@tanstack/react-query'
 import { useNavigate } from 'react-router-dom'
 import { useAuthStore } from '../stores/authStore'
 import { useSocket } from '../hooks/useSocket'
+import { useQueueSync } from '../hooks/useQueueSync'
 import { useQueueStore } from '../stores/queueStore'
 import { dashboardApi } from '../api/dashboard'
 import { clinicsApi } from '../api/clinics'
@@ -59,14 +60,12 @@ const ReceptionDashboard = () => {
     }, 500) // 500ms debounce delay
   }, [refetch])
 
+  // Keep the selected clinic's queue from its room's deltas
+  useQueueSync(isConnected ? socket : null, { clinicId: selectedClinic })
+
   // Set up real-time updates with event batching
   useEffect(() => {
     if (socket && isConnected) {
-      // Listen for queue updates
-      socket.on('queue_updated', (data) => {
-        debouncedRefetch('queue_updated', data)
-      })
-
       // Listen for new check-ins
       socket.on('new_checkin', (data) => {
         debouncedRefetch('new_checkin', data)
@@ -105,7 +104,6 @@ const ReceptionDashboard = () => {
       })
 
       return () => {
-        socket.off('queue_updated')
         socket.off('new_checkin')
         socket.off('visit_status_changed')
         socket.off('appointment_created')
@@ -127,7 +125,7 @@ const ReceptionDashboard = () => {
         leaveQueueRoom(selectedClinic)
       }
     }
-  }, [selectedClinic]) // Only depend on selectedClinic to prevent excessive joins
+  }, [selectedClinic, isConnected]) // Rejoin after a reconnect, not on every render
 
   // Auto-select first clinic if none selected
   useEffect(() => {